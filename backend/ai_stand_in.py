@@ -0,0 +1,297 @@
+"""
+本地 OpenAI 兼容替身服务器
+实现 /v1/chat/completions（流式与非流式），离线时走完整的 OpenAI 服务商代码路径
+（_create_openai_chat_completion、流式解析、不支持参数时的重试、用量上报），而不是模拟模式
+
+可配置：回复长度、生成速度、首字延迟、注入错误响应、流式输出中途失败、视为不支持的参数
+
+运行方式：
+    cd backend
+    python ai_stand_in.py --port 8100 --tokens 200 --tokens-per-second 50 --ttft 0.3
+
+然后在 .env 中把 OpenAI 指向替身服务器：
+    AI_PROVIDER=openai
+    OPENAI_API_KEY=stand-in
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1
+
+测试和 benchmark_chat.py 在进程内启动：
+    with StandInServer(StandInConfig(tokens=50)) as server:
+        server.base_url  # http://127.0.0.1:{随机端口}/v1
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+@dataclass
+class StandInConfig:
+    """替身服务器的行为配置"""
+    tokens: int = 200  # 每次回复的 token 数
+    tokens_per_second: float = 50.0  # 生成速度，0 表示不限速
+    ttft: float = 0.2  # 首个 token 之前的延迟（秒）
+    error_rate: float = 0.0  # 直接返回错误响应的请求比例
+    error_status: int = 500  # 注入错误的 HTTP 状态码（如 429 / 500 / 503）
+    fail_rate: float = 0.0  # 流式输出中途失败的请求比例
+    fail_after: int = 10  # 中途失败前已输出的 token 数
+    fail_mode: str = "disconnect"  # disconnect = 直接断开连接；error = 发送错误事件后结束
+    unsupported_params: tuple[str, ...] = ()  # 视为不支持的参数：请求中出现时返回 400
+    model: str = "stand-in"
+    seed: Optional[int] = None
+
+
+@dataclass
+class StandInStats:
+    """替身服务器的运行统计（线程安全地累加）"""
+    requests: int = 0
+    completed: int = 0
+    injected_errors: int = 0  # 注入的错误响应
+    rejected_params: int = 0  # 因不支持的参数返回 400
+    mid_stream_failures: int = 0
+    disconnects: int = 0  # 客户端提前关闭连接
+    tokens_sent: int = 0
+    active: int = 0
+    peak_active: int = 0
+    closed_at: Optional[float] = None  # 最近一次发现客户端断开的时间（perf_counter）
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, **deltas: int) -> None:
+        with self.lock:
+            for name, value in deltas.items():
+                setattr(self, name, getattr(self, name) + value)
+            self.peak_active = max(self.peak_active, self.active)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {name: value for name, value in self.__dict__.items() if name != "lock"}
+
+
+class _ClientGone(Exception):
+    """客户端已关闭连接"""
+
+
+def _make_handler(config: StandInConfig, stats: StandInStats, rng: random.Random):
+    class Handler(BaseHTTPRequestHandler):
+        # 流式响应使用分块传输：中途断开时客户端能识别为不完整的响应，而不是正常结束
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status: int, payload: dict) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_error(self, status: int, message: str, error_type: str, param: Optional[str] = None) -> None:
+            self._send_json(status, {"error": {"message": message, "type": error_type, "param": param, "code": None}})
+
+        def _write_chunk(self, data: bytes) -> None:
+            try:
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError) as e:
+                raise _ClientGone() from e
+
+        def _write_event(self, payload) -> None:
+            data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+            self._write_chunk(f"data: {data}\n\n".encode("utf-8"))
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send_json(200, {"object": "list", "data": [{"id": config.model, "object": "model"}]})
+            else:
+                self._send_error(404, "Not found", "invalid_request_error")
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_error(404, "Not found", "invalid_request_error")
+                return
+
+            stats.add(requests=1)
+            for param in config.unsupported_params:
+                if param in body:
+                    stats.add(rejected_params=1)
+                    if param == "stream_options":
+                        message = "Unrecognized request argument supplied: stream_options"
+                    else:
+                        message = f"Unsupported parameter: '{param}' is not supported with this model."
+                    self._send_error(400, message, "invalid_request_error", param)
+                    return
+
+            with stats.lock:
+                inject_error = rng.random() < config.error_rate
+                fail_midway = rng.random() < config.fail_rate
+            if inject_error:
+                stats.add(injected_errors=1)
+                self._send_error(config.error_status, "stand-in injected error", "server_error")
+                return
+
+            prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4 + 1
+            stats.add(active=1)
+            try:
+                if body.get("stream"):
+                    self._stream(body, prompt_tokens, fail_midway)
+                else:
+                    self._complete(prompt_tokens)
+            except _ClientGone:
+                stats.add(disconnects=1)
+                with stats.lock:
+                    stats.closed_at = time.perf_counter()
+            finally:
+                stats.add(active=-1)
+
+        def _complete(self, prompt_tokens: int) -> None:
+            delay = config.ttft + (config.tokens / config.tokens_per_second if config.tokens_per_second else 0)
+            time.sleep(delay)
+            content = "".join(f"词{i} " for i in range(config.tokens))
+            stats.add(tokens_sent=config.tokens, completed=1)
+            self._send_json(200, {
+                "id": "chatcmpl-stand-in",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": config.model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": config.tokens,
+                    "total_tokens": prompt_tokens + config.tokens,
+                },
+            })
+
+        def _stream(self, body: dict, prompt_tokens: int, fail_midway: bool) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            interval = 1 / config.tokens_per_second if config.tokens_per_second else 0
+            time.sleep(config.ttft)
+            for i in range(config.tokens):
+                if fail_midway and i >= config.fail_after:
+                    stats.add(mid_stream_failures=1)
+                    if config.fail_mode == "error":
+                        self._write_event({"error": {"message": "stand-in mid-stream failure", "type": "server_error"}})
+                        self._write_chunk(b"")
+                    # disconnect：不发送结束块直接关闭连接
+                    self.close_connection = True
+                    return
+
+                self._write_event({
+                    "id": "chatcmpl-stand-in",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": config.model,
+                    "choices": [{"index": 0, "delta": {"content": f"词{i} "}, "finish_reason": None}],
+                })
+                stats.add(tokens_sent=1)
+                if interval:
+                    time.sleep(interval)
+
+            if body.get("stream_options", {}).get("include_usage"):
+                self._write_event({
+                    "id": "chatcmpl-stand-in",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": config.model,
+                    "choices": [],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": config.tokens,
+                        "total_tokens": prompt_tokens + config.tokens,
+                    },
+                })
+            self._write_event("[DONE]")
+            self._write_chunk(b"")
+            stats.add(completed=1)
+
+    return Handler
+
+
+class StandInServer:
+    """在后台线程中运行的替身服务器，可用作上下文管理器"""
+
+    def __init__(self, config: Optional[StandInConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or StandInConfig()
+        self.stats = StandInStats()
+        rng = random.Random(self.config.seed)
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self.config, self.stats, rng))
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StandInServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """添加替身服务器的命令行参数（benchmark_chat.py 共用）"""
+    parser.add_argument("--tokens", type=int, default=200, help="每次回复的 token 数")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="生成速度，0 表示不限速")
+    parser.add_argument("--ttft", type=float, default=0.2, help="首个 token 之前的延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="直接返回错误响应的请求比例")
+    parser.add_argument("--error-status", type=int, default=500, help="注入错误的 HTTP 状态码")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="流式输出中途失败的请求比例")
+    parser.add_argument("--fail-after", type=int, default=10, help="中途失败前已输出的 token 数")
+    parser.add_argument("--fail-mode", choices=["disconnect", "error"], default="disconnect")
+    parser.add_argument("--unsupported", nargs="*", default=[], help="视为不支持的参数，如 max_tokens stream_options")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args: argparse.Namespace) -> StandInConfig:
+    return StandInConfig(
+        tokens=args.tokens,
+        tokens_per_second=args.tokens_per_second,
+        ttft=args.ttft,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        fail_rate=args.fail_rate,
+        fail_after=args.fail_after,
+        fail_mode=args.fail_mode,
+        unsupported_params=tuple(args.unsupported),
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容替身服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    config = config_from_args(args)
+    server = StandInServer(config, host=args.host, port=args.port)
+    print(f"替身服务器已启动：{server.start()}")
+    print(f"配置：{config}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\n统计：{server.stats.snapshot()}")
+        server.stop()
@@ -0,0 +1,216 @@
+"""
+聊天吞吐基准测试
+启动本地 OpenAI 兼容替身服务器（ai_stand_in.py）和完整的后端服务（uvicorn），
+用多个用户并发发起流式聊天请求，统计首字延迟、token 速率和失败情况。
+
+请求经过完整的 /api/chat 链路：认证、配额、AI 并发限制与排队、上下文构建、
+OpenAI 服务商代码路径、流式合并、检查点写库。
+
+运行方式：
+    cd backend
+    python benchmark_chat.py --sessions 50 --tokens 200 --tokens-per-second 50 --ttft 0.3
+    python benchmark_chat.py --sessions 20 --fail-rate 0.2 --error-rate 0.1
+
+数据库使用临时 SQLite 文件（--database-url 可指定其他数据库），不会影响开发数据。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+
+import ai_stand_in
+
+
+@dataclass
+class SessionResult:
+    status: int = 0
+    ttft: Optional[float] = None  # 发出请求到收到第一帧内容的时间
+    duration: float = 0.0
+    tokens: int = 0  # 收到的替身 token 数
+    frames: int = 0  # 收到的增量帧数
+    queued: bool = False  # 是否经历过排队
+    interrupted: bool = False  # 收到 error 事件：服务商中途失败，回答不完整
+    error: Optional[str] = None
+
+
+def _percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+async def _run_session(client: httpx.AsyncClient, token: str, prompt: str) -> SessionResult:
+    result = SessionResult()
+    headers = {"Authorization": f"Bearer {token}"}
+    response = await client.post("/api/chat/conversations", json={"title": "基准测试"}, headers=headers)
+    conversation_id = response.json()["id"]
+
+    started = time.perf_counter()
+    url = f"/api/chat/conversations/{conversation_id}/messages?stream=true&protocol=2"
+    try:
+        async with client.stream("POST", url, json={"content": prompt}, headers=headers) as response:
+            result.status = response.status_code
+            if response.status_code != 200:
+                result.error = (await response.aread()).decode("utf-8", "replace")[:200]
+                return result
+
+            event = "message"
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data = line[len("data: "):]
+                    if event == "queued":
+                        result.queued = True
+                    elif event == "error":
+                        result.interrupted = True
+                    elif event == "delta":
+                        chunk = json.loads(data)
+                        if result.ttft is None:
+                            result.ttft = time.perf_counter() - started
+                        if chunk.get("replace"):
+                            result.error = chunk["delta"][:200]
+                        result.frames += 1
+                        # 替身服务器的每个 token 形如「词{i} 」
+                        result.tokens += chunk["delta"].count("词")
+                elif not line:
+                    event = "message"
+    except httpx.HTTPError as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.duration = time.perf_counter() - started
+    return result
+
+
+def _create_users(count: int) -> list[str]:
+    """直接在数据库中创建测试用户，返回访问令牌"""
+    import auth
+    import models
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        password_hash = auth.get_password_hash("benchmark")
+        tokens = []
+        for i in range(count):
+            user = models.User(
+                username=f"bench{i}",
+                email=f"bench{i}@example.com",
+                password_hash=password_hash,
+            )
+            db.add(user)
+            db.flush()
+            tokens.append(auth.create_access_token({"sub": str(user.id)}))
+        db.commit()
+        return tokens
+    finally:
+        db.close()
+
+
+def _start_app():
+    """在后台线程中运行 uvicorn，返回服务器对象和基础地址"""
+    import uvicorn
+    from main import app
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+async def _run(base_url: str, tokens: list[str], prompt: str) -> tuple[list[SessionResult], float]:
+    limits = httpx.Limits(max_connections=len(tokens) + 10)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(_run_session(client, token, prompt) for token in tokens))
+        return results, time.perf_counter() - started
+
+
+def _report(results: list[SessionResult], wall: float, args, stand_in: ai_stand_in.StandInServer) -> None:
+    from config import settings
+
+    completed = [r for r in results if r.status == 200 and r.error is None]
+    failed = [r for r in results if r not in completed]
+    complete_replies = [r for r in completed if r.tokens == args.tokens]
+    ttfts = [r.ttft for r in completed if r.ttft is not None]
+    rates = [r.tokens / (r.duration - r.ttft) for r in completed if r.ttft is not None and r.duration > r.ttft]
+    total_tokens = sum(r.tokens for r in results)
+
+    print()
+    print(f"并发会话：{len(results)}，耗时 {wall:.2f} s")
+    print(f"替身服务器：{args.tokens} token/回复，{args.tokens_per_second:g} token/s，首字延迟 {args.ttft * 1000:.0f} ms，"
+          f"错误率 {args.error_rate:g}，中途失败率 {args.fail_rate:g}")
+    print(f"并发限制：全局 {settings.AI_MAX_CONCURRENCY}，单服务商 {settings.AI_PROVIDER_MAX_CONCURRENCY}，"
+          f"排队上限 {settings.AI_QUEUE_MAX_DEPTH}")
+    print(f"成功 {len(completed)}（完整回复 {len(complete_replies)}，中途中断 {sum(r.interrupted for r in completed)}），"
+          f"失败 {len(failed)}，"
+          f"经历排队 {sum(r.queued for r in results)}")
+    if ttfts:
+        print(f"首字延迟：p50 {_percentile(ttfts, 50) * 1000:.0f} ms，p95 {_percentile(ttfts, 95) * 1000:.0f} ms，"
+              f"max {max(ttfts) * 1000:.0f} ms")
+    if rates:
+        print(f"单会话速率：p50 {_percentile(rates, 50):.1f} token/s，p5 {_percentile(rates, 5):.1f} token/s")
+    print(f"总吞吐：{total_tokens / wall:.1f} token/s（共 {total_tokens} token）")
+    if completed:
+        print(f"平均增量帧数：{statistics.mean(r.frames for r in completed):.1f} 帧/回复")
+    print(f"上游：{stand_in.stats.snapshot()}")
+    for r in failed[:5]:
+        print(f"  失败示例：HTTP {r.status} {r.error}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="聊天吞吐基准测试")
+    parser.add_argument("--sessions", type=int, default=20, help="并发会话数（每个会话一个用户）")
+    parser.add_argument("--prompt", default="请详细讲讲梯度下降")
+    parser.add_argument("--database-url", default=None, help="默认使用临时 SQLite 文件")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="覆盖 AI_MAX_CONCURRENCY")
+    parser.add_argument("--provider-max-concurrency", type=int, default=None, help="覆盖 AI_PROVIDER_MAX_CONCURRENCY")
+    ai_stand_in.add_arguments(parser)
+    args = parser.parse_args()
+
+    stand_in = ai_stand_in.StandInServer(ai_stand_in.config_from_args(args))
+    stand_in.start()
+
+    # 配置在导入应用时读取，必须先设置环境变量
+    temp_dir = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{temp_dir.name}/benchmark.db"
+    os.environ["AI_PROVIDER"] = "openai"
+    os.environ["OPENAI_API_KEY"] = "stand-in"
+    os.environ["OPENAI_BASE_URL"] = stand_in.base_url
+    os.environ["OPENAI_MODEL"] = "stand-in"
+    os.environ["AI_RESPONSE_CACHE_ENABLED"] = "false"
+    if args.max_concurrency is not None:
+        os.environ["AI_MAX_CONCURRENCY"] = str(args.max_concurrency)
+    if args.provider_max_concurrency is not None:
+        os.environ["AI_PROVIDER_MAX_CONCURRENCY"] = str(args.provider_max_concurrency)
+
+    server, thread, base_url = _start_app()
+    try:
+        tokens = _create_users(args.sessions)
+        results, wall = asyncio.run(_run(base_url, tokens, args.prompt))
+        _report(results, wall, args, stand_in)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        stand_in.stop()
+        temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -35,6 +35,34 @@ class Settings(BaseSettings):
     # 文件上传配置
     MAX_UPLOAD_SIZE: int = 2097152  # 2MB
     ALLOWED_FILE_TYPES: str = "jpg,jpeg,png,webp,gif,pdf,doc,docx"
+    VIDEO_TRANSCODE_WORKERS: int = 1  # 同时进行的视频转码进程数（0 表示不转码，直接使用原文件）
+    VIDEO_TRANSCODE_NICE: int = 10  # 转码进程降低的调度优先级（nice 值增量，0 表示不调整）
+    IMAGE_VARIANT_WIDTHS: str = "320,640,1024,1600"  # 上传图片生成的版本宽度（像素，逗号分隔，不超过原图宽度）
+    IMAGE_WEBP_QUALITY: int = 80  # WebP 和 JPEG 版本的压缩质量（1-100）
+    IMAGE_MAX_PIXELS: int = 40000000  # 允许解码的最大像素数（宽 × 高），防止解压炸弹
+    UPLOAD_CHUNK_SIZE: int = 8388608  # 断点续传的分块大小（字节，默认 8MB）
+    UPLOAD_SESSION_DIR: str = "upload_sessions"  # 未完成上传及计算哈希前的临时文件目录（不在 uploads 下，不会被静态访问）
+    UPLOAD_SESSION_TTL_HOURS: int = 24  # 上传会话多久没有收到新分块即过期清理
+    UPLOAD_SESSION_CLEANUP_MINUTES: int = 60  # 过期会话清理任务的执行间隔（分钟）
+    UPLOAD_MAX_SESSIONS_PER_USER: int = 3  # 每个用户同时进行的上传会话上限（临时文件按总大小预分配）
+
+    # ========== 通知配置 ==========
+
+    NOTIFICATION_GROUP_WINDOW_MINUTES: int = 1440  # 同一对象的同类通知在此时间窗口内合并为一条
+    NOTIFICATION_GROUP_MAX_ACTORS: int = 10  # 合并通知中保留的最近触发者数量
+
+    # ========== 数据保留配置 ==========
+
+    RETENTION_ENABLED: bool = False  # 是否在后台定期执行数据清理
+    RETENTION_INTERVAL_HOURS: int = 24  # 清理任务执行间隔（小时）
+    RETENTION_BATCH_SIZE: int = 500  # 每批删除行数（每批单独提交，避免长时间持锁）
+    RETENTION_ARCHIVE_DIR: Optional[str] = None  # 配置后删除前先归档为 JSONL 文件
+    # 以下天数为 0 表示不清理该表
+    RETENTION_VERIFICATION_CODE_DAYS: int = 7  # 过期超过 N 天的验证码
+    RETENTION_READ_NOTIFICATION_DAYS: int = 90  # 已读且 N 天无新事件的通知
+    RETENTION_ACTIVITY_DAYS: int = 180  # N 天前的动态
+    # N 天未更新的对话及其消息：会永久删除用户的聊天记录，默认不清理，需显式开启（建议同时配置归档目录）
+    RETENTION_ABANDONED_CONVERSATION_DAYS: int = 0
 
     # ========== 邮件配置 ==========
 
@@ -106,6 +134,32 @@ class Settings(BaseSettings):
     AI_MAX_TOKENS: int = 2000  # 最大生成 Token 数
     AI_TEMPERATURE: float = 0.7  # 生成温度（0-1）
     AI_TIMEOUT: int = 30  # API 超时时间（秒）
+    AI_STREAM_THREADS: int = 32  # 同步 SDK 流式读取使用的专用线程数
+    AI_STREAM_FLUSH_MS: int = 50  # 流式输出合并窗口（毫秒，0 表示不按时间合并）
+    AI_STREAM_FLUSH_CHARS: int = 64  # 累积满多少字符立即输出（0 表示不按长度合并）
+    AI_STREAM_CHECKPOINT_CHARS: int = 200  # 流式回复每新增多少字符写入一次检查点（0 表示不按长度）
+    AI_STREAM_CHECKPOINT_SECONDS: float = 2.0  # 距上次检查点多少秒后写入（0 表示不按时间）
+    AI_MOCK_TOKEN_DELAY_MS: int = 20  # 模拟模式逐词输出的延迟（毫秒）
+    AI_CONTEXT_TOKEN_BUDGET: int = 3000  # 发送给 AI 的上下文 Token 上限（含摘要）
+    AI_CONTEXT_SUMMARY_TOKENS: int = 500  # 较早对话摘要的 Token 上限
+    AI_CONTEXT_SUMMARY_WITH_AI: bool = False  # 使用 AI 生成摘要（默认摘录式，无额外调用）
+    AI_TOKENIZER_ENCODING: str = "cl100k_base"  # tiktoken 编码（不可用时按字符估算）
+    AI_RESPONSE_CACHE_ENABLED: bool = False  # 缓存相同问题的 AI 回复（默认关闭）
+    AI_RESPONSE_CACHE_TTL_SECONDS: int = 3600  # 缓存有效期（秒）
+    AI_RESPONSE_CACHE_MAX_ENTRIES: int = 1000  # 最多缓存条目数（超出按 LRU 淘汰）
+    AI_ROUTER_WINDOW_SECONDS: int = 300  # 服务商错误率与首字延迟的统计窗口（秒）
+    AI_ROUTER_MIN_REQUESTS: int = 5  # 窗口内至少多少次请求才按错误率熔断
+    AI_ROUTER_ERROR_THRESHOLD: float = 0.5  # 错误率达到该值时打开熔断器
+    AI_ROUTER_CONSECUTIVE_FAILURES: int = 3  # 连续失败多少次时打开熔断器
+    AI_ROUTER_COOLDOWN_SECONDS: int = 30  # 熔断器打开后多久放行试探请求
+    AI_ROUTER_HEDGE_MS: int = 0  # 首个服务商多久未返回内容时对冲请求下一个（0 表示不对冲）
+    AI_METRICS_WINDOW_SECONDS: int = 900  # 延迟分位数（首字延迟、排队时间等）的统计窗口（秒）
+    AI_MAX_CONCURRENCY: int = 16  # 全局同时进行的 AI 调用上限
+    AI_PROVIDER_MAX_CONCURRENCY: int = 8  # 单个服务商同时进行的调用上限
+    AI_QUEUE_MAX_DEPTH: int = 100  # 排队请求上限，超出返回 429
+    AI_QUEUE_RETRY_AFTER_SECONDS: int = 10  # 429 响应的 Retry-After
+    AI_DAILY_TOKEN_QUOTA: int = 0  # 每个用户每天（UTC）可用的 Token 数（提示 + 回复，0 表示不限）
+    AI_MONTHLY_TOKEN_QUOTA: int = 0  # 每个用户每月可用的 Token 数（0 表示不限）
 
     class Config:
         env_file = ".env"
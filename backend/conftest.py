@@ -0,0 +1,66 @@
+"""
+pytest 公共夹具
+使用临时 SQLite 数据库运行后端测试，不依赖已启动的服务
+
+运行方式：
+    cd backend
+    python -m pytest -q test_notifications.py
+"""
+
+import os
+import tempfile
+
+# 必须在导入 config / database 之前设置，保证测试不会写入开发数据库
+_TEST_DB_DIR = tempfile.mkdtemp(prefix="v4corner-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TEST_DB_DIR}/test.db"
+
+# 测试中不调用真实 AI 服务（默认模拟模式，需要时由测试注入本地替身）
+for _key in list(os.environ):
+    if _key.startswith(("OPENAI_", "ANTHROPIC_", "GEMINI_", "DEEPSEEK_", "ZHIPUAI_",
+                        "QIANFAN_", "DASHSCOPE_", "OLLAMA_", "ENABLE_OLLAMA", "AI_")):
+        del os.environ[_key]
+
+import pytest
+from fastapi.testclient import TestClient
+
+import auth
+import models
+from database import Base, SessionLocal, engine
+from main import app
+
+
+@pytest.fixture
+def db():
+    """每个测试使用一套全新的表"""
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def client(db):
+    return TestClient(app)
+
+
+@pytest.fixture
+def make_user(db):
+    """创建用户并返回 (user, 认证请求头)"""
+    def _make_user(username: str, role: str = "student"):
+        user = models.User(
+            username=username,
+            email=f"{username}@example.com",
+            password_hash="x",
+            nickname=username,
+            role=role,
+        )
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        token = auth.create_access_token({"sub": str(user.id)})
+        return user, {"Authorization": f"Bearer {token}"}
+
+    return _make_user
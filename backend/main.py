@@ -1,4 +1,5 @@
 from pathlib import Path
+import asyncio
 import logging
 
 from fastapi import FastAPI, HTTPException, Request
@@ -12,7 +13,8 @@ from auth import get_password_hash, validate_password_strength
 from config import settings
 from database import Base, engine, SessionLocal
 import models
-from routers import blogs, auth, users, members, chat, announcements, calendar, verification, notices, stats, checkins, activities, uploads, comments, notifications, likes, favorites
+from routers import blogs, auth, users, members, chat, announcements, calendar, verification, notices, stats, checkins, activities, uploads, comments, notifications, likes, favorites, admin
+from services import retention_service, storage_service, transcode_service, upload_service
 
 logger = logging.getLogger(__name__)
 
@@ -145,6 +147,21 @@ async def startup_event() -> None:
     for upload_dir in upload_dirs:
         upload_dir.mkdir(parents=True, exist_ok=True)
 
+    # 定期清理过期数据（多进程部署时建议只在一个实例上启用）
+    if settings.RETENTION_ENABLED:
+        asyncio.create_task(retention_service.retention_loop())
+
+    # 定期清理长时间没有新分块的断点续传会话
+    asyncio.create_task(upload_service.cleanup_loop())
+
+    # 重新提交上次退出时未完成的视频转码任务
+    transcode_service.resume_pending()
+
+
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    transcode_service.shutdown()
+
 
 # Create uploads directory before mounting static files
 Path("uploads").mkdir(exist_ok=True)
@@ -167,6 +184,17 @@ app.include_router(uploads.router)
 app.include_router(comments.router)
 app.include_router(notifications.router)
 app.include_router(likes.router)
+app.include_router(admin.router)
+
+class ImmutableStaticFiles(StaticFiles):
+    """内容寻址文件（路径含 SHA-256，内容永不改变）允许浏览器永久缓存"""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if storage_service.is_content_addressed(scope["path"]):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
 
 # Static file serving for uploaded files (avatars)
-app.mount("/static", StaticFiles(directory="uploads"), name="static")
+app.mount("/static", ImmutableStaticFiles(directory="uploads"), name="static")
@@ -0,0 +1,53 @@
+"""
+数据库迁移脚本：为 users 表添加广播通知水位线字段
+
+运行方式：
+    cd backend
+    python migrate_add_broadcast_watermarks.py
+
+broadcast_notifications 表由后端启动时的 create_all 自动创建。
+"""
+
+from database import SessionLocal, engine
+from sqlalchemy import inspect, text
+import sys
+
+NEW_COLUMNS = ["broadcast_read_id", "broadcast_cleared_id"]
+
+
+def migrate():
+    """执行迁移"""
+    db = SessionLocal()
+    try:
+        columns = [col["name"] for col in inspect(engine).get_columns("users")]
+
+        with db.begin():
+            for name in NEW_COLUMNS:
+                if name not in columns:
+                    print(f"添加 {name} 字段...")
+                    db.execute(text(
+                        f"ALTER TABLE users ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0"
+                    ))
+                else:
+                    print(f"{name} 字段已存在，跳过")
+
+        print("✅ 迁移成功！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("开始迁移：添加广播通知水位线")
+    print("=" * 50)
+
+    success = migrate()
+
+    if not success:
+        print("\n请检查错误信息并修复后重试")
+        sys.exit(1)
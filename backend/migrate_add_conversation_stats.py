@@ -0,0 +1,112 @@
+"""
+数据库迁移脚本：为 conversations 表添加对话列表冗余字段并回填
+
+运行方式：
+    cd backend
+    python migrate_add_conversation_stats.py
+
+新增 message_count / last_message_preview / last_message_at 三个字段和
+(user_id, updated_at) 索引，然后按批回填已有对话（可重复执行）。
+"""
+
+from database import SessionLocal, engine
+from sqlalchemy import inspect, text
+import sys
+
+NEW_COLUMNS = {
+    "message_count": "INTEGER NOT NULL DEFAULT 0",
+    "last_message_preview": "VARCHAR(100)",
+    "last_message_at": "DATETIME",
+}
+
+# 与 routers/chat.py 的 PREVIEW_CHARS 一致
+PREVIEW_CHARS = 50
+BATCH_SIZE = 500
+
+
+def backfill(db) -> int:
+    """按对话 ID 分批回填，每批单独提交；返回回填的对话数"""
+    total = 0
+    last_id = 0
+    while True:
+        ids = [row[0] for row in db.execute(text(
+            "SELECT id FROM conversations WHERE id > :last_id ORDER BY id LIMIT :limit"
+        ), {"last_id": last_id, "limit": BATCH_SIZE})]
+        if not ids:
+            return total
+
+        for conversation_id in ids:
+            count = db.execute(text(
+                "SELECT COUNT(*) FROM messages WHERE conversation_id = :id"
+            ), {"id": conversation_id}).scalar()
+            last = db.execute(text(
+                "SELECT content, created_at FROM messages WHERE conversation_id = :id "
+                "ORDER BY created_at DESC, id DESC LIMIT 1"
+            ), {"id": conversation_id}).first()
+
+            preview = None
+            last_message_at = None
+            if last is not None:
+                content = last[0] or ""
+                preview = content[:PREVIEW_CHARS] + "..." if len(content) > PREVIEW_CHARS else content
+                last_message_at = last[1]
+
+            db.execute(text(
+                "UPDATE conversations SET message_count = :count, last_message_preview = :preview, "
+                "last_message_at = :last_message_at WHERE id = :id"
+            ), {"count": count, "preview": preview, "last_message_at": last_message_at, "id": conversation_id})
+
+        db.commit()
+        total += len(ids)
+        last_id = ids[-1]
+        print(f"已回填 {total} 个对话...")
+
+
+def migrate():
+    """执行迁移"""
+    db = SessionLocal()
+    try:
+        inspector = inspect(engine)
+        columns = [col["name"] for col in inspector.get_columns("conversations")]
+        indexes = [index["name"] for index in inspector.get_indexes("conversations")]
+
+        with db.begin():
+            for name, definition in NEW_COLUMNS.items():
+                if name not in columns:
+                    print(f"添加 {name} 字段...")
+                    db.execute(text(f"ALTER TABLE conversations ADD COLUMN {name} {definition}"))
+                else:
+                    print(f"{name} 字段已存在，跳过")
+
+            if "idx_conversations_user_updated" not in indexes:
+                print("创建 idx_conversations_user_updated 索引...")
+                db.execute(text(
+                    "CREATE INDEX idx_conversations_user_updated ON conversations (user_id, updated_at)"
+                ))
+            else:
+                print("idx_conversations_user_updated 索引已存在，跳过")
+
+        print("回填对话消息数和最后消息预览...")
+        total = backfill(db)
+        print(f"共回填 {total} 个对话")
+
+        print("✅ 迁移成功！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("开始迁移：添加对话列表冗余字段")
+    print("=" * 50)
+
+    success = migrate()
+
+    if not success:
+        print("\n请检查错误信息并修复后重试")
+        sys.exit(1)
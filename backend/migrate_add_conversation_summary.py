@@ -0,0 +1,54 @@
+"""
+数据库迁移脚本：为 conversations 表添加上下文摘要字段
+
+运行方式：
+    cd backend
+    python migrate_add_conversation_summary.py
+
+已有对话无需回填：下次发送消息时会按 Token 预算增量生成摘要。
+"""
+
+from database import SessionLocal, engine
+from sqlalchemy import inspect, text
+import sys
+
+NEW_COLUMNS = {
+    "context_summary": "TEXT",
+    "summary_until_id": "INTEGER NOT NULL DEFAULT 0",
+}
+
+
+def migrate():
+    """执行迁移"""
+    db = SessionLocal()
+    try:
+        columns = [col["name"] for col in inspect(engine).get_columns("conversations")]
+
+        with db.begin():
+            for name, definition in NEW_COLUMNS.items():
+                if name not in columns:
+                    print(f"添加 {name} 字段...")
+                    db.execute(text(f"ALTER TABLE conversations ADD COLUMN {name} {definition}"))
+                else:
+                    print(f"{name} 字段已存在，跳过")
+
+        print("✅ 迁移成功！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("开始迁移：添加对话上下文摘要")
+    print("=" * 50)
+
+    success = migrate()
+
+    if not success:
+        print("\n请检查错误信息并修复后重试")
+        sys.exit(1)
@@ -0,0 +1,63 @@
+"""
+数据库迁移脚本：为消息历史读取添加复合索引
+
+运行方式：
+    cd backend
+    python migrate_add_message_indexes.py
+
+- messages (conversation_id, id)：按 ID 范围读取对话末尾的消息（上下文构建、历史分页）
+- messages (conversation_id, created_at)：按时间顺序读取 / 导出对话
+- conversations (user_id, updated_at)：对话列表（与 migrate_add_conversation_stats.py 相同，已存在时跳过）
+
+新建数据库由 create_all 自动创建这些索引；可重复执行。
+"""
+
+from database import SessionLocal, engine
+from sqlalchemy import inspect, text
+import sys
+
+INDEXES = [
+    ("messages", "idx_messages_conversation_id", "conversation_id, id"),
+    ("messages", "idx_messages_conversation_created", "conversation_id, created_at"),
+    ("conversations", "idx_conversations_user_updated", "user_id, updated_at"),
+]
+
+
+def migrate():
+    """执行迁移"""
+    db = SessionLocal()
+    try:
+        inspector = inspect(engine)
+        existing = {
+            table: [index["name"] for index in inspector.get_indexes(table)]
+            for table in {table for table, _, _ in INDEXES}
+        }
+
+        with db.begin():
+            for table, name, columns in INDEXES:
+                if name not in existing[table]:
+                    print(f"创建 {name} 索引...")
+                    db.execute(text(f"CREATE INDEX {name} ON {table} ({columns})"))
+                else:
+                    print(f"{name} 索引已存在，跳过")
+
+        print("✅ 迁移成功！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("开始迁移：添加消息历史索引")
+    print("=" * 50)
+
+    success = migrate()
+
+    if not success:
+        print("\n请检查错误信息并修复后重试")
+        sys.exit(1)
@@ -0,0 +1,82 @@
+"""
+数据库迁移脚本：建立对话消息全文检索索引
+
+运行方式：
+    cd backend
+    python migrate_add_message_search.py
+
+创建 message_search_terms 表（新建数据库由 create_all 自动创建），然后按消息 ID
+分批为已有消息建立索引。之后的消息由写入路径增量维护；可重复执行（逐条重建）。
+"""
+
+from database import SessionLocal, engine
+from sqlalchemy import inspect
+import sys
+
+import models
+from services import search_service
+
+BATCH_SIZE = 500
+
+
+def backfill(db) -> int:
+    """按消息 ID 分批建立索引，每批单独提交；返回处理的消息数"""
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.query(
+            models.Message.id,
+            models.Message.conversation_id,
+            models.Message.content,
+            models.Conversation.user_id,
+        ).join(
+            models.Conversation, models.Message.conversation_id == models.Conversation.id
+        ).filter(
+            models.Message.id > last_id
+        ).order_by(models.Message.id).limit(BATCH_SIZE).all()
+        if not rows:
+            return total
+
+        for message_id, conversation_id, content, user_id in rows:
+            search_service.index_message(db, message_id, user_id, conversation_id, content or "")
+
+        db.commit()
+        total += len(rows)
+        last_id = rows[-1][0]
+        print(f"已索引 {total} 条消息...")
+
+
+def migrate():
+    """执行迁移"""
+    db = SessionLocal()
+    try:
+        if "message_search_terms" not in inspect(engine).get_table_names():
+            print("创建 message_search_terms 表...")
+            models.MessageSearchTerm.__table__.create(bind=engine)
+        else:
+            print("message_search_terms 表已存在，跳过")
+
+        print("为已有消息建立检索索引...")
+        total = backfill(db)
+        print(f"共索引 {total} 条消息")
+
+        print("✅ 迁移成功！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("开始迁移：建立消息全文检索索引")
+    print("=" * 50)
+
+    success = migrate()
+
+    if not success:
+        print("\n请检查错误信息并修复后重试")
+        sys.exit(1)
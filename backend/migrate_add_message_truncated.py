@@ -0,0 +1,49 @@
+"""
+数据库迁移脚本：为 messages 表添加 truncated 字段
+
+运行方式：
+    cd backend
+    python migrate_add_message_truncated.py
+
+客户端在回答生成过程中断开时，只保存已发送的部分内容并标记 truncated。
+"""
+
+from database import SessionLocal, engine
+from sqlalchemy import inspect, text
+import sys
+
+
+def migrate():
+    """执行迁移"""
+    db = SessionLocal()
+    try:
+        columns = [col["name"] for col in inspect(engine).get_columns("messages")]
+
+        if "truncated" in columns:
+            print("truncated 字段已存在，跳过")
+            return True
+
+        with db.begin():
+            print("添加 truncated 字段...")
+            db.execute(text("ALTER TABLE messages ADD COLUMN truncated BOOLEAN NOT NULL DEFAULT 0"))
+
+        print("✅ 迁移成功！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("开始迁移：添加消息截断标记")
+    print("=" * 50)
+
+    success = migrate()
+
+    if not success:
+        print("\n请检查错误信息并修复后重试")
+        sys.exit(1)
@@ -0,0 +1,56 @@
+"""
+数据库迁移脚本：为 users 表添加未读通知计数字段，并按通知表回填
+
+运行方式：
+    cd backend
+    python migrate_add_notification_counter.py
+
+脚本可重复执行：字段已存在时仅重新校正计数（修复漂移）。
+"""
+
+from database import SessionLocal, engine
+from sqlalchemy import inspect, text
+import sys
+
+from services.notification_service import reconcile_unread_counts
+
+
+def migrate():
+    """执行迁移"""
+    db = SessionLocal()
+    try:
+        columns = [col["name"] for col in inspect(engine).get_columns("users")]
+
+        with db.begin():
+            if 'unread_notification_count' not in columns:
+                print("添加 unread_notification_count 字段...")
+                db.execute(text(
+                    "ALTER TABLE users ADD COLUMN unread_notification_count INTEGER NOT NULL DEFAULT 0"
+                ))
+            else:
+                print("unread_notification_count 字段已存在，跳过")
+
+        print("回填未读通知计数...")
+        repaired = reconcile_unread_counts(db)
+        print(f"已校正 {repaired} 个用户的计数")
+
+        print("✅ 迁移成功！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("开始迁移：添加未读通知计数器")
+    print("=" * 50)
+
+    success = migrate()
+
+    if not success:
+        print("\n请检查错误信息并修复后重试")
+        sys.exit(1)
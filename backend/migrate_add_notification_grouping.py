@@ -0,0 +1,70 @@
+"""
+数据库迁移脚本：为 notifications 表添加通知合并字段
+
+运行方式：
+    cd backend
+    python migrate_add_notification_grouping.py
+"""
+
+from database import SessionLocal, engine
+from sqlalchemy import inspect, text
+import sys
+
+NEW_COLUMNS = {
+    "group_key": "VARCHAR(100)",
+    "actor_count": "INTEGER NOT NULL DEFAULT 1",
+    "actors": "TEXT",
+    "actor_ids": "TEXT",
+    "last_event_at": "TIMESTAMP",
+}
+
+
+def migrate():
+    """执行迁移"""
+    db = SessionLocal()
+    try:
+        columns = [col["name"] for col in inspect(engine).get_columns("notifications")]
+
+        with db.begin():
+            for name, ddl in NEW_COLUMNS.items():
+                if name not in columns:
+                    print(f"添加 {name} 字段...")
+                    db.execute(text(f"ALTER TABLE notifications ADD COLUMN {name} {ddl}"))
+                else:
+                    print(f"{name} 字段已存在，跳过")
+
+            # 历史通知的最近事件时间即创建时间
+            result = db.execute(text(
+                "UPDATE notifications SET last_event_at = created_at WHERE last_event_at IS NULL"
+            ))
+            print(f"回填 last_event_at：{result.rowcount} 条")
+
+            db.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_notifications_user_group "
+                "ON notifications (user_id, group_key, is_read)"
+            ))
+            db.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_notifications_user_last_event "
+                "ON notifications (user_id, last_event_at)"
+            ))
+
+        print("✅ 迁移成功！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("开始迁移：添加通知合并字段")
+    print("=" * 50)
+
+    success = migrate()
+
+    if not success:
+        print("\n请检查错误信息并修复后重试")
+        sys.exit(1)
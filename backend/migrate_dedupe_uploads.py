@@ -0,0 +1,187 @@
+"""
+数据库迁移脚本：把已有上传文件改为内容寻址存储并去重
+
+运行方式：
+    cd backend
+    python migrate_dedupe_uploads.py
+
+逐个计算 uploads/blog/images 和 uploads/blog/videos 下旧文件（uuid 文件名）的 SHA-256，
+移动到 {前两位}/{sha256}{扩展名}，内容相同的文件只保留一份；图片版本和压缩视频一并改名。
+然后把博客正文、图片信息、转码任务和上传会话中的旧地址替换为新地址，并登记引用
+（上传者可从图片信息 / 转码任务 / 上传会话得知时记为该用户，否则记为未知）。
+
+stored_objects / object_references 表由后端启动时的 create_all 自动创建。
+每个文件处理完单独提交，已迁移的文件不在旧目录中，可重复执行。
+"""
+
+from pathlib import Path
+from typing import Optional
+import re
+import sys
+
+from sqlalchemy import func, inspect
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, engine
+import models
+from services import image_service, storage_service, transcode_service
+
+CATEGORIES = ("images", "videos")
+# 派生文件（图片版本 xxx-320w.webp、压缩视频 xxx-compressed.mp4）随原文件一起处理
+DERIVED_STEM = re.compile(rf"-(\d+w|{transcode_service.RENDITION_SUFFIX.lstrip('-')})$")
+
+
+def legacy_files(category: str) -> list[Path]:
+    """旧目录下直接存放的原文件（不含子目录中已迁移的文件和派生文件）"""
+    directory = storage_service.UPLOAD_ROOT / "blog" / category
+    if not directory.is_dir():
+        return []
+    return sorted(
+        path for path in directory.iterdir()
+        if path.is_file() and not DERIVED_STEM.search(path.stem)
+    )
+
+
+def derived_files(path: Path) -> list[Path]:
+    files = image_service.variant_files(path)
+    rendition = transcode_service.rendition_path(path)
+    if rendition.exists():
+        files.append(rendition)
+    return files
+
+
+def uploader(db: Session, url: str) -> Optional[int]:
+    """从已有记录推断上传者"""
+    for model, column in (
+        (models.ImageAsset, models.ImageAsset.url),
+        (models.TranscodeJob, models.TranscodeJob.source_url),
+        (models.UploadSession, models.UploadSession.url),
+    ):
+        row = db.query(model.user_id).filter(column == url).first()
+        if row is not None:
+            return row[0]
+    return None
+
+
+def replace_url(db: Session, old_url: str, new_url: str) -> None:
+    """把所有记录中的旧地址替换为新地址（不更新博客的 updated_at）"""
+    db.query(models.Blog).filter(models.Blog.content.contains(old_url)).update(
+        {
+            models.Blog.content: func.replace(models.Blog.content, old_url, new_url),
+            models.Blog.updated_at: models.Blog.updated_at,
+        },
+        synchronize_session=False
+    )
+    db.query(models.TranscodeJob).filter(models.TranscodeJob.source_url == old_url).update(
+        {models.TranscodeJob.source_url: new_url}, synchronize_session=False
+    )
+    db.query(models.TranscodeJob).filter(models.TranscodeJob.output_url == old_url).update(
+        {models.TranscodeJob.output_url: new_url}, synchronize_session=False
+    )
+    db.query(models.UploadSession).filter(models.UploadSession.url == old_url).update(
+        {models.UploadSession.url: new_url}, synchronize_session=False
+    )
+    db.query(models.ImageAsset).filter(models.ImageAsset.variants.contains(old_url)).update(
+        {models.ImageAsset.variants: func.replace(models.ImageAsset.variants, old_url, new_url)},
+        synchronize_session=False
+    )
+
+
+def migrate_file(db: Session, category: str, path: Path) -> bool:
+    """迁移一个旧文件，返回是否为重复内容"""
+    old_url = storage_service.to_url(path)
+    sha256 = storage_service.hash_file(path)
+    user_id = uploader(db, old_url)
+
+    stored = db.query(models.StoredObject).filter(models.StoredObject.sha256 == sha256).first()
+    duplicate = stored is not None
+    if stored is None:
+        new_path = storage_service.object_path(category, sha256, path.suffix.lower())
+        stored = models.StoredObject(
+            sha256=sha256, url=storage_service.to_url(new_path), size=path.stat().st_size, ref_count=0
+        )
+        db.add(stored)
+        db.flush()
+    else:
+        new_path = storage_service.url_to_path(stored.url)
+    new_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # 图片信息：重复内容已有记录时删除旧记录，否则改用新地址
+    if db.query(models.ImageAsset).filter(models.ImageAsset.url == stored.url).count():
+        db.query(models.ImageAsset).filter(models.ImageAsset.url == old_url).delete(synchronize_session=False)
+    else:
+        db.query(models.ImageAsset).filter(models.ImageAsset.url == old_url).update(
+            {models.ImageAsset.url: stored.url}, synchronize_session=False
+        )
+
+    # 派生文件按新文件名改名（目标已存在时说明是重复内容，直接删除）
+    for derived in derived_files(path):
+        target = new_path.with_name(sha256 + derived.name.removeprefix(path.stem))
+        replace_url(db, storage_service.to_url(derived), storage_service.to_url(target))
+        if target.exists():
+            derived.unlink()
+        else:
+            derived.rename(target)
+    replace_url(db, old_url, stored.url)
+
+    db.add(models.ObjectReference(object_id=stored.id, user_id=user_id))
+    db.query(models.StoredObject).filter(models.StoredObject.id == stored.id).update(
+        {models.StoredObject.ref_count: models.StoredObject.ref_count + 1},
+        synchronize_session=False
+    )
+
+    if duplicate and new_path.exists():
+        path.unlink()
+    else:
+        path.rename(new_path)
+    db.commit()
+    return duplicate
+
+
+def migrate():
+    """执行迁移"""
+    db = SessionLocal()
+    try:
+        existing = inspect(engine).get_table_names()
+        for model in (models.StoredObject, models.ObjectReference):
+            if model.__tablename__ not in existing:
+                print(f"创建 {model.__tablename__} 表...")
+                model.__table__.create(bind=engine)
+
+        for category in CATEGORIES:
+            files = legacy_files(category)
+            duplicates = 0
+            saved = 0
+            for index, path in enumerate(files, start=1):
+                size = path.stat().st_size
+                if migrate_file(db, category, path):
+                    duplicates += 1
+                    saved += size
+                if index % 100 == 0:
+                    print(f"{category}: 已处理 {index}/{len(files)} 个文件...")
+            print(
+                f"{category}: 迁移 {len(files)} 个文件，其中重复 {duplicates} 个，"
+                f"节省 {saved / 1024 / 1024:.1f}MB"
+            )
+
+        print("✅ 迁移成功！")
+        return True
+
+    except Exception as e:
+        db.rollback()
+        print(f"❌ 迁移失败: {e}")
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print("=" * 50)
+    print("开始迁移：上传文件改为内容寻址存储并去重")
+    print("=" * 50)
+
+    success = migrate()
+
+    if not success:
+        print("\n请检查错误信息并修复后重试")
+        sys.exit(1)
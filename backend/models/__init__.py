@@ -9,8 +9,16 @@ from .notice import Notice
 from .checkin import CheckIn
 from .comment import Comment
 from .notification import Notification
+from .broadcast_notification import BroadcastNotification
 from .like import Like
 from .favorite_folder import FavoriteFolder
 from .favorite import Favorite
+from .ai_usage import AIUsage
+from .message_search import MessageSearchTerm
+from .message_version import MessageVersion
+from .transcode_job import TranscodeJob
+from .image_asset import ImageAsset
+from .upload_session import UploadSession, UploadChunk
+from .stored_object import StoredObject, ObjectReference
 
-__all__ = ["User", "Blog", "Conversation", "Message", "Announcement", "CalendarEvent", "VerificationCode", "Notice", "CheckIn", "Comment", "Notification", "Like", "FavoriteFolder", "Favorite"]
+__all__ = ["User", "Blog", "Conversation", "Message", "Announcement", "CalendarEvent", "VerificationCode", "Notice", "CheckIn", "Comment", "Notification", "BroadcastNotification", "Like", "FavoriteFolder", "Favorite", "AIUsage", "MessageSearchTerm", "MessageVersion", "TranscodeJob", "ImageAsset", "UploadSession", "UploadChunk", "StoredObject", "ObjectReference"]
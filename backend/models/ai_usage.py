@@ -0,0 +1,25 @@
+from datetime import date, datetime
+from sqlalchemy import Column, Date, DateTime, ForeignKey, Integer, String, Index
+
+from database import Base
+
+
+class AIUsage(Base):
+    """AI 用量台账：每个用户每天、每个服务商和模型一行，调用结束后累加"""
+    __tablename__ = "ai_usage_daily"
+
+    id: int = Column(Integer, primary_key=True, index=True)
+    user_id: int = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    day: date = Column(Date, nullable=False)  # UTC 日期
+    provider: str = Column(String(50), nullable=False)  # openai / anthropic / ...（服务商未知时为 unknown）
+    model: str = Column(String(100), nullable=False, default="")
+    requests: int = Column(Integer, nullable=False, default=0)
+    prompt_tokens: int = Column(Integer, nullable=False, default=0)
+    completion_tokens: int = Column(Integer, nullable=False, default=0)
+    updated_at: datetime = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # 索引
+    __table_args__ = (
+        Index('idx_ai_usage_user_day_model', 'user_id', 'day', 'provider', 'model', unique=True),
+        Index('idx_ai_usage_day', 'day'),
+    )
@@ -0,0 +1,28 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, String, Index
+
+from database import Base
+
+
+class BroadcastNotification(Base):
+    """广播通知：全班可见，只存一行，读取时合并进每个用户的通知列表
+
+    每个用户的已读/已清除状态由 users.broadcast_read_id / broadcast_cleared_id
+    水位线表示（id 不大于水位线即视为已读/已清除）。
+    """
+    __tablename__ = "broadcast_notifications"
+
+    id: int = Column(Integer, primary_key=True, index=True)
+    type: str = Column(String(50), nullable=False)  # notice_published
+    title: str = Column(String(200), nullable=False)
+    content: str = Column(String(1000), nullable=False)
+    related_type: str = Column(String(50), nullable=True)  # notice
+    related_id: int = Column(Integer, nullable=True)
+    related_url: str = Column(String(500), nullable=True)
+    created_at: datetime = Column(DateTime(timezone=True), default=datetime.utcnow)
+
+    # 索引
+    __table_args__ = (
+        Index('idx_broadcast_created_at', 'created_at'),
+        Index('idx_broadcast_related', 'related_type', 'related_id'),
+    )
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.orm import relationship
 
 from database import Base
@@ -14,6 +14,20 @@ class Conversation(Base):
     created_at: datetime = Column(DateTime(timezone=True), default=datetime.utcnow)
     updated_at: datetime = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # 上下文摘要：summary_until_id 及之前的消息已合并进 context_summary（见 services/context_service.py）
+    context_summary: str = Column(Text, nullable=True)
+    summary_until_id: int = Column(Integer, nullable=False, default=0, server_default="0")
+
+    # 对话列表使用的冗余字段，由消息写入路径维护（见 routers/chat.py 的 update_conversation_stats）
+    message_count: int = Column(Integer, nullable=False, default=0, server_default="0")
+    last_message_preview: str = Column(String(100), nullable=True)
+    last_message_at: datetime = Column(DateTime(timezone=True), nullable=True)
+
     # 关系
     user = relationship("User", back_populates="conversations")
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
+
+    # 索引：对话列表按用户过滤、按更新时间倒序
+    __table_args__ = (
+        Index('idx_conversations_user_updated', 'user_id', 'updated_at'),
+    )
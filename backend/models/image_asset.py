@@ -0,0 +1,20 @@
+from datetime import datetime
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Integer, String, Text
+
+from database import Base
+
+
+class ImageAsset(Base):
+    """上传图片的尺寸、模糊占位图和多尺寸版本（上传时生成一次）"""
+    __tablename__ = "image_assets"
+
+    id: int = Column(Integer, primary_key=True, index=True)
+    user_id: int = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    url: str = Column(String(255), nullable=False, unique=True, index=True)  # 原图访问地址
+    format: str = Column(String(10), nullable=False)  # 原图格式：jpeg / png / gif / webp
+    width: int = Column(Integer, nullable=False)
+    height: int = Column(Integer, nullable=False)
+    size: int = Column(BigInteger, nullable=False, default=0)
+    placeholder: str | None = Column(Text, nullable=True)  # 模糊占位图 data URI
+    variants: str = Column(Text, nullable=False, default="{}")  # 多尺寸版本 JSON：{"webp": [{"width", "height", "url", "size"}], ...}
+    created_at: datetime = Column(DateTime(timezone=True), default=datetime.utcnow)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.orm import relationship
 
 from database import Base
@@ -14,7 +14,15 @@ class Message(Base):
     content: str = Column(Text, nullable=False)
     tokens_used: int | None = Column(Integer, nullable=True)  # AI消息使用的Token数
     feedback: str | None = Column(String(20), nullable=True)  # 'helpful', 'not_helpful', or NULL
+    truncated: bool = Column(Boolean, nullable=False, default=False, server_default="0")  # 客户端中途断开，只保存了部分回答
     created_at: datetime = Column(DateTime(timezone=True), default=datetime.utcnow)
 
     # 关系
     conversation = relationship("Conversation", back_populates="messages")
+    versions = relationship("MessageVersion", back_populates="message", cascade="all, delete-orphan")
+
+    # 索引：按对话读取历史时只扫描该对话的一段 ID / 时间范围
+    __table_args__ = (
+        Index('idx_messages_conversation_id', 'conversation_id', 'id'),
+        Index('idx_messages_conversation_created', 'conversation_id', 'created_at'),
+    )
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, ForeignKey, Index, Integer, String
+
+from database import Base
+
+
+class MessageSearchTerm(Base):
+    """
+    消息全文检索的倒排索引：每条消息的每个不同词项一行（见 services/search_service.py）
+
+    按用户划分，检索只扫描当前用户、查询词项对应的索引段，不对消息内容做 LIKE 扫描。
+    """
+    __tablename__ = "message_search_terms"
+
+    id: int = Column(Integer, primary_key=True, index=True)
+    user_id: int = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    term: str = Column(String(32), nullable=False)  # 英文单词 / 数字，或中日韩文字的单字、相邻两字
+    message_id: int = Column(Integer, ForeignKey("messages.id", ondelete="CASCADE"), nullable=False)
+    conversation_id: int = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
+    tf: int = Column(Integer, nullable=False, default=1)  # 词项在消息中出现的次数
+
+    # 索引：(user_id, term) 前缀用于检索，包含 message_id / tf 后无需回表；
+    # message_id / conversation_id 用于消息更新和对话删除时清理
+    __table_args__ = (
+        Index('idx_message_search_user_term', 'user_id', 'term', 'message_id', 'tf'),
+        Index('idx_message_search_message', 'message_id'),
+        Index('idx_message_search_conversation', 'conversation_id'),
+    )
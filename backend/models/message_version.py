@@ -0,0 +1,25 @@
+from datetime import datetime
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, Text
+from sqlalchemy.orm import relationship
+
+from database import Base
+
+
+class MessageVersion(Base):
+    """AI 消息被重新生成前的历史版本（新回答开始生成时保存，生成失败时恢复）"""
+    __tablename__ = "message_versions"
+
+    id: int = Column(Integer, primary_key=True, index=True)
+    message_id: int = Column(Integer, ForeignKey("messages.id", ondelete="CASCADE"), nullable=False)
+    content: str = Column(Text, nullable=False)
+    tokens_used: int | None = Column(Integer, nullable=True)
+    truncated: bool = Column(Boolean, nullable=False, default=False, server_default="0")
+    created_at: datetime = Column(DateTime(timezone=True), default=datetime.utcnow)  # 被替换的时间
+
+    # 关系
+    message = relationship("Message", back_populates="versions")
+
+    # 索引
+    __table_args__ = (
+        Index('idx_message_versions_message_id', 'message_id', 'id'),
+    )
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Boolean, Index
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Boolean, Index, Text
 from sqlalchemy.orm import relationship
 
 from database import Base
@@ -19,6 +19,13 @@ class Notification(Base):
     is_read: bool = Column(Boolean, default=False, nullable=False)
     created_at: datetime = Column(DateTime(timezone=True), default=datetime.utcnow)
 
+    # 通知合并（"A 等 13 人点赞了你的博客"）
+    group_key: str = Column(String(100), nullable=True)  # type:对象类型:对象ID，NULL 表示不合并
+    actor_count: int = Column(Integer, default=1, nullable=False, server_default="1")  # 触发者去重人数
+    actors: str = Column(Text, nullable=True)  # 最近触发者 JSON：[{"id": 1, "name": "张三"}]
+    actor_ids: str = Column(Text, nullable=True)  # 全部触发者 ID JSON（去重计数用）：[1, 2, 3]
+    last_event_at: datetime = Column(DateTime(timezone=True), default=datetime.utcnow)  # 最近一次事件时间
+
     # 关系
     user = relationship("User", back_populates="notifications")
 
@@ -28,4 +35,6 @@ class Notification(Base):
         Index('idx_notifications_is_read', 'is_read'),
         Index('idx_notifications_created_at', 'created_at'),
         Index('idx_notifications_user_read', 'user_id', 'is_read'),
+        Index('idx_notifications_user_group', 'user_id', 'group_key', 'is_read'),
+        Index('idx_notifications_user_last_event', 'user_id', 'last_event_at'),
     )
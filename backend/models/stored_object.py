@@ -0,0 +1,31 @@
+from datetime import datetime
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Index, Integer, String
+
+from database import Base
+
+
+class StoredObject(Base):
+    """按内容寻址的上传文件：相同内容只保存一份，路径由 SHA-256 决定"""
+    __tablename__ = "stored_objects"
+
+    id: int = Column(Integer, primary_key=True, index=True)
+    sha256: str = Column(String(64), nullable=False, unique=True, index=True)
+    url: str = Column(String(255), nullable=False, unique=True)  # /static/blog/images/ab/{sha256}.jpg
+    size: int = Column(BigInteger, nullable=False)
+    ref_count: int = Column(Integer, nullable=False, default=0)  # 引用数（冗余，等于 object_references 行数）
+    created_at: datetime = Column(DateTime(timezone=True), default=datetime.utcnow)
+
+
+class ObjectReference(Base):
+    """一次上传对文件的引用；删除媒体时只释放自己的引用，引用归零才删除文件"""
+    __tablename__ = "object_references"
+
+    id: int = Column(Integer, primary_key=True, index=True)
+    object_id: int = Column(Integer, ForeignKey("stored_objects.id", ondelete="CASCADE"), nullable=False)
+    user_id: int | None = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)  # 迁移的历史文件上传者未知
+    created_at: datetime = Column(DateTime(timezone=True), default=datetime.utcnow)
+
+    # 索引
+    __table_args__ = (
+        Index('idx_object_references_object_user', 'object_id', 'user_id'),
+    )
@@ -0,0 +1,29 @@
+from datetime import datetime
+from sqlalchemy import BigInteger, Column, DateTime, Float, ForeignKey, Index, Integer, String, Text
+
+from database import Base
+
+
+class TranscodeJob(Base):
+    """上传视频的后台转码任务（完成后博客中的原视频地址替换为压缩版本）"""
+    __tablename__ = "transcode_jobs"
+
+    id: int = Column(Integer, primary_key=True, index=True)
+    user_id: int = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    status: str = Column(String(20), nullable=False, default="queued")  # queued / running / completed / failed
+    progress: float = Column(Float, nullable=False, default=0.0)  # 0-100，按 FFmpeg 已处理时长 / 视频总时长计算
+    source_url: str = Column(String(255), nullable=False)  # 原始上传文件的访问地址
+    output_url: str | None = Column(String(255), nullable=True)  # 压缩版本的访问地址
+    source_size: int = Column(BigInteger, nullable=False, default=0)
+    output_size: int | None = Column(BigInteger, nullable=True)
+    duration: float | None = Column(Float, nullable=True)  # 视频时长（秒）
+    error: str | None = Column(Text, nullable=True)
+    created_at: datetime = Column(DateTime(timezone=True), default=datetime.utcnow)
+    started_at: datetime | None = Column(DateTime(timezone=True), nullable=True)
+    finished_at: datetime | None = Column(DateTime(timezone=True), nullable=True)
+
+    # 索引
+    __table_args__ = (
+        Index('idx_transcode_jobs_source_url', 'source_url'),
+        Index('idx_transcode_jobs_status', 'status'),
+    )
@@ -0,0 +1,48 @@
+from datetime import datetime
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Index, Integer, String
+from sqlalchemy.orm import relationship
+
+from database import Base
+
+
+class UploadSession(Base):
+    """断点续传会话：客户端分块上传到预分配的临时文件，全部到达后合并为正式视频"""
+    __tablename__ = "upload_sessions"
+
+    id: str = Column(String(32), primary_key=True)  # 随机 ID，同时作为临时文件名
+    user_id: int = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    filename: str = Column(String(255), nullable=False)
+    content_type: str = Column(String(100), nullable=False)
+    size: int = Column(BigInteger, nullable=False)  # 文件总大小（字节）
+    chunk_size: int = Column(Integer, nullable=False)  # 除最后一块外每块的大小
+    status: str = Column(String(20), nullable=False, default="uploading")  # uploading / completing / completed
+    url: str | None = Column(String(255), nullable=True)  # 完成后的视频地址
+    job_id: int | None = Column(Integer, nullable=True)  # 完成后创建的转码任务
+    created_at: datetime = Column(DateTime(timezone=True), default=datetime.utcnow)
+    expires_at: datetime = Column(DateTime(timezone=True), nullable=False)  # 每收到一块顺延
+
+    # 关系
+    chunks = relationship("UploadChunk", cascade="all, delete-orphan")
+
+    # 索引
+    __table_args__ = (
+        Index('idx_upload_sessions_user_status', 'user_id', 'status'),
+        Index('idx_upload_sessions_expires_at', 'expires_at'),
+    )
+
+
+class UploadChunk(Base):
+    """已写入并通过校验的分块"""
+    __tablename__ = "upload_chunks"
+
+    id: int = Column(Integer, primary_key=True, index=True)
+    session_id: str = Column(String(32), ForeignKey("upload_sessions.id", ondelete="CASCADE"), nullable=False)
+    index: int = Column(Integer, nullable=False)  # 分块序号（偏移量 / chunk_size）
+    size: int = Column(Integer, nullable=False)
+    sha256: str = Column(String(64), nullable=False)
+    created_at: datetime = Column(DateTime(timezone=True), default=datetime.utcnow)
+
+    # 索引
+    __table_args__ = (
+        Index('idx_upload_chunks_session_index', 'session_id', 'index', unique=True),
+    )
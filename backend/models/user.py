@@ -17,6 +17,9 @@ class User(Base):
     class_field: str = Column(String(100), nullable=True)  # 班级/学校（class 是 Python 关键字）
     bio: str = Column(String(200), nullable=True)
     role: str = Column(String(20), nullable=False, default="student")
+    unread_notification_count: int = Column(Integer, nullable=False, default=0, server_default="0")  # 未读通知数（冗余计数器）
+    broadcast_read_id: int = Column(Integer, nullable=False, default=0, server_default="0")  # 广播通知已读水位线
+    broadcast_cleared_id: int = Column(Integer, nullable=False, default=0, server_default="0")  # 广播通知已清除水位线
     created_at: datetime = Column(DateTime(timezone=True), default=datetime.utcnow)
     updated_at: datetime = Column(DateTime(timezone=True), onupdate=datetime.utcnow)
 
@@ -0,0 +1,101 @@
+# 管理员运维相关路由
+
+import asyncio
+from datetime import date, datetime
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+import dependencies, schemas
+from services import ai_service, response_cache, retention_service, usage_service
+from services.ai_metrics import latency_metrics
+
+router = APIRouter(prefix="/api/admin", tags=["管理"])
+
+
+@router.post("/retention/run", response_model=schemas.RetentionRunResponse)
+async def run_retention(
+    current_user: dependencies.CurrentUser,
+    dry_run: bool = Query(True, description="仅预览将删除的行数，不实际删除")
+):
+    """执行数据清理（管理员，默认 dry-run）"""
+    dependencies.require_role(current_user, {"admin"})
+
+    # 分批删除可能耗时较长，放到线程中执行
+    reports = await asyncio.to_thread(retention_service.run_retention_job, dry_run)
+
+    return schemas.RetentionRunResponse(
+        dry_run=dry_run,
+        total_rows=sum(report["rows"] for report in reports),
+        seconds=round(sum(report["seconds"] for report in reports), 3),
+        reports=reports
+    )
+
+
+@router.get("/ai/cache", response_model=schemas.ResponseCacheStats)
+async def get_response_cache_stats(current_user: dependencies.CurrentUser):
+    """查看 AI 回复缓存的命中统计（管理员）"""
+    dependencies.require_role(current_user, {"admin"})
+    return response_cache.get_stats()
+
+
+@router.delete("/ai/cache", response_model=schemas.ResponseCacheStats)
+async def clear_response_cache(current_user: dependencies.CurrentUser):
+    """清空 AI 回复缓存及统计（管理员）"""
+    dependencies.require_role(current_user, {"admin"})
+    response_cache.clear()
+    return response_cache.get_stats()
+
+
+@router.get("/ai/providers", response_model=list[schemas.AIProviderStatus])
+async def get_ai_provider_status(current_user: dependencies.CurrentUser):
+    """查看各 AI 服务商的错误率、首字延迟和熔断状态（管理员）"""
+    dependencies.require_role(current_user, {"admin"})
+    return ai_service.get_status()
+
+
+@router.get("/ai/latency", response_model=schemas.AILatencyReport)
+async def get_ai_latency(current_user: dependencies.CurrentUser):
+    """查看 AI 调用延迟：排队时间、首字延迟、生成速度、失败类型和降级原因（管理员）"""
+    dependencies.require_role(current_user, {"admin"})
+    return latency_metrics.snapshot()
+
+
+@router.get("/ai/metrics", response_class=PlainTextResponse)
+async def get_ai_metrics(current_user: dependencies.CurrentUser):
+    """AI 调用延迟统计的 Prometheus 文本格式（管理员，抓取时携带管理员 Token）"""
+    dependencies.require_role(current_user, {"admin"})
+    return PlainTextResponse(latency_metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/ai/usage", response_model=schemas.AIUsageReport)
+async def get_ai_usage(
+    current_user: dependencies.CurrentUser,
+    db: dependencies.DbSession,
+    start: Optional[date] = Query(None, description="开始日期（含，默认本月 1 日）"),
+    end: Optional[date] = Query(None, description="结束日期（含，默认今天）"),
+    user_id: Optional[int] = Query(None, description="只看某个用户")
+):
+    """按用户、服务商和模型汇总 AI Token 用量（管理员）"""
+    dependencies.require_role(current_user, {"admin"})
+
+    today = datetime.utcnow().date()
+    end = end or today
+    start = start or end.replace(day=1)
+    if start > end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="开始日期不能晚于结束日期"
+        )
+
+    items = usage_service.aggregate_usage(db, start, end, user_id)
+    return schemas.AIUsageReport(
+        start=start,
+        end=end,
+        requests=sum(item["requests"] for item in items),
+        prompt_tokens=sum(item["prompt_tokens"] for item in items),
+        completion_tokens=sum(item["completion_tokens"] for item in items),
+        total_tokens=sum(item["total_tokens"] for item in items),
+        items=items
+    )
@@ -8,6 +8,7 @@ from typing import Optional
 
 import dependencies, models, schemas, auth
 from models.activity import Activity
+from services import transcode_service
 
 router = APIRouter(prefix="/api/blogs", tags=["博客"])
 
@@ -237,10 +238,10 @@ async def create_blog(
             detail=f"博客中的媒体文件总大小不能超过2GB（当前{size_mb:.1f}MB）"
         )
 
-    # 创建博客
+    # 创建博客（已压缩完成的视频改用压缩版本）
     blog = models.Blog(
         title=blog_data.title,
-        content=blog_data.content,
+        content=transcode_service.apply_renditions(db, blog_data.content),
         status=blog_data.status,
         author_id=current_user.id,
         author_name=current_user.nickname or current_user.username
@@ -331,7 +332,7 @@ async def update_blog(
     if blog_data.title is not None:
         blog.title = blog_data.title
     if blog_data.content is not None:
-        blog.content = blog_data.content
+        blog.content = transcode_service.apply_renditions(db, blog_data.content)
     if blog_data.status is not None:
         blog.status = blog_data.status
 
@@ -1,20 +1,35 @@
 # AI对话相关路由
 
+import asyncio
+import hashlib
 import json
 import logging
+import time
 from datetime import datetime
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func
 
 import dependencies, models, schemas, auth
-from services import ai_service
+from config import settings
+from services import ai_service, context_service, export_service, response_cache, search_service, stream_registry, usage_service
+from services.ai_limiter import QueueFullError, Ticket, ai_limiter
+from services.ai_metrics import track_request
+from services.ai_service import StreamInterrupted, current_usage, track_usage
+from services.streaming import coalesce_deltas
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/chat", tags=["AI对话"])
 
+# 排队中的流式请求多久检查一次排队位置（秒）
+QUEUE_POSITION_INTERVAL = 1.0
+
+# 对话列表中最后一条消息预览的最大字数
+PREVIEW_CHARS = 50
+
 
 def generate_conversation_title(content: str) -> str:
     """Generate a compact local title from the user's first message."""
@@ -27,6 +42,48 @@ def generate_conversation_title(content: str) -> str:
     return title or "新对话"
 
 
+def message_preview(content: str) -> str:
+    """对话列表中的最后一条消息预览"""
+    return content[:PREVIEW_CHARS] + "..." if len(content) > PREVIEW_CHARS else content
+
+
+def update_conversation_stats(
+    db: Session,
+    conversation_id: int,
+    added: int = 0,
+    last_content: Optional[str] = None
+) -> None:
+    """
+    维护对话列表使用的冗余字段（由调用方提交）
+
+    按 ID 直接更新，不依赖请求会话中的 Conversation 对象（流式响应开始后该对象已脱离会话）。
+
+    Args:
+        added: 新增的消息条数
+        last_content: 对话最后一条消息的内容（用作预览，同时更新最后消息时间）
+    """
+    values = {}
+    if added:
+        values[models.Conversation.message_count] = models.Conversation.message_count + added
+    if last_content is not None:
+        values[models.Conversation.last_message_preview] = message_preview(last_content)
+        values[models.Conversation.last_message_at] = datetime.utcnow()
+    if values:
+        values[models.Conversation.updated_at] = datetime.utcnow()
+        db.query(models.Conversation).filter(
+            models.Conversation.id == conversation_id
+        ).update(values, synchronize_session=False)
+
+
+@router.get("/usage", response_model=schemas.AIUsageSummary)
+async def get_my_usage(
+    current_user: dependencies.CurrentUser,
+    db: dependencies.DbSession
+):
+    """查看自己的 AI 用量与配额"""
+    return usage_service.get_user_usage(db, current_user.id)
+
+
 # ============= Conversation 接口 =============
 
 @router.get("/conversations", response_model=schemas.ConversationListResponse)
@@ -50,41 +107,31 @@ async def list_conversations(
         if q:
             query = query.filter(models.Conversation.title.contains(q))
 
-        # 统计总数
-        total = query.count()
-
-        # 按更新时间倒序，分页查询
-        conversations = query.order_by(
-            models.Conversation.updated_at.desc()
+        # 按更新时间倒序分页；总数由窗口函数在同一条查询中返回
+        rows = query.add_columns(func.count(models.Conversation.id).over()).order_by(
+            models.Conversation.updated_at.desc(),
+            models.Conversation.id.desc()
         ).offset((page - 1) * size).limit(size).all()
 
-        # 构造响应
-        items = []
-        for conv in conversations:
-            # 获取最后一条消息
-            last_message = db.query(models.Message).filter(
-                models.Message.conversation_id == conv.id
-            ).order_by(models.Message.created_at.desc()).first()
-
-            # 生成最后消息预览（最多50字）
-            last_msg_preview = None
-            if last_message:
-                content = last_message.content
-                last_msg_preview = content[:50] + "..." if len(content) > 50 else content
-
-            # 统计消息数量
-            message_count = db.query(func.count(models.Message.id)).filter(
-                models.Message.conversation_id == conv.id
-            ).scalar()
-
-            items.append(schemas.ConversationListItem(
+        if rows:
+            total = rows[0][1]
+        else:
+            # 页码超出范围时没有返回行，单独统计总数
+            total = query.count() if page > 1 else 0
+
+        # 消息数量和最后消息预览已冗余在对话上，无需逐个查询消息表
+        items = [
+            schemas.ConversationListItem(
                 id=conv.id,
                 title=conv.title,
-                last_message=last_msg_preview,
-                message_count=message_count or 0,
+                last_message=conv.last_message_preview,
+                message_count=conv.message_count,
+                last_message_at=conv.last_message_at,
                 created_at=conv.created_at,
                 updated_at=conv.updated_at
-            ))
+            )
+            for conv, _ in rows
+        ]
 
         return schemas.ConversationListResponse(
             total=total,
@@ -151,15 +198,10 @@ async def get_conversation(
             detail="无权限访问此对话"
         )
 
-    # 统计消息数量
-    message_count = db.query(func.count(models.Message.id)).filter(
-        models.Message.conversation_id == conversation_id
-    ).scalar()
-
     return schemas.ConversationRead(
         id=conversation.id,
         title=conversation.title,
-        message_count=message_count or 0,
+        message_count=conversation.message_count,
         created_at=conversation.created_at,
         updated_at=conversation.updated_at
     )
@@ -195,15 +237,10 @@ async def update_conversation(
     db.commit()
     db.refresh(conversation)
 
-    # 统计消息数量
-    message_count = db.query(func.count(models.Message.id)).filter(
-        models.Message.conversation_id == conversation_id
-    ).scalar()
-
     return schemas.ConversationRead(
         id=conversation.id,
         title=conversation.title,
-        message_count=message_count or 0,
+        message_count=conversation.message_count,
         created_at=conversation.created_at,
         updated_at=conversation.updated_at
     )
@@ -233,7 +270,8 @@ async def delete_conversation(
             detail="无权限删除此对话"
         )
 
-    # 删除对话（级联删除消息）
+    # 删除对话（级联删除消息），同时清理消息的检索索引
+    search_service.remove_conversation(db, conversation_id)
     db.delete(conversation)
     db.commit()
 
@@ -248,7 +286,9 @@ async def list_messages(
     current_user: dependencies.CurrentUser,
     db: dependencies.DbSession,
     page: int = Query(1, ge=1, description="页码"),
-    size: int = Query(50, ge=1, le=100, description="每页数量")
+    size: int = Query(50, ge=1, le=100, description="每页数量"),
+    tail: bool = Query(False, description="加载最新的 size 条消息（忽略 page）"),
+    before_id: Optional[int] = Query(None, ge=1, description="加载 ID 小于该值的最新 size 条消息（向前翻页）")
 ):
     """获取对话的消息列表"""
     # 验证对话存在且属于当前用户
@@ -268,18 +308,24 @@ async def list_messages(
             detail="无权限访问此对话"
         )
 
-    # 查询消息
-    query = db.query(models.Message).filter(
-        models.Message.conversation_id == conversation_id
-    )
-
-    # 统计总数
-    total = query.count()
-
-    # 按时间正序，分页查询
-    messages = query.order_by(
-        models.Message.created_at.asc()
-    ).offset((page - 1) * size).limit(size).all()
+    # 消息总数已冗余在对话上
+    total = conversation.message_count
+    next_before_id = None
+
+    if tail or before_id is not None:
+        # 按 ID 倒序读取末尾一段（多取一条判断是否还有更早的消息），不随对话长度变慢
+        messages = context_service.load_tail(db, conversation_id, size + 1, before_id=before_id)
+        if len(messages) > size:
+            messages = messages[:size]
+            next_before_id = messages[-1].id
+        messages.reverse()
+    else:
+        # 按时间正序，分页查询
+        messages = db.query(models.Message).filter(
+            models.Message.conversation_id == conversation_id
+        ).order_by(
+            models.Message.created_at.asc(), models.Message.id.asc()
+        ).offset((page - 1) * size).limit(size).all()
 
     # 构造响应
     items = [
@@ -288,12 +334,47 @@ async def list_messages(
             role=msg.role,
             content=msg.content,
             tokens_used=msg.tokens_used,
+            truncated=msg.truncated,
             created_at=msg.created_at
         )
         for msg in messages
     ]
 
     return schemas.MessageListResponse(
+        total=total,
+        page=page,
+        size=size,
+        items=items,
+        next_before_id=next_before_id
+    )
+
+
+@router.get("/search", response_model=schemas.MessageSearchResponse)
+async def search_messages(
+    current_user: dependencies.CurrentUser,
+    db: dependencies.DbSession,
+    q: str = Query(..., min_length=1, max_length=100, description="搜索关键词"),
+    page: int = Query(1, ge=1, description="页码"),
+    size: int = Query(20, ge=1, le=50, description="每页数量")
+):
+    """在自己的所有对话中检索消息内容（按相关度排序）"""
+    total, results = search_service.search_messages(db, current_user.id, q, page, size)
+    terms = search_service.query_terms(q)
+
+    items = [
+        schemas.MessageSearchItem(
+            message_id=message.id,
+            conversation_id=message.conversation_id,
+            conversation_title=title,
+            role=message.role,
+            snippet=search_service.make_snippet(message.content, terms),
+            score=round(score, 4),
+            created_at=message.created_at
+        )
+        for message, title, score in results
+    ]
+
+    return schemas.MessageSearchResponse(
         total=total,
         page=page,
         size=size,
@@ -301,10 +382,75 @@ async def list_messages(
     )
 
 
+def format_sse(data: str, event: Optional[str] = None, event_id: Optional[int] = None) -> str:
+    """格式化一帧 SSE 数据"""
+    frame = ""
+    if event_id is not None:
+        frame += f"id: {event_id}\n"
+    if event:
+        frame += f"event: {event}\n"
+    return frame + f"data: {data}\n\n"
+
+
+def acquire_ai_ticket(user_id: int) -> Ticket:
+    """申请 AI 调用名额，排队人数已满时返回 429"""
+    try:
+        return ai_limiter.enqueue(user_id)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="AI 服务繁忙，请稍后重试",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+
+def check_ai_quota(db: Session, user_id: int) -> None:
+    """调用 AI 前检查用量配额，已达上限时返回 429"""
+    try:
+        usage_service.check_quota(db, user_id)
+    except usage_service.QuotaExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+
+async def build_ai_context(db: Session, conversation_id: int, before_id: Optional[int] = None) -> list[dict]:
+    """
+    按 Token 预算构造上下文：最近的消息 + 较早内容的摘要（摘要更新后提交）
+
+    在检查配额并获得 AI 调用名额之后调用：生成 AI 摘要本身也是一次 AI 调用，
+    超出配额或仍在排队的请求不应触发。流式响应中请求的会话可能已关闭，按 ID 重新读取对话。
+    """
+    conversation = db.get(models.Conversation, conversation_id)
+    ai_messages = await context_service.build_context(db, conversation, before_id=before_id)
+    db.commit()
+    return ai_messages
+
+
+async def wait_for_ai_slot(ticket: Ticket):
+    """排队等待 AI 调用名额，排队位置变化时发送 queued 事件"""
+    last_position = None
+    while not ticket.granted:
+        position = ai_limiter.position(ticket)
+        if position != last_position:
+            last_position = position
+            yield format_sse(json.dumps({"position": position}), event="queued")
+        await ai_limiter.wait(ticket, timeout=QUEUE_POSITION_INTERVAL)
+
+
 async def generate_ai_response_stream(
     conversation_id: int,
     message_id: int,
-    messages: list[dict]
+    messages: list[dict],
+    user_id: int,
+    buffer: list[str],
+    protocol: int = 1,
+    live: Optional[stream_registry.LiveStream] = None,
+    use_cache: bool = True,
+    errors: Optional[list[str]] = None,
+    interrupted: Optional[list[str]] = None
 ):
     """
     AI 流式响应生成
@@ -314,38 +460,122 @@ async def generate_ai_response_stream(
         conversation_id: 对话 ID
         message_id: AI 消息 ID
         messages: 对话历史，格式：[{"role": "user", "content": "..."}]
+        user_id: 当前用户 ID（用于隔离回复缓存）
+        buffer: 服务端累积的回复片段（调用方结束后 "".join 得到完整内容）
+        protocol: 1 = 每帧携带完整内容（兼容旧前端）；
+            2 = 仅发送带序号的增量，最后发送 summary 事件（内容哈希与 Token 用量）
+        live: 登记的进行中回复，每帧增量同时记录到这里供断线重连的客户端接续
+        use_cache: 为 False 时绕过回复缓存直接调用 AI（重新生成）
+        errors: AI 调用失败时把错误信息追加到这里，调用方据此区分正常回答和错误提示
+        interrupted: 服务商返回部分内容后失败时把错误信息追加到这里（已发送的部分保留，
+            调用方应把回答标记为不完整），同时向客户端发送 error 事件
+
+    服务商的 token 按 AI_STREAM_FLUSH_MS / AI_STREAM_FLUSH_CHARS 合并后再发送，
+    每个 SSE 帧（seq）可能包含多个 token。
     """
-    accumulated_content = ""
+    seq = 0
+    truncated = False
 
     try:
         # 调用 AI 服务生成流式回复
-        async for delta in ai_service.generate_response(messages, stream=True):
-            accumulated_content += delta
+        if use_cache:
+            source = response_cache.generate(messages, user_id, stream=True)
+        else:
+            source = ai_service.generate_response(messages, stream=True)
+        async for delta in coalesce_deltas(source):
+            buffer.append(delta)
+            seq += 1
+            if live is not None:
+                live.publish(seq, delta)
+
+            if protocol >= 2:
+                chunk = schemas.StreamDelta(id=message_id, seq=seq, delta=delta)
+                yield format_sse(chunk.model_dump_json(), event="delta", event_id=seq)
+            else:
+                chunk = schemas.StreamChunk(
+                    id=message_id,
+                    role="assistant",
+                    content="".join(buffer),
+                    delta=delta
+                )
+                yield format_sse(chunk.model_dump_json())
+
+    except StreamInterrupted as e:
+        # 已返回部分内容后失败：保留已发送的部分，告知客户端回答不完整
+        truncated = True
+        if interrupted is not None:
+            interrupted.append(str(e))
+        logger.warning(f"对话 {conversation_id} 的 AI 回答生成中断，保留部分回答（{len(''.join(buffer))} 字）: {e}")
+        yield format_sse(
+            json.dumps({"id": message_id, "detail": f"AI 服务中断，回答不完整：{e}"}, ensure_ascii=False),
+            event="error"
+        )
 
+    except Exception as e:
+        # 如果 AI 调用失败，返回错误信息（作为该消息的完整内容）
+        error_message = f"抱歉，AI 服务调用失败：{str(e)}"
+        buffer[:] = [error_message]
+        if errors is not None:
+            errors.append(str(e))
+        seq += 1
+        if live is not None:
+            live.publish(seq, error_message, replace=True)
+
+        if protocol >= 2:
+            chunk = schemas.StreamDelta(id=message_id, seq=seq, delta=error_message, replace=True)
+            yield format_sse(chunk.model_dump_json(), event="delta", event_id=seq)
+        else:
             chunk = schemas.StreamChunk(
                 id=message_id,
                 role="assistant",
-                content=accumulated_content,
-                delta=delta
+                content=error_message,
+                delta=error_message
             )
+            yield format_sse(chunk.model_dump_json())
+
+    if protocol >= 2:
+        content = "".join(buffer)
+        usage = current_usage.get()
+        if usage is not None:
+            tokens_used = usage_service.billable_tokens(usage, messages, content)
+        else:
+            tokens_used = usage_service.count_prompt_tokens(messages) + context_service.count_tokens(content)
+        summary = schemas.StreamSummary(
+            id=message_id,
+            seq=seq,
+            length=len(content),
+            content_sha256=hashlib.sha256(content.encode("utf-8")).hexdigest(),
+            tokens_used=tokens_used,
+            truncated=truncated
+        )
+        yield format_sse(summary.model_dump_json(), event="summary", event_id=seq + 1)
 
-            yield f"data: {chunk.model_dump_json()}\n\n"
-
-        yield "data: [DONE]\n\n"
+    yield "data: [DONE]\n\n"
 
-    except Exception as e:
-        # 如果 AI 调用失败，返回错误信息
-        error_message = f"抱歉，AI 服务调用失败：{str(e)}"
 
-        chunk = schemas.StreamChunk(
-            id=message_id,
-            role="assistant",
-            content=error_message,
-            delta=error_message
-        )
+async def checkpoint_stream(db: Session, ai_message: models.Message, frames, buffer: list[str]):
+    """
+    转发流式帧，并定期把已生成的部分写入 AI 消息（检查点），连接或进程中断后可从检查点恢复
 
-        yield f"data: {chunk.model_dump_json()}\n\n"
-        yield "data: [DONE]\n\n"
+    每新增 AI_STREAM_CHECKPOINT_CHARS 个字符或每隔 AI_STREAM_CHECKPOINT_SECONDS 秒提交一次。
+    """
+    checked_parts = 0
+    pending_chars = 0
+    last_checkpoint = time.monotonic()
+    async for frame in frames:
+        yield frame
+
+        pending_chars += sum(len(part) for part in buffer[checked_parts:])
+        checked_parts = len(buffer)
+        if pending_chars and (
+            (settings.AI_STREAM_CHECKPOINT_CHARS and pending_chars >= settings.AI_STREAM_CHECKPOINT_CHARS)
+            or (settings.AI_STREAM_CHECKPOINT_SECONDS
+                and time.monotonic() - last_checkpoint >= settings.AI_STREAM_CHECKPOINT_SECONDS)
+        ):
+            ai_message.content = "".join(buffer)
+            db.commit()
+            pending_chars = 0
+            last_checkpoint = time.monotonic()
 
 
 @router.post("/conversations/{conversation_id}/messages", status_code=status.HTTP_201_CREATED, response_model=schemas.MessageRead)
@@ -354,7 +584,8 @@ async def send_message(
     message_data: schemas.MessageCreate,
     current_user: dependencies.CurrentUser,
     db: dependencies.DbSession,
-    stream: bool = Query(False, description="是否使用流式输出")
+    stream: bool = Query(False, description="是否使用流式输出"),
+    protocol: int = Query(1, ge=1, le=2, description="流式协议版本：1=每帧携带全文，2=仅发送增量")
 ):
     """发送消息（支持流式输出）"""
 
@@ -375,65 +606,103 @@ async def send_message(
             detail="无权限访问此对话"
         )
 
-    existing_message_count = db.query(func.count(models.Message.id)).filter(
-        models.Message.conversation_id == conversation_id
-    ).scalar() or 0
-
-    # 保存用户消息
-    user_message = models.Message(
-        conversation_id=conversation_id,
-        role="user",
-        content=message_data.content
-    )
-    db.add(user_message)
+    # 先检查用量配额并申请 AI 调用名额：超出配额或排队已满时直接拒绝，不保存用户消息
+    check_ai_quota(db, current_user.id)
+    ticket = acquire_ai_ticket(current_user.id)
 
-    if conversation.title == "新对话" and existing_message_count == 0:
-        conversation.title = generate_conversation_title(message_data.content)
+    try:
+        # 保存用户消息
+        user_message = models.Message(
+            conversation_id=conversation_id,
+            role="user",
+            content=message_data.content
+        )
+        db.add(user_message)
 
-    db.commit()
-    db.refresh(user_message)
+        if conversation.title == "新对话" and conversation.message_count == 0:
+            conversation.title = generate_conversation_title(message_data.content)
+        update_conversation_stats(db, conversation_id, added=1, last_content=message_data.content)
+        db.flush()
+        search_service.index_message(db, user_message.id, current_user.id, conversation_id, message_data.content)
 
-    # 获取对话历史（用于上下文）
-    history_messages = db.query(models.Message).filter(
-        models.Message.conversation_id == conversation_id
-    ).order_by(models.Message.created_at.asc()).limit(20).all()  # 限制历史消息数量
+        db.commit()
+        db.refresh(user_message)
+    except BaseException:
+        ai_limiter.release(ticket)
+        raise
 
-    # 构造 AI 调用的消息列表
-    ai_messages = [
-        {"role": msg.role, "content": msg.content}
-        for msg in history_messages
-    ]
+    # 流式响应开始后请求的会话可能已关闭，提前取出用户 ID
+    user_id = current_user.id
 
     # 生成 AI 回复
     if stream:
         # 流式输出
         async def generate():
-            # 先生成一个 AI 消息记录
-            ai_message = models.Message(
-                conversation_id=conversation_id,
-                role="assistant",
-                content=""
-            )
-            db.add(ai_message)
-            db.commit()
-            db.refresh(ai_message)
-
-            # 调用 AI 生成流式响应
-            full_content = ""
-            async for chunk in generate_ai_response_stream(conversation_id, ai_message.id, ai_messages):
-                yield chunk
-                # 提取完整内容（从 JSON 中解析）
-                if chunk.startswith("data: ") and "[DONE]" not in chunk:
-                    try:
-                        chunk_data = json.loads(chunk[6:])
-                        full_content = chunk_data.get("content", "")
-                    except:
-                        pass
-
-            # 更新 AI 消息的完整内容
-            ai_message.content = full_content
-            ai_message.tokens_used = len(full_content)  # 简单估算
-            db.commit()
+            try:
+                # 排队期间告知客户端当前位置
+                async for frame in wait_for_ai_slot(ticket):
+                    yield frame
+
+                # 获得名额后再构造上下文（不包含下面新建的空白 AI 消息）
+                ai_messages = await build_ai_context(db, conversation_id)
+
+                # 先生成一个 AI 消息记录（生成结束前标记为不完整，进程中断时检查点仍可识别）
+                ai_message = models.Message(
+                    conversation_id=conversation_id,
+                    role="assistant",
+                    content="",
+                    truncated=True
+                )
+                db.add(ai_message)
+                # 内容为空时保留用户消息作为预览，生成结束后再更新
+                update_conversation_stats(db, conversation_id, added=1)
+                db.flush()
+                # 提交后不再读取消息（不 refresh），生成期间不占用连接池中的连接，
+                # 否则并发流式回复数超过连接池大小时，新请求会阻塞在获取连接上
+                message_id = ai_message.id
+                db.commit()
+                live = stream_registry.start(message_id, user_id)
+                usage = track_usage()
+                track_request(ticket.wait_seconds)
+
+                # 调用 AI 生成流式响应，回复片段累积在服务端列表中，并定期写入检查点
+                buffer: list[str] = []
+                interrupted: list[str] = []
+                try:
+                    async for chunk in checkpoint_stream(db, ai_message, generate_ai_response_stream(
+                        conversation_id, message_id, ai_messages, user_id, buffer, protocol, live,
+                        interrupted=interrupted
+                    ), buffer):
+                        yield chunk
+
+                    # 更新 AI 消息的完整内容（先写入数据库，再通知重连方生成已结束）
+                    full_content = "".join(buffer)
+                    ai_message.content = full_content
+                    ai_message.tokens_used = usage_service.record_usage(
+                        db, user_id, usage, ai_messages, full_content
+                    )
+                    # 服务商中途失败时保留部分回答，标记为不完整
+                    ai_message.truncated = bool(interrupted)
+                    update_conversation_stats(db, conversation_id, last_content=full_content)
+                    search_service.index_message(db, message_id, user_id, conversation_id, full_content)
+                    db.commit()
+                except (asyncio.CancelledError, GeneratorExit):
+                    # 客户端断开：服务商的流已随生成器一起取消并关闭，保存已发送的部分回答
+                    # 服务商不会再返回用量，按已生成的部分估算
+                    partial = "".join(buffer)
+                    ai_message.content = partial
+                    ai_message.tokens_used = usage_service.record_usage(db, user_id, usage, ai_messages, partial)
+                    ai_message.truncated = True
+                    if partial:
+                        update_conversation_stats(db, conversation_id, last_content=partial)
+                        search_service.index_message(db, message_id, user_id, conversation_id, partial)
+                    db.commit()
+                    logger.info(f"对话 {conversation_id} 的客户端已断开，保存部分回答（{len(partial)} 字）")
+                    raise
+                finally:
+                    stream_registry.finish(message_id)
+            finally:
+                ai_limiter.release(ticket)
 
         return StreamingResponse(
             generate(),
@@ -441,24 +710,42 @@ async def send_message(
             headers={
                 "Cache-Control": "no-cache",
                 "Connection": "keep-alive",
-            }
+            },
+            # 响应体未被读取（客户端提前断开）时也归还名额
+            background=BackgroundTask(ai_limiter.release, ticket)
         )
     else:
         # 非流式输出
         ai_response_text = ""
-        async for delta in ai_service.generate_response(ai_messages, stream=False):
-            ai_response_text += delta
+        truncated = False
+        try:
+            await ai_limiter.wait(ticket)
+            ai_messages = await build_ai_context(db, conversation_id)
+            # 在构造上下文之后开始统计，摘要调用的用量不计入本次回复
+            usage = track_usage()
+            track_request(ticket.wait_seconds)
+            async for delta in response_cache.generate(ai_messages, user_id, stream=False):
+                ai_response_text += delta
+        except StreamInterrupted as e:
+            # 服务商返回部分内容后失败：保存部分回答并标记为不完整
+            logger.warning(f"对话 {conversation_id} 的 AI 回答生成中断，保留部分回答（{len(ai_response_text)} 字）: {e}")
+            truncated = True
+        finally:
+            ai_limiter.release(ticket)
 
         ai_message = models.Message(
             conversation_id=conversation_id,
             role="assistant",
             content=ai_response_text,
-            tokens_used=len(ai_response_text)  # 简单估算 Token 数
+            tokens_used=usage_service.record_usage(db, user_id, usage, ai_messages, ai_response_text),
+            truncated=truncated
         )
         db.add(ai_message)
 
-        # 更新对话的 updated_at
-        conversation.updated_at = datetime.utcnow()
+        # 更新对话的消息数、最后消息预览和 updated_at
+        update_conversation_stats(db, conversation_id, added=1, last_content=ai_response_text)
+        db.flush()
+        search_service.index_message(db, ai_message.id, user_id, conversation_id, ai_response_text)
         db.commit()
         db.refresh(ai_message)
 
@@ -467,17 +754,115 @@ async def send_message(
             role=ai_message.role,
             content=ai_message.content,
             tokens_used=ai_message.tokens_used,
+            truncated=ai_message.truncated,
             created_at=ai_message.created_at
         )
 
 
+@router.get("/conversations/{conversation_id}/messages/{message_id}/stream")
+async def resume_message_stream(
+    conversation_id: int,
+    message_id: int,
+    current_user: dependencies.CurrentUser,
+    db: dependencies.DbSession,
+    last_event_id: Optional[int] = Query(None, ge=0, description="已收到的最后一个事件 id（seq）"),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """
+    断线重连：继续接收 AI 回复的流式输出（协议 v2），不会再次调用 AI 服务
+
+    回复仍在本进程生成时，补发 last_event_id 之后的增量并继续输出到结束；
+    否则以一帧 replace 增量发送数据库中保存的内容（完整回答或最近的检查点）。
+    """
+    conversation = db.query(models.Conversation).filter(
+        models.Conversation.id == conversation_id
+    ).first()
+
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="对话不存在"
+        )
+
+    if conversation.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="无权限访问此对话"
+        )
+
+    message = db.query(models.Message).filter(
+        models.Message.id == message_id,
+        models.Message.conversation_id == conversation_id,
+        models.Message.role == "assistant"
+    ).first()
+
+    if not message:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="消息不存在"
+        )
+
+    # EventSource 自动重连时通过 Last-Event-ID 请求头携带最后的事件 id
+    if last_event_id is None:
+        last_event_id = int(last_event_id_header) if last_event_id_header and last_event_id_header.isdigit() else 0
+
+    live = stream_registry.get(message_id)
+
+    async def generate():
+        seq = last_event_id
+        if live is not None:
+            async for seq, delta, replace in live.follow(last_event_id):
+                chunk = schemas.StreamDelta(id=message_id, seq=seq, delta=delta, replace=replace)
+                yield format_sse(chunk.model_dump_json(), event="delta", event_id=seq)
+            seq = max(seq, live.seq)
+            content = live.content
+
+        # 响应开始后请求的会话已关闭，重新读取（生成方在结束前已提交最终状态）；
+        # 读取后立即关闭，否则重新取得的连接要等会话被回收才归还连接池
+        try:
+            saved = db.query(models.Message).filter(models.Message.id == message_id).first()
+        finally:
+            db.close()
+        if live is None:
+            content = saved.content
+            seq += 1
+            chunk = schemas.StreamDelta(id=message_id, seq=seq, delta=content, replace=True)
+            yield format_sse(chunk.model_dump_json(), event="delta", event_id=seq)
+
+        summary = schemas.StreamSummary(
+            id=message_id,
+            seq=seq,
+            length=len(content),
+            content_sha256=hashlib.sha256(content.encode("utf-8")).hexdigest(),
+            tokens_used=saved.tokens_used,  # 生成结束后才有
+            truncated=saved.truncated
+        )
+        yield format_sse(summary.model_dump_json(), event="summary", event_id=seq + 1)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
+
+
 @router.post("/conversations/{conversation_id}/messages/regenerate", response_model=schemas.MessageRead)
 async def regenerate_message(
     conversation_id: int,
     current_user: dependencies.CurrentUser,
-    db: dependencies.DbSession
+    db: dependencies.DbSession,
+    stream: bool = Query(False, description="是否使用流式输出"),
+    protocol: int = Query(1, ge=1, le=2, description="流式协议版本：1=每帧携带全文，2=仅发送增量")
 ):
-    """重新生成最后一条 AI 消息"""
+    """
+    重新生成最后一条 AI 消息（支持流式输出）
+
+    原回答保存为历史版本；新回答生成失败（或流式生成中断时还没有任何内容）时恢复原回答。
+    """
 
     # 验证对话存在且属于当前用户
     conversation = db.query(models.Conversation).filter(
@@ -500,7 +885,7 @@ async def regenerate_message(
     last_ai_message = db.query(models.Message).filter(
         models.Message.conversation_id == conversation_id,
         models.Message.role == "assistant"
-    ).order_by(models.Message.created_at.desc()).first()
+    ).order_by(models.Message.created_at.desc(), models.Message.id.desc()).first()
 
     if not last_ai_message:
         raise HTTPException(
@@ -508,26 +893,133 @@ async def regenerate_message(
             detail="没有可重新生成的 AI 消息"
         )
 
-    # 获取该 AI 消息之前的所有消息（作为上下文）
-    history_messages = db.query(models.Message).filter(
+    # 重新生成的是最后一条消息时更新对话列表预览
+    is_last_message = db.query(models.Message.id).filter(
         models.Message.conversation_id == conversation_id,
-        models.Message.created_at < last_ai_message.created_at
-    ).order_by(models.Message.created_at.asc()).all()
+        models.Message.id > last_ai_message.id
+    ).first() is None
 
-    # 构造 AI 调用的消息列表
-    ai_messages = [
-        {"role": msg.role, "content": msg.content}
-        for msg in history_messages
-    ]
+    # 重新生成内容（使用真实 AI API，与发送消息共用配额和并发限制）
+    check_ai_quota(db, current_user.id)
+    ticket = acquire_ai_ticket(current_user.id)
 
-    # 重新生成内容（使用真实 AI API）
-    new_response_text = ""
-    async for delta in ai_service.generate_response(ai_messages, stream=False):
-        new_response_text += delta
+    # 流式响应开始后请求的会话可能已关闭，提前取出 ID
+    user_id = current_user.id
+    message_id = last_ai_message.id
+
+    def save_previous_version(ai_message: models.Message) -> models.MessageVersion:
+        previous = models.MessageVersion(
+            message_id=ai_message.id,
+            content=ai_message.content,
+            tokens_used=ai_message.tokens_used,
+            truncated=ai_message.truncated
+        )
+        db.add(previous)
+        return previous
+
+    async def prepare_context() -> list[dict]:
+        # 获得名额后再构造上下文：该 AI 消息之前的对话（同样受 Token 预算限制）
+        ai_messages = await build_ai_context(db, conversation_id, before_id=message_id)
+        # 用户对原回答不满意：删除对应缓存，并绕过缓存重新调用 AI
+        response_cache.invalidate(ai_messages, user_id)
+        return ai_messages
+
+    def finish_regeneration(
+        ai_message: models.Message, content: str, usage, ai_messages: list[dict], truncated: bool = False
+    ) -> None:
+        ai_message.content = content
+        ai_message.tokens_used = usage_service.record_usage(db, user_id, usage, ai_messages, content)
+        ai_message.truncated = truncated
+        if is_last_message:
+            update_conversation_stats(db, conversation_id, last_content=content)
+        search_service.index_message(db, message_id, user_id, conversation_id, content)
 
-    # 更新消息
-    last_ai_message.content = new_response_text
-    last_ai_message.tokens_used = len(new_response_text)
+    if stream:
+        async def generate():
+            try:
+                # 排队期间告知客户端当前位置
+                async for frame in wait_for_ai_slot(ticket):
+                    yield frame
+
+                ai_messages = await prepare_context()
+
+                # 原回答先保存为历史版本，新回答生成期间消息标记为不完整并写入检查点
+                ai_message = db.get(models.Message, message_id)
+                previous = save_previous_version(ai_message)
+                ai_message.truncated = True
+                db.commit()
+                live = stream_registry.start(message_id, user_id)
+                usage = track_usage()
+                track_request(ticket.wait_seconds)
+
+                def restore_previous() -> None:
+                    ai_message.content = previous.content
+                    ai_message.tokens_used = previous.tokens_used
+                    ai_message.truncated = previous.truncated
+                    db.delete(previous)
+
+                buffer: list[str] = []
+                errors: list[str] = []
+                interrupted: list[str] = []
+                try:
+                    async for chunk in checkpoint_stream(db, ai_message, generate_ai_response_stream(
+                        conversation_id, message_id, ai_messages, user_id, buffer, protocol, live,
+                        use_cache=False, errors=errors, interrupted=interrupted
+                    ), buffer):
+                        yield chunk
+
+                    if errors:
+                        # AI 调用失败：客户端已收到错误提示，数据库中保留原回答
+                        restore_previous()
+                    else:
+                        # 服务商中途失败时与客户端断开相同，保存部分回答并标记为不完整
+                        finish_regeneration(ai_message, "".join(buffer), usage, ai_messages, truncated=bool(interrupted))
+                    db.commit()
+                except (asyncio.CancelledError, GeneratorExit):
+                    # 客户端断开：与发送消息相同，保存已生成的部分；还没有内容时恢复原回答
+                    partial = "".join(buffer)
+                    if partial and not errors:
+                        finish_regeneration(ai_message, partial, usage, ai_messages, truncated=True)
+                    else:
+                        restore_previous()
+                    db.commit()
+                    logger.info(f"对话 {conversation_id} 重新生成时客户端已断开，保存部分回答（{len(partial)} 字）")
+                    raise
+                finally:
+                    stream_registry.finish(message_id)
+            finally:
+                ai_limiter.release(ticket)
+
+        return StreamingResponse(
+            generate(),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+            },
+            # 响应体未被读取（客户端提前断开）时也归还名额
+            background=BackgroundTask(ai_limiter.release, ticket)
+        )
+
+    new_response_text = ""
+    truncated = False
+    try:
+        await ai_limiter.wait(ticket)
+        ai_messages = await prepare_context()
+        # 在构造上下文之后开始统计，摘要调用的用量不计入本次回复
+        usage = track_usage()
+        track_request(ticket.wait_seconds)
+        async for delta in ai_service.generate_response(ai_messages, stream=False):
+            new_response_text += delta
+    except StreamInterrupted as e:
+        logger.warning(f"对话 {conversation_id} 重新生成时 AI 回答中断，保留部分回答（{len(new_response_text)} 字）: {e}")
+        truncated = True
+    finally:
+        ai_limiter.release(ticket)
+
+    # 新回答生成完成后再替换，原回答保存为历史版本
+    save_previous_version(last_ai_message)
+    finish_regeneration(last_ai_message, new_response_text, usage, ai_messages, truncated=truncated)
     db.commit()
     db.refresh(last_ai_message)
 
@@ -536,10 +1028,58 @@ async def regenerate_message(
         role=last_ai_message.role,
         content=last_ai_message.content,
         tokens_used=last_ai_message.tokens_used,
+        truncated=last_ai_message.truncated,
         created_at=last_ai_message.created_at
     )
 
 
+@router.get("/conversations/{conversation_id}/messages/{message_id}/versions", response_model=schemas.MessageVersionListResponse)
+async def list_message_versions(
+    conversation_id: int,
+    message_id: int,
+    current_user: dependencies.CurrentUser,
+    db: dependencies.DbSession
+):
+    """查看 AI 消息重新生成前的历史版本（从新到旧）"""
+
+    # 验证对话存在且属于当前用户
+    conversation = db.query(models.Conversation).filter(
+        models.Conversation.id == conversation_id
+    ).first()
+
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="对话不存在"
+        )
+
+    if conversation.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="无权限访问此对话"
+        )
+
+    message = db.query(models.Message).filter(
+        models.Message.id == message_id,
+        models.Message.conversation_id == conversation_id
+    ).first()
+
+    if not message:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="消息不存在"
+        )
+
+    versions = db.query(models.MessageVersion).filter(
+        models.MessageVersion.message_id == message_id
+    ).order_by(models.MessageVersion.id.desc()).all()
+
+    return schemas.MessageVersionListResponse(
+        message_id=message_id,
+        items=[schemas.MessageVersionItem.model_validate(version) for version in versions]
+    )
+
+
 @router.post("/conversations/{conversation_id}/messages/{message_id}/feedback", response_model=schemas.MessageFeedbackResponse)
 async def submit_feedback(
     conversation_id: int,
@@ -593,14 +1133,14 @@ async def submit_feedback(
     return schemas.MessageFeedbackResponse(message="反馈已记录")
 
 
-@router.post("/conversations/{conversation_id}/export", response_model=schemas.ConversationExportResponse)
-async def export_conversation(
+@router.get("/conversations/{conversation_id}/export")
+async def download_conversation(
     conversation_id: int,
-    export_data: schemas.ConversationExportRequest,
     current_user: dependencies.CurrentUser,
-    db: dependencies.DbSession
+    db: dependencies.DbSession,
+    format: str = Query("markdown", pattern="^(markdown|json|txt)$", description="导出格式")
 ):
-    """导出对话"""
+    """以文件下载的形式流式导出对话"""
 
     # 验证对话存在且属于当前用户
     conversation = db.query(models.Conversation).filter(
@@ -619,54 +1159,59 @@ async def export_conversation(
             detail="无权限访问此对话"
         )
 
-    # 获取所有消息
-    messages = db.query(models.Message).filter(
-        models.Message.conversation_id == conversation_id
-    ).order_by(models.Message.created_at.asc()).all()
-
-    # 根据格式生成内容
-    if export_data.format == "markdown":
-        content = f"# {conversation.title}\n\n"
-        content += f"**对话时间**：{conversation.created_at.strftime('%Y-%m-%d %H:%M')}\n\n"
-        content += "---\n\n"
-
-        for msg in messages:
-            role_name = "用户" if msg.role == "user" else "AI"
-            content += f"## {role_name}\n\n{msg.content}\n\n---\n\n"
-
-        filename = f"{conversation.title}.md"
-
-    elif export_data.format == "json":
-        messages_data = [
-            {
-                "role": msg.role,
-                "content": msg.content,
-                "created_at": msg.created_at.isoformat()
-            }
-            for msg in messages
-        ]
+    filename = export_service.export_filename(conversation, format)
 
-        content = json.dumps({
-            "title": conversation.title,
-            "created_at": conversation.created_at.isoformat(),
-            "messages": messages_data
-        }, ensure_ascii=False, indent=2)
+    return StreamingResponse(
+        export_service.stream_conversation(conversation_id, format),
+        media_type=export_service.EXPORT_FORMATS[format][1],
+        headers={"Content-Disposition": export_service.content_disposition(filename)}
+    )
 
-        filename = f"{conversation.title}.json"
 
-    else:  # txt
-        content = f"{conversation.title}\n"
-        content += f"对话时间：{conversation.created_at.strftime('%Y-%m-%d %H:%M')}\n"
-        content += "=" * 50 + "\n\n"
+@router.get("/export")
+async def download_all_conversations(
+    current_user: dependencies.CurrentUser,
+    format: str = Query("markdown", pattern="^(markdown|json|txt)$", description="导出格式")
+):
+    """把自己的全部对话打包为 zip 流式下载（每个对话一个文件）"""
+    filename = f"conversations-{datetime.utcnow():%Y%m%d}.zip"
+
+    return StreamingResponse(
+        export_service.stream_archive(current_user.id, format),
+        media_type="application/zip",
+        headers={"Content-Disposition": export_service.content_disposition(filename)}
+    )
 
-        for msg in messages:
-            role_name = "用户" if msg.role == "user" else "AI"
-            content += f"[{role_name}] {msg.created_at.strftime('%H:%M:%S')}\n"
-            content += f"{msg.content}\n\n"
 
-        filename = f"{conversation.title}.txt"
+@router.post("/conversations/{conversation_id}/export", response_model=schemas.ConversationExportResponse)
+async def export_conversation(
+    conversation_id: int,
+    export_data: schemas.ConversationExportRequest,
+    current_user: dependencies.CurrentUser,
+    db: dependencies.DbSession
+):
+    """导出对话（内容放在 JSON 中返回；长对话请使用 GET .../export 流式下载）"""
+
+    # 验证对话存在且属于当前用户
+    conversation = db.query(models.Conversation).filter(
+        models.Conversation.id == conversation_id
+    ).first()
+
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="对话不存在"
+        )
+
+    if conversation.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="无权限访问此对话"
+        )
+
+    content = "".join(export_service.render_conversation(db, conversation, export_data.format))
 
     return schemas.ConversationExportResponse(
         content=content,
-        filename=filename
+        filename=export_service.export_filename(conversation, export_data.format)
     )
@@ -7,6 +7,7 @@ from typing import Optional
 from datetime import datetime, timedelta
 
 import dependencies, models, schemas, auth
+from services import notification_service
 
 router = APIRouter(prefix="/api", tags=["评论"])
 
@@ -270,37 +271,43 @@ async def create_comment(
 
     # 1. 如果是回复评论，通知被回复的用户
     if new_comment.parent_id and new_comment.parent.user_id != current_user.id:
-        notification = models.Notification(
+        notification_service.create_grouped_notification(
+            db,
             user_id=new_comment.parent.user_id,
+            actor_id=current_user.id,
+            actor_name=commenter_name,
             type="comment_reply",
-            title=f"{commenter_name} 回复了你的评论",
+            title_template="{actors} 回复了你的评论",
+            group_target=f"comment:{new_comment.parent_id}",
             content=new_comment.content,
             related_type="comment",
             related_id=new_comment.id,
             related_url=f"/blogs/{blog_id}?comment={new_comment.id}"
         )
-        db.add(notification)
 
     # 2. 如果评论者不是博客作者，通知博客作者
     if current_user.id != blog.author_id:
         # 如果是回复评论，使用 comment_reply_blog 类型
         if new_comment.parent_id:
             notification_type = "comment_reply_blog"
-            title = f"{commenter_name} 回复了你博客下的评论"
+            title_template = "{actors} 回复了你博客下的评论"
         else:
             notification_type = "blog_comment"
-            title = f"{commenter_name} 评论了你的博客《{blog.title}》"
+            title_template = f"{{actors}} 评论了你的博客《{blog.title}》"
 
-        notification = models.Notification(
+        notification_service.create_grouped_notification(
+            db,
             user_id=blog.author_id,
+            actor_id=current_user.id,
+            actor_name=commenter_name,
             type=notification_type,
-            title=title,
+            title_template=title_template,
+            group_target=f"blog:{blog_id}",
             content=new_comment.content,
             related_type="blog",
             related_id=blog_id,
             related_url=f"/blogs/{blog_id}?comment={new_comment.id}"
         )
-        db.add(notification)
 
     db.commit()
 
@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func
 
 import dependencies, models, schemas
+from services import notification_service
 
 router = APIRouter(prefix="/api", tags=["收藏"])
 
@@ -261,16 +262,19 @@ async def favorite_blog(
         # 创建通知（如果收藏者不是作者）
         if current_user.id != blog.author_id:
             favoriter_name = current_user.nickname or current_user.username
-            notification = models.Notification(
+            notification_service.create_grouped_notification(
+                db,
                 user_id=blog.author_id,
+                actor_id=current_user.id,
+                actor_name=favoriter_name,
                 type="blog_favorited",
-                title=f"{favoriter_name} 收藏了你的博客《{blog.title}》",
+                title_template=f"{{actors}} 收藏了你的博客《{blog.title}》",
+                group_target=f"blog:{blog.id}",
                 content=f"{favoriter_name} 收藏了你的博客到文件夹「{folder.name}」",
                 related_type="blog",
                 related_id=blog.id,
                 related_url=f"/blogs/{blog.id}"
             )
-            db.add(notification)
 
     db.commit()
 
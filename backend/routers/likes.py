@@ -4,6 +4,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 import dependencies, models, schemas
+from services import notification_service
 
 router = APIRouter(prefix="/api/blogs", tags=["点赞"])
 
@@ -48,16 +49,19 @@ async def like_blog(
     # 创建通知（如果点赞者不是作者）
     if current_user.id != blog.author_id:
         liker_name = current_user.nickname or current_user.username
-        notification = models.Notification(
+        notification_service.create_grouped_notification(
+            db,
             user_id=blog.author_id,
+            actor_id=current_user.id,
+            actor_name=liker_name,
             type="blog_liked",
-            title=f"{liker_name} 点赞了你的博客《{blog.title}》",
+            title_template=f"{{actors}} 点赞了你的博客《{blog.title}》",
+            group_target=f"blog:{blog.id}",
             content=f"{liker_name} 觉得你的博客很棒",
             related_type="blog",
             related_id=blog.id,
             related_url=f"/blogs/{blog.id}"
         )
-        db.add(notification)
 
     db.commit()
 
@@ -6,10 +6,25 @@ from typing import Optional
 
 import dependencies, models, schemas
 from models.activity import Activity
+from models.notice import generate_excerpt
+from services import notification_service
 
 router = APIRouter(prefix="/api/notices", tags=["班级通知"])
 
 
+def publish_notice_broadcast(db, notice: models.Notice) -> None:
+    """为重要通知发布广播通知（不提交）"""
+    notification_service.publish_broadcast(
+        db,
+        type="notice_published",
+        title=f"{notice.author_name} 发布了重要通知《{notice.title}》"[:200],
+        content=generate_excerpt(notice.content),
+        related_type="notice",
+        related_id=notice.id,
+        related_url=f"/?notice={notice.id}"
+    )
+
+
 @router.get("", response_model=schemas.NoticeListResponse)
 async def list_notices(
     db: dependencies.DbSession,
@@ -146,6 +161,11 @@ async def create_notice(
         target_title=notice.title
     )
     db.add(activity)
+
+    # 重要通知广播给全班（只写一行，成员读取通知列表时合并）
+    if notice.is_important:
+        publish_notice_broadcast(db, notice)
+
     db.commit()
 
     # 重新加载以获取关联数据
@@ -187,6 +207,9 @@ async def update_notice(
     if notice_data.content is not None:
         notice.content = notice_data.content
     if notice_data.is_important is not None:
+        # 普通通知改为重要时补发广播
+        if notice_data.is_important and not notice.is_important:
+            publish_notice_broadcast(db, notice)
         notice.is_important = notice_data.is_important
 
     db.commit()
@@ -223,7 +246,8 @@ async def delete_notice(
 
     dependencies.require_role(current_user, {"committee", "admin"})
 
-    # 删除通知
+    # 删除通知及其广播
+    notification_service.delete_broadcasts_for(db, "notice", notice.id)
     db.delete(notice)
     db.commit()
 
@@ -2,10 +2,11 @@
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import desc, func
+from sqlalchemy import desc
 from typing import Optional
 
 import dependencies, models, schemas
+from services import notification_service
 
 router = APIRouter(prefix="/api/notifications", tags=["通知"])
 
@@ -30,6 +31,41 @@ def format_time_display(created_at) -> str:
         return created_at.strftime("%Y-%m-%d")
 
 
+def build_notification_fields(notification: models.Notification) -> dict:
+    """通知响应字段（合并通知展开为触发者列表）"""
+    return dict(
+        id=notification.id,
+        type=notification.type,
+        title=notification.title,
+        content=notification.content,
+        related_type=notification.related_type,
+        related_id=notification.related_id,
+        related_url=notification.related_url,
+        is_read=notification.is_read,
+        created_at=notification.created_at,
+        actor_count=notification.actor_count or 1,
+        actors=[actor["name"] for actor in notification_service.parse_actors(notification)],
+        last_event_at=notification.last_event_at or notification.created_at,
+    )
+
+
+def build_broadcast_fields(broadcast: models.BroadcastNotification, user: models.User) -> dict:
+    """广播通知响应字段（已读状态由用户水位线决定）"""
+    return dict(
+        id=broadcast.id,
+        type=broadcast.type,
+        title=broadcast.title,
+        content=broadcast.content,
+        related_type=broadcast.related_type,
+        related_id=broadcast.related_id,
+        related_url=broadcast.related_url,
+        is_read=broadcast.id <= (user.broadcast_read_id or 0),
+        created_at=broadcast.created_at,
+        last_event_at=broadcast.created_at,
+        is_broadcast=True,
+    )
+
+
 @router.get("", response_model=schemas.NotificationListResponse)
 async def get_notifications(
     db: dependencies.DbSession,
@@ -39,52 +75,72 @@ async def get_notifications(
     page: int = Query(1, ge=1, description="页码"),
     size: int = Query(20, ge=1, le=50, description="每页数量")
 ):
-    """获取当前用户的通知列表"""
+    """获取当前用户的通知列表（个人通知与广播通知按时间合并）"""
     # 构建查询
     query = db.query(models.Notification).filter(
         models.Notification.user_id == current_user.id
     )
+    broadcast_query = notification_service.visible_broadcasts_query(db, current_user)
 
     # 筛选未读
     if unread_only:
         query = query.filter(models.Notification.is_read == False)
+        broadcast_query = broadcast_query.filter(
+            models.BroadcastNotification.id > current_user.broadcast_read_id
+        )
 
     # 按类型筛选
     if type_filter:
         query = query.filter(models.Notification.type == type_filter)
+        broadcast_query = broadcast_query.filter(models.BroadcastNotification.type == type_filter)
 
-    # 统计总数和未读数
-    total = query.count()
-    unread_count = db.query(func.count(models.Notification.id)).filter(
-        models.Notification.user_id == current_user.id,
-        models.Notification.is_read == False
-    ).scalar()
+    # 未读数直接读取冗余计数器；仅看未读且不筛类型时总数即未读数
+    personal_unread = notification_service.get_unread_count(db, current_user.id)
+    broadcast_total = broadcast_query.count()
+    if unread_only and not type_filter:
+        personal_total = personal_unread
+    else:
+        personal_total = query.count()
+
+    broadcast_unread = notification_service.count_unread_broadcasts(db, current_user)
 
-    # 按创建时间倒序
-    query = query.order_by(desc(models.Notification.created_at))
+    # 按最近事件时间倒序（合并通知有新事件时会重新置顶）
+    query = query.order_by(desc(models.Notification.last_event_at))
+    offset = (page - 1) * size
 
-    # 分页
-    notifications = query.offset((page - 1) * size).limit(size).all()
+    if broadcast_total == 0:
+        # 没有可见广播时直接分页
+        fields_list = [
+            build_notification_fields(notification)
+            for notification in query.offset(offset).limit(size).all()
+        ]
+    else:
+        # 两路各取前 offset+size 条，归并后截取当前页
+        fields_list = [
+            build_notification_fields(notification)
+            for notification in query.limit(offset + size).all()
+        ]
+        broadcasts = broadcast_query.order_by(
+            desc(models.BroadcastNotification.created_at)
+        ).limit(offset + size).all()
+        fields_list.extend(
+            build_broadcast_fields(broadcast, current_user) for broadcast in broadcasts
+        )
+        fields_list.sort(key=lambda fields: fields["last_event_at"], reverse=True)
+        fields_list = fields_list[offset:offset + size]
 
     # 构造响应
-    items = []
-    for notification in notifications:
-        items.append(schemas.NotificationWithTimeDisplay(
-            id=notification.id,
-            type=notification.type,
-            title=notification.title,
-            content=notification.content,
-            related_type=notification.related_type,
-            related_id=notification.related_id,
-            related_url=notification.related_url,
-            is_read=notification.is_read,
-            created_at=notification.created_at,
-            time_display=format_time_display(notification.created_at)
-        ))
+    items = [
+        schemas.NotificationWithTimeDisplay(
+            **fields,
+            time_display=format_time_display(fields["last_event_at"])
+        )
+        for fields in fields_list
+    ]
 
     return schemas.NotificationListResponse(
-        total=total,
-        unread_count=unread_count or 0,
+        total=personal_total + broadcast_total,
+        unread_count=personal_unread + broadcast_unread,
         page=page,
         size=size,
         items=items
@@ -97,22 +153,39 @@ async def mark_all_read(
     current_user: dependencies.CurrentUser
 ):
     """标记所有通知为已读"""
-    # 查询所有未读通知
-    unread_notifications = db.query(models.Notification).filter(
-        models.Notification.user_id == current_user.id,
-        models.Notification.is_read == False
-    ).all()
+    # 单条 UPDATE 语句批量更新，并同步清零未读计数；广播通知推进已读水位线
+    marked_count = notification_service.mark_all_read(db, current_user.id)
+    marked_count += notification_service.mark_broadcasts_read(db, current_user)
+    db.commit()
 
-    marked_count = len(unread_notifications)
+    return schemas.NotificationMarkReadResponse(
+        message="已标记所有通知为已读",
+        marked_count=marked_count
+    )
+
+
+@router.put("/broadcasts/{broadcast_id}/read", response_model=schemas.NotificationMarkReadResponse)
+async def mark_broadcast_read(
+    broadcast_id: int,
+    db: dependencies.DbSession,
+    current_user: dependencies.CurrentUser
+):
+    """标记广播通知为已读（同时标记更早的广播）"""
+    broadcast = db.query(models.BroadcastNotification).filter(
+        models.BroadcastNotification.id == broadcast_id
+    ).first()
 
-    # 批量更新
-    for notification in unread_notifications:
-        notification.is_read = True
+    if not broadcast:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="通知不存在"
+        )
 
+    marked_count = notification_service.mark_broadcasts_read(db, current_user, broadcast_id)
     db.commit()
 
     return schemas.NotificationMarkReadResponse(
-        message="已标记所有通知为已读",
+        message="已标记为已读",
         marked_count=marked_count
     )
 
@@ -141,22 +214,12 @@ async def mark_notification_read(
             detail="无权限访问此通知"
         )
 
-    # 标记已读
-    notification.is_read = True
+    # 标记已读（仅当原本未读时减少计数）
+    notification_service.mark_read(db, current_user.id, notification.id)
     db.commit()
     db.refresh(notification)
 
-    return schemas.NotificationRead(
-        id=notification.id,
-        type=notification.type,
-        title=notification.title,
-        content=notification.content,
-        related_type=notification.related_type,
-        related_id=notification.related_id,
-        related_url=notification.related_url,
-        is_read=notification.is_read,
-        created_at=notification.created_at
-    )
+    return schemas.NotificationRead(**build_notification_fields(notification))
 
 
 @router.delete("", response_model=schemas.NotificationDeleteResponse)
@@ -166,16 +229,13 @@ async def delete_notifications(
     all: bool = Query(False, description="是否清除所有通知")
 ):
     """清除通知"""
-    query = db.query(models.Notification).filter(
-        models.Notification.user_id == current_user.id
+    # all=False 时仅清除已读；DELETE 语句直接返回删除行数
+    deleted_count = notification_service.clear_notifications(
+        db, current_user.id, include_unread=all
+    )
+    deleted_count += notification_service.clear_broadcasts(
+        db, current_user, include_unread=all
     )
-
-    if not all:
-        # 仅清除已读
-        query = query.filter(models.Notification.is_read == True)
-
-    deleted_count = query.count()
-    query.delete(synchronize_session=False)
     db.commit()
 
     return schemas.NotificationDeleteResponse(
@@ -208,7 +268,7 @@ async def delete_notification(
             detail="无权限访问此通知"
         )
 
-    db.delete(notification)
+    notification_service.delete_notification(db, notification)
     db.commit()
 
     return None
@@ -219,14 +279,28 @@ async def get_unread_count(
     db: dependencies.DbSession,
     current_user: dependencies.CurrentUser
 ):
-    """获取未读通知数量"""
-    from sqlalchemy import func
-
-    unread_count = db.query(func.count(models.Notification.id)).filter(
-        models.Notification.user_id == current_user.id,
-        models.Notification.is_read == False
-    ).scalar()
+    """获取未读通知数量（含未读广播）"""
+    unread_count = (
+        notification_service.get_unread_count(db, current_user.id)
+        + notification_service.count_unread_broadcasts(db, current_user)
+    )
 
     return schemas.NotificationUnreadCountResponse(
-        unread_count=unread_count or 0
+        unread_count=unread_count
+    )
+
+
+@router.post("/reconcile", response_model=schemas.NotificationReconcileResponse)
+async def reconcile_unread_counts(
+    db: dependencies.DbSession,
+    current_user: dependencies.CurrentUser
+):
+    """校正所有用户的未读通知计数（管理员）"""
+    dependencies.require_role(current_user, {"admin"})
+
+    repaired_count = notification_service.reconcile_unread_counts(db)
+
+    return schemas.NotificationReconcileResponse(
+        message=f"已修复 {repaired_count} 个用户的未读计数",
+        repaired_count=repaired_count
     )
@@ -1,17 +1,19 @@
 # 媒体文件上传路由
 
+import asyncio
+import hashlib
+import json
 import os
 import uuid
-import subprocess
-import shutil
 from pathlib import Path
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Body
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Body, Header, Query, Request
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-import tempfile
 
-import dependencies
-import ffmpeg_config
+import dependencies, models, schemas
+from config import settings
+from services import image_service, storage_service, transcode_service, upload_service
 
 router = APIRouter(prefix="/api/uploads", tags=["文件上传"])
 
@@ -34,22 +36,14 @@ ALLOWED_VIDEO_TYPES = {
 MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB
 MAX_VIDEO_SIZE = 2 * 1024 * 1024 * 1024  # 2GB
 
-# 视频压缩配置
-VIDEO_COMPRESSION_SETTINGS = {
-    "max_width": 1920,  # 最大宽度
-    "max_height": 1080,  # 最大高度
-    "video_bitrate": "2M",  # 视频码率
-    "audio_bitrate": "128k",  # 音频码率
-    "target_size_mb": 50,  # 目标大小 (MB)
-}
-
 
-@router.post("/image", response_model=dict)
+@router.post("/image", response_model=schemas.ImageUploadResponse)
 async def upload_image(
     current_user: dependencies.CurrentUser,
+    db: dependencies.DbSession,
     file: UploadFile = File(...)
 ):
-    """上传博客图片"""
+    """上传博客图片（同时生成多尺寸 WebP 版本、尺寸和模糊占位图）"""
     # 验证文件类型
     if file.content_type not in ALLOWED_IMAGE_TYPES:
         raise HTTPException(
@@ -57,130 +51,154 @@ async def upload_image(
             detail=f"不支持的图片类型，请上传 {', '.join(ALLOWED_IMAGE_TYPES.keys())} 格式的图片"
         )
 
+    staged = storage_service.staging_path()
     try:
-        # 创建上传目录
-        upload_dir = Path("uploads/blog/images")
-        upload_dir.mkdir(parents=True, exist_ok=True)
-
-        # 生成唯一文件名
-        file_extension = ALLOWED_IMAGE_TYPES[file.content_type]
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = upload_dir / unique_filename
-
-        # 流式写入文件
-        with open(file_path, "wb") as f:
+        # 流式写入临时文件并计算哈希，超出大小限制立即停止
+        digest = hashlib.sha256()
+        file_size = 0
+        with open(staged, "wb") as f:
             while chunk := await file.read(1024 * 1024):  # 每次读取1MB
+                file_size += len(chunk)
+                if file_size > MAX_IMAGE_SIZE:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"图片大小不能超过 {MAX_IMAGE_SIZE // (1024 * 1024)}MB"
+                    )
+                digest.update(chunk)
                 f.write(chunk)
 
-        file_size = file_path.stat().st_size
-        file_url = f"/static/blog/images/{unique_filename}"
+        # 相同内容的图片只保存一份
+        stored, _ = storage_service.store(
+            db, current_user.id, staged, "images", ALLOWED_IMAGE_TYPES[file.content_type], digest.hexdigest()
+        )
+        file_url = stored.url
 
         print(f"图片上传成功: {file.filename}, 大小: {file_size / (1024 * 1024):.2f}MB")
 
-        return {"url": file_url, "type": "image", "size": file_size}
+        # 已处理过的图片直接返回已有版本
+        asset = db.query(models.ImageAsset).filter(models.ImageAsset.url == file_url).first()
+        if asset:
+            return image_response(asset.url, asset.size, asset.format, asset.width, asset.height,
+                                  asset.placeholder, json.loads(asset.variants))
+
+        # 解码和缩放在线程中执行，不阻塞事件循环
+        try:
+            processed = await asyncio.to_thread(
+                image_service.process_image, storage_service.url_to_path(file_url), file_url.rsplit("/", 1)[0]
+            )
+        except image_service.ImageRejected as e:
+            released = storage_service.release(db, current_user.id, file_url)
+            db.commit()
+            storage_service.remove_files(db, released)
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=str(e)
+            )
+
+        if processed is None:
+            return schemas.ImageUploadResponse(url=file_url, size=file_size)
+
+        db.add(models.ImageAsset(
+            user_id=current_user.id,
+            url=file_url,
+            format=processed.format,
+            width=processed.width,
+            height=processed.height,
+            size=file_size,
+            placeholder=processed.placeholder,
+            variants=json.dumps(processed.variants)
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            # 相同图片被同时上传，对方已记录（版本文件名由哈希决定，内容相同）
+            db.rollback()
+
+        return image_response(file_url, file_size, processed.format, processed.width, processed.height,
+                              processed.placeholder, processed.variants)
 
     except Exception as e:
+        # 清理未入库的临时文件（已入库的文件由引用计数管理）
+        staged.unlink(missing_ok=True)
+
+        if isinstance(e, HTTPException):
+            raise
+
         print(f"图片上传错误: {str(e)}")
         import traceback
         traceback.print_exc()
 
-        # 清理部分上传的文件
-        if 'file_path' in locals() and file_path.exists():
-            try:
-                file_path.unlink()
-            except:
-                pass
-
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"图片上传失败: {str(e)}"
         )
 
 
-def compress_video(input_path: Path, output_path: Path) -> tuple[bool, str, str]:
-    """使用 FFmpeg 压缩视频"""
-    try:
-        # 获取 FFmpeg 和 FFprobe 路径
-        ffmpeg_cmd = ffmpeg_config.get_ffmpeg_path()
-        ffprobe_cmd = ffmpeg_config.get_ffprobe_path()
-
-        # 验证 FFmpeg 是否可用
-        if not Path(ffmpeg_cmd).exists() and ffmpeg_cmd == "ffmpeg":
-            # 如果不是绝对路径且不存在，尝试 shutil.which
-            ffmpeg_cmd = shutil.which("ffmpeg")
-            if not ffmpeg_cmd:
-                return False, "FFmpeg 未找到，请在 ffmpeg_config.py 中配置 FFMPEG_PATH", ""
-            ffprobe_cmd = shutil.which("ffprobe", ffmpeg_cmd.replace("ffmpeg", "ffprobe"))
-
-        print(f"使用 FFmpeg: {ffmpeg_cmd}")
-        print(f"使用 FFprobe: {ffprobe_cmd}")
-
-        # 检查 FFmpeg 是否可用
-        subprocess.run([ffmpeg_cmd, "-version"], capture_output=True, check=True)
-
-        # 获取原始文件大小
-        original_size = input_path.stat().st_size / (1024 * 1024)
-
-        # 计算视频时长以确定合适的码率
-        probe_cmd = [
-            ffprobe_cmd,
-            "-v", "error",
-            "-show_entries", "format=duration",
-            "-of", "default=noprint_wrappers=1:nokey=1",
-            str(input_path)
-        ]
-
-        result = subprocess.run(probe_cmd, capture_output=True, text=True)
-        duration = float(result.stdout.strip()) if result.stdout.strip() else 10
-
-        # 根据时长计算目标码率（目标 50MB）
-        target_bitrate = int((VIDEO_COMPRESSION_SETTINGS["target_size_mb"] * 8 * 1024) / duration)
-        target_bitrate = min(target_bitrate, 2000)  # 最大 2Mbps
-        video_bitrate = f"{target_bitrate}k"
-
-        # FFmpeg 压缩命令
-        cmd = [
-            ffmpeg_cmd,
-            "-i", str(input_path),
-            "-vf", f"scale='min({VIDEO_COMPRESSION_SETTINGS['max_width']},iw):-2'",
-            "-b:v", video_bitrate,
-            "-b:a", VIDEO_COMPRESSION_SETTINGS["audio_bitrate"],
-            "-movflags", "+faststart",  # 优化流媒体播放
-            "-y",  # 覆盖输出文件
-            str(output_path)
-        ]
-
-        # 执行压缩
-        subprocess.run(cmd, capture_output=True, check=True)
-
-        # 获取压缩后文件大小
-        compressed_size = output_path.stat().st_size / (1024 * 1024)
-        ratio = (1 - compressed_size / original_size) * 100
-
-        return True, f"压缩成功: {original_size:.1f}MB → {compressed_size:.1f}MB (节省 {ratio:.1f}%)", str(output_path)
-
-    except subprocess.CalledProcessError as e:
-        return False, f"FFmpeg 执行失败: {str(e)}", ""
-    except FileNotFoundError:
-        return False, "FFmpeg 未安装，请联系管理员安装 FFmpeg", ""
-    except Exception as e:
-        return False, f"压缩失败: {str(e)}", ""
+def image_response(url: str, size: int, fmt: str, width: int, height: int,
+                   placeholder: str | None, variants: dict) -> schemas.ImageUploadResponse:
+    return schemas.ImageUploadResponse(
+        url=url,
+        size=size,
+        format=fmt,
+        width=width,
+        height=height,
+        placeholder=placeholder,
+        variants=variants,
+        srcset={name: image_service.build_srcset(items) for name, items in variants.items()}
+    )
+
+
+@router.post("/images/variants", response_model=dict[str, schemas.ImageUploadResponse])
+async def get_image_variants(
+    current_user: dependencies.CurrentUser,
+    db: dependencies.DbSession,
+    urls: List[str] = Body(..., embed=True)
+):
+    """批量获取已上传图片的多尺寸版本（用于渲染博客和列表缩略图，没有版本记录的图片不返回）"""
+    assets = db.query(models.ImageAsset).filter(models.ImageAsset.url.in_(urls[:200])).all()
+    return {
+        asset.url: image_response(asset.url, asset.size, asset.format, asset.width, asset.height,
+                                  asset.placeholder, json.loads(asset.variants))
+        for asset in assets
+    }
 
 
 @router.delete("/media", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_media(
+    db: dependencies.DbSession,
     urls: List[str] = Body(..., embed=True),
     current_user: dependencies.CurrentUser = None
 ):
-    """删除未使用的媒体文件"""
+    """删除未使用的媒体文件（内容寻址文件按引用计数删除）"""
     deleted_count = 0
+    released_objects = set()
+    removed_files = []  # 引用归零的文件，提交之后再删除
     for url in urls:
         # 从 URL 中提取文件路径
         # URL 格式: /static/blog/images/xxx.jpg 或 /static/blog/videos/xxx.mp4
         if url.startswith("/static/"):
+            # 内容寻址文件（包括压缩视频等派生文件）只释放当前用户对原文件的引用，没有其他引用时才删除
+            stored = storage_service.find_object(db, url)
+            if stored is not None:
+                if stored.id not in released_objects:
+                    released_objects.add(stored.id)
+                    released = storage_service.release(db, current_user.id, stored.url)
+                    if released:
+                        removed_files.append(released)
+                        deleted_count += 1
+                        print(f"已删除文件: {stored.url}")
+                continue
+            if storage_service.is_content_addressed(url):
+                continue  # 派生文件的原文件记录已不存在，不单独删除
+
             file_path = Path("uploads") / url.replace("/static/", "")
             if file_path.exists():
                 try:
+                    # 图片的多尺寸版本随原图一起删除
+                    if url.startswith("/static/blog/images/"):
+                        for variant in image_service.variant_files(file_path):
+                            variant.unlink()
+                        db.query(models.ImageAsset).filter(models.ImageAsset.url == url).delete()
                     file_path.unlink()
                     deleted_count += 1
                     print(f"已删除文件: {file_path}")
@@ -189,6 +207,9 @@ async def delete_media(
                     print(f"删除文件失败 {file_path}: {e}")
         else:
             print(f"跳过非博客媒体文件: {url}")
+    db.commit()
+    for paths in removed_files:
+        storage_service.remove_files(db, paths)
     print(f"共删除 {deleted_count} 个媒体文件")
     return None
 
@@ -218,12 +239,36 @@ async def get_media_sizes(
     return {"sizes": sizes}
 
 
+def finish_video_upload(db: Session, user_id: int, final_path: Path, filename: str) -> dict:
+    """视频已存入内容寻址路径：创建转码任务（相同视频复用已有任务）并返回上传结果"""
+    file_size = final_path.stat().st_size
+    file_url = storage_service.to_url(final_path)
+
+    print(f"视频上传成功: {filename}, 大小: {file_size / (1024 * 1024):.1f}MB")
+
+    # 转码在进程池中执行，不阻塞事件循环
+    job = transcode_service.enqueue(db, user_id, final_path)
+    message = f"视频上传成功 ({file_size / (1024 * 1024):.1f}MB)"
+    if job is not None:
+        message += "，正在后台压缩"
+
+    return {
+        "url": file_url,
+        "type": "video",
+        "compressed": False,
+        "message": message,
+        "size": file_size,
+        "job_id": job.id if job is not None else None
+    }
+
+
 @router.post("/video", response_model=dict)
 async def upload_video(
     current_user: dependencies.CurrentUser,
+    db: dependencies.DbSession,
     file: UploadFile = File(...)
 ):
-    """上传博客视频"""
+    """上传博客视频（原文件立即可用，后台压缩完成后博客自动切换到压缩版本）"""
     # 验证文件类型
     if file.content_type not in ALLOWED_VIDEO_TYPES:
         raise HTTPException(
@@ -231,54 +276,342 @@ async def upload_video(
             detail=f"不支持的视频类型，请上传 {', '.join(ALLOWED_VIDEO_TYPES.keys())} 格式的视频"
         )
 
-    temp_path = None
+    staged = storage_service.staging_path()
     try:
-        # 创建上传目录
-        upload_dir = Path("uploads/blog/videos")
-        upload_dir.mkdir(parents=True, exist_ok=True)
-
-        # 生成唯一文件名
-        file_extension = ALLOWED_VIDEO_TYPES[file.content_type]
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        final_path = upload_dir / unique_filename
-
-        # 直接流式写入到最终位置（避免临时文件）
-        with open(final_path, "wb") as f:
+        # 流式写入临时文件并计算哈希
+        digest = hashlib.sha256()
+        file_size = 0
+        with open(staged, "wb") as f:
             while chunk := await file.read(1024 * 1024):  # 每次读取1MB
+                file_size += len(chunk)
+                if file_size > MAX_VIDEO_SIZE:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"视频大小不能超过 {MAX_VIDEO_SIZE // (1024 * 1024 * 1024)}GB"
+                    )
+                digest.update(chunk)
                 f.write(chunk)
 
-        # 获取文件大小
-        file_size = final_path.stat().st_size
-        file_url = f"/static/blog/videos/{unique_filename}"
-
-        print(f"视频上传成功: {file.filename}, 大小: {file_size / (1024 * 1024):.1f}MB")
-
-        return {
-            "url": file_url,
-            "type": "video",
-            "compressed": False,
-            "message": f"视频上传成功 ({file_size / (1024 * 1024):.1f}MB)",
-            "size": file_size
-        }
+        # 相同内容的视频只保存一份
+        stored, _ = storage_service.store(
+            db, current_user.id, staged, "videos", ALLOWED_VIDEO_TYPES[file.content_type], digest.hexdigest()
+        )
+        return finish_video_upload(db, current_user.id, storage_service.url_to_path(stored.url), file.filename)
 
     except HTTPException:
         # 清理临时文件
-        if temp_path and temp_path.exists():
-            temp_path.unlink()
+        staged.unlink(missing_ok=True)
         raise
     except Exception as e:
         print(f"视频上传错误: {str(e)}")
         import traceback
         traceback.print_exc()
 
-        # 清理部分上传的文件
-        if 'final_path' in locals() and final_path.exists():
-            try:
-                final_path.unlink()
-            except:
-                pass
+        # 清理部分上传的文件（已入库的文件由引用计数管理）
+        staged.unlink(missing_ok=True)
 
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"视频处理失败: {str(e)}"
         )
+
+
+def get_own_session(db: Session, session_id: str, user_id: int) -> models.UploadSession:
+    """获取当前用户的上传会话"""
+    session = db.query(models.UploadSession).filter(models.UploadSession.id == session_id).first()
+
+    if not session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="上传会话不存在或已过期"
+        )
+
+    if session.user_id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="无权访问此上传会话"
+        )
+
+    return session
+
+
+@router.post("/sessions", response_model=schemas.UploadSessionRead, status_code=status.HTTP_201_CREATED)
+async def create_upload_session(
+    session_data: schemas.UploadSessionCreate,
+    current_user: dependencies.CurrentUser,
+    db: dependencies.DbSession
+):
+    """创建断点续传会话（大视频分块上传，网络中断后可续传）"""
+    if session_data.content_type not in ALLOWED_VIDEO_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"不支持的视频类型，请上传 {', '.join(ALLOWED_VIDEO_TYPES.keys())} 格式的视频"
+        )
+
+    if session_data.size > MAX_VIDEO_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"视频大小不能超过 {MAX_VIDEO_SIZE // (1024 * 1024 * 1024)}GB"
+        )
+
+    open_sessions = db.query(models.UploadSession).filter(
+        models.UploadSession.user_id == current_user.id,
+        models.UploadSession.status == "uploading"
+    ).count()
+    if open_sessions >= settings.UPLOAD_MAX_SESSIONS_PER_USER:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"同时进行的上传不能超过 {settings.UPLOAD_MAX_SESSIONS_PER_USER} 个，请先完成或取消之前的上传"
+        )
+
+    session = models.UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=current_user.id,
+        filename=session_data.filename,
+        content_type=session_data.content_type,
+        size=session_data.size,
+        chunk_size=settings.UPLOAD_CHUNK_SIZE,
+        status="uploading",
+        expires_at=upload_service.next_expiry()
+    )
+
+    # 按总大小预分配临时文件，磁盘空间不足时在上传前失败
+    try:
+        await asyncio.to_thread(upload_service.preallocate, upload_service.session_path(session.id), session.size)
+    except OSError as e:
+        upload_service.session_path(session.id).unlink(missing_ok=True)
+        raise HTTPException(
+            status_code=status.HTTP_507_INSUFFICIENT_STORAGE,
+            detail=f"服务器存储空间不足: {e}"
+        )
+
+    db.add(session)
+    db.commit()
+    db.refresh(session)
+
+    return upload_service.describe(db, session)
+
+
+@router.get("/sessions/{session_id}", response_model=schemas.UploadSessionRead)
+async def get_upload_session(
+    session_id: str,
+    current_user: dependencies.CurrentUser,
+    db: dependencies.DbSession
+):
+    """查询上传会话已收到的范围（续传前调用，只需补传 missing_chunks）"""
+    session = get_own_session(db, session_id, current_user.id)
+    return upload_service.describe(db, session)
+
+
+@router.put("/sessions/{session_id}/chunks", response_model=schemas.UploadSessionRead)
+async def upload_chunk(
+    session_id: str,
+    request: Request,
+    current_user: dependencies.CurrentUser,
+    db: dependencies.DbSession,
+    offset: int = Query(..., ge=0, description="分块在文件中的起始位置（chunk_size 的整数倍）"),
+    checksum: str = Header(..., alias="X-Chunk-SHA256", description="分块内容的 SHA-256（十六进制）")
+):
+    """上传一个分块（请求体为分块的原始字节，重复上传同一分块会覆盖）"""
+    session = get_own_session(db, session_id, current_user.id)
+
+    if session.status != "uploading":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="上传已完成"
+        )
+
+    if offset % session.chunk_size != 0 or offset >= session.size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"偏移量必须是 {session.chunk_size} 的整数倍且小于文件大小"
+        )
+
+    index = offset // session.chunk_size
+    expected = upload_service.expected_chunk_size(session, index)
+    path = upload_service.session_path(session.id)
+    temp = upload_service.chunk_path(session.id)
+    digest = hashlib.sha256()
+    received = 0
+
+    # 请求体边收边写入分块临时文件（在线程中执行），校验通过后才写入会话文件，
+    # 大小或校验和不正确的重传不会覆盖已收到的正确数据
+    try:
+        f = await asyncio.to_thread(open, temp, "wb")
+        try:
+            async for piece in request.stream():
+                received += len(piece)
+                if received > expected:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"分块大小不正确：应为 {expected} 字节"
+                    )
+                digest.update(piece)
+                await asyncio.to_thread(f.write, piece)
+        finally:
+            await asyncio.to_thread(f.close)
+
+        if received != expected:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"分块大小不正确：应为 {expected} 字节，实际收到 {received} 字节"
+            )
+
+        if digest.hexdigest() != checksum.lower():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="分块校验失败，请重新上传该分块"
+            )
+
+        await asyncio.to_thread(upload_service.write_chunk, path, offset, temp)
+    finally:
+        temp.unlink(missing_ok=True)
+
+    chunk = db.query(models.UploadChunk).filter(
+        models.UploadChunk.session_id == session.id,
+        models.UploadChunk.index == index
+    ).first()
+    if chunk:
+        chunk.sha256 = digest.hexdigest()
+    else:
+        db.add(models.UploadChunk(session_id=session.id, index=index, size=received, sha256=digest.hexdigest()))
+    session.expires_at = upload_service.next_expiry()
+    try:
+        db.commit()
+    except IntegrityError:
+        # 同一分块被并行上传了两次，另一个请求已记录
+        db.rollback()
+
+    return upload_service.describe(db, session)
+
+
+@router.post("/sessions/{session_id}/complete", response_model=dict)
+async def complete_upload_session(
+    session_id: str,
+    current_user: dependencies.CurrentUser,
+    db: dependencies.DbSession
+):
+    """完成上传：所有分块到达后存入内容寻址路径并创建转码任务（重复调用返回相同结果）"""
+    session = get_own_session(db, session_id, current_user.id)
+
+    if session.status == "completed":
+        return completed_result(session)
+
+    received = db.query(models.UploadChunk).filter(models.UploadChunk.session_id == session.id).count()
+    missing = upload_service.total_chunks(session) - received
+    if missing > 0:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"还有 {missing} 个分块未上传"
+        )
+
+    # 条件更新认领会话：并发的完成请求只有一个能继续，避免重复移动临时文件
+    claimed = db.query(models.UploadSession).filter(
+        models.UploadSession.id == session.id,
+        models.UploadSession.status == "uploading"
+    ).update(
+        {models.UploadSession.status: "completing", models.UploadSession.expires_at: upload_service.next_expiry()},
+        synchronize_session=False
+    )
+    db.commit()
+    if not claimed:
+        db.refresh(session)
+        if session.status == "completed":
+            return completed_result(session)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="上传正在完成，请稍后重试",
+            headers={"Retry-After": "1"}
+        )
+
+    try:
+        # 分块可能乱序到达，完成时再对整个文件计算哈希（在线程中执行）
+        staged = upload_service.session_path(session.id)
+        sha256 = await asyncio.to_thread(storage_service.hash_file, staged)
+        stored, _ = storage_service.store(
+            db, current_user.id, staged, "videos", ALLOWED_VIDEO_TYPES[session.content_type], sha256
+        )
+
+        result = finish_video_upload(db, current_user.id, storage_service.url_to_path(stored.url), session.filename)
+    except Exception:
+        # 临时文件还在时恢复为上传中，客户端可以重试完成请求
+        db.rollback()
+        if upload_service.session_path(session.id).exists():
+            session.status = "uploading"
+            db.commit()
+        raise
+
+    session.status = "completed"
+    session.url = result["url"]
+    session.job_id = result["job_id"]
+    session.expires_at = upload_service.next_expiry()  # 保留一段时间，便于客户端重试完成请求
+    db.query(models.UploadChunk).filter(models.UploadChunk.session_id == session.id).delete()
+    db.commit()
+
+    return result
+
+
+def completed_result(session: models.UploadSession) -> dict:
+    """已完成会话的完成结果（重复调用完成接口时返回）"""
+    return {
+        "url": session.url,
+        "type": "video",
+        "compressed": False,
+        "message": "视频已上传",
+        "size": session.size,
+        "job_id": session.job_id
+    }
+
+
+@router.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def cancel_upload_session(
+    session_id: str,
+    current_user: dependencies.CurrentUser,
+    db: dependencies.DbSession
+):
+    """取消上传并删除已上传的数据"""
+    session = get_own_session(db, session_id, current_user.id)
+
+    if session.status == "completing":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="上传正在完成，无法取消"
+        )
+
+    if session.status == "uploading":
+        upload_service.session_path(session.id).unlink(missing_ok=True)
+    db.query(models.UploadChunk).filter(models.UploadChunk.session_id == session.id).delete()
+    db.delete(session)
+    db.commit()
+
+    return None
+
+
+@router.get("/jobs/{job_id}", response_model=schemas.TranscodeJobRead)
+async def get_transcode_job(
+    job_id: int,
+    current_user: dependencies.CurrentUser,
+    db: dependencies.DbSession
+):
+    """查询视频转码任务的进度"""
+    job = db.query(models.TranscodeJob).filter(models.TranscodeJob.id == job_id).first()
+
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="转码任务不存在"
+        )
+
+    # 相同视频共用一个转码任务，上传过该视频的用户都可以查看
+    if job.user_id != current_user.id and not db.query(models.ObjectReference).join(
+        models.StoredObject, models.ObjectReference.object_id == models.StoredObject.id
+    ).filter(
+        models.StoredObject.url == job.source_url,
+        models.ObjectReference.user_id == current_user.id
+    ).first():
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="无权查看此转码任务"
+        )
+
+    return job
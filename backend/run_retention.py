@@ -0,0 +1,35 @@
+"""
+手动执行数据清理（保留策略见 config.py 中的 RETENTION_* 配置）
+
+运行方式：
+    cd backend
+    python run_retention.py --dry-run   # 仅预览将删除的行数
+    python run_retention.py             # 实际删除
+
+对话及消息默认不清理，需配置 RETENTION_ABANDONED_CONVERSATION_DAYS 才会删除。
+"""
+
+import sys
+
+from services.retention_service import run_retention_job
+
+
+if __name__ == "__main__":
+    dry_run = "--dry-run" in sys.argv
+
+    print("=" * 50)
+    print(f"开始数据清理{'（dry-run，不会删除数据）' if dry_run else ''}")
+    print("=" * 50)
+
+    reports = run_retention_job(dry_run=dry_run)
+
+    for report in reports:
+        action = "预计删除" if dry_run else "已删除"
+        print(
+            f"{report['table']:<24} {action} {report['rows']:>8} 行  "
+            f"{report['batches']:>4} 批  {report['seconds']:.3f}s  ({report['policy']})"
+        )
+
+    total = sum(report["rows"] for report in reports)
+    seconds = sum(report["seconds"] for report in reports)
+    print(f"\n合计 {total} 行，耗时 {seconds:.3f}s")
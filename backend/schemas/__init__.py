@@ -34,11 +34,18 @@ from .chat import (
     MessageListItem,
     MessageRead,
     MessageListResponse,
+    MessageSearchItem,
+    MessageSearchResponse,
+    MessageVersionItem,
+    MessageVersionListResponse,
     MessageFeedbackCreate,
     MessageFeedbackResponse,
     ConversationExportRequest,
     ConversationExportResponse,
     StreamChunk,
+    StreamDelta,
+    StreamSummary,
+    AIUsageSummary,
 )
 from .announcement import (
     AnnouncementCreate,
@@ -95,6 +102,7 @@ from .notification import (
     NotificationMarkReadResponse,
     NotificationDeleteResponse,
     NotificationUnreadCountResponse,
+    NotificationReconcileResponse,
 )
 from .like import (
     LikeResponse,
@@ -113,6 +121,24 @@ from .favorite import (
     FavoriteFolderInfo,
     FavoriteStatusResponse,
 )
+from .admin import (
+    RetentionPolicyReport,
+    RetentionRunResponse,
+    ResponseCacheStats,
+    AIProviderStatus,
+    AIUsageItem,
+    AIUsageReport,
+    LatencySummary,
+    AIProviderLatency,
+    AILatencyReport,
+)
+from .upload import (
+    TranscodeJobRead,
+    ImageVariant,
+    ImageUploadResponse,
+    UploadSessionCreate,
+    UploadSessionRead,
+)
 
 __all__ = [
     "BlogCreate",
@@ -144,11 +170,18 @@ __all__ = [
     "MessageListItem",
     "MessageRead",
     "MessageListResponse",
+    "MessageSearchItem",
+    "MessageSearchResponse",
+    "MessageVersionItem",
+    "MessageVersionListResponse",
     "MessageFeedbackCreate",
     "MessageFeedbackResponse",
     "ConversationExportRequest",
     "ConversationExportResponse",
     "StreamChunk",
+    "StreamDelta",
+    "StreamSummary",
+    "AIUsageSummary",
     "AnnouncementCreate",
     "AnnouncementUpdate",
     "AnnouncementRead",
@@ -189,6 +222,7 @@ __all__ = [
     "NotificationMarkReadResponse",
     "NotificationDeleteResponse",
     "NotificationUnreadCountResponse",
+    "NotificationReconcileResponse",
     "LikeResponse",
     "LikeStatusResponse",
     "FavoriteFolderCreate",
@@ -200,4 +234,18 @@ __all__ = [
     "FavoriteResponse",
     "FavoriteFolderInfo",
     "FavoriteStatusResponse",
+    "RetentionPolicyReport",
+    "RetentionRunResponse",
+    "ResponseCacheStats",
+    "AIProviderStatus",
+    "AIUsageItem",
+    "AIUsageReport",
+    "LatencySummary",
+    "AIProviderLatency",
+    "AILatencyReport",
+    "TranscodeJobRead",
+    "ImageVariant",
+    "ImageUploadResponse",
+    "UploadSessionCreate",
+    "UploadSessionRead",
 ]
@@ -0,0 +1,104 @@
+from datetime import date
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class RetentionPolicyReport(BaseModel):
+    """单个保留策略的执行结果"""
+    table: str
+    policy: str
+    rows: int  # 删除行数（dry-run 时为预计删除行数）
+    batches: int
+    seconds: float
+    dry_run: bool
+
+
+class RetentionRunResponse(BaseModel):
+    """数据清理执行结果"""
+    dry_run: bool
+    total_rows: int
+    seconds: float
+    reports: list[RetentionPolicyReport]
+
+
+class ResponseCacheStats(BaseModel):
+    """AI 回复缓存统计"""
+    enabled: bool
+    entries: int
+    max_entries: int
+    ttl_seconds: int
+    hits: int
+    misses: int
+    stores: int
+    evictions: int
+    expirations: int
+    hit_rate: float
+
+
+class AIProviderStatus(BaseModel):
+    """AI 服务商健康状况"""
+    provider: str
+    state: str  # closed=正常, open=熔断中, half_open=试探中
+    requests: int  # 统计窗口内的请求数
+    error_rate: float
+    avg_ttft_ms: Optional[float] = None  # 平均首字延迟（毫秒）
+    consecutive_failures: int
+
+
+class AIUsageItem(BaseModel):
+    """按用户、服务商和模型汇总的 AI 用量"""
+    user_id: int
+    username: str
+    provider: str
+    model: str
+    requests: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+
+
+class AIUsageReport(BaseModel):
+    """AI 用量汇总"""
+    start: date
+    end: date
+    requests: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    items: list[AIUsageItem]
+
+
+class LatencySummary(BaseModel):
+    """统计窗口内的耗时分布"""
+    count: int
+    avg: Optional[float] = None
+    p50: Optional[float] = None
+    p95: Optional[float] = None
+    max: Optional[float] = None
+
+
+class AIProviderLatency(BaseModel):
+    """单个服务商 / 模型的调用延迟"""
+    provider: str
+    model: str
+    attempts: int  # 调用次数（进程启动以来，下同）
+    succeeded: int
+    cancelled: int  # 对冲失败方或客户端断开
+    failed: int
+    errors: dict[str, int]  # 失败类型：timeout / rate_limited / auth / bad_request / server_error / connection / other
+    retries: dict[str, int]  # 参数回退重试：max_tokens / max_completion_tokens / temperature / stream_options
+    completion_tokens: int
+    connect_ms: LatencySummary  # 发出请求到收到响应头
+    ttft_ms: LatencySummary  # 首字延迟
+    max_gap_ms: LatencySummary  # 每次调用中相邻 token 的最大间隔
+    tokens_per_second: LatencySummary  # 首字之后的生成速度
+
+
+class AILatencyReport(BaseModel):
+    """AI 调用延迟统计"""
+    window_seconds: int  # 分布统计的滚动窗口
+    requests: int
+    fallbacks: dict[str, int]  # 降级到模拟回复的原因
+    queue_wait_ms: LatencySummary  # 排队等待 AI 调用名额的时间
+    providers: list[AIProviderLatency]
@@ -24,6 +24,7 @@ class ConversationListItem(BaseModel):
     title: str
     last_message: str | None = None
     message_count: int = 0
+    last_message_at: datetime | None = None
     created_at: datetime
     updated_at: datetime
 
@@ -68,6 +69,7 @@ class MessageListItem(BaseModel):
     role: str  # 'user' or 'assistant'
     content: str
     tokens_used: int | None = None
+    truncated: bool = False  # 生成被中断，内容不完整
     created_at: datetime
 
     class Config:
@@ -80,6 +82,7 @@ class MessageRead(BaseModel):
     role: str
     content: str
     tokens_used: int | None = None
+    truncated: bool = False  # 生成被中断，内容不完整
     created_at: datetime
 
     class Config:
@@ -92,6 +95,44 @@ class MessageListResponse(BaseModel):
     page: int
     size: int
     items: list[MessageListItem]
+    next_before_id: int | None = None  # 按 ID 倒序加载时，还有更早的消息则为下一页的 before_id
+
+
+class MessageSearchItem(BaseModel):
+    """消息检索结果"""
+    message_id: int
+    conversation_id: int
+    conversation_title: str
+    role: str
+    snippet: str  # 命中位置附近的一段内容
+    score: float  # 相关度得分，越大越相关
+    created_at: datetime
+
+
+class MessageSearchResponse(BaseModel):
+    """消息检索响应（分页，按相关度排序）"""
+    total: int
+    page: int
+    size: int
+    items: list[MessageSearchItem]
+
+
+class MessageVersionItem(BaseModel):
+    """AI 消息的历史版本"""
+    id: int
+    content: str
+    tokens_used: int | None = None
+    truncated: bool = False
+    created_at: datetime  # 被重新生成的回答替换的时间
+
+    class Config:
+        from_attributes = True
+
+
+class MessageVersionListResponse(BaseModel):
+    """AI 消息的历史版本列表（从新到旧）"""
+    message_id: int
+    items: list[MessageVersionItem]
 
 
 # ============= Feedback Schemas =============
@@ -127,3 +168,29 @@ class StreamChunk(BaseModel):
     role: str
     content: str
     delta: str  # 新增的内容片段
+
+
+class StreamDelta(BaseModel):
+    """SSE 增量数据块（协议 v2）"""
+    id: int
+    seq: int  # 从 1 开始递增的序号
+    delta: str
+    replace: bool = False  # True 表示用 delta 替换已收到的全部内容（如错误提示）
+
+
+class StreamSummary(BaseModel):
+    """SSE 结束摘要（协议 v2）"""
+    id: int
+    seq: int  # 最后一个增量的序号
+    length: int  # 完整内容字符数
+    content_sha256: str  # 完整内容的 SHA-256，用于校验拼接结果
+    tokens_used: int | None = None
+    truncated: bool = False  # 内容不完整（生成被中断，或从检查点恢复时仍在生成）
+
+
+class AIUsageSummary(BaseModel):
+    """当前用户的 AI 用量与配额"""
+    day_tokens: int  # 今日（UTC）已用 Token 数
+    month_tokens: int  # 本月已用 Token 数
+    daily_quota: int | None = None  # 每日配额（None 表示不限）
+    monthly_quota: int | None = None  # 每月配额（None 表示不限）
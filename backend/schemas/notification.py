@@ -13,6 +13,10 @@ class NotificationRead(BaseModel):
     related_url: str | None = None
     is_read: bool = False
     created_at: datetime
+    actor_count: int = 1  # 合并通知的触发者人数
+    actors: list[str] = []  # 最近触发者显示名（最新在前）
+    last_event_at: datetime | None = None  # 最近一次事件时间
+    is_broadcast: bool = False  # 广播通知（id 为广播 ID，使用 /broadcasts/{id}/read 标记已读）
 
     class Config:
         from_attributes = True
@@ -47,3 +51,9 @@ class NotificationDeleteResponse(BaseModel):
 class NotificationUnreadCountResponse(BaseModel):
     """未读通知数量响应"""
     unread_count: int
+
+
+class NotificationReconcileResponse(BaseModel):
+    """未读计数校正响应"""
+    message: str
+    repaired_count: int
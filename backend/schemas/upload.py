@@ -0,0 +1,66 @@
+from datetime import datetime
+from pydantic import BaseModel, Field
+
+
+class TranscodeJobRead(BaseModel):
+    """视频转码任务进度"""
+    id: int
+    status: str  # queued / running / completed / failed
+    progress: float  # 0-100
+    source_url: str
+    output_url: str | None = None  # 完成后博客使用的视频地址（压缩结果不更小时与 source_url 相同）
+    source_size: int
+    output_size: int | None = None
+    duration: float | None = None  # 视频时长（秒）
+    error: str | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    class Config:
+        from_attributes = True
+
+
+class ImageVariant(BaseModel):
+    """图片的一个尺寸版本"""
+    width: int
+    height: int
+    url: str
+    size: int  # 字节
+
+
+class ImageUploadResponse(BaseModel):
+    """图片上传结果（含多尺寸版本，可直接用于 <picture> / srcset）"""
+    url: str  # 原图地址
+    type: str = "image"
+    size: int  # 原图大小（字节）
+    format: str | None = None  # jpeg / png / gif / webp
+    width: int | None = None  # 原图尺寸（按 EXIF 方向），Pillow 未安装时为空
+    height: int | None = None
+    placeholder: str | None = None  # 模糊占位图 data URI
+    variants: dict[str, list[ImageVariant]] = {}  # 格式 -> 按宽度升序的版本，如 {"webp": [...], "jpeg": [...]}
+    srcset: dict[str, str] = {}  # 格式 -> srcset 字符串，如 "/static/...-320w.webp 320w, ..."
+
+
+class UploadSessionCreate(BaseModel):
+    """创建断点续传会话"""
+    filename: str = Field(..., min_length=1, max_length=255)
+    content_type: str
+    size: int = Field(..., gt=0)  # 文件总大小（字节）
+
+
+class UploadSessionRead(BaseModel):
+    """断点续传会话状态"""
+    id: str
+    filename: str
+    content_type: str
+    size: int
+    chunk_size: int  # 除最后一块外每块的大小，分块偏移量必须是它的整数倍
+    total_chunks: int
+    status: str  # uploading / completing / completed
+    received_bytes: int
+    received_ranges: list[list[int]]  # 已收到的字节范围 [start, end)
+    missing_chunks: list[int]  # 尚未收到的分块序号
+    expires_at: datetime  # 超过该时间没有新分块，会话和已上传的数据会被清理
+    url: str | None = None  # 完成后的视频地址
+    job_id: int | None = None  # 完成后创建的转码任务
@@ -3,6 +3,6 @@ Services 模块
 包含各种业务逻辑服务
 """
 
-from .ai_service import ai_service
+from .ai_router import ai_service
 
 __all__ = ["ai_service"]
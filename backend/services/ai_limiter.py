@@ -0,0 +1,167 @@
+"""
+AI 请求并发限制
+限制同时进行的 AI 调用数量，超出的请求按用户轮转排队，队列过长时直接拒绝
+
+- 全局最多 AI_MAX_CONCURRENCY 个调用同时进行，且不超过可用服务商的并发上限之和
+  （由 services/ai_router.py 通过 capacity_hook 提供），服务商已满时请求也在这里排队
+- 排队的请求在用户之间轮流放行：同一用户连发多条不会挤占其他用户
+- 排队总数达到 AI_QUEUE_MAX_DEPTH 时抛出 QueueFullError，由路由返回 429 和 Retry-After
+
+状态保存在进程内存中，多进程部署时每个进程分别限制。
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+
+from config import settings
+
+
+class QueueFullError(Exception):
+    """排队人数已满"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("AI 服务繁忙，请稍后重试")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """一次 AI 调用的排队凭证"""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.granted = False
+        self.released = False
+        self.created_at = time.monotonic()
+        self.granted_at: Optional[float] = None
+        self._event: Optional[asyncio.Event] = None
+
+    @property
+    def wait_seconds(self) -> Optional[float]:
+        """排队等待的时间（尚未获得名额时为 None）"""
+        if self.granted_at is None:
+            return None
+        return self.granted_at - self.created_at
+
+    def _notify(self) -> None:
+        self.granted = True
+        self.granted_at = time.monotonic()
+        if self._event is not None:
+            self._event.set()
+
+
+class FairLimiter:
+    """全局并发上限 + 按用户轮转的公平队列"""
+
+    def __init__(self):
+        self.active = 0
+        # user_id -> 该用户排队中的凭证；字典顺序即轮转顺序
+        self._queues: "OrderedDict[int, deque[Ticket]]" = OrderedDict()
+        # 服务商的容量上限（可用服务商的并发上限之和），返回 None 表示不限制
+        self.capacity_hook: Optional[Callable[[], Optional[int]]] = None
+
+    @property
+    def capacity(self) -> int:
+        """当前可同时进行的调用数：全局上限与服务商容量中较小的一个"""
+        limit = max(settings.AI_MAX_CONCURRENCY, 1)
+        if self.capacity_hook is not None:
+            provider_limit = self.capacity_hook()
+            if provider_limit is not None:
+                limit = min(limit, max(provider_limit, 1))
+        return limit
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def enqueue(self, user_id: int) -> Ticket:
+        """
+        申请一个调用名额：有空闲名额时立即获得，否则进入该用户的队列
+
+        Raises:
+            QueueFullError: 排队总数已达上限
+        """
+        ticket = Ticket(user_id)
+        if not self._queues and self.active < self.capacity:
+            self.active += 1
+            ticket._notify()
+            return ticket
+
+        if self.waiting >= settings.AI_QUEUE_MAX_DEPTH:
+            raise QueueFullError(settings.AI_QUEUE_RETRY_AFTER_SECONDS)
+
+        self._queues.setdefault(user_id, deque()).append(ticket)
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        """凭证在轮转顺序中的位置（从 1 开始，已获得名额时为 0）"""
+        if ticket.granted:
+            return 0
+
+        position = 0
+        depth = 0
+        while True:
+            found_any = False
+            for queue in self._queues.values():
+                if len(queue) > depth:
+                    found_any = True
+                    position += 1
+                    if queue[depth] is ticket:
+                        return position
+            if not found_any:
+                return 0
+            depth += 1
+
+    async def wait(self, ticket: Ticket, timeout: Optional[float] = None) -> bool:
+        """等待获得名额，超时返回 False（仍在队列中）"""
+        if ticket.granted:
+            return True
+        if ticket._event is None:
+            ticket._event = asyncio.Event()
+        try:
+            await asyncio.wait_for(ticket._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def release(self, ticket: Ticket) -> None:
+        """归还名额或退出队列（可重复调用），并按轮转顺序放行下一个请求"""
+        if ticket.released:
+            return
+        ticket.released = True
+
+        if not ticket.granted:
+            queue = self._queues.get(ticket.user_id)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                if not queue:
+                    del self._queues[ticket.user_id]
+            return
+
+        self.active -= 1
+        self.dispatch()
+
+    def dispatch(self) -> None:
+        """按轮转顺序放行排队的请求，直到没有空闲名额（名额归还或服务商容量增加时调用）"""
+        while self._queues and self.active < self.capacity:
+            user_id, queue = next(iter(self._queues.items()))
+            next_ticket = queue.popleft()
+            # 该用户还有排队请求时移到队尾，轮到其他用户
+            del self._queues[user_id]
+            if queue:
+                self._queues[user_id] = queue
+            self.active += 1
+            next_ticket._notify()
+
+    def get_stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_concurrency": settings.AI_MAX_CONCURRENCY,
+            "capacity": self.capacity,
+            "max_queue_depth": settings.AI_QUEUE_MAX_DEPTH,
+        }
+
+
+ai_limiter = FairLimiter()
@@ -0,0 +1,312 @@
+"""
+AI 调用延迟统计
+记录每次 AI 请求的各阶段耗时，按服务商和模型汇总，供管理员面板和 Prometheus 抓取
+
+- 请求（RequestSpan）：排队等待时间、各次尝试、降级到模拟回复的原因
+- 尝试（AttemptSpan，每个服务商一次）：建立连接（收到响应头）耗时、首字延迟、
+  token 间隔、回复 token 数、生成速度、参数回退重试、失败类型
+- 分位数按 AI_METRICS_WINDOW_SECONDS 滚动窗口计算；计数从进程启动开始累计
+
+调用方式与 Token 用量相同（services/ai_service.py 的 track_usage）：路由在获得 AI 调用名额后
+track_request() 放入一个 RequestSpan，AIRouter 为每个服务商创建 AttemptSpan 并在结束后提交。
+
+状态保存在进程内存中，多进程部署时每个进程分别统计。
+"""
+
+import contextvars
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+from config import settings
+
+@dataclass
+class AttemptSpan:
+    """对一个服务商的一次调用"""
+    provider: str
+    model: Optional[str]
+    started: float = field(default_factory=time.monotonic)
+    connect_seconds: Optional[float] = None  # 发出请求到收到响应头（仅 OpenAI 兼容接口）
+    ttft_seconds: Optional[float] = None
+    max_gap_seconds: float = 0.0  # 相邻两个 token 之间的最大间隔
+    chunks: int = 0
+    completion_tokens: Optional[int] = None
+    retries: list[str] = field(default_factory=list)  # 参数回退重试的原因
+    outcome: Optional[str] = None  # ok / error / cancelled（任务启动前被取消时保持 None，按取消统计）
+    error_kind: Optional[str] = None  # timeout / rate_limited / auth / bad_request / server_error / connection / other
+    _last_token_at: Optional[float] = None
+
+    def on_token(self) -> None:
+        now = time.monotonic()
+        if self.ttft_seconds is None:
+            self.ttft_seconds = now - self.started
+        else:
+            self.max_gap_seconds = max(self.max_gap_seconds, now - self._last_token_at)
+        self._last_token_at = now
+        self.chunks += 1
+
+    def finish(self, outcome: str = "ok", error: Optional[BaseException] = None) -> None:
+        self.outcome = outcome
+        if error is not None:
+            self.error_kind = classify_error(error)
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """首个 token 之后的生成速度"""
+        if not self.completion_tokens or self.ttft_seconds is None or self._last_token_at is None:
+            return None
+        generating = self._last_token_at - self.started - self.ttft_seconds
+        if generating <= 0:
+            return None
+        return self.completion_tokens / generating
+
+
+@dataclass
+class RequestSpan:
+    """一次 AI 请求（可能依次或同时尝试多个服务商）"""
+    queue_wait_seconds: Optional[float] = None
+    attempts: list[AttemptSpan] = field(default_factory=list)
+    fallback_reason: Optional[str] = None  # 降级到模拟回复的原因
+
+
+current_request: contextvars.ContextVar[Optional[RequestSpan]] = contextvars.ContextVar("current_request", default=None)
+current_attempt: contextvars.ContextVar[Optional[AttemptSpan]] = contextvars.ContextVar("current_attempt", default=None)
+
+
+def track_request(queue_wait_seconds: Optional[float] = None) -> RequestSpan:
+    """开始统计当前上下文中的 AI 请求"""
+    span = RequestSpan(queue_wait_seconds=queue_wait_seconds)
+    current_request.set(span)
+    return span
+
+
+def record_connect(seconds: float) -> None:
+    attempt = current_attempt.get()
+    if attempt is not None:
+        attempt.connect_seconds = seconds
+
+
+def record_retry(reason: str) -> None:
+    attempt = current_attempt.get()
+    if attempt is not None:
+        attempt.retries.append(reason)
+
+
+def classify_error(error: BaseException) -> str:
+    """按 HTTP 状态码和异常类型把服务商错误归类（不依赖具体 SDK）"""
+    status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status_code, int):
+        if status_code == 429:
+            return "rate_limited"
+        if status_code in (401, 403):
+            return "auth"
+        if status_code == 408:
+            return "timeout"
+        if 400 <= status_code < 500:
+            return "bad_request"
+        if status_code >= 500:
+            return "server_error"
+
+    names = " ".join(cls.__name__ for cls in type(error).__mro__).lower()
+    if "timeout" in names:
+        return "timeout"
+    if "ratelimit" in names:
+        return "rate_limited"
+    if "authentication" in names or "permission" in names:
+        return "auth"
+    if any(name in names for name in ("connection", "protocol", "network", "readerror")):
+        return "connection"
+    return "other"
+
+
+class _Window:
+    """滚动窗口内的样本，用于计算分位数"""
+
+    def __init__(self):
+        self.samples: deque[tuple[float, float]] = deque()
+
+    def add(self, now: float, value: float) -> None:
+        self.samples.append((now, value))
+
+    def summary(self, now: float, scale: float = 1.0) -> dict:
+        cutoff = now - settings.AI_METRICS_WINDOW_SECONDS
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+        values = sorted(value for _, value in self.samples)
+        if not values:
+            return {"count": 0, "avg": None, "p50": None, "p95": None, "max": None}
+
+        def pick(p: float) -> float:
+            return round(values[min(len(values) - 1, int(p * len(values)))] * scale, 1)
+
+        return {
+            "count": len(values),
+            "avg": round(sum(values) / len(values) * scale, 1),
+            "p50": pick(0.5),
+            "p95": pick(0.95),
+            "max": round(values[-1] * scale, 1),
+        }
+
+
+class _ProviderMetrics:
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        self.attempts = 0
+        self.succeeded = 0
+        self.cancelled = 0
+        self.errors: Counter[str] = Counter()
+        self.retries: Counter[str] = Counter()
+        self.completion_tokens = 0
+        self.connect = _Window()
+        self.ttft = _Window()
+        self.max_gap = _Window()
+        self.tokens_per_second = _Window()
+
+
+class LatencyMetrics:
+    """按服务商和模型汇总的延迟统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.fallbacks: Counter[str] = Counter()
+            self.queue_wait = _Window()
+            self.providers: dict[tuple[str, str], _ProviderMetrics] = {}
+
+    def record(self, span: RequestSpan) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            if span.queue_wait_seconds is not None:
+                self.queue_wait.add(now, span.queue_wait_seconds)
+            if span.fallback_reason:
+                self.fallbacks[span.fallback_reason] += 1
+
+            for attempt in span.attempts:
+                key = (attempt.provider, attempt.model or "")
+                metrics = self.providers.get(key)
+                if metrics is None:
+                    metrics = self.providers[key] = _ProviderMetrics(*key)
+
+                metrics.attempts += 1
+                metrics.retries.update(attempt.retries)
+                if attempt.outcome == "ok":
+                    metrics.succeeded += 1
+                elif attempt.outcome == "error":
+                    metrics.errors[attempt.error_kind or "other"] += 1
+                else:
+                    metrics.cancelled += 1
+
+                metrics.completion_tokens += attempt.completion_tokens or 0
+                if attempt.connect_seconds is not None:
+                    metrics.connect.add(now, attempt.connect_seconds)
+                if attempt.ttft_seconds is not None:
+                    metrics.ttft.add(now, attempt.ttft_seconds)
+                if attempt.chunks > 1:
+                    metrics.max_gap.add(now, attempt.max_gap_seconds)
+                if attempt.outcome == "ok" and attempt.tokens_per_second is not None:
+                    metrics.tokens_per_second.add(now, attempt.tokens_per_second)
+
+    def snapshot(self) -> dict:
+        """管理员面板：计数 + 滚动窗口内的分位数（耗时单位为毫秒）"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "window_seconds": settings.AI_METRICS_WINDOW_SECONDS,
+                "requests": self.requests,
+                "fallbacks": dict(self.fallbacks),
+                "queue_wait_ms": self.queue_wait.summary(now, 1000),
+                "providers": [
+                    {
+                        "provider": metrics.provider,
+                        "model": metrics.model,
+                        "attempts": metrics.attempts,
+                        "succeeded": metrics.succeeded,
+                        "cancelled": metrics.cancelled,
+                        "failed": sum(metrics.errors.values()),
+                        "errors": dict(metrics.errors),
+                        "retries": dict(metrics.retries),
+                        "completion_tokens": metrics.completion_tokens,
+                        "connect_ms": metrics.connect.summary(now, 1000),
+                        "ttft_ms": metrics.ttft.summary(now, 1000),
+                        "max_gap_ms": metrics.max_gap.summary(now, 1000),
+                        "tokens_per_second": metrics.tokens_per_second.summary(now),
+                    }
+                    for metrics in self.providers.values()
+                ],
+            }
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式：累计计数 + 滚动窗口分位数（gauge）"""
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP v4corner_ai_requests_total AI requests",
+            "# TYPE v4corner_ai_requests_total counter",
+            f"v4corner_ai_requests_total {snapshot['requests']}",
+            "# HELP v4corner_ai_fallbacks_total AI requests answered by the mock provider",
+            "# TYPE v4corner_ai_fallbacks_total counter",
+        ]
+        for reason, count in snapshot["fallbacks"].items():
+            lines.append(f'v4corner_ai_fallbacks_total{{reason="{reason}"}} {count}')
+
+        lines += [
+            "# HELP v4corner_ai_queue_wait_ms AI queue wait over the metrics window",
+            "# TYPE v4corner_ai_queue_wait_ms gauge",
+        ]
+        for quantile in ("p50", "p95"):
+            value = snapshot["queue_wait_ms"][quantile]
+            if value is not None:
+                lines.append(f'v4corner_ai_queue_wait_ms{{quantile="{quantile}"}} {value}')
+
+        counters = [
+            ("attempts_total", "Provider calls", lambda item: [({}, item["attempts"])]),
+            ("succeeded_total", "Provider calls that completed", lambda item: [({}, item["succeeded"])]),
+            ("cancelled_total", "Provider calls cancelled by hedging or client disconnect",
+             lambda item: [({}, item["cancelled"])]),
+            ("errors_total", "Provider call failures by kind",
+             lambda item: [({"kind": kind}, count) for kind, count in item["errors"].items()]),
+            ("retries_total", "Parameter fallback retries",
+             lambda item: [({"reason": reason}, count) for reason, count in item["retries"].items()]),
+            ("completion_tokens_total", "Completion tokens", lambda item: [({}, item["completion_tokens"])]),
+        ]
+        for name, help_text, values in counters:
+            lines += [f"# HELP v4corner_ai_{name} {help_text}", f"# TYPE v4corner_ai_{name} counter"]
+            for item in snapshot["providers"]:
+                for extra, value in values(item):
+                    lines.append(f"v4corner_ai_{name}{_labels(item, extra)} {value}")
+
+        gauges = [
+            ("connect_ms", "Time to response headers"),
+            ("ttft_ms", "Time to first token"),
+            ("max_gap_ms", "Largest gap between tokens per call"),
+            ("tokens_per_second", "Generation speed after the first token"),
+        ]
+        for name, help_text in gauges:
+            lines += [f"# HELP v4corner_ai_{name} {help_text} over the metrics window",
+                      f"# TYPE v4corner_ai_{name} gauge"]
+            for item in snapshot["providers"]:
+                for quantile in ("p50", "p95"):
+                    value = item[name][quantile]
+                    if value is not None:
+                        lines.append(f"v4corner_ai_{name}{_labels(item, {'quantile': quantile})} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(item: dict, extra: dict) -> str:
+    labels = {"provider": item["provider"], "model": item["model"], **extra}
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+latency_metrics = LatencyMetrics()
@@ -0,0 +1,388 @@
+"""
+多服务商 AI 路由
+为每个已配置的服务商保留一个客户端，按健康状况和首字延迟选择服务商
+
+- 每个服务商统计滚动窗口内的错误率和首字延迟（TTFT）
+- 连续失败或错误率过高时打开熔断器，冷却后放行一个试探请求（半开）
+- 新请求优先发给错误率低、首字延迟短的服务商；尚未产生内容就失败时自动切换到下一个
+- 可选对冲：首个服务商在 AI_ROUTER_HEDGE_MS 内没有返回内容时同时请求下一个，
+  先返回内容的一方胜出，另一方被取消
+- 每个服务商最多同时处理 AI_PROVIDER_MAX_CONCURRENCY 个请求：可用服务商的上限之和作为 ai_limiter 的容量，
+  超出的请求在 ai_limiter 中按用户轮转排队（并收到排队位置）；已满的服务商暂不分配新请求
+- 所有服务商都不可用时降级为模拟回复
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncGenerator, Optional
+
+from config import get_ai_providers, get_primary_ai_provider, settings
+from services import ai_metrics
+from services.ai_limiter import ai_limiter
+from services.ai_service import AIService, StreamInterrupted, TokenUsage, current_usage, mock_fallback
+from services.context_service import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderHealth:
+    """单个服务商的滚动健康统计与熔断器状态"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.outcomes: deque[tuple[float, bool]] = deque()  # (时间, 是否成功)
+        self.ttfts: deque[tuple[float, float]] = deque()  # (时间, 首字延迟秒数)
+        self.consecutive_failures = 0
+        self.state = "closed"  # closed / open / half_open
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+    def _trim(self, now: float) -> None:
+        cutoff = now - settings.AI_ROUTER_WINDOW_SECONDS
+        while self.outcomes and self.outcomes[0][0] < cutoff:
+            self.outcomes.popleft()
+        while self.ttfts and self.ttfts[0][0] < cutoff:
+            self.ttfts.popleft()
+
+    def error_rate(self, now: float) -> float:
+        self._trim(now)
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for _, ok in self.outcomes if not ok) / len(self.outcomes)
+
+    def average_ttft(self, now: float) -> Optional[float]:
+        self._trim(now)
+        if not self.ttfts:
+            return None
+        return sum(seconds for _, seconds in self.ttfts) / len(self.ttfts)
+
+    def available(self, now: float) -> bool:
+        """熔断器是否允许发送请求（打开状态冷却结束后转为半开）"""
+        if self.state == "open" and now - self.opened_at >= settings.AI_ROUTER_COOLDOWN_SECONDS:
+            self.state = "half_open"
+            self.trial_in_flight = False
+        if self.state == "half_open":
+            return not self.trial_in_flight
+        return self.state == "closed"
+
+    def on_start(self) -> None:
+        if self.state == "half_open":
+            self.trial_in_flight = True
+
+    def on_cancel(self) -> None:
+        """请求被对冲取消：不计入成功或失败"""
+        self.trial_in_flight = False
+
+    def record_ttft(self, now: float, seconds: float) -> None:
+        self.ttfts.append((now, seconds))
+
+    def record_success(self, now: float) -> None:
+        self.consecutive_failures = 0
+        self.trial_in_flight = False
+        if self.state != "closed":
+            logger.info(f"[AI 路由] {self.name} 恢复，关闭熔断器")
+            self.state = "closed"
+            self.outcomes.clear()
+        self.outcomes.append((now, True))
+
+    def record_failure(self, now: float) -> None:
+        self.outcomes.append((now, False))
+        self.consecutive_failures += 1
+        self.trial_in_flight = False
+
+        too_many_errors = (
+            len(self.outcomes) >= settings.AI_ROUTER_MIN_REQUESTS
+            and self.error_rate(now) >= settings.AI_ROUTER_ERROR_THRESHOLD
+        )
+        if self.state == "half_open" or (
+            self.state == "closed"
+            and (self.consecutive_failures >= settings.AI_ROUTER_CONSECUTIVE_FAILURES or too_many_errors)
+        ):
+            logger.warning(f"[AI 路由] {self.name} 失败过多，打开熔断器 {settings.AI_ROUTER_COOLDOWN_SECONDS}s")
+            self.state = "open"
+            self.opened_at = now
+
+    def snapshot(self, now: float) -> dict:
+        ttft = self.average_ttft(now)
+        return {
+            "provider": self.name,
+            "state": self.state,
+            "requests": len(self.outcomes),
+            "error_rate": round(self.error_rate(now), 4),
+            "avg_ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class AIRouter:
+    """按健康状况在多个服务商之间路由请求，接口与 AIService.generate_response 相同"""
+
+    def __init__(self, providers: Optional[list[str]] = None):
+        if providers is None:
+            providers = get_ai_providers()
+            primary = get_primary_ai_provider()
+            if primary:
+                providers = [primary] + [name for name in providers if name != primary]
+
+        self.services: dict[str, AIService] = {}
+        for name in providers:
+            service = AIService(name)
+            # 初始化失败（如未安装 SDK）的服务商已降级为模拟模式，不参与路由
+            if service.provider != "mock":
+                self.services[name] = service
+
+        self.order = list(self.services)
+        self.health = {name: ProviderHealth(name) for name in self.order}
+        self.active = {name: 0 for name in self.order}
+        # 等待服务商空位的请求（按到达顺序唤醒）
+        self._slot_waiters: deque[asyncio.Future] = deque()
+        self._mock = AIService("mock")
+
+    @property
+    def provider(self) -> str:
+        """主要服务商名称（用于展示和缓存键）"""
+        return self.order[0] if self.order else "mock"
+
+    @property
+    def model(self) -> Optional[str]:
+        return self.services[self.order[0]].model if self.order else None
+
+    def select_providers(self, include_busy: bool = False) -> list[str]:
+        """按错误率、平均首字延迟、配置顺序排列当前可用的服务商（默认排除已满的服务商）"""
+        now = time.monotonic()
+
+        def score(name: str):
+            health = self.health[name]
+            ttft = health.average_ttft(now)
+            return (round(health.error_rate(now), 1), ttft if ttft is not None else 0.0, self.order.index(name))
+
+        return sorted(
+            (
+                name for name in self.order
+                if self.health[name].available(now)
+                and (include_busy or self.active[name] < settings.AI_PROVIDER_MAX_CONCURRENCY)
+            ),
+            key=score,
+        )
+
+    def capacity(self) -> Optional[int]:
+        """
+        熔断器允许请求的服务商的并发上限之和（半开的服务商只放行一个试探请求），供 ai_limiter 使用
+
+        没有可用服务商时返回 None：请求降级为模拟回复，不受服务商上限限制
+        """
+        now = time.monotonic()
+        total = sum(
+            1 if self.health[name].state == "half_open" else settings.AI_PROVIDER_MAX_CONCURRENCY
+            for name in self.order if self.health[name].available(now)
+        )
+        return total or None
+
+    def _wake_next_waiter(self) -> None:
+        while self._slot_waiters:
+            waiter = self._slot_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    async def _wait_for_providers(self) -> list[str]:
+        """
+        所有可用服务商都已满时按到达顺序等待空位
+
+        ai_limiter 只在服务商还有空位时放行请求，这里通常不需要等待；只有对冲请求临时多占了
+        空位时才会等待，某个服务商的调用结束后唤醒最早等待的请求
+        """
+        woken = False
+        while True:
+            # 已有请求在等待时排在它们后面，被唤醒的请求优先
+            if woken or not self._slot_waiters:
+                candidates = self.select_providers()
+                if candidates or not self.select_providers(include_busy=True):
+                    return candidates
+            waiter = asyncio.get_running_loop().create_future()
+            if woken:
+                self._slot_waiters.appendleft(waiter)
+            else:
+                self._slot_waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # 已被唤醒但不再需要：把空位让给下一个等待的请求
+                if not waiter.cancelled():
+                    self._wake_next_waiter()
+                raise
+            woken = True
+
+    def get_status(self) -> list[dict]:
+        """各服务商的健康统计"""
+        now = time.monotonic()
+        return [self.health[name].snapshot(now) for name in self.order]
+
+    async def _attempt(
+        self,
+        name: str,
+        messages: list[dict],
+        stream: bool,
+        queue: asyncio.Queue,
+        usage: TokenUsage,
+        span: ai_metrics.AttemptSpan
+    ) -> None:
+        """在独立任务中调用一个服务商，把结果以 (类型, 服务商, 内容) 放入队列"""
+        # 每个尝试单独记录用量和延迟（只在本任务的上下文中生效），由 generate_response 采用胜出方的结果
+        current_usage.set(usage)
+        ai_metrics.current_attempt.set(span)
+        health = self.health[name]
+        health.on_start()
+        self.active[name] += 1
+        started = time.monotonic()
+        first_token = True
+
+        try:
+            async for text in self.services[name].stream_provider(messages, stream):
+                span.on_token()
+                if first_token:
+                    first_token = False
+                    health.record_ttft(time.monotonic(), time.monotonic() - started)
+                # 先按已生成的文本估算回复 token 数，服务商返回用量后以用量为准
+                span.completion_tokens = (span.completion_tokens or 0) + count_tokens(text)
+                queue.put_nowait(("token", name, text))
+        except asyncio.CancelledError:
+            # 对冲失败方：尚未返回内容时按已等待时间记录首字延迟，降低后续优先级
+            now = time.monotonic()
+            if first_token:
+                health.record_ttft(now, now - started)
+            health.on_cancel()
+            span.finish("cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"AI 调用失败 ({name}): {e}")
+            health.record_failure(time.monotonic())
+            span.finish("error", e)
+            queue.put_nowait(("error", name, e))
+            return
+        finally:
+            self.active[name] -= 1
+            self._wake_next_waiter()
+            # 熔断器状态变化会改变服务商容量
+            ai_limiter.dispatch()
+
+        if usage.completion_tokens is not None:
+            span.completion_tokens = usage.completion_tokens
+        health.record_success(time.monotonic())
+        span.finish()
+        queue.put_nowait(("done", name, None))
+        ai_limiter.dispatch()
+
+    async def generate_response(
+        self,
+        messages: list[dict],
+        stream: bool = False
+    ) -> AsyncGenerator[str, None]:
+        """
+        生成 AI 回复：选择最合适的服务商，失败时切换，必要时对冲
+
+        Yields:
+            str: 生成的文本片段（流式模式）或完整文本（非流式）
+        """
+        caller_usage = current_usage.get()
+        # 调用方未开始统计时（如生成摘要）单独统计这次请求
+        request_span = ai_metrics.current_request.get() or ai_metrics.RequestSpan()
+        candidates = await self._wait_for_providers()
+        if not candidates:
+            if self.order:
+                logger.warning("[AI 路由] 所有服务商均处于熔断状态，使用模拟模式")
+                mock_fallback.set(True)
+                request_span.fallback_reason = "circuit_open"
+            else:
+                request_span.fallback_reason = "no_provider"
+            ai_metrics.latency_metrics.record(request_span)
+            async for text in self._mock.generate_response(messages):
+                yield text
+            return
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        tasks: dict[str, asyncio.Task] = {}
+        started_at: dict[str, float] = {}
+        usages: dict[str, TokenUsage] = {}
+        remaining = list(candidates)
+        hedge_seconds = settings.AI_ROUTER_HEDGE_MS / 1000
+        winner = None
+
+        def start_next():
+            name = remaining.pop(0)
+            started_at[name] = loop.time()
+            usages[name] = TokenUsage()
+            span = ai_metrics.AttemptSpan(name, self.services[name].model)
+            request_span.attempts.append(span)
+            tasks[name] = asyncio.create_task(
+                self._attempt(name, messages, stream, queue, usages[name], span)
+            )
+
+        start_next()
+        try:
+            while True:
+                timeout = None
+                if winner is None and hedge_seconds > 0 and remaining and len(tasks) == 1:
+                    (running,) = tasks
+                    timeout = max(started_at[running] + hedge_seconds - loop.time(), 0)
+
+                try:
+                    kind, name, payload = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    logger.info(f"[AI 路由] {next(iter(tasks))} 超过 {settings.AI_ROUTER_HEDGE_MS}ms 未返回内容，对冲请求 {remaining[0]}")
+                    start_next()
+                    continue
+
+                if winner is not None and name != winner:
+                    continue
+
+                if kind == "token":
+                    if winner is None:
+                        winner = name
+                        for other, task in tasks.items():
+                            if other != name:
+                                task.cancel()
+                    yield payload
+                elif kind == "done":
+                    if caller_usage is not None:
+                        caller_usage.update(usages[name])
+                    return
+                else:
+                    tasks.pop(name, None)
+                    # 已经返回了部分内容：与单服务商模式一致，不再追加其他回复，告知调用方回答不完整
+                    if winner is not None:
+                        raise StreamInterrupted(str(payload)) from payload
+                    if tasks:
+                        continue
+                    if remaining:
+                        logger.info(f"[AI 路由] {name} 失败，切换到 {remaining[0]}")
+                        start_next()
+                        continue
+
+                    mock_fallback.set(True)
+                    last_error = request_span.attempts[-1].error_kind if request_span.attempts else None
+                    request_span.fallback_reason = f"all_failed:{last_error or 'other'}"
+                    async for text in self._mock.generate_response(messages):
+                        yield text
+                    return
+        finally:
+            # 中途结束（如客户端断开）时保留胜出方已知的服务商和模型，用量由调用方估算
+            if caller_usage is not None and winner is not None and caller_usage.provider is None:
+                caller_usage.update(usages[winner])
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+            for task in tasks.values():
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+            ai_metrics.latency_metrics.record(request_span)
+
+
+# 创建全局 AI 服务实例
+ai_service = AIRouter()
+ai_limiter.capacity_hook = ai_service.capacity
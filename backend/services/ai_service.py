@@ -5,28 +5,162 @@ AI 服务模块
 """
 
 import asyncio
+import contextvars
 import json
-from typing import AsyncGenerator, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncGenerator, Callable, Iterable, Optional
 import logging
 
 from config import settings, get_ai_providers, get_primary_ai_provider
+from services import ai_metrics
 
 logger = logging.getLogger(__name__)
 
+# 只有同步 SDK 的服务商（Gemini / 智谱 / 通义）在专用线程池中读取流，
+# 不占用 asyncio.to_thread 使用的默认线程池
+_stream_executor = ThreadPoolExecutor(
+    max_workers=settings.AI_STREAM_THREADS,
+    thread_name_prefix="ai-stream"
+)
+
+_STREAM_END = object()
+
+# 当前请求是否因服务商调用失败而降级为模拟回复（供响应缓存等调用方判断结果是否可信）
+mock_fallback: contextvars.ContextVar[bool] = contextvars.ContextVar("mock_fallback", default=False)
+
+
+class StreamInterrupted(Exception):
+    """服务商已返回部分内容后调用失败：调用方应保留已生成的部分并标记为不完整"""
+
+
+class TokenUsage:
+    """一次 AI 调用的 Token 用量；服务商未返回的部分为 None，由调用方用本地分词器补齐"""
+
+    def __init__(self):
+        self.provider: Optional[str] = None
+        self.model: Optional[str] = None
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.cached = False  # 回复来自缓存，没有调用服务商
+
+    def update(self, other: "TokenUsage") -> None:
+        """用另一次调用（如路由中胜出的服务商）的结果覆盖"""
+        self.provider = other.provider
+        self.model = other.model
+        self.prompt_tokens = other.prompt_tokens
+        self.completion_tokens = other.completion_tokens
+
+
+# 调用方通过 track_usage() 放入一个 TokenUsage，服务商返回用量时写入其中
+# （子任务复制上下文时共享同一个对象，因此在合并、路由任务中写入的结果调用方也能看到）
+current_usage: contextvars.ContextVar[Optional[TokenUsage]] = contextvars.ContextVar("current_usage", default=None)
+
+
+def track_usage() -> TokenUsage:
+    """为当前请求开始记录 Token 用量"""
+    usage = TokenUsage()
+    current_usage.set(usage)
+    return usage
+
+
+def report_usage(prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> None:
+    """记录服务商返回的用量（未在记录用量时忽略）"""
+    usage = current_usage.get()
+    if usage is None:
+        return
+    if prompt_tokens is not None:
+        usage.prompt_tokens = prompt_tokens
+    if completion_tokens is not None:
+        usage.completion_tokens = completion_tokens
+
+
+async def iterate_in_thread(factory: Callable[[], Iterable]) -> AsyncGenerator:
+    """
+    在工作线程中创建并消费同步迭代器，通过 asyncio.Queue 把元素交给事件循环
+
+    同步 SDK 在两个 token 之间的网络读取只阻塞工作线程，不会阻塞事件循环。
+    消费方提前退出时通知工作线程停止，并关闭底层响应（若支持 close）。
+
+    Args:
+        factory: 在工作线程中调用，返回同步可迭代对象（通常是发起请求的函数）
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def put(item, error=None):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+        except RuntimeError:
+            # 事件循环已关闭
+            stop.set()
+
+    def worker():
+        iterator = None
+        try:
+            iterator = factory()
+            for item in iterator:
+                if stop.is_set():
+                    break
+                put(item)
+        except BaseException as exc:
+            put(_STREAM_END, exc)
+            return
+        finally:
+            close = getattr(iterator, "close", None)
+            if stop.is_set() and callable(close):
+                try:
+                    close()
+                except Exception:
+                    pass
+        put(_STREAM_END)
+
+    loop.run_in_executor(_stream_executor, worker)
+
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _STREAM_END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def _set_usage_source(provider: str, model: Optional[str]) -> None:
+    usage = current_usage.get()
+    if usage is not None:
+        usage.provider = provider
+        usage.model = model
+
+
+def _report_gemini_usage(response) -> None:
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata:
+        report_usage(metadata.prompt_token_count, metadata.candidates_token_count)
+
 
 class AIService:
     """AI 服务基类"""
 
-    def __init__(self):
+    def __init__(self, provider: Optional[str] = None):
         self.provider = None
         self.client = None
         self.model = None
-        self._initialize_provider()
+        self._initialize_provider(provider)
 
-    def _initialize_provider(self):
-        """初始化 AI 服务商"""
+    def _initialize_provider(self, provider: Optional[str] = None):
+        """初始化 AI 服务商（不指定时使用配置中的主要服务商）"""
         # 获取指定的或自动选择的 AI 服务商
-        provider = get_primary_ai_provider()
+        provider = provider or get_primary_ai_provider()
+
+        if provider == "mock":
+            self.provider = "mock"
+            return
 
         if not provider:
             logger.warning("未配置任何 AI 服务，使用模拟模式")
@@ -64,8 +198,8 @@ class AIService:
     def _init_openai(self):
         """初始化 OpenAI"""
         try:
-            from openai import OpenAI
-            self.client = OpenAI(
+            from openai import AsyncOpenAI
+            self.client = AsyncOpenAI(
                 api_key=settings.OPENAI_API_KEY,
                 base_url=settings.OPENAI_BASE_URL
             )
@@ -77,8 +211,8 @@ class AIService:
     def _init_anthropic(self):
         """初始化 Anthropic Claude"""
         try:
-            from anthropic import Anthropic
-            self.client = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+            from anthropic import AsyncAnthropic
+            self.client = AsyncAnthropic(api_key=settings.ANTHROPIC_API_KEY)
             self.model = settings.ANTHROPIC_MODEL
             logger.info(f"Anthropic Claude 初始化成功，模型: {self.model}")
         except ImportError:
@@ -98,8 +232,8 @@ class AIService:
     def _init_deepseek(self):
         """初始化 DeepSeek"""
         try:
-            from openai import OpenAI
-            self.client = OpenAI(
+            from openai import AsyncOpenAI
+            self.client = AsyncOpenAI(
                 api_key=settings.DEEPSEEK_API_KEY,
                 base_url=settings.DEEPSEEK_BASE_URL
             )
@@ -143,8 +277,8 @@ class AIService:
     def _init_ollama(self):
         """初始化 Ollama（本地模型）"""
         try:
-            from openai import OpenAI
-            self.client = OpenAI(
+            from openai import AsyncOpenAI
+            self.client = AsyncOpenAI(
                 base_url=settings.OLLAMA_BASE_URL,
                 api_key="ollama"  # Ollama 不需要 API Key
             )
@@ -169,6 +303,7 @@ class AIService:
             str: 生成的文本片段（流式模式）或完整文本（非流式）
         """
         if self.provider == "mock":
+            _set_usage_source("mock", None)
             async for text in self._mock_generate(messages):
                 yield text
             return
@@ -176,69 +311,92 @@ class AIService:
         emitted_content = False
 
         try:
-            if self.provider in ["openai", "deepseek", "ollama"]:
-                async for text in self._openai_generate(messages, stream):
-                    emitted_content = True
-                    yield text
-            elif self.provider == "anthropic":
-                async for text in self._anthropic_generate(messages, stream):
-                    emitted_content = True
-                    yield text
-            elif self.provider == "gemini":
-                async for text in self._gemini_generate(messages, stream):
-                    emitted_content = True
-                    yield text
-            elif self.provider == "zhipuai":
-                async for text in self._zhipuai_generate(messages, stream):
-                    emitted_content = True
-                    yield text
-            elif self.provider == "qianfan":
-                async for text in self._qianfan_generate(messages, stream):
-                    emitted_content = True
-                    yield text
-            elif self.provider == "dashscope":
-                async for text in self._dashscope_generate(messages, stream):
-                    emitted_content = True
-                    yield text
-            else:
-                logger.warning(f"服务商 {self.provider} 暂不支持，使用模拟模式")
-                async for text in self._mock_generate(messages):
-                    yield text
+            async for text in self.stream_provider(messages, stream):
+                emitted_content = True
+                yield text
         except Exception as e:
             logger.error(f"AI 调用失败 ({self.provider}): {e}")
-            # 如果兼容接口在流式收尾阶段报错，但已经返回了真实内容，
-            # 不再追加模拟回复，避免同一条回答混入 mock 文案。
+            # 已经返回了真实内容时不再追加模拟回复（避免同一条回答混入 mock 文案），
+            # 而是告知调用方回答不完整
             if emitted_content:
-                return
+                raise StreamInterrupted(str(e)) from e
 
             # 完全没有返回内容时才降级到模拟模式
+            mock_fallback.set(True)
+            _set_usage_source("mock", None)
             async for text in self._mock_generate(messages):
                 yield text
 
+    async def stream_provider(
+        self,
+        messages: list[dict],
+        stream: bool = False
+    ) -> AsyncGenerator[str, None]:
+        """
+        调用当前服务商生成回复，出错时直接抛出异常（不降级到模拟模式）
+
+        供 generate_response 和多服务商路由（services/ai_router.py）使用。
+        """
+        if self.provider in ["openai", "deepseek", "ollama"]:
+            generator = self._openai_generate(messages, stream)
+        elif self.provider == "anthropic":
+            generator = self._anthropic_generate(messages, stream)
+        elif self.provider == "gemini":
+            generator = self._gemini_generate(messages, stream)
+        elif self.provider == "zhipuai":
+            generator = self._zhipuai_generate(messages, stream)
+        elif self.provider == "qianfan":
+            generator = self._qianfan_generate(messages, stream)
+        elif self.provider == "dashscope":
+            generator = self._dashscope_generate(messages, stream)
+        else:
+            raise ValueError(f"服务商 {self.provider} 暂不支持")
+
+        _set_usage_source(self.provider, self.model)
+        try:
+            async for text in generator:
+                yield text
+        finally:
+            # 提前结束时立即关闭底层流，释放连接
+            await generator.aclose()
+
     async def _openai_generate(
         self,
         messages: list[dict],
         stream: bool
     ) -> AsyncGenerator[str, None]:
-        """OpenAI / DeepSeek / Ollama 生成（使用 OpenAI 兼容接口）"""
+        """OpenAI / DeepSeek / Ollama 生成（使用 OpenAI 兼容接口的异步客户端）"""
         if stream:
-            # 流式输出
+            # 流式输出（返回时已收到响应头，记为建立连接的耗时）
+            started = time.monotonic()
             response = await self._create_openai_chat_completion(messages, stream=True)
+            ai_metrics.record_connect(time.monotonic() - started)
 
-            for chunk in response:
-                choices = getattr(chunk, "choices", None)
-                if not choices:
-                    continue
-
-                delta = getattr(choices[0], "delta", None)
-                content = getattr(delta, "content", None)
-                if content:
-                    yield content
-                    # 模拟打字机效果的小延迟
-                    await asyncio.sleep(0.01)
+            try:
+                async for chunk in response:
+                    # 请求了 include_usage 时，最后一个 chunk 不含 choices，只含用量
+                    usage = getattr(chunk, "usage", None)
+                    if usage:
+                        report_usage(usage.prompt_tokens, usage.completion_tokens)
+
+                    choices = getattr(chunk, "choices", None)
+                    if not choices:
+                        continue
+
+                    delta = getattr(choices[0], "delta", None)
+                    content = getattr(delta, "content", None)
+                    if content:
+                        yield content
+            finally:
+                # 提前结束时关闭 HTTP 响应，释放连接
+                await response.close()
         else:
             # 非流式输出
+            started = time.monotonic()
             response = await self._create_openai_chat_completion(messages, stream=False)
+            ai_metrics.record_connect(time.monotonic() - started)
+            if response.usage:
+                report_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
             yield response.choices[0].message.content
 
     def _uses_max_completion_tokens(self) -> bool:
@@ -253,6 +411,9 @@ class AIService:
             "stream": stream,
             "temperature": settings.AI_TEMPERATURE,
         }
+        if stream:
+            # 流式响应默认不返回用量，需要显式请求
+            kwargs["stream_options"] = {"include_usage": True}
 
         token_param = (
             "max_completion_tokens"
@@ -267,29 +428,31 @@ class AIService:
 
         for _ in range(3):
             try:
-                return await asyncio.to_thread(
-                    self.client.chat.completions.create,
-                    **kwargs,
-                )
+                return await self.client.chat.completions.create(**kwargs)
             except Exception as exc:
                 message = str(exc)
                 if "Unsupported parameter" in message and "max_tokens" in message:
                     value = kwargs.pop("max_tokens", settings.AI_MAX_TOKENS)
                     kwargs["max_completion_tokens"] = value
+                    ai_metrics.record_retry("max_tokens")
                     continue
                 if "Unsupported parameter" in message and "max_completion_tokens" in message:
                     value = kwargs.pop("max_completion_tokens", settings.AI_MAX_TOKENS)
                     kwargs["max_tokens"] = value
+                    ai_metrics.record_retry("max_completion_tokens")
                     continue
                 if "Unsupported parameter" in message and "temperature" in message:
                     kwargs.pop("temperature", None)
+                    ai_metrics.record_retry("temperature")
+                    continue
+                if "stream_options" in message and "stream_options" in kwargs:
+                    # 部分兼容接口（旧版 Ollama 等）不支持，此时用量由本地分词器估算
+                    kwargs.pop("stream_options")
+                    ai_metrics.record_retry("stream_options")
                     continue
                 raise
 
-        return await asyncio.to_thread(
-            self.client.chat.completions.create,
-            **kwargs,
-        )
+        return await self.client.chat.completions.create(**kwargs)
 
     async def _anthropic_generate(
         self,
@@ -312,27 +475,28 @@ class AIService:
                 })
 
         if stream:
-            # 流式输出
-            with self.client.messages.stream(
+            # 流式输出（异步客户端，网络读取不阻塞事件循环）
+            async with self.client.messages.stream(
                 model=self.model,
                 system=system_message,
                 messages=anthropic_messages,
                 max_tokens=settings.AI_MAX_TOKENS,
                 temperature=settings.AI_TEMPERATURE
             ) as stream:
-                for text in stream.text_stream:
+                async for text in stream.text_stream:
                     yield text
-                    await asyncio.sleep(0.01)
+                message = await stream.get_final_message()
+                report_usage(message.usage.input_tokens, message.usage.output_tokens)
         else:
             # 非流式输出
-            response = await asyncio.to_thread(
-                self.client.messages.create,
+            response = await self.client.messages.create(
                 model=self.model,
                 system=system_message,
                 messages=anthropic_messages,
                 max_tokens=settings.AI_MAX_TOKENS,
                 temperature=settings.AI_TEMPERATURE
             )
+            report_usage(response.usage.input_tokens, response.usage.output_tokens)
             yield response.content[0].text
 
     async def _gemini_generate(
@@ -359,17 +523,13 @@ class AIService:
                 })
 
         if stream:
-            # 流式输出
-            response = await asyncio.to_thread(
-                self.client.generate_content,
-                gemini_messages,
-                stream=True
-            )
-
-            for chunk in response:
+            # 流式输出（同步 SDK，在工作线程中读取）
+            async for chunk in iterate_in_thread(
+                lambda: self.client.generate_content(gemini_messages, stream=True)
+            ):
+                _report_gemini_usage(chunk)
                 if chunk.text:
                     yield chunk.text
-                    await asyncio.sleep(0.01)
         else:
             # 非流式输出
             response = await asyncio.to_thread(
@@ -377,6 +537,7 @@ class AIService:
                 gemini_messages,
                 stream=False
             )
+            _report_gemini_usage(response)
             yield response.text
 
     async def _zhipuai_generate(
@@ -386,20 +547,21 @@ class AIService:
     ) -> AsyncGenerator[str, None]:
         """智谱 AI 生成"""
         if stream:
-            # 流式输出
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
-                model=self.model,
-                messages=messages,
-                stream=True,
-                max_tokens=settings.AI_MAX_TOKENS,
-                temperature=settings.AI_TEMPERATURE
-            )
-
-            for chunk in response:
+            # 流式输出（同步 SDK，在工作线程中读取）
+            async for chunk in iterate_in_thread(
+                lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    stream=True,
+                    max_tokens=settings.AI_MAX_TOKENS,
+                    temperature=settings.AI_TEMPERATURE
+                )
+            ):
+                # 最后一个 chunk 携带用量
+                if getattr(chunk, "usage", None):
+                    report_usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
                 if chunk.choices[0].delta.content:
                     yield chunk.choices[0].delta.content
-                    await asyncio.sleep(0.01)
         else:
             # 非流式输出
             response = await asyncio.to_thread(
@@ -410,6 +572,8 @@ class AIService:
                 max_tokens=settings.AI_MAX_TOKENS,
                 temperature=settings.AI_TEMPERATURE
             )
+            if getattr(response, "usage", None):
+                report_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
             yield response.choices[0].message.content
 
     async def _qianfan_generate(
@@ -431,21 +595,22 @@ class AIService:
     ) -> AsyncGenerator[str, None]:
         """阿里云通义千问生成"""
         if stream:
-            # 流式输出
-            response = await asyncio.to_thread(
-                self.client.Generation.call,
-                model=self.model,
-                messages=messages,
-                stream=True,
-                max_tokens=settings.AI_MAX_TOKENS,
-                temperature=settings.AI_TEMPERATURE,
-                result_format='message'
-            )
-
-            for chunk in response:
+            # 流式输出（同步 SDK，在工作线程中读取）
+            async for chunk in iterate_in_thread(
+                lambda: self.client.Generation.call(
+                    model=self.model,
+                    messages=messages,
+                    stream=True,
+                    max_tokens=settings.AI_MAX_TOKENS,
+                    temperature=settings.AI_TEMPERATURE,
+                    result_format='message'
+                )
+            ):
+                # 每个 chunk 携带截至当前的累计用量
+                if getattr(chunk, "usage", None):
+                    report_usage(chunk.usage.input_tokens, chunk.usage.output_tokens)
                 if chunk.output.choices[0].message.content:
                     yield chunk.output.choices[0].message.content
-                    await asyncio.sleep(0.01)
         else:
             # 非流式输出
             response = await asyncio.to_thread(
@@ -457,6 +622,8 @@ class AIService:
                 temperature=settings.AI_TEMPERATURE,
                 result_format='message'
             )
+            if getattr(response, "usage", None):
+                report_usage(response.usage.input_tokens, response.usage.output_tokens)
             yield response.output.choices[0].message.content
 
     async def _mock_generate(
@@ -475,12 +642,14 @@ class AIService:
             # 短回复直接返回
             yield mock_response
         else:
-            # 长回复模拟流式输出
+            # 长回复模拟流式输出（逐词延迟模拟服务商生成速度，0 表示不延迟）
+            delay = settings.AI_MOCK_TOKEN_DELAY_MS / 1000
             words = mock_response.split()
             for i, word in enumerate(words):
                 delta = word + (" " if i < len(words) - 1 else "")
                 yield delta
-                await asyncio.sleep(0.05)
+                if delay > 0:
+                    await asyncio.sleep(delay)
 
     def _get_mock_response(self, user_input: str) -> str:
         """生成模拟回复内容"""
@@ -508,6 +677,3 @@ class AIService:
         else:
             return f"这是一个很好的问题！关于「{user_input[:30]}...」，让我来帮你分析一下。\n\n根据我的理解，这个话题涉及多个关键点。不过，我目前运行在模拟模式下，回复内容是预设的示例文本。要获得真实的 AI 回答，需要在后端配置 API Key。\n\n建议你：\n1. 在 backend/.env 文件中添加 OPENAI_API_KEY 或其他 AI 服务的 API Key\n2. 重启后端服务\n3. 就能体验真正的 AI 对话了！\n\n还有什么想了解的吗？"
 
-
-# 创建全局 AI 服务实例
-ai_service = AIService()
@@ -0,0 +1,254 @@
+"""
+对话上下文构建服务
+按 Token 预算选取最近的消息，更早的消息合并进缓存在 Conversation 上的摘要
+
+- 从最新消息向前累加 Token，直到达到 AI_CONTEXT_TOKEN_BUDGET
+- 窗口之外、尚未摘要的消息增量合并进 conversation.context_summary，
+  conversation.summary_until_id 记录已合并的最后一条消息 ID
+- 每次只需读取 summary_until_id 之后的消息，提示长度与对话总长度无关
+- 消息按 ID 倒序分批读取（走 (conversation_id, id) 索引），够用即停，不加载整个对话
+- 读取消息、计算 Token 和摘录式摘要都是同步操作，在线程中执行，不阻塞事件循环
+"""
+
+import asyncio
+import logging
+import re
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+import models
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 每条消息的固定开销（角色、分隔符），与 OpenAI Chat 格式的计数方式一致
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_LINE_CHARS = 80
+
+# 构建上下文时每批读取的消息数
+HISTORY_BATCH_SIZE = 50
+# 一次最多把多少条移出窗口的消息合并进摘要（更早的内容在摘要预算内本来就会被丢弃）
+SUMMARY_SOURCE_LIMIT = 200
+
+_ROLE_LABELS = {"user": "用户", "assistant": "AI", "system": "系统"}
+_CJK_PATTERN = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+
+_encoding = None
+_encoding_failed = False
+
+
+def _get_encoding():
+    """延迟加载 tiktoken 编码；未安装或词表无法加载时返回 None（使用估算）"""
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(settings.AI_TOKENIZER_ENCODING)
+        except Exception as e:
+            _encoding_failed = True
+            logger.warning(f"tiktoken 不可用，Token 数改用估算: {e}")
+    return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    """估算 Token 数：中日韩字符按 1 个计，其余按约 4 个字符 1 个计"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+
+def count_tokens(text: str) -> int:
+    """计算文本的 Token 数（优先使用 tiktoken）"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """从开头保留不超过 max_tokens 的内容"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    while text and count_tokens(text) > max_tokens:
+        text = text[:int(len(text) * 0.9)]
+    return text
+
+
+def _extractive_summary(previous: Optional[str], messages: list[models.Message]) -> str:
+    """
+    摘录式摘要：每条消息保留开头一行，超出摘要预算时丢弃最早的行
+
+    不调用 AI，零额外延迟，作为默认方式和 AI 摘要失败时的降级方案。
+    """
+    lines = previous.splitlines() if previous else []
+    for msg in messages:
+        text = " ".join(msg.content.split())
+        if len(text) > SUMMARY_LINE_CHARS:
+            text = text[:SUMMARY_LINE_CHARS] + "..."
+        lines.append(f"{_ROLE_LABELS.get(msg.role, msg.role)}：{text}")
+
+    # 从最新的行向前保留，每行只计算一次 Token（另加 1 个换行符），最后按上限截断兜底
+    kept, used = [], 0
+    for line in reversed(lines):
+        cost = count_tokens(line) + 1
+        if kept and used + cost > settings.AI_CONTEXT_SUMMARY_TOKENS:
+            break
+        kept.append(line)
+        used += cost
+    kept.reverse()
+    return _truncate_to_tokens("\n".join(kept), settings.AI_CONTEXT_SUMMARY_TOKENS)
+
+
+async def _ai_summary(previous: Optional[str], messages: list[models.Message]) -> str:
+    """使用当前 AI 服务把新移出窗口的消息合并进已有摘要"""
+    from services import ai_service
+
+    # 限制摘要请求本身的长度
+    input_budget = settings.AI_CONTEXT_SUMMARY_TOKENS * 4
+    transcript = "\n".join(
+        f"{_ROLE_LABELS.get(msg.role, msg.role)}：{msg.content}" for msg in messages
+    )
+    transcript = _truncate_to_tokens(transcript, input_budget)
+
+    prompt = (
+        f"已有摘要：\n{previous or '（无）'}\n\n新增对话：\n{transcript}\n\n"
+        f"请把新增对话的要点合并进已有摘要，保留关键事实、结论和用户偏好，"
+        f"输出不超过 {settings.AI_CONTEXT_SUMMARY_TOKENS} 个 Token 的中文摘要，不要输出其他内容。"
+    )
+    parts = []
+    async for delta in ai_service.generate_response([{"role": "user", "content": prompt}], stream=False):
+        parts.append(delta)
+    return _truncate_to_tokens("".join(parts).strip(), settings.AI_CONTEXT_SUMMARY_TOKENS)
+
+
+async def _update_summary(conversation: models.Conversation, messages: list[models.Message]) -> None:
+    """把移出窗口的消息增量合并进对话摘要（由调用方提交）"""
+    summary = None
+    if settings.AI_CONTEXT_SUMMARY_WITH_AI:
+        try:
+            summary = await _ai_summary(conversation.context_summary, messages)
+        except Exception as e:
+            logger.warning(f"对话 {conversation.id} 生成 AI 摘要失败，改用摘录式摘要: {e}")
+
+    if not summary:
+        summary = await asyncio.to_thread(_extractive_summary, conversation.context_summary, messages)
+    conversation.context_summary = summary
+    conversation.summary_until_id = messages[-1].id
+
+
+def load_tail(
+    db: Session,
+    conversation_id: int,
+    limit: int,
+    before_id: Optional[int] = None,
+    after_id: int = 0,
+) -> list[models.Message]:
+    """
+    读取对话中 ID 在 (after_id, before_id) 区间内最新的 limit 条消息（按 ID 倒序）
+
+    条件和排序都落在 (conversation_id, id) 索引上，只扫描需要的一段，
+    耗时与对话总长度无关。
+    """
+    query = db.query(models.Message).filter(
+        models.Message.conversation_id == conversation_id,
+        models.Message.id > after_id,
+    )
+    if before_id is not None:
+        query = query.filter(models.Message.id < before_id)
+    return query.order_by(models.Message.id.desc()).limit(limit).all()
+
+
+def _select_messages(
+    db: Session,
+    conversation: models.Conversation,
+    before_id: Optional[int],
+) -> tuple[list[models.Message], list[models.Message]]:
+    """
+    按 Token 预算选取窗口内的消息和需要合并进摘要的消息（同步执行，由 build_context 放到线程中）
+
+    Returns:
+        tuple: (窗口内的消息（按 ID 倒序）, 移出窗口、待合并进摘要的消息（按 ID 正序）)
+    """
+    budget = settings.AI_CONTEXT_TOKEN_BUDGET
+    summary_until_id = conversation.summary_until_id or 0
+
+    summary_cost = 0
+    if conversation.context_summary:
+        summary_cost = count_tokens(conversation.context_summary) + MESSAGE_OVERHEAD_TOKENS
+
+    # 从最新消息开始分批向前读取，直到超出预算或读完（candidates 按 ID 倒序）
+    candidates: list[models.Message] = []
+    tokens: list[int] = []
+    exhausted = False
+
+    def load_batch(limit: int) -> None:
+        nonlocal exhausted
+        cursor = candidates[-1].id if candidates else before_id
+        batch = load_tail(db, conversation.id, limit, before_id=cursor, after_id=summary_until_id)
+        candidates.extend(batch)
+        tokens.extend(count_tokens(msg.content) + MESSAGE_OVERHEAD_TOKENS for msg in batch)
+        exhausted = len(batch) < limit
+
+    while not exhausted and sum(tokens) <= budget - summary_cost:
+        load_batch(HISTORY_BATCH_SIZE)
+
+    def take_recent(limit: int) -> list[models.Message]:
+        recent, used = [], 0
+        for msg, cost in zip(candidates, tokens):
+            # 最新一条消息无论多长都保留
+            if recent and used + cost > limit:
+                break
+            recent.append(msg)
+            used += cost
+        return recent
+
+    recent = take_recent(budget - summary_cost)
+    dropped: list[models.Message] = []
+
+    if len(recent) < len(candidates) or not exhausted:
+        # 需要合并新消息时摘要可能变长，按摘要上限预留空间
+        recent = take_recent(budget - settings.AI_CONTEXT_SUMMARY_TOKENS - MESSAGE_OVERHEAD_TOKENS)
+        # 只读取紧挨窗口的一段作为摘要来源，更早的消息视为已合并
+        missing = len(recent) + SUMMARY_SOURCE_LIMIT - len(candidates)
+        if missing > 0 and not exhausted:
+            load_batch(missing)
+        dropped = candidates[len(recent):len(recent) + SUMMARY_SOURCE_LIMIT]
+        dropped.reverse()
+
+    return recent, dropped
+
+
+async def build_context(
+    db: Session,
+    conversation: models.Conversation,
+    before_id: Optional[int] = None,
+) -> list[dict]:
+    """
+    构建发送给 AI 的消息列表
+
+    Args:
+        db: 数据库会话
+        conversation: 对话（摘要字段可能被更新，由调用方提交）
+        before_id: 只使用 ID 小于该值的消息（重新生成时排除被替换的回复）
+
+    Returns:
+        list[dict]: [{"role": "system", "content": 摘要}] + 最近的消息（按时间正序）
+    """
+    recent, dropped = await asyncio.to_thread(_select_messages, db, conversation, before_id)
+    if dropped:
+        await _update_summary(conversation, dropped)
+
+    context = []
+    if conversation.context_summary:
+        context.append({
+            "role": "system",
+            "content": f"以下是本次对话较早内容的摘要：\n{conversation.context_summary}",
+        })
+    context.extend({"role": msg.role, "content": msg.content} for msg in reversed(recent))
+    return context
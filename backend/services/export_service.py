@@ -0,0 +1,173 @@
+"""
+对话导出
+按消息逐条生成 Markdown / JSON / TXT 文档，以文件下载的形式流式输出
+
+- 消息用 yield_per 分批读取（PostgreSQL 上为服务端游标），不把整段对话加载进内存
+- 生成的文本片段攒到 EXPORT_CHUNK_BYTES 后再输出，避免逐条消息一个响应块
+- 导出全部对话时边生成边写入 zip：输出流不可回退，条目大小和校验值写在数据描述符中，
+  归档不会在内存中完整生成
+- 生成器是同步的，由 StreamingResponse 放到线程池中迭代，数据库读取不阻塞事件循环
+"""
+
+import io
+import json
+import re
+import zipfile
+from typing import Iterator
+from urllib.parse import quote
+
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+
+EXPORT_FORMATS = {
+    "markdown": ("md", "text/markdown; charset=utf-8"),
+    "json": ("json", "application/json; charset=utf-8"),
+    "txt": ("txt", "text/plain; charset=utf-8"),
+}
+
+# 每批读取的消息数 / 对话数
+EXPORT_BATCH_SIZE = 200
+# 输出的响应块大小
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+_UNSAFE_FILENAME_CHARS = re.compile(r'[\\/:*?"<>|\r\n\t]+')
+
+
+def export_filename(conversation: models.Conversation, fmt: str) -> str:
+    """导出文件名：去掉文件系统不允许的字符"""
+    title = _UNSAFE_FILENAME_CHARS.sub("_", conversation.title).strip(" ._") or f"对话{conversation.id}"
+    return f"{title}.{EXPORT_FORMATS[fmt][0]}"
+
+
+def content_disposition(filename: str) -> str:
+    """附件下载头：ASCII 回退文件名 + RFC 5987 编码的原文件名"""
+    fallback = filename.encode("ascii", "ignore").decode().strip() or "export"
+    fallback = fallback.replace('"', "")
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def iter_messages(db: Session, conversation_id: int) -> Iterator[models.Message]:
+    """按时间正序分批读取对话的消息"""
+    return db.query(models.Message).filter(
+        models.Message.conversation_id == conversation_id
+    ).order_by(
+        models.Message.created_at.asc(), models.Message.id.asc()
+    ).yield_per(EXPORT_BATCH_SIZE)
+
+
+def render_conversation(db: Session, conversation: models.Conversation, fmt: str) -> Iterator[str]:
+    """逐段生成一个对话的导出内容"""
+    messages = iter_messages(db, conversation.id)
+
+    if fmt == "markdown":
+        yield f"# {conversation.title}\n\n"
+        yield f"**对话时间**：{conversation.created_at.strftime('%Y-%m-%d %H:%M')}\n\n"
+        yield "---\n\n"
+        for msg in messages:
+            role_name = "用户" if msg.role == "user" else "AI"
+            yield f"## {role_name}\n\n{msg.content}\n\n---\n\n"
+
+    elif fmt == "json":
+        yield "{\n"
+        yield f'  "title": {json.dumps(conversation.title, ensure_ascii=False)},\n'
+        yield f'  "created_at": {json.dumps(conversation.created_at.isoformat())},\n'
+        yield '  "messages": ['
+        separator = "\n"
+        for msg in messages:
+            item = json.dumps({
+                "role": msg.role,
+                "content": msg.content,
+                "created_at": msg.created_at.isoformat()
+            }, ensure_ascii=False)
+            yield f"{separator}    {item}"
+            separator = ",\n"
+        yield "\n  ]\n}\n" if separator != "\n" else "]\n}\n"
+
+    else:  # txt
+        yield f"{conversation.title}\n"
+        yield f"对话时间：{conversation.created_at.strftime('%Y-%m-%d %H:%M')}\n"
+        yield "=" * 50 + "\n\n"
+        for msg in messages:
+            role_name = "用户" if msg.role == "user" else "AI"
+            yield f"[{role_name}] {msg.created_at.strftime('%H:%M:%S')}\n"
+            yield f"{msg.content}\n\n"
+
+
+def _chunked(pieces: Iterator[str]) -> Iterator[bytes]:
+    """把文本片段编码并攒成较大的块"""
+    buffer = bytearray()
+    for piece in pieces:
+        buffer += piece.encode("utf-8")
+        if len(buffer) >= EXPORT_CHUNK_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def stream_conversation(conversation_id: int, fmt: str) -> Iterator[bytes]:
+    """流式导出单个对话（使用独立会话，请求的会话在响应开始后已关闭）"""
+    db = SessionLocal()
+    try:
+        conversation = db.get(models.Conversation, conversation_id)
+        if conversation is None:
+            return
+        yield from _chunked(render_conversation(db, conversation, fmt))
+    finally:
+        db.close()
+
+
+class _ZipOutput(io.RawIOBase):
+    """zip 的输出流：只追加、不可回退，写入的数据由生成器随时取走"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+        self._size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._size += len(data)
+        return len(data)
+
+    def pending(self) -> int:
+        return self._size
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self._size = 0
+        return data
+
+
+def stream_archive(user_id: int, fmt: str) -> Iterator[bytes]:
+    """把用户的全部对话逐个写入 zip 并流式输出，每个对话一个文件"""
+    db = SessionLocal()
+    output = _ZipOutput()
+    try:
+        conversations = db.query(models.Conversation).filter(
+            models.Conversation.user_id == user_id
+        ).order_by(models.Conversation.id.asc()).yield_per(EXPORT_BATCH_SIZE)
+
+        with zipfile.ZipFile(output, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for conversation in conversations:
+                # 文件名带上对话 ID，避免同名对话互相覆盖
+                name = f"{conversation.id}-{export_filename(conversation, fmt)}"
+                with archive.open(name, mode="w") as entry:
+                    for piece in _chunked(render_conversation(db, conversation, fmt)):
+                        entry.write(piece)
+                        if output.pending() >= EXPORT_CHUNK_BYTES:
+                            yield output.drain()
+                if output.pending() >= EXPORT_CHUNK_BYTES:
+                    yield output.drain()
+
+        # 关闭归档后写入中央目录
+        if output.pending():
+            yield output.drain()
+    finally:
+        db.close()
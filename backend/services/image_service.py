@@ -0,0 +1,159 @@
+"""
+图片处理服务
+上传图片时解码一次，生成多个限定宽度的 WebP 版本（以及原格式的后备版本）、记录原图尺寸和模糊占位图
+
+- 先只读取文件头检查像素数，超过 IMAGE_MAX_PIXELS 的图片直接拒绝，不会解码（防止解压炸弹）
+- JPEG 使用 draft 模式按需要的最大宽度直接以 1/2、1/4、1/8 比例解码，减少内存占用
+- 各版本从大到小依次缩放，每次以上一个版本为源，只完整解码一次
+- 动图（GIF / WebP 动画）缩放会丢失动画，只记录尺寸，不生成版本
+- Pillow 未安装时只保存原图（与 tiktoken 不可用时的处理一致）
+"""
+
+import base64
+import io
+import logging
+import math
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 原格式 -> 后备版本格式（WebP 原图不需要后备版本；GIF 后备用 PNG，避免调色板损失）
+FALLBACK_FORMATS = {"JPEG": "JPEG", "PNG": "PNG", "GIF": "PNG"}
+EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+PLACEHOLDER_WIDTH = 16  # 模糊占位图宽度（像素）
+
+
+class ImageRejected(ValueError):
+    """图片无法识别或尺寸超出限制"""
+
+
+@dataclass
+class ProcessedImage:
+    format: str  # jpeg / png / gif / webp
+    width: int
+    height: int
+    placeholder: Optional[str] = None
+    variants: dict[str, list[dict]] = field(default_factory=dict)  # {"webp": [...], "jpeg": [...]}，按宽度升序
+
+
+def get_variant_widths() -> list[int]:
+    return sorted({int(width) for width in settings.IMAGE_VARIANT_WIDTHS.split(",") if width.strip()})
+
+
+def target_widths(original_width: int) -> list[int]:
+    """小于原图的配置宽度，加上不超过最大配置宽度的原图宽度（原图本身更大时仍可通过原图地址访问）"""
+    configured = get_variant_widths()
+    if not configured:
+        return []
+    widths = [width for width in configured if width < original_width]
+    widths.append(min(original_width, configured[-1]))
+    return sorted(set(widths))
+
+
+def build_srcset(variants: list[dict]) -> str:
+    return ", ".join(f"{variant['url']} {variant['width']}w" for variant in variants)
+
+
+def _placeholder(image) -> str:
+    from PIL import ImageFilter
+
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    tiny = image.resize((PLACEHOLDER_WIDTH, height)).filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    tiny.save(buffer, "WEBP", quality=30)
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def _save(image, path: Path, fmt: str) -> int:
+    if fmt == "JPEG":
+        image.convert("RGB").save(path, fmt, quality=settings.IMAGE_WEBP_QUALITY, optimize=True, progressive=True)
+    elif fmt == "WEBP":
+        image.save(path, fmt, quality=settings.IMAGE_WEBP_QUALITY, method=4)
+    else:
+        image.save(path, fmt, optimize=True)
+    return path.stat().st_size
+
+
+def process_image(path: Path, url_prefix: str) -> Optional[ProcessedImage]:
+    """
+    为已保存的原图生成多尺寸版本（阻塞调用，应在线程中执行）
+
+    版本文件与原图放在同一目录：{原文件名}-{宽度}w.webp / .jpg / .png
+
+    Returns:
+        ProcessedImage；Pillow 未安装时返回 None
+    Raises:
+        ImageRejected: 无法识别的图片或像素数超过 IMAGE_MAX_PIXELS
+    """
+    try:
+        from PIL import Image, ImageOps, UnidentifiedImageError
+    except ImportError:
+        logger.warning("Pillow 未安装，图片不生成多尺寸版本")
+        return None
+
+    try:
+        image = Image.open(path)  # 只读取文件头
+    except Image.DecompressionBombError as e:
+        raise ImageRejected("图片尺寸过大") from e
+    except (UnidentifiedImageError, OSError) as e:
+        raise ImageRejected("无法识别的图片文件") from e
+
+    with image:
+        original_width, original_height = image.size
+        if original_width * original_height > settings.IMAGE_MAX_PIXELS:
+            raise ImageRejected(
+                f"图片尺寸过大（{original_width}×{original_height}），最多 {settings.IMAGE_MAX_PIXELS} 像素"
+            )
+
+        fmt = image.format
+        # EXIF 方向为 5-8 时宽高互换，返回给前端的尺寸以显示方向为准
+        if image.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+            original_width, original_height = original_height, original_width
+        result = ProcessedImage(format=fmt.lower(), width=original_width, height=original_height)
+
+        if getattr(image, "is_animated", False):
+            return result
+
+        widths = target_widths(original_width)
+        if fmt == "JPEG" and widths:
+            # draft 按文件中的存储方向计算，只会缩小到不小于请求的尺寸
+            scale = widths[-1] / original_width
+            image.draft("RGB", (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        try:
+            image.load()
+        except (OSError, Image.DecompressionBombError) as e:
+            raise ImageRejected("图片文件已损坏或尺寸过大") from e
+
+        current = ImageOps.exif_transpose(image)
+        if current.mode not in ("RGB", "RGBA"):
+            current = current.convert("RGBA" if "transparency" in image.info or current.mode in ("LA", "PA") else "RGB")
+
+        formats = ["WEBP"] + ([FALLBACK_FORMATS[fmt]] if fmt in FALLBACK_FORMATS else [])
+        for width in reversed(widths):
+            height = max(1, round(original_height * width / original_width))
+            if current.width != width:
+                current = current.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            for variant_format in formats:
+                filename = f"{path.stem}-{width}w{EXTENSIONS[variant_format]}"
+                size = _save(current, path.with_name(filename), variant_format)
+                result.variants.setdefault(variant_format.lower(), []).insert(0, {
+                    "width": width,
+                    "height": height,
+                    "url": f"{url_prefix}/{filename}",
+                    "size": size,
+                })
+
+        result.placeholder = _placeholder(current)
+        return result
+
+
+def variant_files(path: Path) -> list[Path]:
+    """原图对应的所有版本文件"""
+    return [
+        candidate for candidate in path.parent.glob(f"{path.stem}-*w.*")
+        if candidate.stem.removeprefix(f"{path.stem}-").removesuffix("w").isdigit()
+    ]
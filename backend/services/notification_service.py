@@ -0,0 +1,357 @@
+"""
+通知服务模块
+统一维护 users.unread_notification_count 冗余计数器，负责同类通知的合并，
+以及广播通知（按用户水位线在读取时合并）
+
+所有写入/已读/删除通知的路径都应通过本模块完成，计数器的增减与通知行的
+变更处于同一事务中；reconcile_unread_counts 用于修复计数器漂移。
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+import models
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _adjust_unread_count(db: Session, user_id: int, delta: int) -> None:
+    """在当前事务中增减用户的未读计数（不提交）"""
+    if not delta:
+        return
+
+    db.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(unread_notification_count=models.User.unread_notification_count + delta)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def create_notification(db: Session, user_id: int, **fields) -> models.Notification:
+    """
+    创建通知并同步增加未读计数（不提交，由调用方统一 commit）
+
+    Args:
+        db: 数据库会话
+        user_id: 接收通知的用户 ID
+        **fields: Notification 的其余字段（type, title, content, related_* 等）
+    """
+    notification = models.Notification(user_id=user_id, **fields)
+    db.add(notification)
+    _adjust_unread_count(db, user_id, 1)
+    return notification
+
+
+def format_actors(names: list[str], actor_count: int) -> str:
+    """渲染触发者：张三 / 张三 和 李四 / 张三 和其他 12 人"""
+    if not names:
+        return f"{actor_count} 人"
+    if actor_count <= 1:
+        return names[0]
+    if actor_count == 2 and len(names) >= 2:
+        return f"{names[0]} 和 {names[1]}"
+    return f"{names[0]} 和其他 {actor_count - 1} 人"
+
+
+def parse_actors(notification: models.Notification) -> list[dict]:
+    """读取通知中保存的最近触发者列表（最新在前）"""
+    if not notification.actors:
+        return []
+    try:
+        return json.loads(notification.actors)
+    except (TypeError, ValueError):
+        return []
+
+
+def parse_actor_ids(notification: models.Notification) -> list[int]:
+    """读取合并通知的全部触发者 ID（迁移前的通知没有该字段时退回最近触发者列表）"""
+    if notification.actor_ids:
+        try:
+            return json.loads(notification.actor_ids)
+        except (TypeError, ValueError):
+            pass
+    return [actor["id"] for actor in parse_actors(notification) if actor.get("id") is not None]
+
+
+def create_grouped_notification(
+    db: Session,
+    user_id: int,
+    actor_id: int,
+    actor_name: str,
+    type: str,
+    title_template: str,
+    group_target: str,
+    **fields
+) -> models.Notification:
+    """
+    创建可合并的通知（不提交）
+
+    同一接收者、同一类型、同一对象在时间窗口内的未读通知会被合并为一条：
+    更新触发者列表、人数和最近事件时间，而不是插入新行。
+
+    Args:
+        actor_id: 触发者用户 ID（用于去重计数）
+        actor_name: 触发者显示名
+        title_template: 标题模板，"{actors}" 会被替换为触发者描述
+        group_target: 合并对象，如 "blog:42"、"comment:7"
+        **fields: content, related_type, related_id, related_url 等字段，
+            合并时以最近一次事件为准
+    """
+    now = datetime.utcnow()
+    group_key = f"{type}:{group_target}"
+    window_start = now - timedelta(minutes=settings.NOTIFICATION_GROUP_WINDOW_MINUTES)
+
+    existing = db.query(models.Notification).filter(
+        models.Notification.user_id == user_id,
+        models.Notification.group_key == group_key,
+        models.Notification.is_read == False,
+        models.Notification.last_event_at >= window_start
+    ).order_by(models.Notification.last_event_at.desc()).with_for_update().first()
+
+    if existing is None:
+        actors = [{"id": actor_id, "name": actor_name}]
+        return create_notification(
+            db,
+            user_id=user_id,
+            type=type,
+            title=title_template.replace("{actors}", actor_name),
+            group_key=group_key,
+            actor_count=1,
+            actors=json.dumps(actors, ensure_ascii=False),
+            actor_ids=json.dumps([actor_id]),
+            last_event_at=now,
+            **fields
+        )
+
+    # 合并到已有通知：未读状态不变，因此无需调整未读计数
+    # 人数按全部触发者 ID 去重（显示用的 actors 只保留最近几个，不能用来判断是否重复）
+    actor_ids = parse_actor_ids(existing)
+    if actor_id not in actor_ids:
+        actor_ids.append(actor_id)
+        existing.actor_count = (existing.actor_count or 1) + 1
+        existing.actor_ids = json.dumps(actor_ids)
+
+    actors = parse_actors(existing)
+    actors = [actor for actor in actors if actor.get("id") != actor_id]
+    actors.insert(0, {"id": actor_id, "name": actor_name})
+    actors = actors[:settings.NOTIFICATION_GROUP_MAX_ACTORS]
+
+    existing.actors = json.dumps(actors, ensure_ascii=False)
+    existing.title = title_template.replace(
+        "{actors}",
+        format_actors([actor["name"] for actor in actors], existing.actor_count)
+    )
+    existing.last_event_at = now
+    for key, value in fields.items():
+        setattr(existing, key, value)
+
+    return existing
+
+
+def get_unread_count(db: Session, user_id: int) -> int:
+    """读取冗余的未读计数（主键查询，不扫描通知表）"""
+    count = db.query(models.User.unread_notification_count).filter(
+        models.User.id == user_id
+    ).scalar()
+    return max(count or 0, 0)
+
+
+def mark_read(db: Session, user_id: int, notification_id: int) -> bool:
+    """
+    标记单个通知为已读
+
+    Returns:
+        bool: 通知是否由未读变为已读
+    """
+    changed = db.query(models.Notification).filter(
+        models.Notification.id == notification_id,
+        models.Notification.user_id == user_id,
+        models.Notification.is_read == False
+    ).update({models.Notification.is_read: True}, synchronize_session=False)
+
+    _adjust_unread_count(db, user_id, -changed)
+    return bool(changed)
+
+
+def mark_all_read(db: Session, user_id: int) -> int:
+    """一条 UPDATE 语句标记所有未读通知为已读，返回受影响行数"""
+    marked_count = db.query(models.Notification).filter(
+        models.Notification.user_id == user_id,
+        models.Notification.is_read == False
+    ).update({models.Notification.is_read: True}, synchronize_session=False)
+
+    _adjust_unread_count(db, user_id, -marked_count)
+    return marked_count
+
+
+def delete_notification(db: Session, notification: models.Notification) -> None:
+    """删除单个通知，若为未读则同步减少计数"""
+    if not notification.is_read:
+        _adjust_unread_count(db, notification.user_id, -1)
+    db.delete(notification)
+
+
+def clear_notifications(db: Session, user_id: int, include_unread: bool = False) -> int:
+    """
+    批量清除通知（DELETE 语句），返回删除行数
+
+    Args:
+        include_unread: True 时清除全部通知，否则仅清除已读通知
+    """
+    base_query = db.query(models.Notification).filter(
+        models.Notification.user_id == user_id
+    )
+
+    deleted_count = base_query.filter(
+        models.Notification.is_read == True
+    ).delete(synchronize_session=False)
+
+    if include_unread:
+        unread_deleted = base_query.filter(
+            models.Notification.is_read == False
+        ).delete(synchronize_session=False)
+        _adjust_unread_count(db, user_id, -unread_deleted)
+        deleted_count += unread_deleted
+
+    return deleted_count
+
+
+def reconcile_unread_counts(db: Session, user_id: Optional[int] = None) -> int:
+    """
+    一致性检查：按通知表重新统计未读数，修复漂移的计数器
+
+    Args:
+        user_id: 仅检查指定用户；为 None 时检查全部用户
+
+    Returns:
+        int: 被修复的用户数量
+    """
+    actual_query = db.query(
+        models.Notification.user_id,
+        func.count(models.Notification.id)
+    ).filter(
+        models.Notification.is_read == False
+    )
+    users_query = db.query(models.User.id, models.User.unread_notification_count)
+
+    if user_id is not None:
+        actual_query = actual_query.filter(models.Notification.user_id == user_id)
+        users_query = users_query.filter(models.User.id == user_id)
+
+    actual_counts = dict(actual_query.group_by(models.Notification.user_id).all())
+
+    repaired = 0
+    for uid, stored_count in users_query.all():
+        actual = actual_counts.get(uid, 0)
+        if stored_count != actual:
+            logger.warning(f"修复未读通知计数: user={uid}, stored={stored_count}, actual={actual}")
+            db.execute(
+                update(models.User)
+                .where(models.User.id == uid)
+                .values(unread_notification_count=actual)
+                .execution_options(synchronize_session=False)
+            )
+            repaired += 1
+
+    db.commit()
+    return repaired
+
+
+# ============= 广播通知（写一次，读时合并） =============
+
+def publish_broadcast(db: Session, **fields) -> models.BroadcastNotification:
+    """
+    发布广播通知（不提交）
+
+    只写入一行，不为每个成员插入通知；成员读取通知列表时按水位线合并。
+    """
+    broadcast = models.BroadcastNotification(**fields)
+    db.add(broadcast)
+    return broadcast
+
+
+def delete_broadcasts_for(db: Session, related_type: str, related_id: int) -> int:
+    """删除关联对象的广播通知（不提交），返回删除行数"""
+    return db.query(models.BroadcastNotification).filter(
+        models.BroadcastNotification.related_type == related_type,
+        models.BroadcastNotification.related_id == related_id
+    ).delete(synchronize_session=False)
+
+
+def visible_broadcasts_query(db: Session, user: models.User):
+    """用户可见的广播：注册之后发布、且未被清除"""
+    query = db.query(models.BroadcastNotification).filter(
+        models.BroadcastNotification.id > (user.broadcast_cleared_id or 0)
+    )
+    if user.created_at is not None:
+        query = query.filter(models.BroadcastNotification.created_at >= user.created_at)
+    return query
+
+
+def count_unread_broadcasts(db: Session, user: models.User) -> int:
+    """未读广播数：可见且 id 大于已读水位线"""
+    return visible_broadcasts_query(db, user).filter(
+        models.BroadcastNotification.id > (user.broadcast_read_id or 0)
+    ).count()
+
+
+def _latest_broadcast_id(db: Session) -> int:
+    return db.query(func.max(models.BroadcastNotification.id)).scalar() or 0
+
+
+def _advance_watermark(db: Session, user: models.User, column, target: int) -> None:
+    """单调推进水位线（并发请求不会让水位线回退）"""
+    db.execute(
+        update(models.User)
+        .where(models.User.id == user.id, column < target)
+        .values({column: target})
+        .execution_options(synchronize_session=False)
+    )
+    # 同步内存中的值但不标记为脏数据，避免 flush 时覆盖更高的水位线
+    set_committed_value(user, column.key, max(getattr(user, column.key) or 0, target))
+
+
+def mark_broadcasts_read(db: Session, user: models.User, up_to_id: Optional[int] = None) -> int:
+    """
+    将已读水位线推进到 up_to_id（默认最新广播），返回新变为已读的广播数
+
+    水位线语义下，标记某条广播已读会同时标记更早的广播为已读。
+    """
+    target = _latest_broadcast_id(db) if up_to_id is None else up_to_id
+    read_id = user.broadcast_read_id or 0
+    if target <= read_id:
+        return 0
+
+    newly_read = visible_broadcasts_query(db, user).filter(
+        models.BroadcastNotification.id > read_id,
+        models.BroadcastNotification.id <= target
+    ).count()
+    _advance_watermark(db, user, models.User.broadcast_read_id, target)
+    return newly_read
+
+
+def clear_broadcasts(db: Session, user: models.User, include_unread: bool = False) -> int:
+    """
+    推进已清除水位线，返回对该用户隐藏的广播数
+
+    Args:
+        include_unread: True 时清除全部广播，否则只清除已读广播
+    """
+    target = _latest_broadcast_id(db) if include_unread else (user.broadcast_read_id or 0)
+    if target <= (user.broadcast_cleared_id or 0):
+        return 0
+
+    cleared = visible_broadcasts_query(db, user).filter(
+        models.BroadcastNotification.id <= target
+    ).count()
+    _advance_watermark(db, user, models.User.broadcast_cleared_id, target)
+    _advance_watermark(db, user, models.User.broadcast_read_id, target)
+    return cleared
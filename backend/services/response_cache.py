@@ -0,0 +1,158 @@
+"""
+AI 回复缓存（需在配置中启用 AI_RESPONSE_CACHE_ENABLED）
+同一班级的学生常问相同的问题（作业截止时间、网站用法），命中缓存可省去一次付费调用
+
+缓存键 = 规范化后的问题 + 上下文哈希 + 服务商/模型 + 温度档位：
+- 规范化：全角转半角、忽略大小写、合并空白、去掉末尾标点，使近似重复的问题也能命中
+- 上下文只有当前问题（新对话的第一句）时条目可在用户间共享；
+  上下文包含历史消息或摘要时，缓存键加入用户 ID，绝不跨用户共享私有对话
+- 条目按 TTL 过期，超过容量时淘汰最久未使用的条目（LRU）
+
+缓存保存在进程内存中，多进程部署时每个进程各自缓存。
+"""
+
+import hashlib
+import json
+import logging
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import AsyncGenerator, Optional
+
+from config import settings
+from services import ai_service
+from services.ai_service import current_usage, mock_fallback
+
+logger = logging.getLogger(__name__)
+
+_TRAILING_PUNCTUATION = "?？!！.。~～ "
+
+
+@dataclass
+class CacheEntry:
+    content: str
+    expires_at: float
+
+
+_entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0}
+
+
+def normalize_prompt(text: str) -> str:
+    """规范化问题文本，使仅在大小写、全半角、空白或末尾标点上不同的问题得到相同结果"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(_TRAILING_PUNCTUATION)
+
+
+def make_key(messages: list[dict], user_id: int) -> str:
+    """根据 AI 调用的消息列表计算缓存键（最后一条为当前问题）"""
+    prompt = normalize_prompt(messages[-1]["content"]) if messages else ""
+    context = messages[:-1]
+    context_hash = hashlib.sha256(
+        json.dumps(context, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+    # 有历史消息时上下文属于用户的私有对话，按用户隔离
+    scope = f"user:{user_id}" if context else "shared"
+    model = f"{ai_service.provider}:{getattr(ai_service, 'model', None) or ''}"
+    temperature_bucket = round(settings.AI_TEMPERATURE, 1)
+
+    raw = "\n".join([scope, model, str(temperature_bucket), context_hash, prompt])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get(key: str) -> Optional[str]:
+    """读取缓存，过期条目视为未命中并删除"""
+    entry = _entries.get(key)
+    if entry is None:
+        return None
+    if entry.expires_at <= time.monotonic():
+        del _entries[key]
+        _stats["expirations"] += 1
+        return None
+    _entries.move_to_end(key)
+    return entry.content
+
+
+def put(key: str, content: str) -> None:
+    """写入缓存，超过容量时淘汰最久未使用的条目"""
+    _entries[key] = CacheEntry(content, time.monotonic() + settings.AI_RESPONSE_CACHE_TTL_SECONDS)
+    _entries.move_to_end(key)
+    _stats["stores"] += 1
+    while len(_entries) > max(settings.AI_RESPONSE_CACHE_MAX_ENTRIES, 1):
+        _entries.popitem(last=False)
+        _stats["evictions"] += 1
+
+
+def invalidate(messages: list[dict], user_id: int) -> None:
+    """删除该问题对应的缓存（例如用户对回答不满意而重新生成）"""
+    _entries.pop(make_key(messages, user_id), None)
+
+
+def clear() -> None:
+    """清空缓存和统计"""
+    _entries.clear()
+    for name in _stats:
+        _stats[name] = 0
+
+
+def get_stats() -> dict:
+    """缓存统计：命中、未命中、写入、淘汰、过期次数，当前条目数和命中率"""
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        "enabled": settings.AI_RESPONSE_CACHE_ENABLED,
+        "entries": len(_entries),
+        "max_entries": settings.AI_RESPONSE_CACHE_MAX_ENTRIES,
+        "ttl_seconds": settings.AI_RESPONSE_CACHE_TTL_SECONDS,
+        **_stats,
+        "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+    }
+
+
+async def _replay(content: str) -> AsyncGenerator[str, None]:
+    """把缓存的回答按片段重新输出，走与实时回复相同的流式路径"""
+    size = max(settings.AI_STREAM_FLUSH_CHARS, 16)
+    for start in range(0, len(content), size):
+        yield content[start:start + size]
+
+
+async def generate(
+    messages: list[dict],
+    user_id: int,
+    stream: bool = False,
+) -> AsyncGenerator[str, None]:
+    """
+    带缓存的 AI 回复生成，接口与 ai_service.generate_response 相同
+
+    只缓存完整生成的回答：调用中断、报错或降级为模拟回复时不写入缓存。
+    """
+    if not settings.AI_RESPONSE_CACHE_ENABLED or not messages:
+        async for delta in ai_service.generate_response(messages, stream=stream):
+            yield delta
+        return
+
+    key = make_key(messages, user_id)
+    cached = get(key)
+    if cached is not None:
+        _stats["hits"] += 1
+        logger.info(f"AI 回复缓存命中（用户 {user_id}）")
+        usage = current_usage.get()
+        if usage is not None:
+            usage.cached = True
+        async for delta in _replay(cached):
+            yield delta
+        return
+
+    _stats["misses"] += 1
+    mock_fallback.set(False)
+    parts = []
+    async for delta in ai_service.generate_response(messages, stream=stream):
+        parts.append(delta)
+        yield delta
+
+    content = "".join(parts)
+    if content and not mock_fallback.get():
+        put(key, content)
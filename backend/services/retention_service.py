@@ -0,0 +1,179 @@
+"""
+数据保留服务
+定期清理会无限增长的表：过期验证码、已读通知、旧动态、长期未更新的对话
+
+每张表的保留天数在 config.Settings 中配置（RETENTION_*）。删除按主键分批进行，
+每批单独提交，避免长时间持有锁；支持 dry-run 预览和删除前归档为 JSONL。
+"""
+
+import asyncio
+import json
+import logging
+import math
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import exists, func, select
+from sqlalchemy.orm import Session
+
+import models
+from config import settings
+from database import SessionLocal
+from models.activity import Activity
+
+logger = logging.getLogger(__name__)
+
+
+def _archive_rows(db: Session, model, ids: list[int], archive_dir: str) -> None:
+    """将即将删除的行追加写入 {archive_dir}/{表名}-{日期}.jsonl"""
+    directory = Path(archive_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{model.__tablename__}-{datetime.utcnow():%Y%m%d}.jsonl"
+
+    rows = db.query(model).filter(model.id.in_(ids)).all()
+    columns = [column.name for column in model.__table__.columns]
+    with path.open("a", encoding="utf-8") as f:
+        for row in rows:
+            record = {name: getattr(row, name) for name in columns}
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+def purge_in_batches(
+    db: Session,
+    model,
+    condition,
+    policy: str,
+    batch_size: int,
+    dry_run: bool = False,
+    archive_dir: Optional[str] = None,
+) -> dict:
+    """
+    按主键分批删除满足条件的行
+
+    Returns:
+        dict: {"table", "policy", "rows", "batches", "seconds", "dry_run"}
+            dry-run 时 rows/batches 为预计值
+    """
+    started = time.perf_counter()
+
+    if dry_run:
+        rows = db.query(func.count(model.id)).filter(condition).scalar() or 0
+        batches = math.ceil(rows / batch_size)
+    else:
+        rows = batches = 0
+        while True:
+            ids = [
+                row[0]
+                for row in db.query(model.id).filter(condition).order_by(model.id).limit(batch_size).all()
+            ]
+            if not ids:
+                break
+
+            if archive_dir:
+                _archive_rows(db, model, ids, archive_dir)
+
+            db.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+
+            rows += len(ids)
+            batches += 1
+
+    return {
+        "table": model.__tablename__,
+        "policy": policy,
+        "rows": rows,
+        "batches": batches,
+        "seconds": round(time.perf_counter() - started, 3),
+        "dry_run": dry_run,
+    }
+
+
+def run_retention(db: Session, dry_run: bool = False) -> list[dict]:
+    """执行所有已启用的保留策略，返回每个策略的执行报告"""
+    now = datetime.utcnow()
+    batch_size = max(settings.RETENTION_BATCH_SIZE, 1)
+    archive_dir = settings.RETENTION_ARCHIVE_DIR
+    reports = []
+
+    def purge(model, condition, policy):
+        report = purge_in_batches(db, model, condition, policy, batch_size, dry_run, archive_dir)
+        reports.append(report)
+        logger.info(
+            f"[数据清理] {report['table']}: {report['rows']} 行, "
+            f"{report['batches']} 批, {report['seconds']}s{' (dry-run)' if dry_run else ''}"
+        )
+
+    if settings.RETENTION_VERIFICATION_CODE_DAYS > 0:
+        cutoff = now - timedelta(days=settings.RETENTION_VERIFICATION_CODE_DAYS)
+        purge(
+            models.VerificationCode,
+            models.VerificationCode.expires_at < cutoff,
+            f"过期超过 {settings.RETENTION_VERIFICATION_CODE_DAYS} 天的验证码",
+        )
+
+    if settings.RETENTION_READ_NOTIFICATION_DAYS > 0:
+        # 只清理已读通知，未读计数器无需调整
+        cutoff = now - timedelta(days=settings.RETENTION_READ_NOTIFICATION_DAYS)
+        purge(
+            models.Notification,
+            (models.Notification.is_read == True) & (models.Notification.last_event_at < cutoff),
+            f"{settings.RETENTION_READ_NOTIFICATION_DAYS} 天前的已读通知",
+        )
+
+    if settings.RETENTION_ACTIVITY_DAYS > 0:
+        cutoff = now - timedelta(days=settings.RETENTION_ACTIVITY_DAYS)
+        purge(
+            Activity,
+            Activity.created_at < cutoff,
+            f"{settings.RETENTION_ACTIVITY_DAYS} 天前的动态",
+        )
+
+    if settings.RETENTION_ABANDONED_CONVERSATION_DAYS > 0:
+        cutoff = now - timedelta(days=settings.RETENTION_ABANDONED_CONVERSATION_DAYS)
+        abandoned_ids = select(models.Conversation.id).where(
+            models.Conversation.updated_at < cutoff
+        )
+        policy = f"{settings.RETENTION_ABANDONED_CONVERSATION_DAYS} 天未更新的对话"
+
+        # 先分批删除消息的检索索引、历史版本和消息，再删除已无消息的对话（dry-run 时消息尚在，直接按时间预估）
+        purge(models.MessageSearchTerm, models.MessageSearchTerm.conversation_id.in_(abandoned_ids), policy)
+        purge(
+            models.MessageVersion,
+            models.MessageVersion.message_id.in_(
+                select(models.Message.id).where(models.Message.conversation_id.in_(abandoned_ids))
+            ),
+            policy,
+        )
+        purge(models.Message, models.Message.conversation_id.in_(abandoned_ids), policy)
+        conversation_condition = models.Conversation.updated_at < cutoff
+        if not dry_run:
+            conversation_condition = conversation_condition & ~exists().where(
+                models.Message.conversation_id == models.Conversation.id
+            )
+        purge(models.Conversation, conversation_condition, policy)
+
+    return reports
+
+
+def run_retention_job(dry_run: bool = False) -> list[dict]:
+    """使用独立会话执行一次数据清理（供后台任务 / 命令行调用）"""
+    db = SessionLocal()
+    try:
+        return run_retention(db, dry_run=dry_run)
+    finally:
+        db.close()
+
+
+async def retention_loop() -> None:
+    """后台定时清理任务：在线程中执行，避免阻塞事件循环"""
+    interval = max(settings.RETENTION_INTERVAL_HOURS, 1) * 3600
+
+    while True:
+        try:
+            await asyncio.to_thread(run_retention_job)
+        except Exception as e:
+            logger.error(f"[数据清理] 执行失败: {e}", exc_info=True)
+
+        await asyncio.sleep(interval)
@@ -0,0 +1,173 @@
+"""
+对话消息全文检索
+在 message_search_terms 表中为每个用户维护消息内容的倒排索引
+
+- 分词：英文单词 / 数字按小写整词；中日韩文字没有空格分隔，索引每个字和相邻两字（二元组）
+- 查询：查询词中连续两个及以上的中日韩文字按二元组匹配，单个字按单字匹配，所有词项都要出现
+- 排序：按词频和逆文档频率打分（BM25 的简化形式，不做长度归一），分数相同时较新的消息在前
+- 消息写入、重新生成、删除时由调用方增量更新索引，检索只走 (user_id, term) 索引，不扫描消息内容
+"""
+
+import math
+import re
+from collections import Counter
+
+from sqlalchemy import case, delete, desc, func, insert
+from sqlalchemy.orm import Session
+
+import models
+
+# 单个词项的最大长度（与 message_search_terms.term 一致）
+MAX_TERM_CHARS = 32
+# 一次查询最多使用的词项数
+MAX_QUERY_TERMS = 16
+# 词频饱和参数：同一词项重复出现时得分增长逐渐放缓
+TF_SATURATION = 1.2
+# 检索结果摘要的长度，以及命中位置之前保留的字数
+SNIPPET_CHARS = 80
+SNIPPET_LEAD_CHARS = 20
+
+_CJK = r"぀-ヿ㐀-䶿一-鿿가-힯豈-﫿"
+_TOKEN_PATTERN = re.compile(rf"([{_CJK}]+)|((?:(?![{_CJK}])[^\W_])+)")
+
+
+def _split(text: str) -> list[tuple[str, bool]]:
+    """把文本切成 (片段, 是否为中日韩文字) 列表，英文统一小写"""
+    return [
+        (cjk, True) if cjk else (word[:MAX_TERM_CHARS], False)
+        for cjk, word in _TOKEN_PATTERN.findall(text.lower())
+    ]
+
+
+def tokenize(text: str) -> list[str]:
+    """建立索引用的词项（含重复，用于统计词频）"""
+    terms = []
+    for run, is_cjk in _split(text):
+        if not is_cjk:
+            terms.append(run)
+            continue
+        terms.extend(run)
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def query_terms(q: str) -> list[str]:
+    """查询用的词项（去重，保持顺序）"""
+    terms = []
+    for run, is_cjk in _split(q):
+        if is_cjk and len(run) > 1:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.append(run)
+    return list(dict.fromkeys(terms))[:MAX_QUERY_TERMS]
+
+
+def index_message(
+    db: Session,
+    message_id: int,
+    user_id: int,
+    conversation_id: int,
+    content: str
+) -> None:
+    """重建一条消息的索引（由调用方提交；消息内容更新后重复调用即可）"""
+    db.execute(delete(models.MessageSearchTerm).where(models.MessageSearchTerm.message_id == message_id))
+    counts = Counter(tokenize(content))
+    if counts:
+        db.execute(insert(models.MessageSearchTerm), [
+            {
+                "user_id": user_id,
+                "term": term,
+                "message_id": message_id,
+                "conversation_id": conversation_id,
+                "tf": tf,
+            }
+            for term, tf in counts.items()
+        ])
+
+
+def remove_conversation(db: Session, conversation_id: int) -> None:
+    """删除对话前清理其消息的索引（由调用方提交）"""
+    db.execute(delete(models.MessageSearchTerm).where(
+        models.MessageSearchTerm.conversation_id == conversation_id
+    ))
+
+
+def make_snippet(content: str, terms: list[str]) -> str:
+    """截取第一个命中词项附近的一段内容作为摘要"""
+    text = " ".join(content.split())
+    lowered = text.lower()
+    positions = [pos for pos in (lowered.find(term) for term in terms) if pos >= 0]
+    start = max(min(positions, default=0) - SNIPPET_LEAD_CHARS, 0)
+    snippet = text[start:start + SNIPPET_CHARS]
+    if start > 0:
+        snippet = "..." + snippet
+    if start + SNIPPET_CHARS < len(text):
+        snippet += "..."
+    return snippet
+
+
+def search_messages(
+    db: Session,
+    user_id: int,
+    q: str,
+    page: int = 1,
+    size: int = 20
+) -> tuple[int, list[tuple[models.Message, str, float]]]:
+    """
+    检索用户自己的对话消息
+
+    Returns:
+        tuple: (命中总数, 当前页的 [(消息, 对话标题, 得分)])，按得分从高到低
+    """
+    terms = query_terms(q)
+    if not terms:
+        return 0, []
+
+    Term = models.MessageSearchTerm
+
+    # 各词项的文档频率；任一词项没有出现过时不可能全部命中
+    doc_freq = dict(db.query(Term.term, func.count(Term.id)).filter(
+        Term.user_id == user_id,
+        Term.term.in_(terms)
+    ).group_by(Term.term).all())
+    if len(doc_freq) < len(terms):
+        return 0, []
+
+    total_messages = db.query(func.sum(models.Conversation.message_count)).filter(
+        models.Conversation.user_id == user_id
+    ).scalar() or 0
+    total_messages = max(total_messages, max(doc_freq.values()))
+    weights = {
+        term: math.log(1 + (total_messages - df + 0.5) / (df + 0.5))
+        for term, df in doc_freq.items()
+    }
+
+    weight = case(weights, value=Term.term, else_=0.0)
+    score = func.sum(weight * Term.tf * (TF_SATURATION + 1) / (Term.tf + TF_SATURATION)).label("score")
+
+    # 每条消息的每个词项只有一行：命中的词项数等于查询词项数即全部命中
+    query = db.query(Term.message_id).filter(
+        Term.user_id == user_id,
+        Term.term.in_(terms)
+    ).group_by(Term.message_id).having(func.count(Term.id) == len(terms))
+
+    rows = query.add_columns(score, func.count().over()).order_by(
+        desc("score"), Term.message_id.desc()
+    ).offset((page - 1) * size).limit(size).all()
+
+    if not rows:
+        # 页码超出范围时没有返回行，单独统计总数
+        return (query.count() if page > 1 else 0), []
+    total = rows[0][2]
+
+    found = {
+        message.id: (message, title)
+        for message, title in db.query(models.Message, models.Conversation.title).join(
+            models.Conversation, models.Message.conversation_id == models.Conversation.id
+        ).filter(models.Message.id.in_([row[0] for row in rows])).all()
+    }
+    return total, [
+        (*found[message_id], float(row_score))
+        for message_id, row_score, _ in rows
+        if message_id in found
+    ]
@@ -0,0 +1,193 @@
+"""
+内容寻址存储
+上传文件边接收边计算 SHA-256，按哈希保存到 uploads/blog/{images|videos}/{前两位}/{sha256}{扩展名}
+
+- 相同内容只保存一份：已存在时直接丢弃新上传的临时文件，增加引用
+- 每次上传记录一条引用（object_references），删除媒体时只释放自己的引用，引用归零才删除文件
+- 登记引用和释放引用都先锁定对象行；引用归零时文件在事务提交之后才删除（见 remove_files），
+  回滚不会留下没有文件的记录，并发上传也不会引用正在删除的文件
+- 路径由内容决定、永不改变，静态文件可设置为浏览器永久缓存（见 main.ImmutableStaticFiles）
+"""
+
+import hashlib
+import logging
+import re
+import shutil
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+from config import settings
+from services import image_service, transcode_service
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_ROOT = Path("uploads")
+# 内容寻址文件及其派生文件（图片版本、压缩视频）：.../ab/{sha256}[-320w].ext
+CONTENT_ADDRESSED_PATH = re.compile(r"/([0-9a-f]{2})/\1[0-9a-f]{62}[^/]*$")
+
+
+def staging_path() -> Path:
+    """上传中的临时文件（不在静态目录下）"""
+    directory = Path(settings.UPLOAD_SESSION_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f"{uuid.uuid4().hex}.upload"
+
+
+def object_path(category: str, sha256: str, extension: str) -> Path:
+    return UPLOAD_ROOT / "blog" / category / sha256[:2] / f"{sha256}{extension}"
+
+
+def to_url(path: Path) -> str:
+    return "/static/" + Path(path).relative_to(UPLOAD_ROOT).as_posix()
+
+
+def url_to_path(url: str) -> Path:
+    return UPLOAD_ROOT / url.removeprefix("/static/")
+
+
+def is_content_addressed(path: str) -> bool:
+    return CONTENT_ADDRESSED_PATH.search(path) is not None
+
+
+def hash_file(path: Path) -> str:
+    """计算已有文件的 SHA-256（阻塞调用，大文件应在线程中执行）"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _add_reference(db: Session, stored: models.StoredObject, user_id: Optional[int]) -> None:
+    db.add(models.ObjectReference(object_id=stored.id, user_id=user_id))
+    db.query(models.StoredObject).filter(models.StoredObject.id == stored.id).update(
+        {models.StoredObject.ref_count: models.StoredObject.ref_count + 1},
+        synchronize_session=False
+    )
+
+
+def _locked(db: Session, condition) -> Optional[models.StoredObject]:
+    """读取并锁定对象行直到事务结束（SQLite 不支持 FOR UPDATE，写事务本身是串行的）"""
+    return db.query(models.StoredObject).filter(condition).with_for_update().populate_existing().first()
+
+
+def store(
+    db: Session,
+    user_id: Optional[int],
+    staged: Path,
+    category: str,
+    extension: str,
+    sha256: str
+) -> tuple[models.StoredObject, bool]:
+    """
+    把已计算哈希的临时文件存入内容寻址路径并记录引用
+
+    Returns:
+        (StoredObject, 是否为新文件)；内容已存在时临时文件被删除
+    """
+    stored = _locked(db, models.StoredObject.sha256 == sha256)
+    if stored is not None and url_to_path(stored.url).exists():
+        staged.unlink(missing_ok=True)
+        created = False
+    else:
+        final_path = object_path(category, sha256, extension) if stored is None else url_to_path(stored.url)
+        final_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(staged, final_path)
+        created = True
+        if stored is None:
+            stored = models.StoredObject(sha256=sha256, url=to_url(final_path), size=final_path.stat().st_size, ref_count=0)
+            db.add(stored)
+            try:
+                db.flush()
+            except IntegrityError:
+                # 相同内容被同时上传：对方已登记，文件内容相同，共用即可
+                db.rollback()
+                stored = _locked(db, models.StoredObject.sha256 == sha256)
+                created = False
+
+    _add_reference(db, stored, user_id)
+    db.commit()
+    db.refresh(stored)
+    return stored, created
+
+
+def find_object(db: Session, url: str) -> Optional[models.StoredObject]:
+    """按地址查找内容寻址文件；派生文件（图片版本、压缩视频）对应其原文件"""
+    stored = db.query(models.StoredObject).filter(models.StoredObject.url == url).first()
+    if stored is None and is_content_addressed(url):
+        sha256 = url.rsplit("/", 1)[-1][:64]
+        stored = db.query(models.StoredObject).filter(models.StoredObject.sha256 == sha256).first()
+    return stored
+
+
+def release(db: Session, user_id: int, url: str) -> Optional[list[Path]]:
+    """
+    释放用户对文件的一个引用（优先释放自己的，其次是上传者未知的历史引用），调用方提交
+
+    派生文件的地址释放的是原文件的引用，派生文件不会被单独删除。
+    引用归零时只删除数据库记录，文件由调用方在提交之后用 remove_files 删除。
+
+    Returns:
+        None: 不是内容寻址文件；[]: 没有可释放的引用或文件仍被引用；
+        否则为引用归零后需要删除的文件（版本、压缩视频和原文件）
+    """
+    stored = find_object(db, url)
+    if stored is None:
+        return None
+    # 锁定对象行：本事务提交前，并发的上传（store）不能为它增加引用
+    stored = _locked(db, models.StoredObject.id == stored.id)
+    if stored is None:
+        return []
+    url = stored.url
+
+    reference = db.query(models.ObjectReference).filter(
+        models.ObjectReference.object_id == stored.id,
+        models.ObjectReference.user_id == user_id
+    ).first() or db.query(models.ObjectReference).filter(
+        models.ObjectReference.object_id == stored.id,
+        models.ObjectReference.user_id.is_(None)
+    ).first()
+    if reference is None:
+        return []
+
+    db.delete(reference)
+    db.query(models.StoredObject).filter(models.StoredObject.id == stored.id).update(
+        {models.StoredObject.ref_count: models.StoredObject.ref_count - 1},
+        synchronize_session=False
+    )
+    db.flush()
+    db.refresh(stored)
+    if stored.ref_count > 0:
+        return []
+
+    db.query(models.ImageAsset).filter(models.ImageAsset.url == url).delete()
+    # 转码任务随源文件删除，之后重新上传同一视频时重新转码（进行中的任务结束时删除其输出）
+    db.query(models.TranscodeJob).filter(models.TranscodeJob.source_url == url).delete()
+    db.delete(stored)
+
+    path = url_to_path(url)
+    return image_service.variant_files(path) + [transcode_service.rendition_path(path), path]
+
+
+def remove_files(db: Session, paths: list[Path]) -> None:
+    """
+    删除 release 返回的文件（在事务提交之后调用）
+
+    提交之后相同内容又被上传（重新登记了记录）时保留文件，由新的上传使用
+    """
+    if not paths:
+        return
+    sha256 = paths[-1].name[:64]
+    if db.query(models.StoredObject.id).filter(models.StoredObject.sha256 == sha256).first():
+        return
+    for path in paths:
+        path.unlink(missing_ok=True)
+    try:
+        paths[-1].parent.rmdir()  # 前缀目录已空时一并删除
+    except OSError:
+        pass
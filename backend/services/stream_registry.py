@@ -0,0 +1,85 @@
+"""
+进行中的 AI 流式回复登记
+客户端断线重连时，可从这里接上仍在生成的回复，无需再次调用服务商
+
+- 每条正在生成的 AI 消息对应一个 LiveStream，按序号（seq）保存已发送的增量
+- 重连方从 last_event_id 之后开始补发，然后继续接收新的增量直到生成结束
+- 生成结束后从登记表移除，此时完整内容已写入数据库
+
+状态保存在进程内存中，多进程部署时重连请求可能落到其他进程，此时由数据库中的检查点恢复。
+"""
+
+import asyncio
+from typing import AsyncGenerator, Optional
+
+
+class LiveStream:
+    """一条正在生成的 AI 回复"""
+
+    def __init__(self, message_id: int, user_id: int):
+        self.message_id = message_id
+        self.user_id = user_id
+        self.frames: list[tuple[int, str, bool]] = []  # (seq, delta, replace)
+        self.parts: list[str] = []  # 当前完整内容的片段
+        self.done = False
+        self._changed = asyncio.Event()
+
+    @property
+    def seq(self) -> int:
+        return self.frames[-1][0] if self.frames else 0
+
+    @property
+    def content(self) -> str:
+        return "".join(self.parts)
+
+    def _notify(self) -> None:
+        # 唤醒所有等待者，之后的等待使用新的事件
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, seq: int, delta: str, replace: bool = False) -> None:
+        """记录一帧增量（replace 为 True 时 delta 替换已有的全部内容）"""
+        if replace:
+            self.parts[:] = [delta]
+        else:
+            self.parts.append(delta)
+        self.frames.append((seq, delta, replace))
+        self._notify()
+
+    def finish(self) -> None:
+        self.done = True
+        self._notify()
+
+    async def follow(self, after_seq: int = 0) -> AsyncGenerator[tuple[int, str, bool], None]:
+        """补发 after_seq 之后的增量，并持续输出新的增量直到生成结束"""
+        index = 0
+        while True:
+            while index < len(self.frames):
+                frame = self.frames[index]
+                index += 1
+                if frame[0] > after_seq:
+                    yield frame
+            if self.done:
+                return
+            await self._changed.wait()
+
+
+_streams: dict[int, LiveStream] = {}
+
+
+def start(message_id: int, user_id: int) -> LiveStream:
+    """登记一条开始生成的回复"""
+    live = LiveStream(message_id, user_id)
+    _streams[message_id] = live
+    return live
+
+
+def get(message_id: int) -> Optional[LiveStream]:
+    return _streams.get(message_id)
+
+
+def finish(message_id: int) -> None:
+    """生成结束（完成、失败或客户端断开）：唤醒重连方并移除登记"""
+    live = _streams.pop(message_id, None)
+    if live is not None:
+        live.finish()
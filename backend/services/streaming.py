@@ -0,0 +1,109 @@
+"""
+流式输出工具
+将服务商逐 token 返回的增量合并为较少的 SSE 帧
+"""
+
+import asyncio
+from typing import AsyncGenerator, AsyncIterator
+
+from config import settings
+
+_END = object()
+
+
+async def coalesce_deltas(
+    source: AsyncIterator[str],
+    flush_ms: int | None = None,
+    flush_chars: int | None = None,
+) -> AsyncGenerator[str, None]:
+    """
+    合并增量：距上次输出满 flush_ms 毫秒或累积满 flush_chars 个字符时输出一次
+
+    - 第一个增量立即输出，不增加首字延迟
+    - 服务商本身慢于 flush_ms 时，每个增量到达即输出，不做任何等待
+    - 服务商很快时，多个 token 合并为一帧，减少帧数和序列化开销
+
+    服务商的流在单独的任务中读取，消费方提前退出时取消该任务（同时关闭上游流）。
+
+    Args:
+        source: 增量文本的异步迭代器
+        flush_ms: 时间阈值（默认 AI_STREAM_FLUSH_MS，0 表示不按时间合并）
+        flush_chars: 字符阈值（默认 AI_STREAM_FLUSH_CHARS，0 表示不按长度合并）
+    """
+    flush_ms = settings.AI_STREAM_FLUSH_MS if flush_ms is None else flush_ms
+    flush_chars = settings.AI_STREAM_FLUSH_CHARS if flush_chars is None else flush_chars
+
+    if flush_ms <= 0 and flush_chars <= 0:
+        async for delta in source:
+            yield delta
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for delta in source:
+                queue.put_nowait((delta, None))
+        except Exception as exc:
+            queue.put_nowait((_END, exc))
+            return
+        queue.put_nowait((_END, None))
+
+    producer = asyncio.create_task(pump())
+    interval = flush_ms / 1000
+    pending: list[str] = []
+    pending_chars = 0
+    last_flush = None  # None 表示还没有输出过
+
+    try:
+        while True:
+            timeout = None
+            if pending and flush_ms > 0:
+                timeout = max(last_flush + interval - loop.time(), 0)
+
+            try:
+                if not queue.empty():
+                    delta, error = queue.get_nowait()
+                else:
+                    delta, error = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                # 时间阈值到达，输出已累积的内容
+                yield "".join(pending)
+                pending.clear()
+                pending_chars = 0
+                last_flush = loop.time()
+                continue
+
+            if delta is _END:
+                if error is not None:
+                    if pending:
+                        yield "".join(pending)
+                    raise error
+                break
+
+            pending.append(delta)
+            pending_chars += len(delta)
+
+            now = loop.time()
+            if (
+                last_flush is None
+                or (flush_chars > 0 and pending_chars >= flush_chars)
+                or (flush_ms > 0 and now - last_flush >= interval)
+            ):
+                yield "".join(pending)
+                pending.clear()
+                pending_chars = 0
+                last_flush = now
+
+        if pending:
+            yield "".join(pending)
+    finally:
+        if not producer.done():
+            producer.cancel()
+            # 消费方所在的取消域（如 Starlette 检测到断开后）会反复取消当前任务，
+            # 用 shield 等待，避免这些取消再次打断读取任务里关闭上游连接的过程
+            try:
+                await asyncio.shield(producer)
+            except (asyncio.CancelledError, Exception):
+                pass
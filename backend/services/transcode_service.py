@@ -0,0 +1,334 @@
+"""
+视频转码服务
+上传的视频先以原文件保存并立即返回，随后在独立的进程池中用 FFmpeg 压缩
+
+- 进程池大小由 VIDEO_TRANSCODE_WORKERS 控制（0 表示不转码），工作进程降低调度优先级，
+  转码占满 CPU 时 API 请求仍能及时处理
+- 工作进程通过 `-progress pipe:1` 读取 FFmpeg 已处理的时长，按视频总时长换算进度写入 transcode_jobs
+- 转码完成后把博客内容中的原视频地址替换为压缩版本；之后保存的博客也会自动替换
+- 压缩结果不比原文件小时保留原文件
+"""
+
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import ffmpeg_config
+import models
+from config import settings
+from database import SessionLocal, engine
+
+logger = logging.getLogger(__name__)
+
+# 视频压缩配置
+VIDEO_COMPRESSION_SETTINGS = {
+    "max_width": 1920,  # 最大宽度
+    "max_height": 1080,  # 最大高度
+    "video_bitrate": "2M",  # 视频码率
+    "audio_bitrate": "128k",  # 音频码率
+    "target_size_mb": 50,  # 目标大小 (MB)
+}
+
+RENDITION_SUFFIX = "-compressed"  # 压缩版本文件名后缀：{原文件名}-compressed.mp4
+PROGRESS_UPDATE_SECONDS = 1.0  # 工作进程写入进度的最小间隔
+VIDEO_URL_PATTERN = re.compile(r'/static/blog/videos/[^"\'\s<>?#]+')
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _init_worker() -> None:
+    """工作进程初始化：不复用父进程的数据库连接，并降低 CPU 调度优先级"""
+    engine.dispose(close=False)
+    if settings.VIDEO_TRANSCODE_NICE and hasattr(os, "nice"):
+        os.nice(settings.VIDEO_TRANSCODE_NICE)
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.VIDEO_TRANSCODE_WORKERS,
+            initializer=_init_worker
+        )
+    return _executor
+
+
+def shutdown(wait: bool = False) -> None:
+    """关闭进程池（未开始的任务保持 queued，下次启动时重新提交）"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait, cancel_futures=True)
+        _executor = None
+
+
+def resolve_ffmpeg() -> tuple[str, str]:
+    """获取 FFmpeg 和 FFprobe 命令（ffmpeg_config 未配置时从 PATH 查找）"""
+    ffmpeg_cmd = ffmpeg_config.get_ffmpeg_path()
+    ffprobe_cmd = ffmpeg_config.get_ffprobe_path()
+    if ffmpeg_cmd == "ffmpeg":
+        ffmpeg_cmd = shutil.which("ffmpeg") or ffmpeg_cmd
+    if ffprobe_cmd == "ffprobe":
+        ffprobe_cmd = shutil.which("ffprobe") or ffprobe_cmd
+    return ffmpeg_cmd, ffprobe_cmd
+
+
+def rendition_path(source_path: Path) -> Path:
+    return source_path.with_name(f"{source_path.stem}{RENDITION_SUFFIX}.mp4")
+
+
+def to_url(path: Path) -> str:
+    """uploads/blog/videos/xxx.mp4 -> /static/blog/videos/xxx.mp4"""
+    return "/static/" + Path(path).relative_to("uploads").as_posix()
+
+
+def parse_progress(line: str, duration: Optional[float]) -> Optional[float]:
+    """
+    解析 FFmpeg `-progress` 输出的一行，返回进度百分比（0-100）
+
+    out_time_us / out_time_ms 均为微秒（out_time_ms 是 FFmpeg 历史遗留的命名）；
+    `progress=end` 表示处理完成。其他行或时长未知时返回 None
+    """
+    key, _, value = line.strip().partition("=")
+    if key == "progress":
+        return 100.0 if value == "end" else None
+    if key not in ("out_time_us", "out_time_ms") or not duration:
+        return None
+    try:
+        seconds = int(value) / 1_000_000
+    except ValueError:
+        return None  # 开始阶段为 N/A
+    # 最后一段可能略超过探测到的时长，完成前最多显示 99.9%
+    return round(min(max(seconds / duration * 100, 0.0), 99.9), 1)
+
+
+def probe_duration(ffprobe_cmd: str, input_path: str) -> Optional[float]:
+    result = subprocess.run(
+        [
+            ffprobe_cmd,
+            "-v", "error",
+            "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            input_path
+        ],
+        capture_output=True,
+        text=True,
+        timeout=60
+    )
+    try:
+        return float(result.stdout.strip())
+    except ValueError:
+        return None
+
+
+def build_command(ffmpeg_cmd: str, input_path: str, output_path: str, duration: Optional[float]) -> list[str]:
+    """按时长计算目标码率（目标 50MB，最大 2Mbps），限制宽度并把 moov 放到文件头便于边下边播"""
+    target_bitrate = int((VIDEO_COMPRESSION_SETTINGS["target_size_mb"] * 8 * 1024) / (duration or 10))
+    target_bitrate = min(target_bitrate, 2000)
+    return [
+        ffmpeg_cmd,
+        "-i", input_path,
+        "-vf", f"scale='min({VIDEO_COMPRESSION_SETTINGS['max_width']},iw):-2'",
+        "-b:v", f"{target_bitrate}k",
+        "-b:a", VIDEO_COMPRESSION_SETTINGS["audio_bitrate"],
+        "-movflags", "+faststart",
+        "-progress", "pipe:1",
+        "-nostats",
+        "-loglevel", "error",
+        "-y",
+        output_path
+    ]
+
+
+def _update_job(job_id: int, **values) -> None:
+    db = SessionLocal()
+    try:
+        db.query(models.TranscodeJob).filter(models.TranscodeJob.id == job_id).update(values)
+        db.commit()
+    finally:
+        db.close()
+
+
+def run_transcode(job_id: int, input_path: str, output_path: str, ffmpeg_cmd: str, ffprobe_cmd: str) -> dict:
+    """
+    在工作进程中执行转码，期间定期把进度写入数据库
+
+    Returns:
+        dict: {"duration", "output_size"}；失败时抛出异常，由主进程记录
+    """
+    duration = probe_duration(ffprobe_cmd, input_path)
+    _update_job(job_id, status="running", progress=0.0, duration=duration, started_at=datetime.utcnow())
+
+    # stderr 写入临时文件，避免输出过多时管道写满阻塞 FFmpeg
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            build_command(ffmpeg_cmd, input_path, output_path, duration),
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+            stdin=subprocess.DEVNULL,
+            text=True
+        )
+        last_progress, last_update = 0.0, time.monotonic()
+        for line in process.stdout:
+            progress = parse_progress(line, duration)
+            if progress is None or progress <= last_progress:
+                continue
+            last_progress = progress
+            if time.monotonic() - last_update >= PROGRESS_UPDATE_SECONDS:
+                _update_job(job_id, progress=progress)
+                last_update = time.monotonic()
+
+        if process.wait() != 0:
+            stderr.seek(0)
+            message = stderr.read().decode("utf-8", "replace").strip()[-500:]
+            raise RuntimeError(f"FFmpeg 执行失败（退出码 {process.returncode}）: {message}")
+
+    return {"duration": duration, "output_size": Path(output_path).stat().st_size}
+
+
+def apply_renditions(db: Session, content: str) -> str:
+    """把内容中已有压缩版本的视频地址替换为压缩版本（保存博客时调用）"""
+    urls = set(VIDEO_URL_PATTERN.findall(content))
+    if not urls:
+        return content
+
+    jobs = db.query(models.TranscodeJob).filter(
+        models.TranscodeJob.source_url.in_(urls),
+        models.TranscodeJob.status == "completed"
+    ).all()
+    for job in jobs:
+        if job.output_url and job.output_url != job.source_url:
+            content = content.replace(job.source_url, job.output_url)
+    return content
+
+
+def _switch_blogs(db: Session, source_url: str, output_url: str) -> int:
+    """已保存的博客改用压缩版本（不更新 updated_at）"""
+    return db.query(models.Blog).filter(
+        models.Blog.content.contains(source_url)
+    ).update(
+        {
+            models.Blog.content: func.replace(models.Blog.content, source_url, output_url),
+            models.Blog.updated_at: models.Blog.updated_at,
+        },
+        synchronize_session=False
+    )
+
+
+def _finish(job_id: int, output_path: Path, future: Future) -> None:
+    """任务结束回调（在进程池的管理线程中执行）：记录结果并切换博客中的视频地址"""
+    db = SessionLocal()
+    try:
+        job = db.get(models.TranscodeJob, job_id)
+        if job is None:
+            # 源文件已被删除（引用全部释放），压缩结果不再需要
+            output_path.unlink(missing_ok=True)
+            return
+
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.warning(f"[视频转码] 任务 {job_id} 失败: {e}")
+            job.status = "failed"
+            job.error = str(e)[:1000] or e.__class__.__name__
+            output_path.unlink(missing_ok=True)
+        else:
+            job.status = "completed"
+            job.progress = 100.0
+            job.duration = result["duration"]
+            if result["output_size"] < job.source_size:
+                job.output_url = to_url(output_path)
+                job.output_size = result["output_size"]
+                switched = _switch_blogs(db, job.source_url, job.output_url)
+                logger.info(
+                    f"[视频转码] 任务 {job_id} 完成: {job.source_size / 1024 / 1024:.1f}MB → "
+                    f"{job.output_size / 1024 / 1024:.1f}MB，更新 {switched} 篇博客"
+                )
+            else:
+                # 原文件已经足够小，不替换
+                output_path.unlink(missing_ok=True)
+                job.output_url = job.source_url
+                job.output_size = job.source_size
+
+        job.finished_at = datetime.utcnow()
+        db.commit()
+    except Exception:
+        logger.exception(f"[视频转码] 记录任务 {job_id} 结果失败")
+    finally:
+        db.close()
+
+
+def submit(job: models.TranscodeJob) -> None:
+    """把任务提交到进程池"""
+    source_path = Path("uploads") / job.source_url.removeprefix("/static/")
+    output_path = rendition_path(source_path)
+    ffmpeg_cmd, ffprobe_cmd = resolve_ffmpeg()
+    # 工作进程可能早于工作目录变更启动，传绝对路径
+    future = get_executor().submit(
+        run_transcode, job.id, str(source_path.resolve()), str(output_path.resolve()), ffmpeg_cmd, ffprobe_cmd
+    )
+    future.add_done_callback(lambda f, job_id=job.id: _finish(job_id, output_path, f))
+
+
+def enqueue(db: Session, user_id: int, source_path: Path) -> Optional[models.TranscodeJob]:
+    """为上传的视频创建转码任务（未启用转码时返回 None；相同视频复用未失败的任务）"""
+    if settings.VIDEO_TRANSCODE_WORKERS <= 0:
+        return None
+
+    existing = db.query(models.TranscodeJob).filter(
+        models.TranscodeJob.source_url == to_url(source_path),
+        models.TranscodeJob.status != "failed"
+    ).order_by(models.TranscodeJob.id.desc()).first()
+    if existing:
+        return existing
+
+    job = models.TranscodeJob(
+        user_id=user_id,
+        status="queued",
+        source_url=to_url(source_path),
+        source_size=source_path.stat().st_size
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    submit(job)
+    return job
+
+
+def resume_pending() -> int:
+    """启动时重新提交上次未完成的任务（源文件已删除的标记为失败）"""
+    if settings.VIDEO_TRANSCODE_WORKERS <= 0:
+        return 0
+
+    db = SessionLocal()
+    try:
+        jobs = db.query(models.TranscodeJob).filter(
+            models.TranscodeJob.status.in_(("queued", "running"))
+        ).all()
+        resumed = 0
+        for job in jobs:
+            if (Path("uploads") / job.source_url.removeprefix("/static/")).exists():
+                job.status = "queued"
+                job.progress = 0.0
+                resumed += 1
+            else:
+                job.status = "failed"
+                job.error = "源文件不存在"
+                job.finished_at = datetime.utcnow()
+        db.commit()
+        for job in jobs:
+            if job.status == "queued":
+                submit(job)
+        return resumed
+    finally:
+        db.close()
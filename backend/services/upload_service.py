@@ -0,0 +1,146 @@
+"""
+断点续传服务
+大视频按固定大小分块上传：创建会话 → 按偏移量 PUT 分块（附 SHA-256）→ 查询已收到的范围 → 完成
+
+- 创建会话时按总大小预分配临时文件，分块校验通过后写入对应偏移量，完成时无需再拼接
+- 分块记录在 upload_chunks 中（会话 + 序号唯一），多个分块可以并行上传
+- 连接中断后重新查询会话即可得到缺失的分块，只需补传缺失部分
+- 长时间没有收到新分块的会话由后台任务清理（删除临时文件和记录）
+"""
+
+import asyncio
+import errno
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy.orm import Session
+
+import models
+from config import settings
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+def session_path(session_id: str) -> Path:
+    return Path(settings.UPLOAD_SESSION_DIR) / f"{session_id}.part"
+
+
+def chunk_path(session_id: str) -> Path:
+    """接收中的分块先写入单独的临时文件，校验通过后才写入会话文件"""
+    return Path(settings.UPLOAD_SESSION_DIR) / f"{session_id}.{uuid.uuid4().hex}.chunk"
+
+
+def write_chunk(path: Path, offset: int, source: Path) -> None:
+    """把校验通过的分块复制到会话文件的对应位置"""
+    with open(source, "rb") as src, open(path, "r+b") as dst:
+        dst.seek(offset)
+        shutil.copyfileobj(src, dst)
+
+
+def preallocate(path: Path, size: int) -> None:
+    """创建指定大小的临时文件（支持时真正分配磁盘空间，空间不足时立即失败）"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        if size > 0 and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+                return
+            except OSError as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL):  # 文件系统不支持，退回稀疏文件
+                    raise
+        f.truncate(size)
+
+
+def total_chunks(session: models.UploadSession) -> int:
+    return max((session.size + session.chunk_size - 1) // session.chunk_size, 1)
+
+
+def expected_chunk_size(session: models.UploadSession, index: int) -> int:
+    """第 index 块应有的字节数（最后一块可能较小）"""
+    return min(session.chunk_size, session.size - index * session.chunk_size)
+
+
+def next_expiry() -> datetime:
+    return datetime.utcnow() + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+
+
+def received_ranges(session: models.UploadSession, indexes: list[int]) -> list[list[int]]:
+    """把已收到的分块序号合并为字节范围 [start, end)"""
+    ranges: list[list[int]] = []
+    for index in sorted(indexes):
+        start = index * session.chunk_size
+        end = start + expected_chunk_size(session, index)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+    return ranges
+
+
+def describe(db: Session, session: models.UploadSession) -> dict:
+    """会话状态（供 UploadSessionRead 使用）"""
+    indexes = [
+        row[0] for row in db.query(models.UploadChunk.index).filter(models.UploadChunk.session_id == session.id).all()
+    ]
+    ranges = received_ranges(session, indexes)
+    received = set(indexes)
+    return {
+        "id": session.id,
+        "filename": session.filename,
+        "content_type": session.content_type,
+        "size": session.size,
+        "chunk_size": session.chunk_size,
+        "total_chunks": total_chunks(session),
+        "status": session.status,
+        "received_bytes": sum(end - start for start, end in ranges) if session.status == "uploading" else session.size,
+        "received_ranges": ranges if session.status == "uploading" else [[0, session.size]],
+        "missing_chunks": (
+            [index for index in range(total_chunks(session)) if index not in received]
+            if session.status == "uploading" else []
+        ),
+        "expires_at": session.expires_at,
+        "url": session.url,
+        "job_id": session.job_id,
+    }
+
+
+def expire_sessions(db: Session) -> int:
+    """删除已过期的会话（未完成的同时删除临时文件），返回删除的会话数"""
+    expired = db.query(models.UploadSession).filter(
+        models.UploadSession.expires_at < datetime.utcnow()
+    ).all()
+    for session in expired:
+        if session.status != "completed":
+            session_path(session.id).unlink(missing_ok=True)
+        db.query(models.UploadChunk).filter(models.UploadChunk.session_id == session.id).delete()
+        db.delete(session)
+    db.commit()
+    if expired:
+        logger.info(f"[断点续传] 清理 {len(expired)} 个过期上传会话")
+    return len(expired)
+
+
+def expire_sessions_job() -> int:
+    db = SessionLocal()
+    try:
+        return expire_sessions(db)
+    finally:
+        db.close()
+
+
+async def cleanup_loop() -> None:
+    """后台定时清理过期会话：在线程中执行，避免阻塞事件循环"""
+    interval = max(settings.UPLOAD_SESSION_CLEANUP_MINUTES, 1) * 60
+
+    while True:
+        try:
+            await asyncio.to_thread(expire_sessions_job)
+        except Exception as e:
+            logger.error(f"[断点续传] 清理过期会话失败: {e}", exc_info=True)
+
+        await asyncio.sleep(interval)
@@ -0,0 +1,204 @@
+"""
+AI 用量计量与配额
+记录每次 AI 调用的提示和回复 Token 数，按用户、日期、服务商和模型累加到 ai_usage_daily 台账
+
+- 优先使用服务商返回的用量；服务商未返回（部分兼容接口、调用中途断开）时用本地分词器计算
+- 回复来自缓存或模拟模式（包括熔断、未配置服务商时的兜底回复）时没有调用服务商，不计入用量
+- 每日 / 每月配额（AI_DAILY_TOKEN_QUOTA / AI_MONTHLY_TOKEN_QUOTA）在调用服务商之前检查，
+  已用量达到配额时拒绝新请求；进行中的请求不会被中断，因此实际用量可能略超配额
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+from config import settings
+from services.ai_service import TokenUsage
+from services.context_service import MESSAGE_OVERHEAD_TOKENS, count_tokens
+
+
+class QuotaExceededError(Exception):
+    """AI 用量已达配额"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def count_prompt_tokens(messages: list[dict]) -> int:
+    """按与上下文预算相同的方式计算提示的 Token 数"""
+    return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def finalize_usage(usage: TokenUsage, messages: list[dict], content: str) -> TokenUsage:
+    """补齐服务商未返回的用量（可重复调用）"""
+    if usage.cached:
+        usage.prompt_tokens = usage.completion_tokens = 0
+        return usage
+    if usage.prompt_tokens is None:
+        usage.prompt_tokens = count_prompt_tokens(messages)
+    if usage.completion_tokens is None:
+        usage.completion_tokens = count_tokens(content)
+    return usage
+
+
+def billable_tokens(usage: TokenUsage, messages: list[dict], content: str) -> int:
+    """本次调用计入台账和配额的 Token 数（回复来自缓存或模拟模式时为 0）"""
+    finalize_usage(usage, messages, content)
+    if usage.cached or usage.provider == "mock":
+        return 0
+    return usage.prompt_tokens + usage.completion_tokens
+
+
+def _increment(db: Session, user_id: int, day: date, provider: str, model: str, usage: TokenUsage) -> int:
+    """在数据库中原子累加台账行（不读取后再写回，并发请求不会互相覆盖），返回更新的行数"""
+    return db.query(models.AIUsage).filter(
+        models.AIUsage.user_id == user_id,
+        models.AIUsage.day == day,
+        models.AIUsage.provider == provider,
+        models.AIUsage.model == model
+    ).update(
+        {
+            models.AIUsage.requests: models.AIUsage.requests + 1,
+            models.AIUsage.prompt_tokens: models.AIUsage.prompt_tokens + usage.prompt_tokens,
+            models.AIUsage.completion_tokens: models.AIUsage.completion_tokens + usage.completion_tokens,
+            models.AIUsage.updated_at: datetime.utcnow(),
+        },
+        synchronize_session=False
+    )
+
+
+def record_usage(
+    db: Session,
+    user_id: int,
+    usage: TokenUsage,
+    messages: list[dict],
+    content: str
+) -> int:
+    """
+    把一次调用的用量累加到台账（由调用方提交）
+
+    当天还没有台账行时在保存点中插入；同一用户的另一个请求同时插入了该行（唯一索引冲突）时
+    只回滚保存点并改为累加，调用方同一事务中的其他修改（如 AI 回复）不受影响
+
+    Returns:
+        int: 本次调用计入的总 Token 数（提示 + 回复；缓存和模拟模式为 0）
+    """
+    tokens = billable_tokens(usage, messages, content)
+    if usage.cached or usage.provider == "mock":
+        return 0
+
+    day = datetime.utcnow().date()
+    provider = usage.provider or "unknown"
+    model = usage.model or ""
+    if not _increment(db, user_id, day, provider, model, usage):
+        try:
+            with db.begin_nested():
+                db.add(models.AIUsage(
+                    user_id=user_id,
+                    day=day,
+                    provider=provider,
+                    model=model,
+                    requests=1,
+                    prompt_tokens=usage.prompt_tokens,
+                    completion_tokens=usage.completion_tokens
+                ))
+        except IntegrityError:
+            _increment(db, user_id, day, provider, model, usage)
+    return tokens
+
+
+def used_tokens(db: Session, user_id: int, since: date) -> int:
+    """用户自某天（含）以来的总 Token 数（不含旧版本记录的模拟模式用量）"""
+    total = db.query(
+        func.sum(models.AIUsage.prompt_tokens + models.AIUsage.completion_tokens)
+    ).filter(
+        models.AIUsage.user_id == user_id,
+        models.AIUsage.day >= since,
+        models.AIUsage.provider != "mock"
+    ).scalar()
+    return total or 0
+
+
+def get_user_usage(db: Session, user_id: int) -> dict:
+    """用户今日和本月的用量及配额"""
+    today = datetime.utcnow().date()
+    return {
+        "day_tokens": used_tokens(db, user_id, today),
+        "month_tokens": used_tokens(db, user_id, today.replace(day=1)),
+        "daily_quota": settings.AI_DAILY_TOKEN_QUOTA or None,
+        "monthly_quota": settings.AI_MONTHLY_TOKEN_QUOTA or None,
+    }
+
+
+def check_quota(db: Session, user_id: int) -> None:
+    """
+    调用服务商之前检查配额
+
+    Raises:
+        QuotaExceededError: 今日或本月用量已达配额（retry_after 为距离配额重置的秒数）
+    """
+    now = datetime.utcnow()
+    today = now.date()
+
+    if settings.AI_DAILY_TOKEN_QUOTA > 0 and used_tokens(db, user_id, today) >= settings.AI_DAILY_TOKEN_QUOTA:
+        reset = datetime.combine(today + timedelta(days=1), datetime.min.time())
+        raise QuotaExceededError("今日 AI 用量已达上限，请明天再试", int((reset - now).total_seconds()) + 1)
+
+    month_start = today.replace(day=1)
+    if settings.AI_MONTHLY_TOKEN_QUOTA > 0 and used_tokens(db, user_id, month_start) >= settings.AI_MONTHLY_TOKEN_QUOTA:
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        reset = datetime.combine(next_month, datetime.min.time())
+        raise QuotaExceededError("本月 AI 用量已达上限", int((reset - now).total_seconds()) + 1)
+
+
+def aggregate_usage(
+    db: Session,
+    start: date,
+    end: date,
+    user_id: Optional[int] = None
+) -> list[dict]:
+    """按用户、服务商和模型汇总 [start, end] 期间的用量，按总 Token 数降序"""
+    total = func.sum(models.AIUsage.prompt_tokens + models.AIUsage.completion_tokens)
+    query = db.query(
+        models.AIUsage.user_id,
+        models.User.username,
+        models.AIUsage.provider,
+        models.AIUsage.model,
+        func.sum(models.AIUsage.requests),
+        func.sum(models.AIUsage.prompt_tokens),
+        func.sum(models.AIUsage.completion_tokens),
+        total
+    ).join(
+        models.User, models.User.id == models.AIUsage.user_id
+    ).filter(
+        models.AIUsage.day >= start,
+        models.AIUsage.day <= end
+    )
+    if user_id is not None:
+        query = query.filter(models.AIUsage.user_id == user_id)
+
+    rows = query.group_by(
+        models.AIUsage.user_id,
+        models.User.username,
+        models.AIUsage.provider,
+        models.AIUsage.model
+    ).order_by(total.desc()).all()
+
+    return [
+        {
+            "user_id": row[0],
+            "username": row[1],
+            "provider": row[2],
+            "model": row[3],
+            "requests": row[4],
+            "prompt_tokens": row[5],
+            "completion_tokens": row[6],
+            "total_tokens": row[7],
+        }
+        for row in rows
+    ]
@@ -0,0 +1,119 @@
+"""测试 AI 调用并发限制与公平排队"""
+
+import asyncio
+import json
+
+import models
+from config import settings
+from routers.chat import wait_for_ai_slot
+from services.ai_limiter import FairLimiter, ai_limiter
+
+
+def test_queue_is_round_robin_across_users(monkeypatch):
+    monkeypatch.setattr(settings, "AI_MAX_CONCURRENCY", 1)
+    limiter = FairLimiter()
+
+    running = limiter.enqueue(1)
+    a2, a3 = limiter.enqueue(1), limiter.enqueue(1)
+    b1 = limiter.enqueue(2)
+    c1 = limiter.enqueue(3)
+
+    # 同一用户连发多条不会挤占其他用户
+    assert [limiter.position(t) for t in (a2, b1, c1, a3)] == [1, 2, 3, 4]
+
+    order = []
+    current = running
+    for _ in range(4):
+        limiter.release(current)
+        current = next(t for t in (a2, a3, b1, c1) if t.granted and not t.released)
+        order.append(current)
+    assert order == [a2, b1, c1, a3]
+
+    limiter.release(current)
+    assert limiter.active == 0 and limiter.waiting == 0
+
+
+def test_cancelled_waiter_leaves_queue(monkeypatch):
+    monkeypatch.setattr(settings, "AI_MAX_CONCURRENCY", 1)
+    limiter = FairLimiter()
+
+    running = limiter.enqueue(1)
+    waiting = limiter.enqueue(2)
+    limiter.release(waiting)
+    limiter.release(running)
+
+    assert not waiting.granted
+    assert limiter.active == 0 and limiter.waiting == 0
+
+
+def test_provider_capacity_limits_grants(monkeypatch):
+    monkeypatch.setattr(settings, "AI_MAX_CONCURRENCY", 10)
+    limiter = FairLimiter()
+    capacity = {"value": 1}
+    limiter.capacity_hook = lambda: capacity["value"]
+
+    # 服务商已满：请求在公平队列中排队，而不是获得名额后再等待服务商
+    running = limiter.enqueue(1)
+    a2, b1 = limiter.enqueue(1), limiter.enqueue(2)
+    assert [limiter.position(t) for t in (a2, b1)] == [1, 2]
+
+    # 服务商容量增加（如熔断器恢复）时立即放行，不必等名额归还
+    capacity["value"] = 2
+    limiter.dispatch()
+    assert a2.granted and not b1.granted
+    limiter.release(running)
+    assert b1.granted
+
+    # 没有可用服务商（降级为模拟回复）时只受全局上限限制
+    capacity["value"] = None
+    assert limiter.enqueue(3).granted and limiter.capacity == 10
+
+
+def test_queued_client_receives_position_events(monkeypatch):
+    monkeypatch.setattr(settings, "AI_MAX_CONCURRENCY", 1)
+
+    async def scenario():
+        holder = ai_limiter.enqueue(1)
+        ticket = ai_limiter.enqueue(2)
+        frames = []
+
+        async def consume():
+            async for frame in wait_for_ai_slot(ticket):
+                frames.append(frame)
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        ai_limiter.release(holder)
+        await asyncio.wait_for(task, 1)
+        ai_limiter.release(ticket)
+        return frames
+
+    frames = asyncio.run(scenario())
+
+    assert frames[0].startswith("event: queued\n")
+    assert json.loads(frames[0].split("data: ")[1]) == {"position": 1}
+    assert ai_limiter.active == 0
+
+
+def test_full_queue_is_rejected_with_retry_after(client, db, make_user, monkeypatch):
+    monkeypatch.setattr(settings, "AI_MAX_CONCURRENCY", 1)
+    monkeypatch.setattr(settings, "AI_QUEUE_MAX_DEPTH", 0)
+    monkeypatch.setattr(settings, "AI_QUEUE_RETRY_AFTER_SECONDS", 7)
+    _, headers = make_user("alice")
+    conversation_id = client.post("/api/chat/conversations", json={"title": "新对话"}, headers=headers).json()["id"]
+
+    holder = ai_limiter.enqueue(999)
+    try:
+        response = client.post(
+            f"/api/chat/conversations/{conversation_id}/messages?stream=true",
+            json={"content": "你好"},
+            headers=headers,
+        )
+    finally:
+        ai_limiter.release(holder)
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "7"
+    # 被拒绝的请求不保存用户消息
+    assert db.query(models.Message).count() == 0
+    assert ai_limiter.active == 0 and ai_limiter.waiting == 0
@@ -0,0 +1,90 @@
+"""测试 AI 调用延迟统计：各阶段耗时、参数回退重试、失败类型与降级原因（使用本地替身服务器）"""
+
+import asyncio
+
+import pytest
+from openai import AsyncOpenAI
+
+from ai_stand_in import StandInConfig, StandInServer
+from services import ai_service
+from services.ai_metrics import latency_metrics
+from services.ai_router import AIRouter, ProviderHealth
+from services.ai_service import AIService, mock_fallback
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    latency_metrics.reset()
+    yield
+    latency_metrics.reset()
+
+
+def _router(server: StandInServer) -> AIRouter:
+    service = AIService("mock")
+    service.provider = "openai"
+    service.client = AsyncOpenAI(base_url=server.base_url, api_key="stand-in", max_retries=0)
+    service.model = "stand-in"
+    router = AIRouter(providers=[])
+    router.services = {"openai": service}
+    router.order = ["openai"]
+    router.health = {"openai": ProviderHealth("openai")}
+    router.active = {"openai": 0}
+    return router
+
+
+def test_chat_stream_records_latency_per_provider(client, make_user, monkeypatch):
+    config = StandInConfig(tokens=20, tokens_per_second=200, ttft=0.05, unsupported_params=("max_tokens",))
+    with StandInServer(config) as server:
+        monkeypatch.setattr(ai_service, "generate_response", _router(server).generate_response)
+        _, headers = make_user("alice")
+        conversation_id = client.post("/api/chat/conversations", json={"title": "新对话"}, headers=headers).json()["id"]
+        client.post(
+            f"/api/chat/conversations/{conversation_id}/messages?stream=true&protocol=2",
+            json={"content": "什么是梯度下降？"},
+            headers=headers,
+        )
+
+    _, admin_headers = make_user("admin", role="admin")
+    report = client.get("/api/admin/ai/latency", headers=admin_headers).json()
+
+    assert report["requests"] == 1 and report["fallbacks"] == {}
+    assert report["queue_wait_ms"]["count"] == 1
+    (item,) = report["providers"]
+    assert (item["provider"], item["model"], item["attempts"], item["succeeded"]) == ("openai", "stand-in", 1, 1)
+    assert item["retries"] == {"max_tokens": 1}
+    # 服务商返回的用量优先于本地估算
+    assert item["completion_tokens"] == 20
+    assert item["ttft_ms"]["p50"] >= 50 and item["connect_ms"]["count"] == 1
+    assert item["max_gap_ms"]["count"] == 1 and item["tokens_per_second"]["p50"] > 0
+
+    metrics = client.get("/api/admin/ai/metrics", headers=admin_headers).text
+    assert 'v4corner_ai_retries_total{provider="openai",model="stand-in",reason="max_tokens"} 1' in metrics
+    assert 'v4corner_ai_ttft_ms{provider="openai",model="stand-in",quantile="p95"}' in metrics
+
+
+@pytest.mark.parametrize(("config", "kind"), [
+    (StandInConfig(error_rate=1, error_status=429), "rate_limited"),
+    (StandInConfig(error_rate=1, error_status=503), "server_error"),
+    (StandInConfig(tokens=50, tokens_per_second=0, ttft=0, fail_rate=1, fail_after=0), "connection"),
+])
+def test_failures_are_classified_and_fallback_reason_recorded(config, kind):
+    async def ask(router):
+        mock_fallback.set(False)
+        parts = [text async for text in router.generate_response([{"role": "user", "content": "hi"}], stream=True)]
+        return "".join(parts), mock_fallback.get()
+
+    with StandInServer(config) as server:
+        _, fell_back = asyncio.run(ask(_router(server)))
+
+    snapshot = latency_metrics.snapshot()
+    (item,) = snapshot["providers"]
+    assert item["failed"] == 1 and item["errors"] == {kind: 1}
+    assert fell_back is True
+    assert snapshot["fallbacks"] == {f"all_failed:{kind}": 1}
+
+
+def test_latency_endpoints_require_admin(client, make_user):
+    _, headers = make_user("alice")
+
+    assert client.get("/api/admin/ai/latency", headers=headers).status_code == 403
+    assert client.get("/api/admin/ai/metrics", headers=headers).status_code == 403
@@ -0,0 +1,167 @@
+"""测试多服务商 AI 路由：故障切换、熔断、延迟感知选择与对冲（使用本地替身服务商）"""
+
+import asyncio
+import time
+
+import pytest
+
+from config import settings
+from services.ai_router import AIRouter, ProviderHealth
+from services.ai_service import StreamInterrupted, mock_fallback
+
+
+class StandInProvider:
+    """替身服务商：可设置首字延迟和失败"""
+
+    def __init__(self, name: str, ttft: float = 0.0, fail: bool = False, fail_after: int | None = None):
+        self.provider = name
+        self.model = f"{name}-model"
+        self.ttft = ttft
+        self.fail = fail
+        self.fail_after = fail_after  # 返回指定个数的 token 后失败
+        self.calls = 0
+        self.cancelled = False
+
+    async def stream_provider(self, messages, stream=False):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.ttft)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise RuntimeError(f"{self.provider} 不可用")
+        for index, token in enumerate([self.provider, "：", "你好"]):
+            if index == self.fail_after:
+                raise RuntimeError(f"{self.provider} 连接中断")
+            yield token
+
+
+def _make_router(*providers: StandInProvider) -> AIRouter:
+    router = AIRouter(providers=[])
+    router.services = {p.provider: p for p in providers}
+    router.order = [p.provider for p in providers]
+    router.health = {p.provider: ProviderHealth(p.provider) for p in providers}
+    router.active = {p.provider: 0 for p in providers}
+    return router
+
+
+def _ask(router: AIRouter) -> str:
+    async def collect():
+        mock_fallback.set(False)
+        parts = [text async for text in router.generate_response([{"role": "user", "content": "hi"}], stream=True)]
+        return "".join(parts), mock_fallback.get()
+
+    text, fell_back = asyncio.run(collect())
+    return "[mock]" if fell_back else text
+
+
+def test_failover_to_next_provider_before_first_token():
+    router = _make_router(StandInProvider("a", fail=True), StandInProvider("b"))
+
+    assert _ask(router) == "b：你好"
+    assert router.health["a"].consecutive_failures == 1
+
+
+def test_circuit_breaker_opens_and_recovers(monkeypatch):
+    monkeypatch.setattr(settings, "AI_ROUTER_CONSECUTIVE_FAILURES", 1)
+    a, b = StandInProvider("a", fail=True), StandInProvider("b")
+    router = _make_router(a, b)
+
+    _ask(router)
+    assert router.health["a"].state == "open"
+
+    # 熔断期间直接跳过 a
+    calls = a.calls
+    assert _ask(router) == "b：你好"
+    assert a.calls == calls
+
+    # 冷却结束后放行一个试探请求，成功则关闭熔断器
+    monkeypatch.setattr(settings, "AI_ROUTER_COOLDOWN_SECONDS", 0)
+    a.fail = False
+    b.fail = True
+    assert _ask(router) == "a：你好"
+    assert router.health["a"].state == "closed"
+
+
+def test_all_providers_failing_falls_back_to_mock():
+    router = _make_router(StandInProvider("a", fail=True), StandInProvider("b", fail=True))
+
+    assert _ask(router) == "[mock]"
+
+
+def test_failure_after_first_token_is_reported_not_hidden():
+    router = _make_router(StandInProvider("a", fail_after=2), StandInProvider("b"))
+    parts = []
+
+    async def collect():
+        async for text in router.generate_response([{"role": "user", "content": "hi"}], stream=True):
+            parts.append(text)
+
+    # 已返回部分内容：不切换服务商、不降级为模拟回复，而是告知调用方回答不完整
+    with pytest.raises(StreamInterrupted):
+        asyncio.run(collect())
+    assert parts == ["a", "："]
+    assert router.services["b"].calls == 0
+
+
+def test_prefers_provider_with_lower_ttft():
+    slow, fast = StandInProvider("slow", ttft=0.05), StandInProvider("fast")
+    router = _make_router(slow, fast)
+
+    _ask(router)  # 按配置顺序先用 slow
+    _ask(router)  # fast 尚无统计，被试用一次
+    for _ in range(3):
+        assert _ask(router) == "fast：你好"
+
+    assert router.select_providers() == ["fast", "slow"]
+
+
+def test_hedging_starts_second_provider_after_deadline(monkeypatch):
+    monkeypatch.setattr(settings, "AI_ROUTER_HEDGE_MS", 50)
+    stalled, backup = StandInProvider("stalled", ttft=2.0), StandInProvider("backup")
+    router = _make_router(stalled, backup)
+
+    started = time.perf_counter()
+    assert _ask(router) == "backup：你好"
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.5
+    assert stalled.cancelled
+    # 被取消的请求不计为失败，但记录了较长的首字延迟
+    assert router.health["stalled"].consecutive_failures == 0
+    assert router.select_providers() == ["backup", "stalled"]
+
+
+def test_busy_provider_is_skipped(monkeypatch):
+    monkeypatch.setattr(settings, "AI_PROVIDER_MAX_CONCURRENCY", 1)
+    router = _make_router(StandInProvider("a"), StandInProvider("b"))
+    router.active["a"] = 1  # a 已达到并发上限
+
+    assert _ask(router) == "b：你好"
+
+
+def test_full_provider_wakes_waiters_in_arrival_order(monkeypatch):
+    monkeypatch.setattr(settings, "AI_PROVIDER_MAX_CONCURRENCY", 1)
+    provider = StandInProvider("a", ttft=0.02)
+    router = _make_router(provider)
+    assert router.capacity() == 1
+    finished = []
+
+    async def ask(index):
+        async for _ in router.generate_response([{"role": "user", "content": "hi"}], stream=True):
+            pass
+        finished.append(index)
+
+    async def scenario():
+        await asyncio.gather(*(ask(index) for index in range(4)))
+
+    asyncio.run(scenario())
+
+    assert finished == [0, 1, 2, 3] and provider.calls == 4
+    assert not router._slot_waiters and router.active["a"] == 0
+
+    # 熔断器打开后没有可用服务商，不再限制容量（降级为模拟回复）
+    router.health["a"].state = "open"
+    router.health["a"].opened_at = time.monotonic()
+    assert router.capacity() is None
@@ -0,0 +1,110 @@
+"""测试 OpenAI 服务商代码路径（使用本地 OpenAI 兼容替身服务器，而不是模拟模式）"""
+
+import asyncio
+import json
+
+import pytest
+from openai import AsyncOpenAI
+
+import models
+from ai_stand_in import StandInConfig, StandInServer
+from config import settings
+from services import ai_service
+from services.ai_service import AIService, track_usage
+
+MESSAGES = [{"role": "user", "content": "讲讲梯度下降"}]
+
+
+def _service(server: StandInServer, model: str = "stand-in") -> AIService:
+    service = AIService("mock")
+    service.provider = "openai"
+    service.client = AsyncOpenAI(base_url=server.base_url, api_key="stand-in", max_retries=0)
+    service.model = model
+    return service
+
+
+async def _collect(service: AIService, stream: bool = True):
+    usage = track_usage()
+    parts = []
+    async for text in service.stream_provider(MESSAGES, stream=stream):
+        parts.append(text)
+    return "".join(parts), usage
+
+
+def test_stream_and_usage_through_stand_in():
+    with StandInServer(StandInConfig(tokens=20, tokens_per_second=0, ttft=0)) as server:
+        text, usage = asyncio.run(_collect(_service(server)))
+        full, full_usage = asyncio.run(_collect(_service(server), stream=False))
+
+    assert text == full == "".join(f"词{i} " for i in range(20))
+    assert usage.completion_tokens == full_usage.completion_tokens == 20
+    assert usage.provider == "openai" and usage.prompt_tokens > 0
+    assert server.stats.completed == 2
+
+
+def test_unsupported_parameters_are_retried():
+    config = StandInConfig(tokens=5, tokens_per_second=0, ttft=0, unsupported_params=("max_tokens", "stream_options"))
+    with StandInServer(config) as server:
+        text, usage = asyncio.run(_collect(_service(server)))
+
+    assert text.startswith("词0 ")
+    # 去掉 stream_options 后不再有用量，由调用方用本地分词器估算
+    assert usage.completion_tokens is None
+    assert server.stats.rejected_params == 2 and server.stats.requests == 3
+
+
+@pytest.mark.parametrize("fail_mode", ["disconnect", "error"])
+def test_mid_stream_failure_raises(fail_mode):
+    config = StandInConfig(tokens=50, tokens_per_second=0, ttft=0, fail_rate=1, fail_after=5, fail_mode=fail_mode)
+    parts = []
+
+    async def scenario(service):
+        async for text in service.stream_provider(MESSAGES, stream=True):
+            parts.append(text)
+
+    with StandInServer(config) as server:
+        with pytest.raises(Exception):
+            asyncio.run(scenario(_service(server)))
+
+    assert len(parts) == 5
+    assert server.stats.mid_stream_failures == 1
+
+
+def test_mid_stream_failure_keeps_partial_answer_as_truncated(client, db, make_user, monkeypatch):
+    monkeypatch.setattr(settings, "AI_RESPONSE_CACHE_ENABLED", False)
+    config = StandInConfig(tokens=50, tokens_per_second=0, ttft=0, fail_rate=1, fail_after=5, fail_mode="error")
+    _, headers = make_user("alice")
+    conversation_id = client.post("/api/chat/conversations", json={"title": "新对话"}, headers=headers).json()["id"]
+
+    with StandInServer(config) as server:
+        monkeypatch.setattr(ai_service, "generate_response", _service(server).generate_response)
+        response = client.post(
+            f"/api/chat/conversations/{conversation_id}/messages?stream=true&protocol=2",
+            json={"content": "讲讲梯度下降"},
+            headers=headers,
+        )
+
+    # 已发送的部分保留（不被错误提示替换），随后发送 error 事件，summary 标记为不完整
+    partial = "".join(f"词{i} " for i in range(5))
+    assert "event: error" in response.text
+    summary = next(
+        json.loads(block.split("data: ", 1)[1]) for block in response.text.split("\n\n") if "event: summary" in block
+    )
+    assert summary["length"] == len(partial) and summary["truncated"] is True
+
+    db.expire_all()
+    assistant = db.query(models.Message).filter(models.Message.role == "assistant").one()
+    assert (assistant.content, assistant.truncated) == (partial, True)
+
+
+def test_injected_error_falls_back_to_mock():
+    with StandInServer(StandInConfig(error_rate=1, error_status=503)) as server:
+        service = _service(server)
+
+        async def scenario():
+            return [text async for text in service.generate_response(MESSAGES, stream=True)]
+
+        parts = asyncio.run(scenario())
+
+    assert parts and "词0" not in "".join(parts)
+    assert server.stats.injected_errors == 1
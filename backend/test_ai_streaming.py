@@ -0,0 +1,100 @@
+"""测试 AI 流式输出不阻塞事件循环（使用本地替身服务商）"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+from services.ai_service import AIService
+
+TOKEN_DELAY = 0.05
+TOKENS = ["你", "好", "，", "世", "界"]
+
+
+class SlowZhipuStandIn:
+    """模拟同步 SDK：每个 token 之间阻塞式地等待网络读取"""
+
+    def __init__(self):
+        self.closed = False
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        assert kwargs["stream"] is True
+        return self._stream()
+
+    def _stream(self):
+        try:
+            for token in TOKENS:
+                time.sleep(TOKEN_DELAY)
+                delta = SimpleNamespace(content=token)
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+        finally:
+            self.closed = True
+
+
+def _make_service(client) -> AIService:
+    service = AIService()
+    service.provider = "zhipuai"
+    service.client = client
+    service.model = "stand-in"
+    return service
+
+
+async def _collect(service: AIService) -> str:
+    parts = []
+    async for text in service.generate_response([{"role": "user", "content": "hi"}], stream=True):
+        parts.append(text)
+    return "".join(parts)
+
+
+async def _heartbeat(stop: asyncio.Event, gaps: list[float]):
+    """模拟同时到达的其他请求：记录事件循环两次调度之间的最大间隔"""
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(0.005)
+        now = time.perf_counter()
+        gaps.append(now - last)
+        last = now
+
+
+def test_slow_provider_stream_does_not_block_event_loop():
+    async def scenario():
+        stop = asyncio.Event()
+        gaps: list[float] = []
+        heartbeat = asyncio.create_task(_heartbeat(stop, gaps))
+
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            _collect(_make_service(SlowZhipuStandIn())),
+            _collect(_make_service(SlowZhipuStandIn())),
+            _collect(_make_service(SlowZhipuStandIn())),
+        )
+        elapsed = time.perf_counter() - started
+
+        stop.set()
+        await heartbeat
+        return results, elapsed, max(gaps)
+
+    results, elapsed, max_gap = asyncio.run(scenario())
+
+    assert results == ["你好，世界"] * 3
+    single_stream = TOKEN_DELAY * len(TOKENS)
+    # 三个流并发进行，而不是在事件循环上串行阻塞
+    assert elapsed < single_stream * 2
+    # 事件循环从未被 token 之间的网络读取卡住
+    assert max_gap < TOKEN_DELAY
+
+
+def test_consumer_exit_stops_and_closes_provider_stream():
+    client = SlowZhipuStandIn()
+
+    async def scenario():
+        stream = _make_service(client).generate_response(
+            [{"role": "user", "content": "hi"}], stream=True
+        )
+        first = await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(TOKEN_DELAY * 3)
+        return first
+
+    assert asyncio.run(scenario()) == "你"
+    assert client.closed
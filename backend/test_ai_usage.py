@@ -0,0 +1,221 @@
+"""测试 AI 用量计量、配额与管理员汇总"""
+
+import asyncio
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+import models
+from config import settings
+from services import ai_service, usage_service
+from services.ai_router import AIRouter, ProviderHealth
+from services.ai_service import AIService, current_usage, report_usage, track_usage
+from services.context_service import count_tokens
+
+REPLY = "梯度下降沿负梯度方向更新参数。"
+
+
+def _ask(client, headers, content: str = "什么是梯度下降？"):
+    conversation_id = client.post("/api/chat/conversations", json={"title": "新对话"}, headers=headers).json()["id"]
+    return client.post(
+        f"/api/chat/conversations/{conversation_id}/messages?stream=true&protocol=2",
+        json={"content": content},
+        headers=headers,
+    )
+
+
+def _summary(response) -> dict:
+    block = next(b for b in response.text.split("\n\n") if "event: summary" in b)
+    return json.loads(block.split("data: ", 1)[1])
+
+
+class FakeCompletions:
+    """OpenAI 兼容客户端替身：按 include_usage 在最后返回用量 chunk"""
+
+    def __init__(self):
+        self.kwargs = None
+
+    async def create(self, **kwargs):
+        self.kwargs = kwargs
+
+        async def chunks():
+            for text in ["梯度", "下降"]:
+                yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+            if kwargs.get("stream_options", {}).get("include_usage"):
+                yield SimpleNamespace(usage=SimpleNamespace(prompt_tokens=42, completion_tokens=7), choices=[])
+
+        class Stream:
+            def __aiter__(self):
+                return chunks()
+
+            async def close(self):
+                pass
+
+        return Stream()
+
+
+def test_openai_stream_usage_reaches_caller_through_router():
+    completions = FakeCompletions()
+    service = AIService("mock")
+    service.provider = "openai"
+    service.model = "gpt-test"
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    router = AIRouter(providers=[])
+    router.services = {"openai": service}
+    router.order = ["openai"]
+    router.health = {"openai": ProviderHealth("openai")}
+    router.active = {"openai": 0}
+
+    async def run():
+        usage = track_usage()
+        text = "".join([t async for t in router.generate_response([{"role": "user", "content": "hi"}], stream=True)])
+        return text, usage
+
+    text, usage = asyncio.run(run())
+
+    assert text == "梯度下降"
+    assert completions.kwargs["stream_options"] == {"include_usage": True}
+    assert (usage.provider, usage.model, usage.prompt_tokens, usage.completion_tokens) == ("openai", "gpt-test", 42, 7)
+
+
+def test_reported_usage_is_written_to_ledger(client, db, make_user, monkeypatch):
+    async def fake_generate(messages, stream=False):
+        usage = current_usage.get()
+        usage.provider, usage.model = "openai", "gpt-test"
+        yield REPLY
+        report_usage(120, 30)
+
+    monkeypatch.setattr(ai_service, "generate_response", fake_generate)
+    user, headers = make_user("alice")
+
+    response = _ask(client, headers)
+
+    assert _summary(response)["tokens_used"] == 150
+    db.expire_all()
+    row = db.query(models.AIUsage).one()
+    assert (row.user_id, row.provider, row.model, row.requests) == (user.id, "openai", "gpt-test", 1)
+    assert (row.prompt_tokens, row.completion_tokens) == (120, 30)
+    assert db.query(models.Message).filter(models.Message.role == "assistant").one().tokens_used == 150
+
+
+def test_unreported_usage_is_counted_with_local_tokenizer(client, db, make_user, monkeypatch):
+    async def fake_generate(messages, stream=False):
+        yield REPLY
+
+    monkeypatch.setattr(ai_service, "generate_response", fake_generate)
+    _, headers = make_user("alice")
+
+    _ask(client, headers)
+    _ask(client, headers)
+
+    db.expire_all()
+    row = db.query(models.AIUsage).one()
+    assert row.provider == "unknown" and row.requests == 2
+    assert row.completion_tokens == 2 * count_tokens(REPLY)
+    assert row.prompt_tokens > 0
+
+
+def test_concurrent_first_usage_of_the_day_keeps_the_answer(client, db, make_user, monkeypatch):
+    async def fake_generate(messages, stream=False):
+        yield REPLY
+
+    monkeypatch.setattr(ai_service, "generate_response", fake_generate)
+    _, headers = make_user("alice")
+    _ask(client, headers)
+
+    # 模拟竞争：本次请求检查时当天还没有台账行，插入前另一个请求已插入（唯一索引冲突）
+    increment = usage_service._increment
+    attempts = []
+
+    def lose_race(*args):
+        attempts.append(args)
+        return 0 if len(attempts) == 1 else increment(*args)
+
+    monkeypatch.setattr(usage_service, "_increment", lose_race)
+    response = _ask(client, headers, "再问一次")
+
+    assert response.status_code == 200 and len(attempts) == 2
+    db.expire_all()
+    row = db.query(models.AIUsage).one()
+    assert row.requests == 2 and row.completion_tokens == 2 * count_tokens(REPLY)
+    # 台账冲突只回滚保存点，AI 回复照常保存
+    assistants = db.query(models.Message).filter(models.Message.role == "assistant").all()
+    assert [(m.content, m.truncated) for m in assistants] == [(REPLY, False), (REPLY, False)]
+
+
+def test_quota_is_enforced_before_calling_provider(client, db, make_user, monkeypatch):
+    calls = []
+
+    async def fake_generate(messages, stream=False):
+        calls.append(messages)
+        yield REPLY
+
+    monkeypatch.setattr(ai_service, "generate_response", fake_generate)
+    monkeypatch.setattr(settings, "AI_DAILY_TOKEN_QUOTA", 100)
+    user, headers = make_user("alice")
+    db.add(models.AIUsage(
+        user_id=user.id, day=datetime.utcnow().date(), provider="openai", model="gpt-test",
+        requests=3, prompt_tokens=80, completion_tokens=20
+    ))
+    db.commit()
+
+    response = _ask(client, headers)
+
+    assert response.status_code == 429
+    assert 0 < int(response.headers["Retry-After"]) <= 86400
+    assert calls == []
+    assert db.query(models.Message).count() == 0
+
+    usage = client.get("/api/chat/usage", headers=headers).json()
+    assert usage == {"day_tokens": 100, "month_tokens": 100, "daily_quota": 100, "monthly_quota": None}
+
+
+def test_mock_fallback_answers_do_not_use_quota(client, db, make_user, monkeypatch):
+    # 测试环境没有配置服务商，回答来自模拟模式兜底
+    monkeypatch.setattr(settings, "AI_DAILY_TOKEN_QUOTA", 1)
+    user, headers = make_user("alice")
+    # 旧版本记录的模拟模式用量也不占用配额
+    db.add(models.AIUsage(
+        user_id=user.id, day=datetime.utcnow().date(), provider="mock", model="",
+        requests=1, prompt_tokens=50, completion_tokens=50
+    ))
+    db.commit()
+
+    for content in ("什么是梯度下降？", "再问一次"):
+        response = _ask(client, headers, content)
+        assert response.status_code == 200 and _summary(response)["tokens_used"] == 0
+
+    db.expire_all()
+    assert db.query(models.AIUsage).count() == 1
+    assert client.get("/api/chat/usage", headers=headers).json()["day_tokens"] == 0
+
+
+def test_admin_usage_report_groups_by_user_provider_and_model(client, db, make_user):
+    alice, _ = make_user("alice")
+    bob, bob_headers = make_user("bob")
+    _, admin_headers = make_user("teacher", role="admin")
+    today = datetime.utcnow().date()
+    for user, provider, prompt, completion in [
+        (alice, "openai", 100, 50),
+        (alice, "deepseek", 10, 5),
+        (bob, "openai", 300, 200),
+    ]:
+        db.add(models.AIUsage(
+            user_id=user.id, day=today, provider=provider, model=f"{provider}-model",
+            requests=2, prompt_tokens=prompt, completion_tokens=completion
+        ))
+    db.commit()
+
+    assert client.get("/api/admin/ai/usage", headers=bob_headers).status_code == 403
+
+    report = client.get("/api/admin/ai/usage", headers=admin_headers).json()
+    assert report["total_tokens"] == 665 and report["requests"] == 6
+    assert [(item["username"], item["provider"], item["total_tokens"]) for item in report["items"]] == [
+        ("bob", "openai", 500),
+        ("alice", "openai", 150),
+        ("alice", "deepseek", 15),
+    ]
+
+    only_alice = client.get(f"/api/admin/ai/usage?user_id={alice.id}", headers=admin_headers).json()
+    assert only_alice["total_tokens"] == 165
@@ -0,0 +1,178 @@
+"""测试按 Token 预算构造 AI 对话上下文"""
+
+import asyncio
+from datetime import datetime
+
+import httpx
+
+import models
+from config import settings
+from main import app
+from services import ai_service, context_service
+from services.ai_limiter import ai_limiter
+from services.context_service import MESSAGE_OVERHEAD_TOKENS, count_tokens
+
+BUDGET = 600
+SUMMARY_TOKENS = 150
+
+
+def _fill_conversation(db, user, turns: int) -> models.Conversation:
+    conversation = models.Conversation(user_id=user.id, title="长对话")
+    db.add(conversation)
+    db.flush()
+    for i in range(turns):
+        db.add(models.Message(conversation_id=conversation.id, role="user", content=f"第{i}轮问题：" + "梯度下降" * 10))
+        db.add(models.Message(conversation_id=conversation.id, role="assistant", content=f"第{i}轮回答：" + "学习率" * 20))
+    db.commit()
+    return conversation
+
+
+def _capture(monkeypatch) -> list[list[dict]]:
+    calls = []
+
+    async def fake_generate(messages, stream=False):
+        calls.append(messages)
+        yield "好的"
+
+    monkeypatch.setattr(ai_service, "generate_response", fake_generate)
+    monkeypatch.setattr(settings, "AI_CONTEXT_TOKEN_BUDGET", BUDGET)
+    monkeypatch.setattr(settings, "AI_CONTEXT_SUMMARY_TOKENS", SUMMARY_TOKENS)
+    return calls
+
+
+def _prompt_tokens(messages: list[dict]) -> int:
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def test_long_conversation_sends_recent_turns_within_budget(client, db, make_user, monkeypatch):
+    calls = _capture(monkeypatch)
+    user, headers = make_user("alice")
+    conversation = _fill_conversation(db, user, turns=40)
+
+    response = client.post(
+        f"/api/chat/conversations/{conversation.id}/messages",
+        json={"content": "最新的问题"},
+        headers=headers,
+    )
+    assert response.status_code == 201
+
+    sent = calls[0]
+    # 发送的是最近的消息（而不是最早的 20 条），较早内容以摘要代替
+    assert sent[-1] == {"role": "user", "content": "最新的问题"}
+    assert sent[-2]["content"].startswith("第39轮回答")
+    assert sent[0]["role"] == "system"
+    assert "第0轮" not in "".join(m["content"] for m in sent[1:])
+    assert _prompt_tokens(sent) <= BUDGET
+
+    db.refresh(conversation)
+    assert conversation.context_summary
+    assert count_tokens(conversation.context_summary) <= SUMMARY_TOKENS
+    assert conversation.summary_until_id > 0
+
+
+def test_summary_is_updated_incrementally(client, db, make_user, monkeypatch):
+    calls = _capture(monkeypatch)
+    user, headers = make_user("bob")
+    conversation = _fill_conversation(db, user, turns=40)
+
+    client.post(f"/api/chat/conversations/{conversation.id}/messages", json={"content": "问题一"}, headers=headers)
+    db.refresh(conversation)
+    first_until = conversation.summary_until_id
+
+    # 摘要已覆盖的消息不再读取：后续只会把新移出窗口的消息合并进摘要
+    db.query(models.Message).filter(models.Message.id <= first_until).update({"content": "已删除"})
+    db.commit()
+
+    for i in range(3):
+        client.post(
+            f"/api/chat/conversations/{conversation.id}/messages",
+            json={"content": f"追问{i}：" + "动量法" * 30},
+            headers=headers,
+        )
+
+    db.refresh(conversation)
+    assert conversation.summary_until_id > first_until
+    assert "已删除" not in "".join(m["content"] for m in calls[-1])
+    assert all(_prompt_tokens(sent) <= BUDGET for sent in calls)
+
+
+def test_regenerate_uses_budgeted_context_without_replaced_answer(client, db, make_user, monkeypatch):
+    calls = _capture(monkeypatch)
+    user, headers = make_user("carol")
+    conversation = _fill_conversation(db, user, turns=40)
+
+    response = client.post(f"/api/chat/conversations/{conversation.id}/messages/regenerate", headers=headers)
+    assert response.status_code == 200
+
+    sent = calls[0]
+    assert sent[-1]["content"].startswith("第39轮问题")
+    assert _prompt_tokens(sent) <= BUDGET
+
+
+def test_short_conversation_has_no_summary(db, make_user):
+    user, _ = make_user("dave")
+    conversation = _fill_conversation(db, user, turns=2)
+
+    context = asyncio.run(context_service.build_context(db, conversation))
+
+    assert [m["role"] for m in context] == ["user", "assistant", "user", "assistant"]
+    assert conversation.context_summary is None
+
+
+def test_extractive_summary_counts_each_line_once(monkeypatch):
+    monkeypatch.setattr(settings, "AI_CONTEXT_SUMMARY_TOKENS", SUMMARY_TOKENS)
+    messages = [
+        models.Message(role="user" if i % 2 == 0 else "assistant", content=f"第{i}条：" + "梯度下降" * 30)
+        for i in range(250)
+    ]
+    counted = []
+
+    def counting(text):
+        counted.append(text)
+        return count_tokens(text)
+
+    monkeypatch.setattr(context_service, "count_tokens", counting)
+    summary = context_service._extractive_summary(None, messages)
+
+    # 只保留最新的几行，且不会每丢弃一行就重新计算整段摘要
+    assert summary.splitlines()[-1].startswith("AI：第249条")
+    assert count_tokens(summary) <= SUMMARY_TOKENS
+    assert len(counted) <= 20
+
+
+def test_ai_summary_waits_for_quota_and_ai_slot(client, db, make_user, monkeypatch):
+    calls = _capture(monkeypatch)
+    monkeypatch.setattr(settings, "AI_CONTEXT_SUMMARY_WITH_AI", True)
+    monkeypatch.setattr(settings, "AI_MAX_CONCURRENCY", 1)
+    user, headers = make_user("dave")
+    conversation = _fill_conversation(db, user, turns=40)
+    path = f"/api/chat/conversations/{conversation.id}/messages"
+
+    # 超出配额：拒绝请求，不生成摘要（摘要本身也是一次 AI 调用）
+    monkeypatch.setattr(settings, "AI_DAILY_TOKEN_QUOTA", 100)
+    db.add(models.AIUsage(user_id=user.id, day=datetime.utcnow().date(), provider="openai", model="gpt-test",
+                          requests=1, prompt_tokens=100, completion_tokens=0))
+    db.commit()
+    assert client.post(path, json={"content": "问题"}, headers=headers).status_code == 429
+    monkeypatch.setattr(settings, "AI_DAILY_TOKEN_QUOTA", 0)
+
+    # 排队期间不生成摘要，获得名额后才调用
+    async def scenario():
+        holder = ai_limiter.enqueue(999)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as http:
+            request = asyncio.create_task(http.post(f"{path}?stream=true", json={"content": "问题"}, headers=headers))
+            await asyncio.sleep(0.2)
+            calls_while_queued = len(calls)
+            ai_limiter.release(holder)
+            response = await asyncio.wait_for(request, 5)
+        return calls_while_queued, response
+
+    calls_while_queued, response = asyncio.run(scenario())
+
+    assert calls_while_queued == 0
+    assert response.status_code == 200 and "event: queued" in response.text
+    # 先生成摘要，再生成回答
+    assert len(calls) == 2 and "已有摘要" in calls[0][0]["content"]
+    db.refresh(conversation)
+    assert conversation.context_summary == "好的"
@@ -0,0 +1,109 @@
+"""
+测试客户端断开时取消上游生成
+
+使用本地 OpenAI 兼容替身服务器逐个发送 token，直接驱动 ASGI 应用：
+收到几帧后模拟浏览器关闭标签页，测量服务器观察到上游连接被关闭的延迟。
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+from openai import AsyncOpenAI
+
+import models
+from ai_stand_in import StandInConfig, StandInServer
+from main import app
+from services import ai_service
+from services.ai_service import AIService
+
+TOKEN_COUNT = 500
+
+
+@pytest.fixture
+def stand_in_server():
+    with StandInServer(StandInConfig(tokens=TOKEN_COUNT, tokens_per_second=50, ttft=0)) as server:
+        yield server.base_url, server.stats
+
+
+async def _stream_then_disconnect(path: str, token: str, frames_before_disconnect: int) -> float:
+    """发送流式请求，收到指定帧数后断开，返回断开时刻"""
+    body = json.dumps({"content": "讲一个很长的故事"}).encode("utf-8")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"stream=true&protocol=2",
+        "headers": [
+            (b"host", b"testserver"),
+            (b"content-type", b"application/json"),
+            (b"authorization", f"Bearer {token}".encode()),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    disconnect = asyncio.Event()
+    request_sent = False
+    frames = 0
+    disconnected_at = None
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal frames, disconnected_at
+        if message["type"] == "http.response.body" and b"event: delta" in message.get("body", b""):
+            frames += 1
+            if frames >= frames_before_disconnect and not disconnect.is_set():
+                disconnected_at = time.perf_counter()
+                disconnect.set()
+
+    await asyncio.wait_for(app(scope, receive, send), timeout=10)
+    return disconnected_at
+
+
+def test_disconnect_cancels_upstream_and_keeps_partial_answer(client, db, make_user, monkeypatch, stand_in_server):
+    base_url, state = stand_in_server
+    service = AIService("mock")
+    service.provider = "openai"
+    service.client = AsyncOpenAI(base_url=base_url, api_key="stand-in", max_retries=0)
+    service.model = "stand-in"
+    monkeypatch.setattr(ai_service, "generate_response", service.generate_response)
+
+    _, headers = make_user("alice")
+    conversation_id = client.post("/api/chat/conversations", json={"title": "新对话"}, headers=headers).json()["id"]
+    token = headers["Authorization"].split(" ", 1)[1]
+
+    disconnected_at = asyncio.run(
+        _stream_then_disconnect(f"/api/chat/conversations/{conversation_id}/messages", token, 3)
+    )
+
+    # 等待替身服务器在下一次写入时发现连接已关闭
+    deadline = time.perf_counter() + 2
+    while state.closed_at is None and time.perf_counter() < deadline:
+        time.sleep(0.01)
+
+    assert state.closed_at is not None, "上游连接在客户端断开后仍未关闭"
+    latency = state.closed_at - disconnected_at
+    print(f"\n取消延迟: {latency * 1000:.1f} ms（上游已发送 {state.tokens_sent}/{TOKEN_COUNT} 个 token）")
+    assert latency < 0.5
+    assert state.tokens_sent < TOKEN_COUNT // 2
+
+    db.expire_all()
+    assistant = db.query(models.Message).filter(models.Message.role == "assistant").one()
+    assert assistant.truncated is True
+    assert assistant.content.startswith("词0 ")
+
+    messages = client.get(f"/api/chat/conversations/{conversation_id}/messages", headers=headers).json()["items"]
+    assert messages[-1]["truncated"] is True
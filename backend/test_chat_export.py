@@ -0,0 +1,85 @@
+"""测试对话导出：单个对话流式下载、全部对话 zip 归档"""
+
+import io
+import json
+import zipfile
+from urllib.parse import unquote
+
+import models
+from services import export_service
+
+
+def _conversation(db, user_id: int, title: str, turns: int) -> models.Conversation:
+    conversation = models.Conversation(user_id=user_id, title=title, message_count=turns * 2)
+    db.add(conversation)
+    db.flush()
+    for i in range(turns):
+        db.add(models.Message(conversation_id=conversation.id, role="user", content=f"问题 {i}"))
+        db.add(models.Message(conversation_id=conversation.id, role="assistant", content=f"回答 {i}：" + "内容" * 50))
+    db.commit()
+    return conversation
+
+
+def test_single_conversation_downloads_as_stream(client, db, make_user, monkeypatch):
+    user, headers = make_user("alice")
+    conversation = _conversation(db, user.id, "傅里叶/变换", 300)
+    monkeypatch.setattr(export_service, "EXPORT_CHUNK_BYTES", 4096)
+
+    response = client.get(f"/api/chat/conversations/{conversation.id}/export?format=markdown", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/markdown")
+    assert unquote(response.headers["content-disposition"].split("filename*=UTF-8''")[1]) == "傅里叶_变换.md"
+
+    # 分块输出，而不是一次生成整个文档（测试客户端会合并响应体，直接检查生成器）
+    chunks = list(export_service.stream_conversation(conversation.id, "markdown"))
+    assert len(chunks) > 1 and all(len(chunk) < 2 * 4096 for chunk in chunks)
+    assert b"".join(chunks) == response.content
+    text = response.text
+    assert text.startswith("# 傅里叶/变换\n")
+    assert text.count("## 用户") == 300 and "回答 299：" in text
+
+    # JSON 格式逐条生成，结果仍是合法 JSON；旧的 POST 接口内容一致
+    document = client.get(f"/api/chat/conversations/{conversation.id}/export?format=json", headers=headers).text
+    data = json.loads(document)
+    assert data["title"] == "傅里叶/变换"
+    assert [m["content"] for m in data["messages"][:2]] == ["问题 0", "回答 0：" + "内容" * 50]
+    legacy = client.post(f"/api/chat/conversations/{conversation.id}/export", json={"format": "json"}, headers=headers)
+    assert legacy.json()["content"] == document
+
+
+def test_empty_conversation_exports_valid_json(client, db, make_user):
+    user, headers = make_user("alice")
+    conversation = _conversation(db, user.id, "空对话", 0)
+
+    data = client.get(f"/api/chat/conversations/{conversation.id}/export?format=json", headers=headers).json()
+
+    assert data["messages"] == []
+
+
+def test_export_checks_ownership(client, db, make_user):
+    alice, _ = make_user("alice")
+    _, bob_headers = make_user("bob")
+    conversation = _conversation(db, alice.id, "私人对话", 1)
+
+    assert client.get(f"/api/chat/conversations/{conversation.id}/export", headers=bob_headers).status_code == 403
+    assert client.get("/api/chat/conversations/999/export", headers=bob_headers).status_code == 404
+
+
+def test_export_all_streams_zip_of_own_conversations(client, db, make_user):
+    alice, headers = make_user("alice")
+    bob, _ = make_user("bob")
+    first = _conversation(db, alice.id, "梯度下降", 200)
+    second = _conversation(db, alice.id, "梯度下降", 2)
+    _conversation(db, bob.id, "别人的对话", 1)
+
+    response = client.get("/api/chat/export?format=txt", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.namelist() == [f"{first.id}-梯度下降.txt", f"{second.id}-梯度下降.txt"]
+        text = archive.read(f"{first.id}-梯度下降.txt").decode("utf-8")
+        assert archive.testzip() is None
+
+    assert text.startswith("梯度下降\n")
+    assert text.count("[用户]") == 200
@@ -0,0 +1,200 @@
+"""测试流式重新生成：SSE 协议、历史版本、失败恢复与客户端断开"""
+
+import asyncio
+import json
+
+import models
+from config import settings
+from database import SessionLocal
+from main import app
+from services import ai_service
+
+OLD_ANSWER = "旧回答：梯度下降沿梯度方向更新参数。"
+NEW_REPLY = ["新回答：", "梯度下降", "沿负梯度", "方向更新", "参数。"]
+
+
+def _parse_sse(body: str) -> list[dict]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        event = {"event": "message", "data": ""}
+        for line in block.split("\n"):
+            field, _, value = line.partition(": ")
+            event[field] = value
+        events.append(event)
+    return events
+
+
+def _conversation_with_answer(db, user) -> tuple[int, int]:
+    conversation = models.Conversation(user_id=user.id, title="梯度下降", message_count=2)
+    db.add(conversation)
+    db.flush()
+    db.add(models.Message(conversation_id=conversation.id, role="user", content="什么是梯度下降？"))
+    answer = models.Message(conversation_id=conversation.id, role="assistant", content=OLD_ANSWER, tokens_used=30)
+    db.add(answer)
+    db.commit()
+    return conversation.id, answer.id
+
+
+def _regenerate_url(conversation_id: int) -> str:
+    return f"/api/chat/conversations/{conversation_id}/messages/regenerate?stream=true&protocol=2"
+
+
+def test_stream_regenerate_uses_delta_protocol_and_keeps_prior_version(client, db, make_user, monkeypatch):
+    monkeypatch.setattr(settings, "AI_STREAM_FLUSH_MS", 0)
+    monkeypatch.setattr(settings, "AI_STREAM_FLUSH_CHARS", 0)
+    monkeypatch.setattr(settings, "AI_STREAM_CHECKPOINT_CHARS", 4)
+    seen = []
+
+    async def fake_generate(messages, stream=False):
+        assert stream is True
+        for delta in NEW_REPLY:
+            yield delta
+        # 新回答生成期间：原回答已保存为历史版本，消息中是检查点
+        with SessionLocal() as session:
+            message = session.query(models.Message).filter(models.Message.role == "assistant").one()
+            version = session.query(models.MessageVersion).one()
+            seen.append((message.content, message.truncated, version.content))
+
+    monkeypatch.setattr(ai_service, "generate_response", fake_generate)
+    user, headers = make_user("alice")
+    conversation_id, message_id = _conversation_with_answer(db, user)
+
+    response = client.post(_regenerate_url(conversation_id), headers=headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _parse_sse(response.text)
+    deltas = [json.loads(e["data"]) for e in events if e["event"] == "delta"]
+    assert [d["delta"] for d in deltas] == NEW_REPLY
+    assert all(d["id"] == message_id for d in deltas)
+    summary = json.loads(next(e["data"] for e in events if e["event"] == "summary"))
+    assert summary["length"] == len("".join(NEW_REPLY))
+    assert events[-1]["data"] == "[DONE]"
+
+    checkpoint, truncated, prior = seen[0]
+    assert checkpoint and checkpoint != "".join(NEW_REPLY) and truncated is True
+    assert prior == OLD_ANSWER
+
+    items = client.get(f"/api/chat/conversations/{conversation_id}/messages", headers=headers).json()["items"]
+    assert len(items) == 2
+    assert items[-1]["content"] == "".join(NEW_REPLY) and items[-1]["truncated"] is False
+
+    versions = client.get(
+        f"/api/chat/conversations/{conversation_id}/messages/{message_id}/versions", headers=headers
+    ).json()
+    assert [(v["content"], v["tokens_used"]) for v in versions["items"]] == [(OLD_ANSWER, 30)]
+
+    conversations = client.get("/api/chat/conversations", headers=headers).json()["items"]
+    assert conversations[0]["last_message"].startswith("新回答")
+
+
+def test_provider_failure_restores_previous_answer(client, db, make_user, monkeypatch):
+    async def failing_generate(messages, stream=False):
+        yield "半截"
+        raise RuntimeError("上游超时")
+
+    monkeypatch.setattr(ai_service, "generate_response", failing_generate)
+    user, headers = make_user("alice")
+    conversation_id, message_id = _conversation_with_answer(db, user)
+
+    response = client.post(_regenerate_url(conversation_id), headers=headers)
+
+    deltas = [json.loads(e["data"]) for e in _parse_sse(response.text) if e["event"] == "delta"]
+    assert deltas[-1]["replace"] is True and "上游超时" in deltas[-1]["delta"]
+
+    db.expire_all()
+    message = db.get(models.Message, message_id)
+    assert (message.content, message.truncated, message.tokens_used) == (OLD_ANSWER, False, 30)
+    assert db.query(models.MessageVersion).count() == 0
+
+
+def test_non_stream_regenerate_also_keeps_prior_version(client, db, make_user, monkeypatch):
+    async def fake_generate(messages, stream=False):
+        yield "".join(NEW_REPLY)
+
+    monkeypatch.setattr(ai_service, "generate_response", fake_generate)
+    user, headers = make_user("alice")
+    conversation_id, message_id = _conversation_with_answer(db, user)
+
+    response = client.post(f"/api/chat/conversations/{conversation_id}/messages/regenerate", headers=headers)
+
+    assert response.json()["content"] == "".join(NEW_REPLY)
+    assert [v.content for v in db.query(models.MessageVersion).all()] == [OLD_ANSWER]
+
+
+async def _regenerate_then_disconnect(conversation_id: int, token: str, frames_before_disconnect: int) -> None:
+    """直接驱动 ASGI 应用，收到指定数量的增量帧后模拟客户端断开（0 表示收到响应头就断开）"""
+    path = f"/api/chat/conversations/{conversation_id}/messages/regenerate"
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"stream=true&protocol=2",
+        "headers": [(b"host", b"testserver"), (b"authorization", f"Bearer {token}".encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    disconnect = asyncio.Event()
+    request_sent = False
+    frames = 0
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal frames
+        if message["type"] == "http.response.body" and b"event: delta" in message.get("body", b""):
+            frames += 1
+        if frames >= frames_before_disconnect and message["type"].startswith("http.response"):
+            disconnect.set()
+
+    await asyncio.wait_for(app(scope, receive, send), timeout=10)
+
+
+def _slow_reply(monkeypatch, first_token_delay: float) -> None:
+    async def slow_generate(messages, stream=False):
+        await asyncio.sleep(first_token_delay)
+        for delta in NEW_REPLY:
+            yield delta
+            await asyncio.sleep(0.05)
+
+    monkeypatch.setattr(settings, "AI_STREAM_FLUSH_MS", 0)
+    monkeypatch.setattr(settings, "AI_STREAM_FLUSH_CHARS", 0)
+    monkeypatch.setattr(ai_service, "generate_response", slow_generate)
+
+
+def test_disconnect_keeps_partial_answer_and_prior_version(client, db, make_user, monkeypatch):
+    _slow_reply(monkeypatch, 0)
+    user, headers = make_user("alice")
+    conversation_id, message_id = _conversation_with_answer(db, user)
+
+    asyncio.run(_regenerate_then_disconnect(conversation_id, headers["Authorization"].split(" ", 1)[1], 2))
+
+    db.expire_all()
+    message = db.get(models.Message, message_id)
+    assert message.truncated is True
+    assert message.content.startswith("新回答：") and message.content != "".join(NEW_REPLY)
+    assert [v.content for v in db.query(models.MessageVersion).all()] == [OLD_ANSWER]
+
+
+def test_disconnect_before_first_token_restores_previous_answer(client, db, make_user, monkeypatch):
+    _slow_reply(monkeypatch, 5)
+    user, headers = make_user("alice")
+    conversation_id, message_id = _conversation_with_answer(db, user)
+
+    asyncio.run(_regenerate_then_disconnect(conversation_id, headers["Authorization"].split(" ", 1)[1], 0))
+
+    db.expire_all()
+    message = db.get(models.Message, message_id)
+    assert (message.content, message.truncated) == (OLD_ANSWER, False)
+    assert db.query(models.MessageVersion).count() == 0
@@ -0,0 +1,155 @@
+"""测试流式回复的检查点与断线重连"""
+
+import asyncio
+import hashlib
+import json
+
+import models
+from config import settings
+from database import SessionLocal
+from services import ai_service, stream_registry
+
+REPLY = ["傅里叶", "变换", "把信号", "分解为", "正弦波"]
+
+
+def _parse_sse(body: str) -> list[dict]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        event = {"id": None, "event": "message", "data": ""}
+        for line in block.split("\n"):
+            field, _, value = line.partition(": ")
+            event[field] = value
+        events.append(event)
+    return events
+
+
+def _add_assistant_message(db, user, content: str, truncated: bool) -> models.Message:
+    conversation = models.Conversation(user_id=user.id, title="新对话")
+    db.add(conversation)
+    db.commit()
+    message = models.Message(conversation_id=conversation.id, role="assistant", content=content, truncated=truncated)
+    db.add(message)
+    db.commit()
+    db.refresh(message)
+    return message
+
+
+async def _provider_must_not_be_called(messages, stream=False):
+    raise AssertionError("重连不应再次调用 AI 服务")
+    yield
+
+
+def test_partial_answer_is_checkpointed_while_streaming(client, db, make_user, monkeypatch):
+    monkeypatch.setattr(settings, "AI_STREAM_FLUSH_MS", 0)
+    monkeypatch.setattr(settings, "AI_STREAM_FLUSH_CHARS", 0)
+    monkeypatch.setattr(settings, "AI_STREAM_CHECKPOINT_CHARS", 4)
+    seen = []
+
+    async def fake_generate(messages, stream=False):
+        for delta in REPLY:
+            yield delta
+        # 生成结束前，数据库中应已有检查点
+        with SessionLocal() as session:
+            message = session.query(models.Message).filter(models.Message.role == "assistant").one()
+            seen.append((message.content, message.truncated))
+
+    monkeypatch.setattr(ai_service, "generate_response", fake_generate)
+    _, headers = make_user("alice")
+    conversation_id = client.post("/api/chat/conversations", json={"title": "新对话"}, headers=headers).json()["id"]
+
+    client.post(
+        f"/api/chat/conversations/{conversation_id}/messages?stream=true&protocol=2",
+        json={"content": "什么是傅里叶变换？"},
+        headers=headers,
+    )
+
+    checkpoint, truncated = seen[0]
+    assert checkpoint and "".join(REPLY).startswith(checkpoint) and checkpoint != "".join(REPLY)
+    assert truncated is True
+
+    db.expire_all()
+    message = db.query(models.Message).filter(models.Message.role == "assistant").one()
+    assert message.content == "".join(REPLY)
+    assert message.truncated is False
+
+
+def test_resume_replays_buffered_frames_after_last_event_id(client, db, make_user, monkeypatch):
+    monkeypatch.setattr(ai_service, "generate_response", _provider_must_not_be_called)
+    user, headers = make_user("alice")
+    message = _add_assistant_message(db, user, "".join(REPLY[:3]), truncated=False)
+
+    # 本进程中已生成三帧且刚结束，登记尚未移除
+    live = stream_registry.start(message.id, user.id)
+    for seq, delta in enumerate(REPLY[:3], start=1):
+        live.publish(seq, delta)
+    live.finish()
+    try:
+        response = client.get(
+            f"/api/chat/conversations/{message.conversation_id}/messages/{message.id}/stream",
+            headers={**headers, "Last-Event-ID": "1"},
+        )
+    finally:
+        stream_registry.finish(message.id)
+
+    events = _parse_sse(response.text)
+    deltas = [json.loads(e["data"]) for e in events if e["event"] == "delta"]
+    assert [(d["seq"], d["delta"]) for d in deltas] == [(2, REPLY[1]), (3, REPLY[2])]
+
+    summary = json.loads(next(e for e in events if e["event"] == "summary")["data"])
+    full = "".join(REPLY[:3])
+    assert summary["seq"] == 3
+    assert summary["content_sha256"] == hashlib.sha256(full.encode("utf-8")).hexdigest()
+    assert summary["truncated"] is False
+    assert events[-1]["data"] == "[DONE]"
+
+
+def test_resume_falls_back_to_persisted_checkpoint(client, db, make_user, monkeypatch):
+    monkeypatch.setattr(ai_service, "generate_response", _provider_must_not_be_called)
+    user, headers = make_user("alice")
+    message = _add_assistant_message(db, user, "傅里叶变换把", truncated=True)
+
+    response = client.get(
+        f"/api/chat/conversations/{message.conversation_id}/messages/{message.id}/stream?last_event_id=5",
+        headers=headers,
+    )
+
+    events = _parse_sse(response.text)
+    delta = json.loads(next(e for e in events if e["event"] == "delta")["data"])
+    assert delta == {"id": message.id, "seq": 6, "delta": "傅里叶变换把", "replace": True}
+    summary = json.loads(next(e for e in events if e["event"] == "summary")["data"])
+    assert summary["truncated"] is True
+
+
+def test_resume_requires_owner(client, db, make_user):
+    alice, _ = make_user("alice")
+    _, bob_headers = make_user("bob")
+    message = _add_assistant_message(db, alice, "私有回答", truncated=False)
+
+    response = client.get(
+        f"/api/chat/conversations/{message.conversation_id}/messages/{message.id}/stream",
+        headers=bob_headers,
+    )
+
+    assert response.status_code == 403
+
+
+def test_follower_receives_frames_published_after_it_attached():
+    async def scenario():
+        live = stream_registry.LiveStream(message_id=1, user_id=1)
+        live.publish(1, REPLY[0])
+
+        async def follow():
+            return [frame async for frame in live.follow(after_seq=0)]
+
+        follower = asyncio.create_task(follow())
+        await asyncio.sleep(0)
+        live.publish(2, REPLY[1])
+        await asyncio.sleep(0)
+        live.publish(3, "服务调用失败", replace=True)
+        live.finish()
+        return await asyncio.wait_for(follower, timeout=1), live.content
+
+    frames, content = asyncio.run(scenario())
+
+    assert frames == [(1, REPLY[0], False), (2, REPLY[1], False), (3, "服务调用失败", True)]
+    assert content == "服务调用失败"
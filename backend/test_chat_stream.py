@@ -0,0 +1,135 @@
+"""测试 AI 对话流式协议"""
+
+import hashlib
+import json
+
+import models
+from config import settings
+from services import ai_service
+from services.ai_service import StreamInterrupted
+
+REPLY = ["傅里叶", "变换", "把信号", "分解为", "正弦波"]
+
+
+async def _fake_generate(messages, stream=False):
+    for delta in REPLY:
+        yield delta
+
+
+def _parse_sse(body: str) -> list[dict]:
+    """把 SSE 响应体解析为 [{"id", "event", "data"}]"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        event = {"id": None, "event": "message", "data": ""}
+        for line in block.split("\n"):
+            field, _, value = line.partition(": ")
+            event[field] = value
+        events.append(event)
+    return events
+
+
+def _start_conversation(client, headers) -> int:
+    return client.post("/api/chat/conversations", json={"title": "新对话"}, headers=headers).json()["id"]
+
+
+def test_protocol_v2_sends_only_deltas_and_summary(client, db, make_user, monkeypatch):
+    monkeypatch.setattr(ai_service, "generate_response", _fake_generate)
+    # 关闭合并，使每个 token 对应一帧
+    monkeypatch.setattr(settings, "AI_STREAM_FLUSH_MS", 0)
+    monkeypatch.setattr(settings, "AI_STREAM_FLUSH_CHARS", 0)
+    _, headers = make_user("alice")
+    conversation_id = _start_conversation(client, headers)
+
+    response = client.post(
+        f"/api/chat/conversations/{conversation_id}/messages?stream=true&protocol=2",
+        json={"content": "什么是傅里叶变换？"},
+        headers=headers,
+    )
+    events = _parse_sse(response.text)
+
+    deltas = [e for e in events if e["event"] == "delta"]
+    assert [json.loads(e["data"])["seq"] for e in deltas] == [1, 2, 3, 4, 5]
+    assert [e["id"] for e in deltas] == ["1", "2", "3", "4", "5"]
+    # 每帧只携带增量，不重复发送已累积的全文
+    assert all("content" not in json.loads(e["data"]) for e in deltas)
+
+    full = "".join(json.loads(e["data"])["delta"] for e in deltas)
+    summary = json.loads(next(e for e in events if e["event"] == "summary")["data"])
+    assert summary["seq"] == 5
+    assert summary["content_sha256"] == hashlib.sha256(full.encode("utf-8")).hexdigest()
+    assert events[-1]["data"] == "[DONE]"
+
+    assistant = db.query(models.Message).filter(models.Message.role == "assistant").one()
+    assert assistant.content == full
+
+
+def test_protocol_v1_remains_default(client, db, make_user, monkeypatch):
+    monkeypatch.setattr(ai_service, "generate_response", _fake_generate)
+    _, headers = make_user("bob")
+    conversation_id = _start_conversation(client, headers)
+
+    response = client.post(
+        f"/api/chat/conversations/{conversation_id}/messages?stream=true",
+        json={"content": "你好"},
+        headers=headers,
+    )
+    chunks = [json.loads(e["data"]) for e in _parse_sse(response.text) if e["data"] != "[DONE]"]
+
+    assert chunks[-1]["content"] == "".join(REPLY)
+    assert chunks[-1]["content"].endswith(chunks[-1]["delta"])
+
+
+def test_stream_does_not_hold_database_connection(client, db, make_user, monkeypatch):
+    from database import engine
+
+    checked_out = []
+
+    async def fake_generate(messages, stream=False):
+        for delta in REPLY:
+            # 生成期间（检查点之间）不占用连接池中的连接
+            checked_out.append(engine.pool.checkedout())
+            yield delta
+
+    monkeypatch.setattr(ai_service, "generate_response", fake_generate)
+    monkeypatch.setattr(settings, "AI_STREAM_FLUSH_MS", 0)
+    monkeypatch.setattr(settings, "AI_STREAM_FLUSH_CHARS", 0)
+    _, headers = make_user("alice")
+    conversation_id = _start_conversation(client, headers)
+    db.commit()
+    baseline = engine.pool.checkedout()  # 连接池是进程级的，只比较本次请求新占用的连接
+
+    client.post(
+        f"/api/chat/conversations/{conversation_id}/messages?stream=true&protocol=2",
+        json={"content": "什么是傅里叶变换？"},
+        headers=headers,
+    )
+
+    assert checked_out and max(checked_out) <= baseline
+
+
+def test_interrupted_answer_is_saved_as_truncated(client, db, make_user, monkeypatch):
+    async def interrupted_generate(messages, stream=False):
+        yield REPLY[0]
+        raise StreamInterrupted("连接中断")
+
+    monkeypatch.setattr(ai_service, "generate_response", interrupted_generate)
+    _, headers = make_user("alice")
+    conversation_id = _start_conversation(client, headers)
+
+    # 非流式：返回并保存已生成的部分，标记为不完整
+    data = client.post(
+        f"/api/chat/conversations/{conversation_id}/messages", json={"content": "你好"}, headers=headers
+    ).json()
+    assert (data["content"], data["truncated"]) == (REPLY[0], True)
+
+    # 协议 v1：已发送的内容不被替换，最后发送 error 事件
+    response = client.post(
+        f"/api/chat/conversations/{conversation_id}/messages?stream=true", json={"content": "再说一遍"}, headers=headers
+    )
+    events = _parse_sse(response.text)
+    assert [json.loads(e["data"])["content"] for e in events if e["event"] == "message" and e["data"] != "[DONE]"] == [REPLY[0]]
+    assert json.loads(next(e for e in events if e["event"] == "error")["data"])["id"] == data["id"] + 2
+
+    db.expire_all()
+    assistants = db.query(models.Message).filter(models.Message.role == "assistant").all()
+    assert [(m.content, m.truncated) for m in assistants] == [(REPLY[0], True), (REPLY[0], True)]
@@ -0,0 +1,250 @@
+"""测试内容寻址存储：上传去重、引用计数删除、永久缓存响应头以及旧文件迁移"""
+
+import hashlib
+import io
+import json
+from pathlib import Path
+
+import pytest
+
+import migrate_dedupe_uploads
+import models
+from config import settings
+from services import storage_service
+
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, "VIDEO_TRANSCODE_WORKERS", 0)
+    return tmp_path / "uploads" / "blog"
+
+
+def _jpeg(size=(800, 600), color="orange"):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def _upload_image(client, headers, data, filename="photo.jpg"):
+    return client.post("/api/uploads/image", files={"file": (filename, data, "image/jpeg")}, headers=headers)
+
+
+def _delete(client, headers, url):
+    return client.request("DELETE", "/api/uploads/media", json={"urls": [url]}, headers=headers)
+
+
+def _files(directory):
+    return sorted(path for path in directory.rglob("*") if path.is_file())
+
+
+def test_identical_uploads_share_one_object(client, db, make_user, upload_dir):
+    _, alice = make_user("alice")
+    _, bob = make_user("bob")
+    data = _jpeg()
+    sha256 = hashlib.sha256(data).hexdigest()
+
+    first = _upload_image(client, alice, data).json()
+    second = _upload_image(client, bob, data, "copy.jpg").json()
+
+    assert first["url"] == second["url"] == f"/static/blog/images/{sha256[:2]}/{sha256}.jpg"
+    assert first["variants"] == second["variants"]
+    assert storage_service.url_to_path(first["url"]).read_bytes() == data
+    # 原图 + 3 个宽度 × (WebP + JPEG) 版本，第二次上传不产生新文件
+    assert len(_files(upload_dir)) == 7
+    assert not list(Path(settings.UPLOAD_SESSION_DIR).iterdir())  # 临时文件已清理
+
+    stored = db.query(models.StoredObject).one()
+    assert (stored.sha256, stored.ref_count, stored.size) == (sha256, 2, len(data))
+    assert db.query(models.ImageAsset).count() == 1
+
+
+def test_delete_releases_only_own_reference(client, db, make_user, upload_dir):
+    _, alice = make_user("alice")
+    _, bob = make_user("bob")
+    _, mallory = make_user("mallory")
+    url = _upload_image(client, alice, _jpeg()).json()["url"]
+    _upload_image(client, bob, _jpeg())
+
+    # 没有引用的用户不能删除别人的文件
+    assert _delete(client, mallory, url).status_code == 204
+    assert db.query(models.StoredObject).one().ref_count == 2
+
+    # 仍被 bob 引用：只释放 alice 的引用，文件保留
+    assert _delete(client, alice, url).status_code == 204
+    assert _delete(client, alice, url).status_code == 204  # 重复删除不会释放别人的引用
+    db.expire_all()
+    assert db.query(models.StoredObject).one().ref_count == 1
+    assert storage_service.url_to_path(url).exists()
+
+    # 最后一个引用释放后删除原图、所有版本和记录
+    assert _delete(client, bob, url).status_code == 204
+    assert _files(upload_dir) == []
+    assert db.query(models.StoredObject).count() == 0
+    assert db.query(models.ObjectReference).count() == 0
+    assert db.query(models.ImageAsset).count() == 0
+
+
+def test_released_files_are_removed_only_after_commit(client, db, make_user, upload_dir):
+    alice, headers = make_user("alice")
+    data = _jpeg()
+    url = _upload_image(client, headers, data).json()["url"]
+    files = _files(upload_dir)
+
+    # 引用归零后回滚：记录和文件都保留
+    released = storage_service.release(db, alice.id, url)
+    assert storage_service.url_to_path(url) in released
+    assert _files(upload_dir) == files
+    db.rollback()
+    assert db.query(models.StoredObject).one().ref_count == 1
+
+    # 提交之后、删除文件之前相同内容又被上传：文件留给新的上传使用
+    released = storage_service.release(db, alice.id, url)
+    db.commit()
+    assert _upload_image(client, headers, data).json()["url"] == url
+    storage_service.remove_files(db, released)
+    assert storage_service.url_to_path(url).read_bytes() == data
+    assert db.query(models.StoredObject).one().ref_count == 1
+
+    # 没有被重新上传时正常删除
+    released = storage_service.release(db, alice.id, url)
+    db.commit()
+    storage_service.remove_files(db, released)
+    assert _files(upload_dir) == []
+
+
+def test_video_upload_is_deduplicated(client, db, make_user, upload_dir):
+    _, alice = make_user("alice")
+    _, bob = make_user("bob")
+    data = b"\x00\x00\x00\x18ftypmp42" + bytes(range(256)) * 64
+
+    urls = [
+        client.post("/api/uploads/video", files={"file": ("clip.mp4", data, "video/mp4")}, headers=headers).json()["url"]
+        for headers in (alice, bob)
+    ]
+
+    assert urls[0] == urls[1] and storage_service.is_content_addressed(urls[0])
+    assert _files(upload_dir) == [storage_service.url_to_path(urls[0]).resolve()]
+    assert db.query(models.StoredObject).one().ref_count == 2
+
+
+def test_shared_video_rendition_is_released_with_source(client, db, make_user, upload_dir):
+    uploader, alice = make_user("alice")
+    _, bob = make_user("bob")
+    data = b"\x00\x00\x00\x18ftypmp42" + bytes(range(256)) * 64
+    for headers in (alice, bob):
+        url = client.post("/api/uploads/video", files={"file": ("clip.mp4", data, "video/mp4")}, headers=headers).json()["url"]
+
+    # 转码完成后博客中使用的是压缩版本地址
+    source = storage_service.url_to_path(url)
+    rendition = source.with_name(f"{source.stem}-compressed.mp4")
+    rendition.write_bytes(b"small")
+    rendition_url = storage_service.to_url(rendition)
+    db.add(models.TranscodeJob(user_id=uploader.id, status="completed", source_url=url, output_url=rendition_url))
+    db.commit()
+
+    # 删除压缩版本地址释放的是原视频的引用，仍被 bob 引用时两个文件都保留
+    assert _delete(client, alice, rendition_url).status_code == 204
+    db.expire_all()
+    assert db.query(models.StoredObject).one().ref_count == 1
+    assert source.exists() and rendition.exists()
+
+    # 同一请求中同时包含原视频和压缩版本只释放一个引用
+    response = client.request("DELETE", "/api/uploads/media", json={"urls": [url, rendition_url]}, headers=bob)
+    assert response.status_code == 204
+    assert _files(upload_dir) == []
+    assert db.query(models.StoredObject).count() == 0
+    assert db.query(models.TranscodeJob).count() == 0
+
+
+def test_media_sizes_does_not_release_references(client, db, make_user):
+    _, alice = make_user("alice")
+    data = _jpeg()
+    url = _upload_image(client, alice, data).json()["url"]
+
+    response = client.post("/api/uploads/media/sizes", json={"urls": [url, "/static/blog/images/missing.jpg"]}, headers=alice)
+
+    assert response.status_code == 200
+    assert response.json() == {"sizes": {url: len(data), "/static/blog/images/missing.jpg": 0}}
+    assert db.query(models.StoredObject).one().ref_count == 1
+    assert storage_service.url_to_path(url).exists()
+
+
+def test_hashed_urls_are_cached_permanently(client, make_user):
+    _, alice = make_user("alice")
+    data = _upload_image(client, alice, _jpeg()).json()
+
+    for url in (data["url"], data["variants"]["webp"][0]["url"]):
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+
+    legacy = Path("uploads/blog/images/legacy.jpg")
+    legacy.write_bytes(b"legacy")
+    assert "cache-control" not in client.get("/static/blog/images/legacy.jpg").headers
+
+
+def test_migration_dedupes_legacy_tree(db, make_user, upload_dir):
+    alice, _ = make_user("alice")
+    images = upload_dir / "images"
+    videos = upload_dir / "videos"
+    images.mkdir(parents=True)
+    videos.mkdir(parents=True)
+
+    data = _jpeg()
+    sha256 = hashlib.sha256(data).hexdigest()
+    (images / "aaa.jpg").write_bytes(data)
+    (images / "aaa-320w.webp").write_bytes(b"variant")
+    (images / "bbb.jpg").write_bytes(data)
+    (images / "bbb-320w.webp").write_bytes(b"variant")
+    (videos / "ccc.mp4").write_bytes(b"video")
+    (videos / "ccc-compressed.mp4").write_bytes(b"small")
+
+    variants = {"webp": [{"width": 320, "height": 240, "url": "/static/blog/images/aaa-320w.webp", "size": 7}]}
+    db.add_all([
+        models.ImageAsset(user_id=alice.id, url="/static/blog/images/aaa.jpg", format="jpeg",
+                          width=800, height=600, variants=json.dumps(variants)),
+        models.ImageAsset(user_id=alice.id, url="/static/blog/images/bbb.jpg", format="jpeg",
+                          width=800, height=600, variants="{}"),
+        models.TranscodeJob(user_id=alice.id, status="completed", source_url="/static/blog/videos/ccc.mp4",
+                            output_url="/static/blog/videos/ccc-compressed.mp4"),
+        models.Blog(title="t", author_id=alice.id, author_name="alice", content=(
+            '<img src="/static/blog/images/aaa.jpg"><img src="/static/blog/images/bbb.jpg">'
+            '<video src="/static/blog/videos/ccc-compressed.mp4"></video>'
+        )),
+    ])
+    db.commit()
+
+    assert migrate_dedupe_uploads.migrate()
+
+    image_url = f"/static/blog/images/{sha256[:2]}/{sha256}.jpg"
+    video_sha = hashlib.sha256(b"video").hexdigest()
+    video_url = f"/static/blog/videos/{video_sha[:2]}/{video_sha}.mp4"
+    assert [path.relative_to(upload_dir).as_posix() for path in _files(upload_dir)] == [
+        f"images/{sha256[:2]}/{sha256}-320w.webp",
+        f"images/{sha256[:2]}/{sha256}.jpg",
+        f"videos/{video_sha[:2]}/{video_sha}-compressed.mp4",
+        f"videos/{video_sha[:2]}/{video_sha}.mp4",
+    ]
+
+    db.expire_all()
+    stored = {row.url: row for row in db.query(models.StoredObject).all()}
+    assert set(stored) == {image_url, video_url}
+    assert (stored[image_url].ref_count, stored[video_url].ref_count) == (2, 1)
+    assert {row.user_id for row in db.query(models.ObjectReference).all()} == {alice.id}
+
+    asset = db.query(models.ImageAsset).one()
+    assert asset.url == image_url
+    assert json.loads(asset.variants)["webp"][0]["url"] == image_url.replace(".jpg", "-320w.webp")
+    job = db.query(models.TranscodeJob).one()
+    assert (job.source_url, job.output_url) == (video_url, video_url.replace(".mp4", "-compressed.mp4"))
+    assert db.query(models.Blog).one().content == (
+        f'<img src="{image_url}"><img src="{image_url}">'
+        f'<video src="{job.output_url}"></video>'
+    )
+
+    # 可重复执行：已迁移的文件不再处理
+    assert migrate_dedupe_uploads.migrate()
+    assert db.query(models.ObjectReference).count() == 3
@@ -0,0 +1,102 @@
+"""测试对话列表的冗余字段与查询次数"""
+
+from sqlalchemy import event
+
+from database import engine
+from services import ai_service
+
+REPLY = "傅里叶变换把信号分解为不同频率的正弦波。"
+
+
+async def _fake_generate(messages, stream=False):
+    yield REPLY
+
+
+class QueryCounter:
+    """统计请求期间执行的 SQL 语句数"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine, "before_cursor_execute", self)
+
+
+def _new_conversation(client, headers, title="新对话") -> int:
+    return client.post("/api/chat/conversations", json={"title": title}, headers=headers).json()["id"]
+
+
+def test_sidebar_query_count_does_not_grow_with_conversations(client, make_user, monkeypatch):
+    monkeypatch.setattr(ai_service, "generate_response", _fake_generate)
+    _, headers = make_user("alice")
+
+    def count_list_queries() -> int:
+        with QueryCounter() as counter:
+            response = client.get("/api/chat/conversations", headers=headers)
+        assert response.status_code == 200
+        return counter.count
+
+    for i in range(2):
+        client.post(f"/api/chat/conversations/{_new_conversation(client, headers)}/messages",
+                    json={"content": f"问题 {i}"}, headers=headers)
+    few = count_list_queries()
+
+    for i in range(18):
+        client.post(f"/api/chat/conversations/{_new_conversation(client, headers)}/messages",
+                    json={"content": f"问题 {i}"}, headers=headers)
+    many = count_list_queries()
+
+    assert many == few
+    assert many <= 2  # 认证查询用户 + 一次对话列表查询
+
+
+def test_stats_are_maintained_by_message_write_paths(client, make_user, monkeypatch):
+    monkeypatch.setattr(ai_service, "generate_response", _fake_generate)
+    _, headers = make_user("alice")
+    first = _new_conversation(client, headers)
+    second = _new_conversation(client, headers)
+
+    client.post(f"/api/chat/conversations/{first}/messages?stream=true&protocol=2",
+                json={"content": "什么是傅里叶变换？"}, headers=headers)
+    client.post(f"/api/chat/conversations/{second}/messages",
+                json={"content": "你好"}, headers=headers)
+
+    items = client.get("/api/chat/conversations", headers=headers).json()["items"]
+    # 最近有新消息的对话排在前面
+    assert [item["id"] for item in items] == [second, first]
+    by_id = {item["id"]: item for item in items}
+    assert by_id[first]["message_count"] == 2
+    assert by_id[first]["last_message"] == REPLY
+    assert by_id[first]["last_message_at"] is not None
+    assert by_id[first]["title"] == "什么是傅里叶变换"
+    assert client.get(f"/api/chat/conversations/{first}", headers=headers).json()["message_count"] == 2
+
+    async def regenerated(messages, stream=False):
+        yield "重新生成的回答"
+
+    monkeypatch.setattr(ai_service, "generate_response", regenerated)
+    client.post(f"/api/chat/conversations/{first}/messages/regenerate", headers=headers)
+
+    items = client.get("/api/chat/conversations", headers=headers).json()["items"]
+    assert items[0]["id"] == first
+    assert items[0]["last_message"] == "重新生成的回答"
+    assert items[0]["message_count"] == 2
+
+
+def test_total_and_out_of_range_page(client, make_user):
+    _, headers = make_user("alice")
+    for i in range(3):
+        _new_conversation(client, headers, title=f"对话 {i}")
+
+    page = client.get("/api/chat/conversations?size=2", headers=headers).json()
+    assert page["total"] == 3 and len(page["items"]) == 2
+
+    beyond = client.get("/api/chat/conversations?page=5&size=2", headers=headers).json()
+    assert beyond["total"] == 3 and beyond["items"] == []
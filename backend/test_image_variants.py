@@ -0,0 +1,120 @@
+"""测试上传图片时生成多尺寸 WebP 版本、尺寸、模糊占位图以及解压炸弹防护"""
+
+import io
+from pathlib import Path
+
+import pytest
+
+from routers import uploads
+from services import image_service
+
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / "uploads" / "blog" / "images"
+
+
+def _image_bytes(size, fmt="JPEG", mode="RGB", **save_options):
+    buffer = io.BytesIO()
+    Image.new(mode, size, "orange").save(buffer, fmt, **save_options)
+    return buffer.getvalue()
+
+
+def _upload(client, headers, data, content_type="image/jpeg", filename="photo.jpg"):
+    return client.post("/api/uploads/image", files={"file": (filename, data, content_type)}, headers=headers)
+
+
+def test_upload_generates_webp_and_fallback_variants(client, make_user, upload_dir):
+    _, headers = make_user("alice")
+
+    response = _upload(client, headers, _image_bytes((2000, 1000)))
+
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["format"], data["width"], data["height"]) == ("jpeg", 2000, 1000)
+    assert data["placeholder"].startswith("data:image/webp;base64,")
+    assert set(data["variants"]) == {"webp", "jpeg"}
+
+    webp = data["variants"]["webp"]
+    assert [(item["width"], item["height"]) for item in webp] == [(320, 160), (640, 320), (1024, 512), (1600, 800)]
+    assert [item["width"] for item in data["variants"]["jpeg"]] == [320, 640, 1024, 1600]
+    assert data["srcset"]["webp"] == ", ".join(f"{item['url']} {item['width']}w" for item in webp)
+
+    for item in webp:
+        path = Path("uploads", item["url"].removeprefix("/static/"))
+        assert path.stat().st_size == item["size"]
+        with Image.open(path) as variant:
+            assert (variant.format, variant.size) == ("WEBP", (item["width"], item["height"]))
+
+
+def test_small_png_keeps_original_width_and_png_fallback(client, make_user):
+    _, headers = make_user("alice")
+
+    data = _upload(client, headers, _image_bytes((200, 100), "PNG", "RGBA"), "image/png", "logo.png").json()
+
+    assert [item["width"] for item in data["variants"]["webp"]] == [200]
+    assert [item["url"].endswith("-200w.png") for item in data["variants"]["png"]] == [True]
+
+
+def test_exif_orientation_is_applied(client, make_user):
+    _, headers = make_user("alice")
+    exif = Image.Exif()
+    exif[0x0112] = 6  # 顺时针旋转 90°
+
+    data = _upload(client, headers, _image_bytes((600, 400), exif=exif)).json()
+
+    assert (data["width"], data["height"]) == (400, 600)
+    assert [(item["width"], item["height"]) for item in data["variants"]["webp"]] == [(320, 480), (400, 600)]
+
+
+def test_animated_gif_is_not_resized(client, make_user):
+    _, headers = make_user("alice")
+    frames = [Image.new("RGB", (500, 300), color) for color in ("red", "blue")]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, "GIF", save_all=True, append_images=frames[1:])
+
+    data = _upload(client, headers, buffer.getvalue(), "image/gif", "anim.gif").json()
+
+    assert (data["format"], data["width"], data["height"]) == ("gif", 500, 300)
+    assert data["variants"] == {} and data["placeholder"] is None
+
+
+def test_decompression_bomb_is_rejected_before_decoding(client, make_user, monkeypatch, upload_dir):
+    monkeypatch.setattr(image_service.settings, "IMAGE_MAX_PIXELS", 1000 * 1000)
+    _, headers = make_user("alice")
+
+    response = _upload(client, headers, _image_bytes((2000, 1000)))
+
+    assert response.status_code == 422
+    assert "图片尺寸过大" in response.json()["detail"]
+    assert list(upload_dir.iterdir()) == []
+
+
+def test_invalid_and_oversized_uploads_are_rejected(client, make_user, monkeypatch, upload_dir):
+    _, headers = make_user("alice")
+
+    response = _upload(client, headers, b"not an image", "image/png", "fake.png")
+    assert response.status_code == 422 and response.json()["detail"] == "无法识别的图片文件"
+
+    monkeypatch.setattr(uploads, "MAX_IMAGE_SIZE", 1024)
+    response = _upload(client, headers, b"x" * 4096)
+    assert response.status_code == 413
+
+    assert list(upload_dir.iterdir()) == []
+
+
+def test_variant_lookup_and_delete(client, make_user, upload_dir):
+    _, headers = make_user("alice")
+    url = _upload(client, headers, _image_bytes((800, 600))).json()["url"]
+
+    found = client.post("/api/uploads/images/variants", json={"urls": [url, "/static/blog/images/missing.jpg"]}, headers=headers).json()
+    assert list(found) == [url]
+    assert [item["width"] for item in found[url]["variants"]["webp"]] == [320, 640, 800]
+
+    response = client.request("DELETE", "/api/uploads/media", json={"urls": [url]}, headers=headers)
+    assert response.status_code == 204
+    assert list(upload_dir.iterdir()) == []
+    assert client.post("/api/uploads/images/variants", json={"urls": [url]}, headers=headers).json() == {}
@@ -0,0 +1,168 @@
+"""
+测试长对话的历史读取：索引、按 ID 范围读取末尾窗口、上下文构建只读取需要的部分
+
+基准测试（对比 1 万条消息的对话与短对话的耗时）：
+    cd backend
+    python test_message_history.py
+"""
+
+import os
+import tempfile
+
+if __name__ == "__main__":
+    # 基准测试使用临时数据库，不写入开发数据库
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='v4corner-bench-')}/bench.db"
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, insert, text
+
+import models
+from database import engine
+from services import context_service
+
+
+def _seed_conversation(db, user_id: int, count: int, content_chars: int = 120) -> models.Conversation:
+    """批量写入一个包含 count 条消息的对话"""
+    conversation = models.Conversation(user_id=user_id, title="长对话", message_count=count)
+    db.add(conversation)
+    db.commit()
+
+    start = datetime(2025, 1, 1)
+    rows = [
+        {
+            "conversation_id": conversation.id,
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": f"第 {i} 条消息 " + "内容" * (content_chars // 2),
+            "truncated": False,
+            "created_at": start + timedelta(seconds=i),
+        }
+        for i in range(count)
+    ]
+    for offset in range(0, count, 5000):
+        db.execute(insert(models.Message), rows[offset:offset + 5000])
+    db.commit()
+    return conversation
+
+
+def test_tail_pages_follow_before_id_cursor(client, db, make_user):
+    user, headers = make_user("alice")
+    conversation = _seed_conversation(db, user.id, 120, content_chars=10)
+    url = f"/api/chat/conversations/{conversation.id}/messages"
+
+    first = client.get(f"{url}?tail=true&size=50", headers=headers).json()
+    assert first["total"] == 120
+    assert [item["content"].split()[1] for item in first["items"]][:2] == ["70", "71"]
+    assert first["items"][-1]["content"].startswith("第 119 条")
+
+    collected = first["items"]
+    cursor = first["next_before_id"]
+    while cursor is not None:
+        page = client.get(f"{url}?before_id={cursor}&size=50", headers=headers).json()
+        collected = page["items"] + collected
+        cursor = page["next_before_id"]
+
+    assert [item["content"].split()[1] for item in collected] == [str(i) for i in range(120)]
+
+
+def test_history_queries_use_conversation_indexes(db, make_user):
+    user, _ = make_user("alice")
+    conversation = _seed_conversation(db, user.id, 10, content_chars=10)
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        context_service.load_tail(db, conversation.id, 5, before_id=8)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    statement, parameters = statements[-1]
+    with engine.connect() as conn:
+        plan = " ".join(str(row[-1]) for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters))
+    assert "idx_messages_conversation_id" in plan
+    assert "TEMP B-TREE" not in plan  # 顺序直接来自索引，无需排序
+
+
+def test_build_context_reads_only_the_tail_window(db, make_user, monkeypatch):
+    user, _ = make_user("alice")
+    conversation = _seed_conversation(db, user.id, 3000)
+    requested = []
+    original = context_service.load_tail
+
+    def counting_load_tail(db, conversation_id, limit, **kwargs):
+        requested.append(limit)
+        return original(db, conversation_id, limit, **kwargs)
+
+    monkeypatch.setattr(context_service, "load_tail", counting_load_tail)
+
+    context = asyncio.run(context_service.build_context(db, conversation))
+
+    assert sum(requested) <= 4 * context_service.HISTORY_BATCH_SIZE + context_service.SUMMARY_SOURCE_LIMIT
+    assert context[0]["role"] == "system"
+    assert context[-1]["content"].startswith("第 2999 条")
+    # 摘要覆盖到窗口之前的最后一条消息，下次只需读取之后的消息
+    first_recent_index = int(context[1]["content"].split()[1])
+    summary_last = db.get(models.Message, conversation.summary_until_id)
+    assert int(summary_last.content.split()[1]) == first_recent_index - 1
+
+
+def _benchmark(sizes=(100, 1000, 10000), repeat: int = 20) -> None:
+    from database import Base, SessionLocal
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    user = models.User(username="bench", email="bench@example.com", password_hash="x", nickname="bench")
+    db.add(user)
+    db.commit()
+    user_id = user.id
+
+    def measure(fn) -> float:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+            db.expunge_all()
+        return (time.perf_counter() - started) / repeat * 1000
+
+    print(f"{'消息数':>8}{'OFFSET 读最后一页(ms)':>24}{'按 ID 读末尾 50 条(ms)':>26}{'整段读取(ms)':>16}{'build_context(ms)':>20}")
+    for size in sizes:
+        conversation = _seed_conversation(db, user_id, size)
+        conversation_id = conversation.id
+
+        def offset_last_page():
+            db.query(models.Message).filter(
+                models.Message.conversation_id == conversation_id
+            ).order_by(models.Message.created_at.asc()).offset(max(size - 50, 0)).limit(50).all()
+
+        def load_everything():
+            db.query(models.Message).filter(
+                models.Message.conversation_id == conversation_id
+            ).order_by(models.Message.id.desc()).all()
+
+        def build():
+            conv = db.get(models.Conversation, conversation_id)
+            conv.context_summary, conv.summary_until_id = None, 0
+            asyncio.run(context_service.build_context(db, conv))
+
+        print(
+            f"{size:>8}"
+            f"{measure(offset_last_page):>24.2f}"
+            f"{measure(lambda: context_service.load_tail(db, conversation_id, 50)):>26.2f}"
+            f"{measure(load_everything):>16.2f}"
+            f"{measure(build):>20.2f}"
+        )
+
+    with engine.connect() as conn:
+        plan = conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM messages WHERE conversation_id = 1 AND id < 100 ORDER BY id DESC LIMIT 50"
+        )).all()
+    print("\n按 ID 读取末尾窗口的查询计划：", " / ".join(str(row[-1]) for row in plan))
+    db.close()
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,127 @@
+"""测试对话消息全文检索：中文分词、按用户隔离、增量更新与相关度排序"""
+
+from sqlalchemy import event
+
+import models
+from database import engine
+from services import ai_service, search_service
+
+
+def _reply_with(monkeypatch, text: str) -> None:
+    async def fake_generate(messages, stream=False):
+        yield text
+
+    monkeypatch.setattr(ai_service, "generate_response", fake_generate)
+
+
+def _ask(client, headers, content: str, conversation_id: int | None = None) -> int:
+    if conversation_id is None:
+        conversation_id = client.post("/api/chat/conversations", json={"title": "新对话"}, headers=headers).json()["id"]
+    client.post(f"/api/chat/conversations/{conversation_id}/messages", json={"content": content}, headers=headers)
+    return conversation_id
+
+
+def _search(client, headers, q: str) -> dict:
+    response = client.get("/api/chat/search", params={"q": q}, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_tokenize_indexes_cjk_chars_and_bigrams():
+    assert search_service.tokenize("傅里叶 FFT变换") == ["傅", "里", "叶", "傅里", "里叶", "fft", "变", "换", "变换"]
+    assert search_service.query_terms("傅里叶变换") == ["傅里", "里叶", "叶变", "变换"]
+    assert search_service.query_terms("熵 Entropy") == ["熵", "entropy"]
+    assert search_service.query_terms("！？") == []
+
+
+def test_search_finds_answers_and_jumps_to_message(client, make_user, monkeypatch):
+    _, headers = make_user("alice")
+    _reply_with(monkeypatch, "傅里叶变换把信号分解为不同频率的正弦波。")
+    fourier = _ask(client, headers, "什么是傅里叶变换？")
+    _reply_with(monkeypatch, "梯度下降沿负梯度方向更新参数。")
+    _ask(client, headers, "什么是梯度下降？")
+
+    result = _search(client, headers, "傅里叶变换")
+
+    assert result["total"] == 2
+    roles = {item["role"] for item in result["items"]}
+    assert roles == {"user", "assistant"}
+    assert all(item["conversation_id"] == fourier for item in result["items"])
+
+    answer = next(item for item in result["items"] if item["role"] == "assistant")
+    assert "傅里叶变换" in answer["snippet"]
+    # 结果中的消息 ID 可直接定位到对话中的消息
+    messages = client.get(
+        f"/api/chat/conversations/{fourier}/messages?before_id={answer['message_id'] + 1}&size=1", headers=headers
+    ).json()["items"]
+    assert messages[0]["content"].startswith("傅里叶变换")
+
+    # 所有查询词项都要出现
+    assert _search(client, headers, "傅里叶 梯度")["total"] == 0
+    assert _search(client, headers, "正弦")["total"] == 1
+
+
+def test_more_relevant_messages_rank_first(client, make_user, monkeypatch):
+    _, headers = make_user("alice")
+    _reply_with(monkeypatch, "好的")
+    conversation = _ask(client, headers, "卷积神经网络里的卷积核、卷积层和卷积运算")
+    _ask(client, headers, "卷积是什么", conversation)
+    _ask(client, headers, "今天学了卷积，还有很多别的内容要复习，比如线性代数和概率论", conversation)
+
+    items = _search(client, headers, "卷积")["items"]
+
+    assert len(items) == 3
+    assert items[0]["snippet"].startswith("卷积神经网络")
+    assert items[0]["score"] > items[-1]["score"]
+
+
+def test_search_is_scoped_to_current_user(client, make_user, monkeypatch):
+    _, alice = make_user("alice")
+    _, bob = make_user("bob")
+    _reply_with(monkeypatch, "好的")
+    _ask(client, alice, "拉普拉斯变换的收敛域")
+
+    assert _search(client, alice, "拉普拉斯")["total"] == 1
+    assert _search(client, bob, "拉普拉斯")["total"] == 0
+
+
+def test_index_follows_regenerate_and_delete(client, db, make_user, monkeypatch):
+    _, headers = make_user("alice")
+    _reply_with(monkeypatch, "旧回答：矩阵的秩")
+    conversation = _ask(client, headers, "线性代数问题")
+
+    _reply_with(monkeypatch, "新回答：特征值分解")
+    client.post(f"/api/chat/conversations/{conversation}/messages/regenerate", headers=headers)
+
+    assert _search(client, headers, "秩")["total"] == 0
+    assert _search(client, headers, "特征值")["total"] == 1
+
+    client.delete(f"/api/chat/conversations/{conversation}", headers=headers)
+    assert _search(client, headers, "特征值")["total"] == 0
+    assert db.query(models.MessageSearchTerm).count() == 0
+
+
+def test_search_does_not_scan_message_content(client, make_user, monkeypatch):
+    _, headers = make_user("alice")
+    _reply_with(monkeypatch, "傅里叶变换把信号分解为不同频率的正弦波。")
+    _ask(client, headers, "什么是傅里叶变换？")
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        _search(client, headers, "傅里叶变换")
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    assert not any("LIKE" in statement.upper() for statement, _ in statements)
+
+    ranking, parameters = next(
+        (statement, parameters) for statement, parameters in statements
+        if "GROUP BY message_search_terms.message_id" in statement
+    )
+    with engine.connect() as conn:
+        plan = " ".join(str(row[-1]) for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {ranking}", parameters))
+    assert "idx_message_search_user_term" in plan
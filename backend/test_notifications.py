@@ -0,0 +1,152 @@
+"""测试通知未读计数器与批量操作"""
+
+import models
+from config import settings
+from services import notification_service
+
+
+def _notify(db, user_id: int, count: int = 1):
+    for i in range(count):
+        notification_service.create_notification(
+            db,
+            user_id=user_id,
+            type="system",
+            title=f"通知 {i}",
+            content="内容",
+        )
+    db.commit()
+
+
+def test_counter_follows_insert_read_and_delete(client, db, make_user):
+    user, headers = make_user("alice")
+    _notify(db, user.id, 3)
+
+    response = client.get("/api/notifications/unread-count", headers=headers)
+    assert response.json()["unread_count"] == 3
+
+    first_id = db.query(models.Notification.id).filter(
+        models.Notification.user_id == user.id
+    ).first()[0]
+    client.put(f"/api/notifications/{first_id}/read", headers=headers)
+    # 重复标记不会重复扣减
+    client.put(f"/api/notifications/{first_id}/read", headers=headers)
+    assert client.get("/api/notifications/unread-count", headers=headers).json()["unread_count"] == 2
+
+    unread_id = db.query(models.Notification.id).filter(
+        models.Notification.user_id == user.id,
+        models.Notification.is_read == False
+    ).first()[0]
+    client.delete(f"/api/notifications/{unread_id}", headers=headers)
+
+    listing = client.get("/api/notifications", headers=headers).json()
+    assert listing["total"] == 2
+    assert listing["unread_count"] == 1
+
+
+def test_bulk_read_and_clear_return_affected_counts(client, db, make_user):
+    user, headers = make_user("bob")
+    _notify(db, user.id, 5)
+
+    response = client.post("/api/notifications/read-all", headers=headers)
+    assert response.json()["marked_count"] == 5
+    assert client.get("/api/notifications/unread-count", headers=headers).json()["unread_count"] == 0
+
+    _notify(db, user.id, 2)
+    response = client.delete("/api/notifications", headers=headers)
+    assert response.json()["deleted_count"] == 5
+
+    response = client.delete("/api/notifications?all=true", headers=headers)
+    assert response.json()["deleted_count"] == 2
+    assert client.get("/api/notifications/unread-count", headers=headers).json()["unread_count"] == 0
+
+
+def test_reconcile_repairs_drift(client, db, make_user):
+    user, _ = make_user("carol")
+    _, admin_headers = make_user("admin", role="admin")
+    _notify(db, user.id, 4)
+
+    db.query(models.User).filter(models.User.id == user.id).update(
+        {models.User.unread_notification_count: 42}
+    )
+    db.commit()
+
+    response = client.post("/api/notifications/reconcile", headers=admin_headers)
+    assert response.json()["repaired_count"] == 1
+    assert notification_service.get_unread_count(db, user.id) == 4
+
+
+def test_likes_coalesce_into_one_grouped_notification(client, db, make_user):
+    author, author_headers = make_user("author")
+    blog = models.Blog(title="傅里叶变换", content="...", author_id=author.id, author_name="author")
+    db.add(blog)
+    db.commit()
+
+    for name in ["u1", "u2", "u3"]:
+        _, headers = make_user(name)
+        assert client.post(f"/api/blogs/{blog.id}/like", headers=headers).status_code == 200
+
+    listing = client.get("/api/notifications", headers=author_headers).json()
+    assert listing["total"] == 1
+    assert listing["unread_count"] == 1
+
+    item = listing["items"][0]
+    assert item["actor_count"] == 3
+    assert item["actors"] == ["u3", "u2", "u1"]
+    assert item["title"] == "u3 和其他 2 人 点赞了你的博客《傅里叶变换》"
+
+    # 已读后的新事件开启新的一组
+    client.post("/api/notifications/read-all", headers=author_headers)
+    _, headers = make_user("u4")
+    client.post(f"/api/blogs/{blog.id}/like", headers=headers)
+    listing = client.get("/api/notifications", headers=author_headers).json()
+    assert listing["total"] == 2
+    assert listing["items"][0]["title"] == "u4 点赞了你的博客《傅里叶变换》"
+
+
+def test_repeat_actor_beyond_display_list_is_not_recounted(client, db, make_user, monkeypatch):
+    monkeypatch.setattr(settings, "NOTIFICATION_GROUP_MAX_ACTORS", 2)
+    author, author_headers = make_user("author")
+    blog = models.Blog(title="傅里叶变换", content="...", author_id=author.id, author_name="author")
+    db.add(blog)
+    db.commit()
+
+    users = {name: make_user(name)[1] for name in ["u1", "u2", "u3"]}
+    for headers in users.values():
+        client.post(f"/api/blogs/{blog.id}/like", headers=headers)
+
+    # u1 已不在显示列表中：取消后再次点赞不会重复计数
+    client.delete(f"/api/blogs/{blog.id}/like", headers=users["u1"])
+    client.post(f"/api/blogs/{blog.id}/like", headers=users["u1"])
+
+    item = client.get("/api/notifications", headers=author_headers).json()["items"][0]
+    assert item["actor_count"] == 3
+    assert item["actors"] == ["u1", "u3"]
+    assert item["title"] == "u1 和其他 2 人 点赞了你的博客《傅里叶变换》"
+
+
+def test_important_notice_is_broadcast_and_merged_at_read_time(client, db, make_user):
+    _, officer_headers = make_user("officer", role="committee")
+    _, student_headers = make_user("student")
+
+    response = client.post(
+        "/api/notices",
+        json={"title": "期中考试安排", "content": "周五上午九点", "is_important": True},
+        headers=officer_headers,
+    )
+    assert response.status_code == 201
+    # 发布只写一行广播，不为成员逐个插入
+    assert db.query(models.BroadcastNotification).count() == 1
+    assert db.query(models.Notification).count() == 0
+
+    listing = client.get("/api/notifications", headers=student_headers).json()
+    assert listing["total"] == 1
+    assert listing["unread_count"] == 1
+    item = listing["items"][0]
+    assert item["is_broadcast"] and not item["is_read"]
+
+    client.put(f"/api/notifications/broadcasts/{item['id']}/read", headers=student_headers)
+    assert client.get("/api/notifications/unread-count", headers=student_headers).json()["unread_count"] == 0
+
+    response = client.delete("/api/notifications", headers=student_headers)
+    assert response.json()["deleted_count"] == 1
+    assert client.get("/api/notifications", headers=student_headers).json()["total"] == 0
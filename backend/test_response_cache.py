@@ -0,0 +1,123 @@
+"""测试 AI 回复缓存"""
+
+import json
+
+import pytest
+
+from config import settings
+from services import ai_service, response_cache
+
+REPLY = "作业截止时间是本周五 23:59，请在网站的作业页面提交。"
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    """替身服务商：记录调用次数，并启用缓存"""
+    calls = []
+
+    async def fake_generate(messages, stream=False):
+        calls.append(messages)
+        yield REPLY[:10]
+        yield REPLY[10:]
+
+    monkeypatch.setattr(ai_service, "generate_response", fake_generate)
+    monkeypatch.setattr(settings, "AI_RESPONSE_CACHE_ENABLED", True)
+    response_cache.clear()
+    yield calls
+    response_cache.clear()
+
+
+def _ask(client, headers, content: str, conversation_id: int | None = None) -> tuple[int, str]:
+    """在对话中以流式 v2 协议提问，返回 (对话 ID, 拼接后的回答)"""
+    if conversation_id is None:
+        conversation_id = client.post(
+            "/api/chat/conversations", json={"title": "新对话"}, headers=headers
+        ).json()["id"]
+    body = client.post(
+        f"/api/chat/conversations/{conversation_id}/messages?stream=true&protocol=2",
+        json={"content": content},
+        headers=headers,
+    ).text
+    deltas = [
+        json.loads(line[len("data: "):])["delta"]
+        for block in body.split("\n\n")
+        if "event: delta" in block
+        for line in block.split("\n")
+        if line.startswith("data: ")
+    ]
+    return conversation_id, "".join(deltas)
+
+
+def test_same_first_question_is_served_from_cache(client, make_user, provider):
+    _, alice = make_user("alice")
+    _, bob = make_user("bob")
+
+    _, first = _ask(client, alice, "作业什么时候截止？")
+    # 仅大小写、全半角、空白和末尾标点不同的问题视为相同
+    _, second = _ask(client, bob, " 作业什么时候截止 ? ")
+
+    assert first == second == REPLY
+    assert len(provider) == 1
+    stats = response_cache.get_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_private_history_is_never_shared_across_users(client, make_user, provider):
+    _, alice = make_user("alice")
+    _, bob = make_user("bob")
+
+    alice_conversation, _ = _ask(client, alice, "我的学号是 2023001")
+    bob_conversation, _ = _ask(client, bob, "我的学号是 2023001")
+    assert len(provider) == 1  # 新对话第一句可以共享
+
+    _ask(client, alice, "帮我总结一下", alice_conversation)
+    _ask(client, bob, "帮我总结一下", bob_conversation)
+
+    # 上下文包含各自的历史消息，即使内容相同也分别调用
+    assert len(provider) == 3
+
+
+def test_regenerate_bypasses_cache(client, make_user, provider):
+    _, headers = make_user("alice")
+    conversation_id, _ = _ask(client, headers, "怎么发博客")
+
+    client.post(f"/api/chat/conversations/{conversation_id}/messages/regenerate", headers=headers)
+
+    assert len(provider) == 2
+
+
+def test_ttl_and_lru_eviction(monkeypatch):
+    monkeypatch.setattr(settings, "AI_RESPONSE_CACHE_MAX_ENTRIES", 2)
+    response_cache.clear()
+
+    response_cache.put("a", "A")
+    response_cache.put("b", "B")
+    assert response_cache.get("a") == "A"  # a 变为最近使用
+    response_cache.put("c", "C")
+
+    assert response_cache.get("b") is None
+    assert response_cache.get("a") == "A"
+    assert response_cache.get_stats()["evictions"] == 1
+
+    monkeypatch.setattr(settings, "AI_RESPONSE_CACHE_TTL_SECONDS", -1)
+    response_cache.put("d", "D")
+    assert response_cache.get("d") is None
+    assert response_cache.get_stats()["expirations"] == 1
+    response_cache.clear()
+
+
+def test_cache_is_opt_in(client, make_user, monkeypatch):
+    calls = []
+
+    async def fake_generate(messages, stream=False):
+        calls.append(messages)
+        yield REPLY
+
+    monkeypatch.setattr(ai_service, "generate_response", fake_generate)
+    _, alice = make_user("alice")
+    _, bob = make_user("bob")
+
+    _ask(client, alice, "网站怎么用")
+    _ask(client, bob, "网站怎么用")
+
+    assert len(calls) == 2
@@ -0,0 +1,59 @@
+"""测试数据保留任务"""
+
+from datetime import datetime, timedelta
+
+import models
+from config import settings
+from services import retention_service
+
+
+def test_retention_dry_run_then_batched_delete(db, make_user, monkeypatch):
+    monkeypatch.setattr(settings, "RETENTION_BATCH_SIZE", 2)
+    monkeypatch.setattr(settings, "RETENTION_ABANDONED_CONVERSATION_DAYS", 365)
+    user, _ = make_user("alice")
+    old = datetime.utcnow() - timedelta(days=400)
+
+    for i in range(5):
+        db.add(models.VerificationCode(email=f"{i}@example.com", code="123456", expires_at=old))
+    db.add(models.VerificationCode(email="fresh@example.com", code="123456", expires_at=datetime.utcnow()))
+    db.add(models.Notification(user_id=user.id, type="system", title="t", content="c", is_read=True, last_event_at=old))
+    db.add(models.Notification(user_id=user.id, type="system", title="t", content="c", is_read=False, last_event_at=old))
+    conversation = models.Conversation(user_id=user.id, title="旧对话", updated_at=old)
+    db.add(conversation)
+    db.flush()
+    for i in range(3):
+        db.add(models.Message(conversation_id=conversation.id, role="user", content=str(i)))
+    db.commit()
+
+    preview = {r["table"]: r for r in retention_service.run_retention(db, dry_run=True)}
+    assert preview["verification_codes"]["rows"] == 5
+    assert preview["verification_codes"]["batches"] == 3
+    assert preview["notifications"]["rows"] == 1
+    assert preview["conversations"]["rows"] == 1
+    assert db.query(models.VerificationCode).count() == 6
+
+    reports = retention_service.run_retention(db)
+    removed = {(r["table"], r["rows"]) for r in reports}
+    assert ("verification_codes", 5) in removed
+    assert ("messages", 3) in removed
+    assert ("conversations", 1) in removed
+
+    assert db.query(models.VerificationCode).count() == 1
+    # 未读通知不受影响
+    assert db.query(models.Notification).filter(models.Notification.is_read == False).count() == 1
+    assert db.query(models.Conversation).count() == 0
+
+
+def test_conversations_are_kept_unless_explicitly_enabled(db, make_user):
+    user, _ = make_user("alice")
+    old = datetime.utcnow() - timedelta(days=4000)
+    conversation = models.Conversation(user_id=user.id, title="旧对话", updated_at=old)
+    db.add(conversation)
+    db.flush()
+    db.add(models.Message(conversation_id=conversation.id, role="user", content="你好"))
+    db.commit()
+
+    # 默认配置下不删除聊天记录
+    tables = {r["table"] for r in retention_service.run_retention(db)}
+    assert not tables & {"conversations", "messages"}
+    assert db.query(models.Message).count() == 1
@@ -0,0 +1,100 @@
+"""
+测试流式输出的增量合并
+
+直接运行可输出有无合并时的帧数、帧率与完成时间对比：
+    cd backend
+    python test_stream_coalescing.py
+"""
+
+import asyncio
+import time
+
+from services.streaming import coalesce_deltas
+
+TOKEN = "字"
+
+
+async def _provider(count: int, delay: float = 0.0, stalls: dict | None = None, state: dict | None = None):
+    """本地替身服务商：每 delay 秒产生一个 token，stalls 指定在第几个 token 后额外停顿"""
+    try:
+        for i in range(count):
+            if delay:
+                await asyncio.sleep(delay)
+            else:
+                await asyncio.sleep(0)
+            yield TOKEN
+            if stalls and i in stalls:
+                await asyncio.sleep(stalls[i])
+    finally:
+        if state is not None:
+            state["closed"] = True
+
+
+async def _measure(source, flush_ms: int, flush_chars: int) -> dict:
+    """统计帧数、帧到达时间与完成时间"""
+    started = time.perf_counter()
+    frames = []
+    async for frame in coalesce_deltas(source, flush_ms, flush_chars):
+        frames.append((time.perf_counter() - started, frame))
+    elapsed = time.perf_counter() - started
+    return {
+        "frames": frames,
+        "seconds": elapsed,
+        "fps": len(frames) / elapsed if elapsed else 0.0,
+        "content": "".join(frame for _, frame in frames),
+    }
+
+
+def test_fast_provider_is_coalesced_into_few_frames():
+    result = asyncio.run(_measure(_provider(2000), flush_ms=50, flush_chars=64))
+
+    assert result["content"] == TOKEN * 2000
+    # 第一个 token 立即输出，不增加首字延迟
+    assert result["frames"][0][1] == TOKEN
+    assert len(result["frames"]) <= 2000 // 64 + 2
+
+
+def test_slow_provider_is_never_delayed():
+    delay, count = 0.03, 10
+    result = asyncio.run(_measure(_provider(count, delay=delay), flush_ms=20, flush_chars=64))
+
+    # 服务商慢于合并窗口：每个 token 到达即输出，没有额外等待
+    assert len(result["frames"]) == count
+    assert result["seconds"] < delay * count + 0.1
+
+
+def test_pending_delta_is_flushed_when_window_expires():
+    # 两个 token 后服务商停顿 0.3 秒：第二个 token 应在窗口到期时输出，而不是等到停顿结束
+    result = asyncio.run(_measure(_provider(3, stalls={1: 0.3}), flush_ms=30, flush_chars=64))
+
+    times = [at for at, _ in result["frames"]]
+    assert result["content"] == TOKEN * 3
+    assert len(times) == 3
+    assert times[1] < 0.2
+
+
+def test_consumer_exit_cancels_provider_stream():
+    state = {"closed": False}
+
+    async def scenario():
+        stream = coalesce_deltas(_provider(100, delay=0.01, state=state), 50, 64)
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(scenario()) == TOKEN
+    assert state["closed"]
+
+
+if __name__ == "__main__":
+    scenarios = [
+        ("快速服务商 2000 token / 原先每 token sleep 10ms", lambda: _provider(2000, delay=0.01), 0, 0),
+        ("快速服务商 2000 token / 不合并", lambda: _provider(2000), 0, 0),
+        ("快速服务商 2000 token / 合并 50ms 或 64 字", lambda: _provider(2000), 50, 64),
+        ("慢速服务商 50 token, 40ms/token / 不合并", lambda: _provider(50, delay=0.04), 0, 0),
+        ("慢速服务商 50 token, 40ms/token / 合并 50ms 或 64 字", lambda: _provider(50, delay=0.04), 50, 64),
+    ]
+    print(f"{'场景':<48}{'帧数':>8}{'帧/秒':>12}{'完成时间(s)':>14}")
+    for name, factory, flush_ms, flush_chars in scenarios:
+        result = asyncio.run(_measure(factory(), flush_ms, flush_chars))
+        print(f"{name:<48}{len(result['frames']):>8}{result['fps']:>12.1f}{result['seconds']:>14.3f}")
@@ -0,0 +1,210 @@
+"""测试大视频断点续传：预分配、分块校验、中断后续传、完成、过期清理与上传吞吐量"""
+
+import asyncio
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+import pytest
+
+import models
+from config import settings
+from main import app
+from services import storage_service, upload_service
+
+CHUNK_SIZE = 64 * 1024
+
+
+@pytest.fixture(autouse=True)
+def upload_settings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, "UPLOAD_CHUNK_SIZE", CHUNK_SIZE)
+    monkeypatch.setattr(settings, "VIDEO_TRANSCODE_WORKERS", 0)
+
+
+def _create(client, headers, size, content_type="video/mp4"):
+    return client.post(
+        "/api/uploads/sessions",
+        json={"filename": "lecture.mp4", "content_type": content_type, "size": size},
+        headers=headers,
+    )
+
+
+def _put(client, headers, session_id, data, offset, checksum=None):
+    return client.put(
+        f"/api/uploads/sessions/{session_id}/chunks?offset={offset}",
+        content=data,
+        headers={**headers, "X-Chunk-SHA256": checksum or hashlib.sha256(data).hexdigest()},
+    )
+
+
+def _chunks(payload):
+    return [(offset, payload[offset:offset + CHUNK_SIZE]) for offset in range(0, len(payload), CHUNK_SIZE)]
+
+
+def test_resume_after_interrupted_upload(client, make_user):
+    _, headers = make_user("alice")
+    payload = os.urandom(CHUNK_SIZE * 5 + 1000)
+
+    session = _create(client, headers, len(payload)).json()
+    assert (session["chunk_size"], session["total_chunks"], session["received_bytes"]) == (CHUNK_SIZE, 6, 0)
+    # 临时文件按总大小预分配，不在 uploads（静态目录）下
+    part = upload_service.session_path(session["id"])
+    assert part.stat().st_size == len(payload) and not part.is_relative_to("uploads")
+
+    # 第一次连接：传了 0、1、3 块后中断（第 3 块乱序）
+    chunks = _chunks(payload)
+    for offset, data in (chunks[0], chunks[1], chunks[3]):
+        assert _put(client, headers, session["id"], data, offset).status_code == 200
+
+    # 重新连接后查询缺失的分块，只补传缺失部分
+    state = client.get(f"/api/uploads/sessions/{session['id']}", headers=headers).json()
+    assert state["received_ranges"] == [[0, 2 * CHUNK_SIZE], [3 * CHUNK_SIZE, 4 * CHUNK_SIZE]]
+    assert state["missing_chunks"] == [2, 4, 5]
+    assert state["received_bytes"] == 3 * CHUNK_SIZE
+
+    for index in state["missing_chunks"]:
+        offset, data = chunks[index]
+        state = _put(client, headers, session["id"], data, offset).json()
+    assert state["missing_chunks"] == [] and state["received_ranges"] == [[0, len(payload)]]
+
+    result = client.post(f"/api/uploads/sessions/{session['id']}/complete", headers=headers).json()
+    assert result["url"].startswith("/static/blog/videos/") and result["size"] == len(payload)
+    assert Path("uploads", result["url"].removeprefix("/static/")).read_bytes() == payload
+    assert not part.exists()
+
+    # 完成请求的响应丢失时可以重试，返回相同结果
+    retry = client.post(f"/api/uploads/sessions/{session['id']}/complete", headers=headers).json()
+    assert retry["url"] == result["url"]
+
+
+def test_concurrent_complete_moves_file_once(client, db, make_user, monkeypatch):
+    _, headers = make_user("alice")
+    payload = os.urandom(CHUNK_SIZE * 2)
+    session_id = _create(client, headers, len(payload)).json()["id"]
+    for offset, data in _chunks(payload):
+        _put(client, headers, session_id, data, offset)
+
+    # 计算哈希较慢时，第二个完成请求在第一个处理期间到达
+    hash_file = storage_service.hash_file
+    def slow_hash(path):
+        time.sleep(0.2)
+        return hash_file(path)
+    monkeypatch.setattr(storage_service, "hash_file", slow_hash)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as http:
+            path = f"/api/uploads/sessions/{session_id}/complete"
+            return await asyncio.gather(http.post(path, headers=headers), http.post(path, headers=headers))
+
+    first, second = asyncio.run(scenario())
+
+    assert first.status_code == 200
+    assert second.status_code == 409 and second.json()["detail"] == "上传正在完成，请稍后重试"
+    assert second.headers["retry-after"] == "1"
+    assert db.query(models.StoredObject).one().ref_count == 1
+
+    # 处理完成后重试返回相同结果
+    retry = client.post(f"/api/uploads/sessions/{session_id}/complete", headers=headers)
+    assert retry.status_code == 200 and retry.json()["url"] == first.json()["url"]
+
+
+def test_chunk_validation(client, make_user):
+    _, headers = make_user("alice")
+    payload = os.urandom(CHUNK_SIZE * 2 + 10)
+    session_id = _create(client, headers, len(payload)).json()["id"]
+    (first, data), _, (last, tail) = _chunks(payload)
+
+    # 校验和不匹配：不记录该分块，重传后成功
+    response = _put(client, headers, session_id, data, first, checksum="0" * 64)
+    assert response.status_code == 400 and response.json()["detail"] == "分块校验失败，请重新上传该分块"
+    assert _put(client, headers, session_id, data, first).json()["missing_chunks"] == [1, 2]
+
+    assert _put(client, headers, session_id, data, 100).status_code == 400  # 偏移量未对齐
+    assert _put(client, headers, session_id, data[:-1], CHUNK_SIZE).status_code == 400  # 大小不足
+    assert _put(client, headers, session_id, tail + b"x", last).status_code == 400  # 最后一块过长
+    assert _put(client, headers, session_id, tail, len(payload) + CHUNK_SIZE).status_code == 400  # 超出文件
+
+    response = client.post(f"/api/uploads/sessions/{session_id}/complete", headers=headers)
+    assert response.status_code == 409 and response.json()["detail"] == "还有 2 个分块未上传"
+
+
+def test_rejected_reupload_keeps_accepted_chunk(client, make_user):
+    _, headers = make_user("alice")
+    payload = os.urandom(CHUNK_SIZE * 2)
+    session_id = _create(client, headers, len(payload)).json()["id"]
+    chunks = _chunks(payload)
+    for offset, data in chunks:
+        _put(client, headers, session_id, data, offset)
+
+    # 已收到的分块被错误内容重传：返回 400，原数据不被覆盖
+    offset, data = chunks[0]
+    response = _put(client, headers, session_id, bytes(len(data)), offset, checksum=hashlib.sha256(data).hexdigest())
+    assert response.status_code == 400
+    assert _put(client, headers, session_id, data[:100], offset).status_code == 400  # 大小不足
+    assert sorted(p.name for p in Path(settings.UPLOAD_SESSION_DIR).iterdir()) == [f"{session_id}.part"]
+
+    result = client.post(f"/api/uploads/sessions/{session_id}/complete", headers=headers).json()
+    assert Path("uploads", result["url"].removeprefix("/static/")).read_bytes() == payload
+
+
+def test_session_limits_and_ownership(client, make_user, monkeypatch):
+    _, alice = make_user("alice")
+    _, bob = make_user("bob")
+
+    assert _create(client, alice, 100, content_type="application/zip").status_code == 422
+    assert _create(client, alice, 3 * 1024 ** 3).status_code == 413
+
+    session_id = _create(client, alice, 100).json()["id"]
+    assert client.get(f"/api/uploads/sessions/{session_id}", headers=bob).status_code == 403
+    assert _put(client, bob, session_id, b"x" * 100, 0).status_code == 403
+    assert client.get("/api/uploads/sessions/missing", headers=alice).status_code == 404
+
+    monkeypatch.setattr(settings, "UPLOAD_MAX_SESSIONS_PER_USER", 1)
+    assert _create(client, alice, 100).status_code == 429
+
+    # 取消后删除临时文件，可以开始新的上传
+    assert client.delete(f"/api/uploads/sessions/{session_id}", headers=alice).status_code == 204
+    assert not upload_service.session_path(session_id).exists()
+    assert _create(client, alice, 100).status_code == 201
+
+
+def test_abandoned_sessions_expire(client, db, make_user):
+    _, headers = make_user("alice")
+    abandoned = _create(client, headers, CHUNK_SIZE * 2).json()["id"]
+    active = _create(client, headers, CHUNK_SIZE * 2).json()["id"]
+    _put(client, headers, abandoned, b"a" * CHUNK_SIZE, 0)
+
+    db.query(models.UploadSession).filter(models.UploadSession.id == abandoned).update(
+        {"expires_at": datetime.utcnow() - timedelta(minutes=1)}
+    )
+    db.commit()
+
+    assert upload_service.expire_sessions(db) == 1
+    assert not upload_service.session_path(abandoned).exists()
+    assert upload_service.session_path(active).exists()
+    assert db.query(models.UploadChunk).filter(models.UploadChunk.session_id == abandoned).count() == 0
+    assert client.get(f"/api/uploads/sessions/{abandoned}", headers=headers).status_code == 404
+
+
+def test_chunked_upload_throughput(client, make_user, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_CHUNK_SIZE", 1024 * 1024)
+    _, headers = make_user("alice")
+    payload = os.urandom(32 * 1024 * 1024)
+
+    session_id = _create(client, headers, len(payload)).json()["id"]
+    started = time.perf_counter()
+    for offset in range(0, len(payload), 1024 * 1024):
+        data = payload[offset:offset + 1024 * 1024]
+        assert _put(client, headers, session_id, data, offset).status_code == 200
+    result = client.post(f"/api/uploads/sessions/{session_id}/complete", headers=headers).json()
+    elapsed = time.perf_counter() - started
+
+    # 每块的数据库记录和校验开销应远小于传输本身：进程内传输至少应达到 20MB/s
+    throughput = len(payload) / (1024 * 1024) / elapsed
+    assert throughput > 20, f"{throughput:.1f}MB/s"
+    assert hashlib.sha256(Path("uploads", result["url"].removeprefix("/static/")).read_bytes()).digest() == hashlib.sha256(payload).digest()
@@ -0,0 +1,147 @@
+"""测试视频后台转码：进度解析、任务进度查询、完成后博客切换到压缩版本（使用模拟的 FFmpeg 脚本）"""
+
+import sys
+import time
+
+import pytest
+
+import models
+from services import transcode_service
+from services.transcode_service import parse_progress
+
+FAKE_FFPROBE = """#!{python}
+print("4.0")
+"""
+
+# 输出 25%、50% 的进度后等待放行文件出现，再写出比原文件小的结果
+FAKE_FFMPEG = """#!{python}
+import os, sys, time
+if {fail!r}:
+    sys.stderr.write("boom: invalid data found when processing input\\n")
+    sys.exit(1)
+for us in (1000000, 2000000):
+    print(f"out_time_us={{us}}\\nprogress=continue", flush=True)
+deadline = time.time() + 10
+while not os.path.exists({release!r}) and time.time() < deadline:
+    time.sleep(0.02)
+open(sys.argv[-1], "wb").write(b"c" * 1024)
+print("out_time_us=4000000\\nprogress=end", flush=True)
+"""
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    """在临时目录中上传，并用脚本代替 FFmpeg / FFprobe"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(transcode_service, "PROGRESS_UPDATE_SECONDS", 0)
+    release = tmp_path / "release"
+
+    def install(fail: bool = False):
+        ffmpeg = tmp_path / "ffmpeg"
+        ffprobe = tmp_path / "ffprobe"
+        ffmpeg.write_text(FAKE_FFMPEG.format(python=sys.executable, fail=fail, release=str(release)))
+        ffprobe.write_text(FAKE_FFPROBE.format(python=sys.executable))
+        ffmpeg.chmod(0o755)
+        ffprobe.chmod(0o755)
+        monkeypatch.setattr(transcode_service, "resolve_ffmpeg", lambda: (str(ffmpeg), str(ffprobe)))
+        return release
+
+    yield install
+    transcode_service.shutdown(wait=True)
+
+
+def _upload(client, headers, size=4096):
+    response = client.post(
+        "/api/uploads/video",
+        files={"file": ("lecture.mp4", b"v" * size, "video/mp4")},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def _wait_for(client, headers, job_id, predicate, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/uploads/jobs/{job_id}", headers=headers).json()
+        if predicate(job):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"转码任务状态未达到预期: {job}")
+
+
+def test_parse_progress():
+    assert parse_progress("out_time_us=1500000\n", 3.0) == 50.0
+    assert parse_progress("out_time_ms=1500000", 3.0) == 50.0
+    assert parse_progress("out_time_us=N/A", 3.0) is None
+    assert parse_progress("out_time_us=9000000", 3.0) == 99.9
+    assert parse_progress("out_time_us=1500000", None) is None
+    assert parse_progress("frame=42", 3.0) is None
+    assert parse_progress("progress=continue", 3.0) is None
+    assert parse_progress("progress=end", None) == 100.0
+
+
+def test_blog_switches_to_compressed_rendition(client, db, make_user, fake_ffmpeg):
+    release = fake_ffmpeg()
+    _, headers = make_user("alice")
+
+    uploaded = _upload(client, headers)
+    assert uploaded["compressed"] is False and uploaded["job_id"] is not None
+    source_url = uploaded["url"]
+
+    job = _wait_for(client, headers, uploaded["job_id"], lambda job: job["progress"] >= 50)
+    assert job["status"] == "running" and job["duration"] == 4.0 and job["progress"] == 50.0
+
+    # 转码尚未完成时保存的博客先使用原视频
+    content = f'<p>课堂录像</p><video controls><source src="{source_url}"></video>'
+    blog = client.post("/api/blogs", json={"title": "录像", "content": content}, headers=headers).json()
+    assert source_url in blog["content"]
+
+    release.touch()
+    job = _wait_for(client, headers, uploaded["job_id"], lambda job: job["status"] == "completed")
+    output_url = job["output_url"]
+    assert output_url.endswith("-compressed.mp4") and job["progress"] == 100.0
+    assert (job["source_size"], job["output_size"]) == (4096, 1024)
+
+    db.expire_all()
+    saved = db.get(models.Blog, blog["id"])
+    assert output_url in saved.content and source_url not in saved.content
+
+    # 之后保存的博客即使仍引用原地址，也会改用压缩版本
+    later = client.post("/api/blogs", json={"title": "再次引用", "content": content}, headers=headers).json()
+    assert output_url in later["content"]
+
+
+def test_failed_transcode_keeps_original(client, make_user, fake_ffmpeg):
+    fake_ffmpeg(fail=True)
+    _, headers = make_user("alice")
+
+    uploaded = _upload(client, headers)
+    job = _wait_for(client, headers, uploaded["job_id"], lambda job: job["status"] != "queued" and job["finished_at"])
+
+    assert job["status"] == "failed" and "boom" in job["error"]
+    assert job["output_url"] is None
+
+    content = f'<video controls><source src="{uploaded["url"]}"></video>'
+    blog = client.post("/api/blogs", json={"title": "录像", "content": content}, headers=headers).json()
+    assert uploaded["url"] in blog["content"]
+
+
+def test_job_is_visible_only_to_uploader(client, make_user, fake_ffmpeg):
+    fake_ffmpeg(fail=True)
+    _, alice = make_user("alice")
+    _, bob = make_user("bob")
+
+    job_id = _upload(client, alice)["job_id"]
+
+    assert client.get(f"/api/uploads/jobs/{job_id}", headers=bob).status_code == 403
+    assert client.get("/api/uploads/jobs/999999", headers=alice).status_code == 404
+
+
+def test_transcoding_disabled(client, make_user, fake_ffmpeg, monkeypatch):
+    monkeypatch.setattr(transcode_service.settings, "VIDEO_TRANSCODE_WORKERS", 0)
+    _, headers = make_user("alice")
+
+    uploaded = _upload(client, headers)
+
+    assert uploaded["job_id"] is None
@@ -13,6 +13,8 @@ import type {
   MessageFeedbackCreate,
   MessageFeedbackResponse,
   MessageListResponse,
+  MessageSearchResponse,
+  MessageVersionListResponse,
   StreamChunk
 } from '../types/chat';
 
@@ -77,16 +79,36 @@ export async function deleteConversation(conversationId: number): Promise<void>
 
 // ============= Message API =============
 
+/**
+ * 在自己的所有对话中检索消息内容（按相关度排序）
+ */
+export async function searchMessages(params: {
+  q: string;
+  page?: number;
+  size?: number;
+}): Promise<MessageSearchResponse> {
+  const queryParams = new URLSearchParams();
+  queryParams.set('q', params.q);
+  if (params.page) queryParams.set('page', params.page.toString());
+  if (params.size) queryParams.set('size', params.size.toString());
+
+  return apiRequest<MessageSearchResponse>(`/api/chat/search?${queryParams.toString()}`);
+}
+
 /**
  * 获取对话的消息列表
  */
 export async function getMessages(conversationId: number, params: {
   page?: number;
   size?: number;
+  tail?: boolean;
+  before_id?: number;
 } = {}): Promise<MessageListResponse> {
   const queryParams = new URLSearchParams();
   if (params.page) queryParams.set('page', params.page.toString());
   if (params.size) queryParams.set('size', params.size.toString());
+  if (params.tail) queryParams.set('tail', 'true');
+  if (params.before_id) queryParams.set('before_id', params.before_id.toString());
 
   return apiRequest<MessageListResponse>(
     `/api/chat/conversations/${conversationId}/messages?${queryParams.toString()}`
@@ -110,14 +132,16 @@ export async function sendMessage(
 }
 
 /**
- * 发送消息（流式）
+ * 发起流式 AI 请求并逐帧回调（发送消息 / 重新生成共用）
  */
-export async function sendMessageStream(
-  conversationId: number,
-  data: MessageCreate,
+async function postChatStream(
+  path: string,
+  body: unknown,
+  failureMessage: string,
   onChunk: (chunk: StreamChunk) => void,
   onComplete?: () => void,
-  onError?: (error: Error) => void
+  onError?: (error: Error) => void,
+  onQueued?: (position: number) => void
 ): Promise<void> {
   const token = getAccessToken();
   if (!token) {
@@ -126,19 +150,23 @@ export async function sendMessageStream(
 
   try {
     const response = await fetch(
-      apiUrl(`/api/chat/conversations/${conversationId}/messages?stream=true`),
+      apiUrl(path),
       {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
           'Authorization': `Bearer ${token}`,
         },
-        body: JSON.stringify(data),
+        body: JSON.stringify(body),
       }
     );
 
     if (!response.ok) {
-      throw new Error('发送消息失败');
+      if (response.status === 429) {
+        const retryAfter = response.headers.get('Retry-After');
+        throw new Error(`AI 服务繁忙，请${retryAfter ? ` ${retryAfter} 秒后` : '稍后'}重试`);
+      }
+      throw new Error(failureMessage);
     }
 
     const reader = response.body?.getReader();
@@ -148,6 +176,7 @@ export async function sendMessageStream(
 
     const decoder = new TextDecoder();
     let buffer = '';
+    let eventName = 'message';
 
     while (true) {
       const { done, value } = await reader.read();
@@ -162,7 +191,11 @@ export async function sendMessageStream(
       buffer = lines.pop() || '';
 
       for (const line of lines) {
-        if (line.startsWith('data: ')) {
+        if (line === '') {
+          eventName = 'message';
+        } else if (line.startsWith('event: ')) {
+          eventName = line.slice(7).trim();
+        } else if (line.startsWith('data: ')) {
           const data = line.slice(6).trim();
 
           if (data === '[DONE]') {
@@ -171,8 +204,13 @@ export async function sendMessageStream(
           }
 
           try {
-            const chunk = JSON.parse(data) as StreamChunk;
-            onChunk(chunk);
+            if (eventName === 'queued') {
+              // 服务器繁忙时的排队位置
+              onQueued?.((JSON.parse(data) as { position: number }).position);
+            } else {
+              const chunk = JSON.parse(data) as StreamChunk;
+              onChunk(chunk);
+            }
           } catch (e) {
             console.error('解析SSE数据失败:', e);
           }
@@ -185,6 +223,28 @@ export async function sendMessageStream(
   }
 }
 
+/**
+ * 发送消息（流式）
+ */
+export async function sendMessageStream(
+  conversationId: number,
+  data: MessageCreate,
+  onChunk: (chunk: StreamChunk) => void,
+  onComplete?: () => void,
+  onError?: (error: Error) => void,
+  onQueued?: (position: number) => void
+): Promise<void> {
+  return postChatStream(
+    `/api/chat/conversations/${conversationId}/messages?stream=true`,
+    data,
+    '发送消息失败',
+    onChunk,
+    onComplete,
+    onError,
+    onQueued
+  );
+}
+
 /**
  * 重新生成最后一条 AI 消息
  */
@@ -198,6 +258,39 @@ export async function regenerateMessage(conversationId: number): Promise<Message
   );
 }
 
+/**
+ * 重新生成最后一条 AI 消息（流式，原回答保存为历史版本）
+ */
+export async function regenerateMessageStream(
+  conversationId: number,
+  onChunk: (chunk: StreamChunk) => void,
+  onComplete?: () => void,
+  onError?: (error: Error) => void,
+  onQueued?: (position: number) => void
+): Promise<void> {
+  return postChatStream(
+    `/api/chat/conversations/${conversationId}/messages/regenerate?stream=true`,
+    {},
+    '重新生成失败',
+    onChunk,
+    onComplete,
+    onError,
+    onQueued
+  );
+}
+
+/**
+ * 获取 AI 消息重新生成前的历史版本
+ */
+export async function getMessageVersions(
+  conversationId: number,
+  messageId: number
+): Promise<MessageVersionListResponse> {
+  return apiRequest<MessageVersionListResponse>(
+    `/api/chat/conversations/${conversationId}/messages/${messageId}/versions`
+  );
+}
+
 /**
  * 对 AI 消息进行反馈
  */
@@ -245,3 +338,53 @@ export function downloadExportedConversation(content: string, filename: string):
   document.body.removeChild(link);
   URL.revokeObjectURL(url);
 }
+
+/**
+ * 以文件形式下载导出内容（服务端流式生成）
+ */
+async function downloadExport(path: string, fallbackName: string): Promise<void> {
+  const token = getAccessToken();
+  if (!token) {
+    throw new Error('未认证');
+  }
+
+  const response = await fetch(apiUrl(path), {
+    headers: { 'Authorization': `Bearer ${token}` },
+  });
+  if (!response.ok) {
+    throw new Error('导出失败');
+  }
+
+  // 优先使用 Content-Disposition 中 UTF-8 编码的文件名
+  const disposition = response.headers.get('Content-Disposition') || '';
+  const match = disposition.match(/filename\*=UTF-8''([^;]+)/);
+  const filename = match ? decodeURIComponent(match[1]) : fallbackName;
+
+  const url = URL.createObjectURL(await response.blob());
+  const link = document.createElement('a');
+  link.href = url;
+  link.download = filename;
+  document.body.appendChild(link);
+  link.click();
+  document.body.removeChild(link);
+  URL.revokeObjectURL(url);
+}
+
+/**
+ * 下载单个对话
+ */
+export function downloadConversation(
+  conversationId: number,
+  format: ConversationExportRequest['format'] = 'markdown'
+): Promise<void> {
+  return downloadExport(`/api/chat/conversations/${conversationId}/export?format=${format}`, `conversation.${format === 'markdown' ? 'md' : format}`);
+}
+
+/**
+ * 下载全部对话（zip）
+ */
+export function downloadAllConversations(
+  format: ConversationExportRequest['format'] = 'markdown'
+): Promise<void> {
+  return downloadExport(`/api/chat/export?format=${format}`, 'conversations.zip');
+}
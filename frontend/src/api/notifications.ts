@@ -41,6 +41,13 @@ export async function markNotificationRead(
   return put<void>(`${API_PREFIX}/${notificationId}/read`, {});
 }
 
+// 标记广播通知为已读（同时标记更早的广播）
+export async function markBroadcastRead(
+  broadcastId: number
+): Promise<NotificationMarkReadResponse> {
+  return put<NotificationMarkReadResponse>(`${API_PREFIX}/broadcasts/${broadcastId}/read`, {});
+}
+
 // 清除通知
 export async function deleteNotifications(all: boolean = false): Promise<NotificationDeleteResponse> {
   const query = all ? '?all=true' : '?all=false';
@@ -74,12 +74,24 @@ export default function NotificationCenter() {
   }, [isOpen]);
 
   // 标记单个通知为已读
-  const handleMarkRead = async (notificationId: number) => {
+  const handleMarkRead = async (notification: NotificationWithTimeDisplay) => {
     try {
-      await notificationsApi.markNotificationRead(notificationId);
+      if (notification.is_broadcast) {
+        // 广播按水位线标记，更早的广播也一并变为已读
+        await notificationsApi.markBroadcastRead(notification.id);
+        setNotifications(prev =>
+          prev.map(n =>
+            n.is_broadcast && n.id <= notification.id ? { ...n, is_read: true } : n
+          )
+        );
+        loadUnreadCount();
+        return;
+      }
+
+      await notificationsApi.markNotificationRead(notification.id);
       setNotifications(prev =>
         prev.map(n =>
-          n.id === notificationId ? { ...n, is_read: true } : n
+          !n.is_broadcast && n.id === notification.id ? { ...n, is_read: true } : n
         )
       );
       setUnreadCount(prev => Math.max(0, prev - 1));
@@ -117,7 +129,7 @@ export default function NotificationCenter() {
   const handleDelete = async (notificationId: number) => {
     try {
       await notificationsApi.deleteNotification(notificationId);
-      setNotifications(prev => prev.filter(n => n.id !== notificationId));
+      setNotifications(prev => prev.filter(n => n.is_broadcast || n.id !== notificationId));
       loadUnreadCount();
     } catch (error) {
       console.error('删除通知失败:', error);
@@ -232,7 +244,7 @@ export default function NotificationCenter() {
               <div>
                 {notifications.map((notification) => (
                   <div
-                    key={notification.id}
+                    key={`${notification.is_broadcast ? 'broadcast' : 'notification'}-${notification.id}`}
                     style={{
                       padding: '0.75rem 1rem',
                       borderBottom: '1px solid #f1f5f9',
@@ -257,7 +269,7 @@ export default function NotificationCenter() {
                         style={{ flex: 1, minWidth: 0 }}
                         onClick={() => {
                           if (!notification.is_read) {
-                            handleMarkRead(notification.id);
+                            handleMarkRead(notification);
                           }
                           if (notification.related_url) {
                             window.location.href = notification.related_url;
@@ -275,7 +287,8 @@ export default function NotificationCenter() {
                         </div>
                       </div>
 
-                      {/* 删除按钮 */}
+                      {/* 删除按钮（广播通知通过"清除"批量隐藏） */}
+                      {!notification.is_broadcast && (
                       <button
                         onClick={(e) => {
                           e.stopPropagation();
@@ -301,6 +314,7 @@ export default function NotificationCenter() {
                           />
                         </svg>
                       </button>
+                      )}
                     </div>
                   </div>
                 ))}
@@ -1,11 +1,15 @@
 import { useEffect, useState, useRef, useCallback } from 'react';
-import { useParams, useNavigate } from 'react-router-dom';
+import { useParams, useNavigate, useSearchParams } from 'react-router-dom';
 import { createConversation, deleteConversation, getConversation, getConversations, getMessages, sendMessageStream, submitFeedback } from '../api/chat';
 import type { ConversationListItem, Message, StreamChunk } from '../types/chat';
 
 export default function ChatDetail() {
   const { conversationId } = useParams<{ conversationId: string }>();
   const navigate = useNavigate();
+  const [searchParams] = useSearchParams();
+  // 从消息检索结果跳转过来时要定位的消息
+  const targetMessageId = Number(searchParams.get('message')) || null;
+  const jumpTargetRef = useRef<number | null>(null);
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const textareaRef = useRef<HTMLTextAreaElement>(null);
 
@@ -63,12 +67,22 @@ export default function ChatDetail() {
 
       const [convData, messagesData, conversationsData] = await Promise.all([
         getConversation(parseInt(conversationId)),
-        getMessages(parseInt(conversationId)),
+        getMessages(parseInt(conversationId), { tail: true }),
         getConversations({ page: 1, size: 30 })
       ]);
 
+      // 目标消息不在最新的一段中时，向前逐页加载到目标消息为止
+      let items = messagesData.items;
+      let cursor = messagesData.next_before_id;
+      while (targetMessageId && cursor && !items.some((msg) => msg.id === targetMessageId)) {
+        const older = await getMessages(parseInt(conversationId), { before_id: cursor, size: 100 });
+        items = [...older.items, ...items];
+        cursor = older.next_before_id;
+      }
+      jumpTargetRef.current = targetMessageId;
+
       setTitle(convData.title);
-      setMessages(messagesData.items);
+      setMessages(items);
       setConversations(conversationsData.items);
     } catch (err: any) {
       setError(err.message || '加载失败');
@@ -79,16 +93,22 @@ export default function ChatDetail() {
 
   useEffect(() => {
     loadConversation();
-  }, [conversationId]);
+  }, [conversationId, targetMessageId]);
 
-  // 自动滚动到底部
+  // 自动滚动到底部（从检索结果跳转时先滚动到目标消息）
   const scrollToBottom = useCallback(() => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   }, []);
 
   useEffect(() => {
+    const target = jumpTargetRef.current && document.getElementById(`message-${jumpTargetRef.current}`);
+    if (target) {
+      jumpTargetRef.current = null;
+      target.scrollIntoView({ block: 'center' });
+      return;
+    }
     scrollToBottom();
-  }, [messages, scrollToBottom]);
+  }, [messages, loading, scrollToBottom]);
 
   const refreshConversationMeta = async () => {
     if (!conversationId) return;
@@ -163,6 +183,12 @@ export default function ChatDetail() {
         (err) => {
           setError(err.message || '发送失败');
           setSending(false);
+        },
+        // onQueued
+        (position: number) => {
+          setMessages(prev => prev.map(msg =>
+            msg.id === aiMessageId ? { ...msg, content: `排队中，当前第 ${position} 位...` } : msg
+          ));
         }
       );
     } catch (err: any) {
@@ -314,10 +340,12 @@ export default function ChatDetail() {
             return (
             <div
               key={msg.id}
+              id={`message-${msg.id}`}
               style={{
                 marginBottom: '1.5rem',
                 display: 'flex',
-                flexDirection: 'column'
+                flexDirection: 'column',
+                ...(msg.id === targetMessageId ? { outline: '2px solid #fde68a', outlineOffset: '6px', borderRadius: '8px' } : {})
               }}
             >
               {/* 消息头部 */}
@@ -1,11 +1,12 @@
 import { useEffect, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { getConversations, createConversation, deleteConversation } from '../api/chat';
-import type { ConversationListItem } from '../types/chat';
+import { getConversations, createConversation, deleteConversation, downloadAllConversations, searchMessages } from '../api/chat';
+import type { ConversationListItem, MessageSearchItem } from '../types/chat';
 
 export default function ChatList() {
   const navigate = useNavigate();
   const [conversations, setConversations] = useState<ConversationListItem[]>([]);
+  const [messageHits, setMessageHits] = useState<MessageSearchItem[]>([]);
   const [loading, setLoading] = useState(true);
   const [searchQuery, setSearchQuery] = useState('');
   const [error, setError] = useState<string | null>(null);
@@ -15,8 +16,13 @@ export default function ChatList() {
     try {
       setLoading(true);
       setError(null);
-      const response = await getConversations({ q: query, page: 1, size: 20 });
+      // 有关键词时同时检索标题和消息内容
+      const [response, hits] = await Promise.all([
+        getConversations({ q: query, page: 1, size: 20 }),
+        query.trim() ? searchMessages({ q: query.trim(), page: 1, size: 20 }) : null
+      ]);
       setConversations(response.items);
+      setMessageHits(hits ? hits.items : []);
     } catch (err: any) {
       setError(err.message || '加载失败');
     } finally {
@@ -44,6 +50,15 @@ export default function ChatList() {
     }
   };
 
+  // 导出全部对话（zip）
+  const handleExportAll = async () => {
+    try {
+      await downloadAllConversations('markdown');
+    } catch (err: any) {
+      setError(err.message || '导出失败');
+    }
+  };
+
   // 删除对话
   const handleDeleteConversation = async (id: number, e: React.MouseEvent) => {
     e.stopPropagation();
@@ -83,6 +98,21 @@ export default function ChatList() {
       {/* 页头 */}
       <div style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center', marginBottom: '1.5rem' }}>
         <h1>AI对话</h1>
+        <div style={{ display: 'flex', gap: '0.75rem' }}>
+        <button
+          onClick={handleExportAll}
+          style={{
+            padding: '0.75rem 1.25rem',
+            backgroundColor: 'transparent',
+            color: '#0f172a',
+            border: '1px solid #cbd5e1',
+            borderRadius: '8px',
+            fontSize: '1rem',
+            cursor: 'pointer'
+          }}
+        >
+          导出全部
+        </button>
         <button
           onClick={handleCreateConversation}
           style={{
@@ -100,6 +130,7 @@ export default function ChatList() {
         >
           + 新对话
         </button>
+        </div>
       </div>
 
       <hr style={{ border: 'none', borderBottom: '2px solid #e2e8f0', marginBottom: '1.5rem' }} />
@@ -140,7 +171,7 @@ export default function ChatList() {
         <div style={{ textAlign: 'center', padding: '3rem', color: '#64748b' }}>
           加载中...
         </div>
-      ) : conversations.length === 0 ? (
+      ) : conversations.length === 0 && messageHits.length === 0 ? (
         <div style={{ textAlign: 'center', padding: '3rem', color: '#64748b' }}>
           {searchQuery ? '没有找到匹配的对话' : '还没有对话，点击上方按钮创建一个吧！'}
         </div>
@@ -223,6 +254,38 @@ export default function ChatList() {
               </div>
             </div>
           ))}
+
+          {/* 消息内容检索结果：点击跳转到对话中的对应消息 */}
+          {messageHits.length > 0 && (
+            <>
+              <div style={{ color: '#64748b', fontSize: '0.9rem', marginTop: '0.5rem' }}>
+                在消息中找到 {messageHits.length} 条结果
+              </div>
+              {messageHits.map((hit) => (
+                <div
+                  key={hit.message_id}
+                  onClick={() => navigate(`/chat/${hit.conversation_id}?message=${hit.message_id}`)}
+                  style={{
+                    backgroundColor: '#f8fafc',
+                    border: '1px solid #e2e8f0',
+                    borderRadius: '12px',
+                    padding: '1rem 1.25rem',
+                    cursor: 'pointer'
+                  }}
+                >
+                  <div style={{ fontWeight: '600', marginBottom: '0.35rem' }}>
+                    {hit.role === 'assistant' ? '🤖' : '👤'} {hit.conversation_title}
+                  </div>
+                  <div style={{ color: '#334155', fontSize: '0.9rem', marginBottom: '0.35rem' }}>
+                    {hit.snippet}
+                  </div>
+                  <div style={{ color: '#64748b', fontSize: '0.85rem' }}>
+                    {formatTime(hit.created_at)}
+                  </div>
+                </div>
+              ))}
+            </>
+          )}
         </div>
       )}
     </div>
@@ -13,6 +13,7 @@ export interface ConversationListItem {
   title: string;
   last_message: string | null;
   message_count: number;
+  last_message_at: string | null;
   created_at: string;
   updated_at: string;
 }
@@ -56,9 +57,40 @@ export interface MessageListResponse {
   total: number;
   page: number;
   size: number;
+  next_before_id: number | null;
   items: MessageListItem[];
 }
 
+export interface MessageSearchItem {
+  message_id: number;
+  conversation_id: number;
+  conversation_title: string;
+  role: 'user' | 'assistant';
+  snippet: string;
+  score: number;
+  created_at: string;
+}
+
+export interface MessageSearchResponse {
+  total: number;
+  page: number;
+  size: number;
+  items: MessageSearchItem[];
+}
+
+export interface MessageVersion {
+  id: number;
+  content: string;
+  tokens_used: number | null;
+  truncated: boolean;
+  created_at: string;
+}
+
+export interface MessageVersionListResponse {
+  message_id: number;
+  items: MessageVersion[];
+}
+
 export interface MessageFeedbackCreate {
   feedback: 'helpful' | 'not_helpful';
 }
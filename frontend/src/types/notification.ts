@@ -1,17 +1,21 @@
 // 通知相关类型定义
 
-export type NotificationType = 'comment_reply' | 'blog_comment' | 'comment_reply_blog' | 'system';
+export type NotificationType = 'comment_reply' | 'blog_comment' | 'comment_reply_blog' | 'blog_liked' | 'blog_favorited' | 'notice_published' | 'system';
 
 export interface Notification {
   id: number;
   type: NotificationType;
   title: string;
   content: string;
-  related_type: 'blog' | 'comment' | null;
+  related_type: 'blog' | 'comment' | 'notice' | null;
   related_id: number | null;
   related_url: string | null;
   is_read: boolean;
   created_at: string;
+  actor_count: number;  // 合并通知的触发者人数
+  actors: string[];  // 最近触发者显示名（最新在前）
+  last_event_at: string | null;
+  is_broadcast: boolean;  // 广播通知（全班可见，按水位线标记已读）
 }
 
 export interface NotificationWithTimeDisplay extends Notification {